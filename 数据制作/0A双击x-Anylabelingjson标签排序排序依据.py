@@ -1,5 +1,14 @@
 ﻿import os
-import json
+import sys
+
+from anylabeling_bulk import SkipFile, run_bulk
+
+try:
+    from reading_order import SORT_MODES, points_to_box, reading_order
+except ImportError:
+    # 排序引擎与检测服务共用，放在 漫画软件 目录；脚本被复制到别处时请把 reading_order.py 一起复制过去
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "漫画软件"))
+    from reading_order import SORT_MODES, points_to_box, reading_order
 
 # ==============================================================================
 # --- 配置区: 工作流排序规则 ---
@@ -14,8 +23,12 @@ EXCEPTION_LABEL = "other"
 #    - 这个模式将应用于 **除了特殊置顶标签之外的所有其他标签**。
 #    - 所有其他标签会被看作一个整体，然后根据这个模式进行空间排序。
 #    - 可用选项:
+#      --- 自动分栏 (按框的区间重叠识别真正的列/行) ---
+#      "COLUMNS_RTL"   --> **【竖排漫画推荐】** 自动分列, 列从右到左, 列内从上到下
+#      "COLUMNS_LTR"   --> 自动分列, 列从左到右, 列内从上到下
+#      "ROWS_TTB"      --> 自动分行 (横排文字), 行从上到下, 行内从左到右
 #      --- 从右到左 (适用于漫画) ---
-#      "REV_X_THEN_Y"  --> **【强烈推荐】** 先从右到左分栏, 再从上到下排序
+#      "REV_X_THEN_Y"  --> 先按横坐标从右到左, 横坐标相同再从上到下
 #      "Y_THEN_REV_X"  --> 先从上到下分行, 再从右到左排序
 #      "REV_X"         --> 仅横坐标 (严格从右到左)
 #      --- 从左到右 ---
@@ -26,74 +39,34 @@ EXCEPTION_LABEL = "other"
 #
 SPATIAL_SORT_MODE = "REV_X"
 #
+# 3. 自动分栏的重叠比例 (仅 COLUMNS_* / ROWS_TTB 模式使用)
+#    - 一个框与当前列的水平重叠宽度 >= 该比例 * 自身宽度时, 视为同一列 (分行模式同理, 使用垂直方向)
+#
+COLUMN_MIN_OVERLAP = 0.5
+#
 # --- 配置区结束 ---
 # ==============================================================================
 
-def get_bounding_box_top_left(points):
-    """从点列表中计算出边界框的左上角坐标 (x_min, y_min)"""
-    if not points: return (0, 0)
-    x_coords = [p[0] for p in points]
-    y_coords = [p[1] for p in points]
-    return (min(x_coords), min(y_coords))
-
-def sort_shapes_in_file(file_path):
+def sort_transform(data, file_path):
     """
-    读取JSON文件，根据新的工作流规则进行排序，然后写回文件。
+    根据工作流规则对 shapes 排序（读写由 anylabeling_bulk 统一完成）：
+    特殊置顶标签保持原有顺序放在最前，其余标签的外接框只提取一次，交给 reading_order 按 SPATIAL_SORT_MODE 排序。
+    返回位置发生变化的标注数（0 表示顺序未变，不会写回文件）。
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception as e:
-        print(f"  - 错误: 读取或解析文件 '{os.path.basename(file_path)}' 时失败: {e}")
-        return False
-
     if not isinstance(data, dict) or 'shapes' not in data or not isinstance(data['shapes'], list):
-        print(f"  - 警告: 文件 '{os.path.basename(file_path)}' 结构不符，已跳过。")
-        return False
+        raise SkipFile("结构不符")
 
-    # --- 全新的核心排序逻辑 ---
-    def create_workflow_sort_key(shape):
-        label = shape.get('label')
-        points = shape.get('points', [])
-        x_min, y_min = get_bounding_box_top_left(points)
+    original = data['shapes']
+    pinned = [shape for shape in original if shape.get('label') == EXCEPTION_LABEL]
+    others = [shape for shape in original if shape.get('label') != EXCEPTION_LABEL]
+    boxes = [points_to_box(shape.get('points', [])) for shape in others]
+    order = reading_order(boxes, SPATIAL_SORT_MODE, COLUMN_MIN_OVERLAP)
+    data['shapes'] = pinned + [others[i] for i in order]
 
-        # 第一级排序: 判断是否为特殊置顶标签
-        # 如果是，它属于第 0 组；否则属于第 1 组。
-        primary_group = 0 if label == EXCEPTION_LABEL else 1
-
-        # 第二级和第三级排序: 应用空间规则
-        # 只有第 1 组（非特殊标签）才需要关心空间位置
-        if primary_group == 0:
-            # 对于特殊标签，空间位置不重要，给一个固定值即可
-            return (primary_group, 0, 0)
-        else:
-            # 对于其他所有标签，应用配置好的空间排序模式
-            if SPATIAL_SORT_MODE == "REV_X_THEN_Y":
-                return (primary_group, -x_min, y_min)
-            elif SPATIAL_SORT_MODE == "Y_THEN_REV_X":
-                return (primary_group, y_min, -x_min)
-            elif SPATIAL_SORT_MODE == "REV_X":
-                return (primary_group, -x_min, 0)
-            elif SPATIAL_SORT_MODE == "X_THEN_Y":
-                return (primary_group, x_min, y_min)
-            elif SPATIAL_SORT_MODE == "Y_THEN_X":
-                return (primary_group, y_min, x_min)
-            elif SPATIAL_SORT_MODE == "X":
-                return (primary_group, x_min, 0)
-            elif SPATIAL_SORT_MODE == "Y":
-                return (primary_group, y_min, 0)
-            else: # "NONE"
-                return (primary_group, 0, 0)
-
-    data['shapes'].sort(key=create_workflow_sort_key)
-
-    try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        return True
-    except Exception as e:
-        print(f"  - 错误: 写入文件 '{os.path.basename(file_path)}' 时失败: {e}")
-        return False
+    moved = sum(1 for before, after in zip(original, data['shapes']) if before is not after)
+    if moved:
+        print(f"  - 已排序: {os.path.basename(file_path)}")
+    return moved
 
 def main():
     try:
@@ -104,6 +77,10 @@ def main():
     print(f"正在扫描并处理目录: {work_dir}")
     print(f"特殊置顶标签: '{EXCEPTION_LABEL}'")
     print(f"其余标签空间排序模式: {SPATIAL_SORT_MODE}\n")
+    if SPATIAL_SORT_MODE not in SORT_MODES:
+        print(f"错误：未知的排序模式 '{SPATIAL_SORT_MODE}'，可用模式: {', '.join(SORT_MODES)}")
+        input("\n按 Enter 键退出...")
+        return
 
     json_files = [f for f in os.listdir(work_dir) if f.lower().endswith('.json')]
     
@@ -112,15 +89,11 @@ def main():
         input("\n按 Enter 键退出...")
         return
         
-    processed_count = 0
-    for filename in json_files:
-        if filename == os.path.basename(__file__): continue
-        file_path = os.path.join(work_dir, filename)
-        if sort_shapes_in_file(file_path):
-            print(f"  - 已排序: {filename}")
-            processed_count += 1
-            
-    print(f"\n处理完成！总共修改了 {processed_count} 个 JSON 文件。")
+    files = [os.path.join(work_dir, f) for f in json_files]
+    summary = run_bulk(files, sort_transform)
+
+    print(f"\n处理完成！总共修改了 {summary['written']} 个 JSON 文件（顺序未变 {summary['unchanged']} 个），"
+          f"耗时 {summary['elapsed']:.2f} 秒。")
     input("按 Enter 键退出...")
 
 if __name__ == "__main__":
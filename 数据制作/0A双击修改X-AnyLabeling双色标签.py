@@ -1,9 +1,11 @@
 ﻿import os
-import json
 
-def process_json_file(json_path):
+from anylabeling_bulk import SkipFile, run_bulk
+
+def process_json_file(data, json_path):
     """
-    处理单个JSON文件，根据规则修改标签。
+    处理单个JSON文件的数据，根据规则修改标签（读写由 anylabeling_bulk 统一完成）。
+    返回修改的标签数量（0 表示无需修改，不会写回文件）。
     """
     print(f"--- 正在处理文件: {os.path.basename(json_path)} ---")
 
@@ -13,19 +15,12 @@ def process_json_file(json_path):
     # 为每个目标标签创建一个独立的计数器
     counters = {label: 0 for label in target_labels}
 
-    try:
-        # 使用 'utf-8' 编码读取JSON文件
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception as e:
-        print(f"错误：无法读取或解析JSON文件 {json_path}。原因: {e}")
-        return
-
     # 检查JSON数据结构，通常标注信息在 'shapes' 键下
     if 'shapes' not in data or not isinstance(data['shapes'], list):
         print(f"警告：在 {json_path} 中未找到 'shapes' 列表，跳过此文件。")
-        return
+        raise SkipFile()
 
+    changes = 0
     # 遍历所有标注对象
     for shape in data['shapes']:
         label = shape.get('label')
@@ -39,16 +34,11 @@ def process_json_file(json_path):
             if counters[label] % 2 == 0:
                 new_label = f"{label}2"
                 shape['label'] = new_label
+                changes += 1
                 print(f"  已将第 {counters[label]} 个 '{label}' 修改为 '{new_label}'")
 
-    # 将修改后的内容写回原文件
-    try:
-        # 使用 'utf-8' 编码和缩进写回JSON文件，确保可读性
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        print(f"--- 文件 {os.path.basename(json_path)} 处理完成并已保存。 ---\n")
-    except Exception as e:
-        print(f"错误：无法写入文件 {json_path}。原因: {e}")
+    print(f"--- 文件 {os.path.basename(json_path)} 处理完成（修改 {changes} 处）。 ---\n")
+    return changes
 
 def main():
     """
@@ -61,7 +51,7 @@ def main():
     # 定义常见的图片文件扩展名
     image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.gif'}
     
-    found_files = False
+    json_paths = []
     # 遍历目录中的所有文件
     for filename in os.listdir(script_dir):
         # 分离文件名和扩展名
@@ -75,13 +65,15 @@ def main():
             
             # 检查同名的JSON文件是否存在
             if os.path.exists(json_path):
-                found_files = True
-                process_json_file(json_path)
+                json_paths.append(json_path)
             else:
                 print(f"未找到与图片 '{filename}' 对应的JSON文件 '{json_filename}'，已跳过。\n")
 
-    if not found_files:
+    if not json_paths:
         print("未在当前目录中找到任何匹配的图片和JSON文件对。")
+    else:
+        summary = run_bulk(json_paths, process_json_file)
+        print(f"共修改 {summary['written']} 个文件，未变化 {summary['unchanged']} 个，失败 {summary['error']} 个。")
 
     # 在程序结束时等待用户按键，以便查看输出信息
     input("\n所有操作已完成。按 Enter 键退出...")
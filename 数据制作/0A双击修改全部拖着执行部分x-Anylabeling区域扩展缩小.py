@@ -1,8 +1,9 @@
 ﻿import os
 import sys
-import json
 from collections import defaultdict
 
+from anylabeling_bulk import SkipFile, run_bulk
+
 # ==============================================================================
 # ========================== 配置区：类别映射与扩展值 ===========================
 # ==============================================================================
@@ -187,27 +188,18 @@ def adjust_box(box, margins, image_w=None, image_h=None):
     return [nx_min, ny_min, nx_max, ny_max], constrained, notes
 
 
-def process_file(file_path, global_stats):
+def process_file(data, file_path):
     """
-    处理单个 JSON 文件：
-    - 读取文件并兼容 dict/list 结构
+    处理单个 JSON 文件的数据（读写由 anylabeling_bulk 统一完成）：
+    - 兼容 dict/list 结构
     - 对 rectangle 类型的 shape 应用扩展值
     - 打印每个框的简要信息
-    - 回写 JSON
-    - 更新全局统计（仅计数，不打印）
+    返回调整的框数（0 表示内容未变化，不会写回文件）。
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception as e:
-        print(f"  - 错误: 读取文件 '{os.path.basename(file_path)}' 失败: {e}")
-        return False
-
     img_w, img_h, shapes, structure_type, root_ref = get_image_dimensions_and_shapes(data)
 
     if structure_type == 'unknown' or shapes is None:
-        print(f"  - 跳过: {os.path.basename(file_path)} (不支持的 JSON 结构：{type(data).__name__})")
-        return False
+        raise SkipFile(f"不支持的 JSON 结构：{type(data).__name__}")
 
     img_size_str = f"{img_w}x{img_h}" if (img_w is not None and img_h is not None) else "未知"
     print(f"  - 处理: {os.path.basename(file_path)} (结构: {structure_type}, 图像尺寸: {img_size_str}, 框数: {len(shapes)})")
@@ -289,23 +281,9 @@ def process_file(file_path, global_stats):
             if BOUNDARY_OPTIONS["keep_within_image"] and (img_w is None or img_h is None):
                 print("      提示: 缺少图像尺寸，已跳过边界裁剪")
 
-    # 写回 JSON：保持原结构
-    try:
-        if structure_type == 'dict':
-            root_ref['shapes'] = shapes
-        elif structure_type == 'list':
-            pass
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(root_ref, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        print(f"  - 错误: 写入文件 '{os.path.basename(file_path)}' 失败: {e}")
-        return False
-
+    # shapes 是 data 中列表的引用，已原地修改，结构保持不变
     # 不打印“完成: 成功调整了 X …”这句，保持安静
-    # 更新全局计数（仅用于最终总计行）
-    global_stats["processed_files"] += 1
-
-    return True
+    return modified
 
 
 def main():
@@ -381,19 +359,11 @@ def main():
 
     print(f"\n总计找到 {len(targets)} 个 JSON 文件，开始处理...\n")
 
-    # 全局统计（仅计数）
-    global_stats = {
-        "processed_files": 0
-    }
-
-    for path in targets:
-        if path.endswith('.py'):
-            continue
-        process_file(path, global_stats)
+    summary = run_bulk(targets, process_file)
 
     # 结尾仅保留三行 + “按 Enter 键退出...”
     print("\n" + "="*50)
-    print(f"处理完成！总共成功修改了 {global_stats['processed_files']} 个 JSON 文件。")
+    print(f"处理完成！总共成功修改了 {summary['written']} 个 JSON 文件（未变化 {summary['unchanged']} 个），耗时 {summary['elapsed']:.2f} 秒。")
     print("="*50)
     input("按 Enter 键退出...")
 
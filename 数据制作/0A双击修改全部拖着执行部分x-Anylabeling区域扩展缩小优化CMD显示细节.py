@@ -1,8 +1,11 @@
 ﻿import os
 import sys
-import json
 from collections import defaultdict
 
+import numpy as np
+
+from anylabeling_bulk import SkipFile, run_bulk
+
 # ==============================================================================
 # ========================== 配置区：类别映射与扩展值 ===========================
 # ==============================================================================
@@ -46,6 +49,12 @@ BOUNDARY_OPTIONS = {
     "debug_mode": False,         # 是否打印更详细的调试信息
 }
 
+# 5) 控制台输出选项（大文件夹上逐框打印是主要耗时，默认只打印每个文件的摘要）
+REPORT_OPTIONS = {
+    "per_file_summary": True,    # 是否为每个文件打印一行标签统计摘要
+    "sample_boxes": 0,           # 每个文件打印多少个框的详细信息（0 = 不打印，-1 = 全部打印）
+}
+
 # --- 配置区结束 ---
 # ==============================================================================
 
@@ -121,6 +130,20 @@ def class_margins(class_id):
     return {"top": float(t), "bottom": float(b), "left": float(l), "right": float(r)}
 
 
+_margin_rows = {}
+
+
+def class_margin_row(class_id):
+    """
+    返回类别的边距元组 (上, 下, 左, 右)，已转换为浮点数；按类别缓存，避免每个框重复查表。
+    """
+    row = _margin_rows.get(class_id)
+    if row is None:
+        t, b, l, r = EXPAND_VALUES.get(class_id, EXPAND_VALUES.get(DEFAULT_CLASS_ID, (0, 0, 0, 0)))
+        row = _margin_rows[class_id] = (float(t), float(b), float(l), float(r))
+    return row
+
+
 def margins_str(m):
     return f"上{m['top']} 下{m['bottom']} 左{m['left']} 右{m['right']}"
 
@@ -187,27 +210,83 @@ def adjust_box(box, margins, image_w=None, image_h=None):
     return [nx_min, ny_min, nx_max, ny_max], constrained, notes
 
 
-def process_file(file_path, global_stats):
+def gather_boxes(point_lists):
+    """
+    把多个 shape 的点集一次性转换为 (N, 4) 的 [x_min, y_min, x_max, y_max] 数组。
+    点数可以不同（两点或四点矩形），用 reduceat 按段求最小/最大值。
+    """
+    counts = np.fromiter((len(p) for p in point_lists), dtype=np.intp, count=len(point_lists))
+    flat = np.array([pt[:2] for p in point_lists for pt in p], dtype=np.float64).reshape(-1, 2)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return np.stack([
+        np.minimum.reduceat(flat[:, 0], starts),
+        np.minimum.reduceat(flat[:, 1], starts),
+        np.maximum.reduceat(flat[:, 0], starts),
+        np.maximum.reduceat(flat[:, 1], starts),
+    ], axis=1)
+
+
+def adjust_boxes(boxes, margins, image_w=None, image_h=None):
     """
-    处理单个 JSON 文件：
-    - 读取文件并兼容 dict/list 结构
+    adjust_box 的向量化版本：对 (N, 4) 的 boxes 一次性应用边距、边界裁剪和最小尺寸限制。
+    margins 为 (N, 4) 数组，列顺序与 EXPAND_VALUES 相同（上、下、左、右）。
+    返回：new_boxes 列表、constrained 布尔数组。
+    计算顺序与 adjust_box 完全相同，结果逐值一致（裁剪到图像边界的坐标同样保持原来的整数写法）。
+    """
+    nx_min = boxes[:, 0] - margins[:, 2]
+    ny_min = boxes[:, 1] - margins[:, 0]
+    nx_max = boxes[:, 2] + margins[:, 3]
+    ny_max = boxes[:, 3] + margins[:, 1]
+    constrained = np.zeros(len(boxes), dtype=bool)
+    clipped = np.zeros(boxes.shape, dtype=bool)  # 被裁剪到图像边界的坐标
+    clip_values = (0, 0, image_w, image_h)
+
+    # 1) 限制在图像内（可选；若无图像尺寸则不启用裁剪）
+    if BOUNDARY_OPTIONS["keep_within_image"] and image_w is not None and image_h is not None:
+        for col, (values, mask) in enumerate(((nx_min, nx_min < 0), (ny_min, ny_min < 0),
+                                              (nx_max, nx_max > image_w), (ny_max, ny_max > image_h))):
+            values[mask] = clip_values[col]
+            clipped[:, col] = mask
+            constrained |= mask
+
+    # 2) 最小尺寸限制：围绕中心扩展到最小宽高
+    min_w = BOUNDARY_OPTIONS["min_width"]
+    min_h = BOUNDARY_OPTIONS["min_height"]
+    small_w = (nx_max - nx_min) < min_w
+    small_h = (ny_max - ny_min) < min_h
+    cx = (nx_min + nx_max) / 2
+    cy = (ny_min + ny_max) / 2
+    nx_min = np.where(small_w, cx - min_w / 2, nx_min)
+    nx_max = np.where(small_w, cx + min_w / 2, nx_max)
+    ny_min = np.where(small_h, cy - min_h / 2, ny_min)
+    ny_max = np.where(small_h, cy + min_h / 2, ny_max)
+    constrained |= small_w | small_h
+    clipped[:, 0] &= ~small_w
+    clipped[:, 2] &= ~small_w
+    clipped[:, 1] &= ~small_h
+    clipped[:, 3] &= ~small_h
+
+    new_boxes = np.stack([nx_min, ny_min, nx_max, ny_max], axis=1).tolist()
+    for row, col in zip(*np.nonzero(clipped)):
+        new_boxes[row][col] = clip_values[col]
+    return new_boxes, constrained
+
+
+def process_file(data, file_path):
+    """
+    处理单个 JSON 文件的数据（读写由 anylabeling_bulk 统一完成）：
+    - 兼容 dict/list 结构
     - 对 rectangle 类型的 shape 应用扩展值
     - 打印人性化的处理结果
-    - 回写 JSON
-    - 更新全局统计
+    返回调整的框数（0 表示内容未变化，不会写回文件）。
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception as e:
-        print(f"  - 错误: 读取文件 '{os.path.basename(file_path)}' 失败: {e}")
-        return False
+    # 添加分隔线在前面
+    print("-" * 60)
 
     img_w, img_h, shapes, structure_type, root_ref = get_image_dimensions_and_shapes(data)
 
     if structure_type == 'unknown' or shapes is None:
-        print(f"  - 跳过: {os.path.basename(file_path)} (不支持的文件格式)")
-        return False
+        raise SkipFile("不支持的文件格式")
 
     img_size_str = f"{img_w}x{img_h}" if (img_w is not None and img_h is not None) else "未知"
     
@@ -217,11 +296,11 @@ def process_file(file_path, global_stats):
     skipped_labels = defaultdict(int)  # 统计每个标签被跳过的数量
     non_rect_count = 0
     
-    modified = 0
     skipped_not_rect = 0
     skipped_no_change = 0
+    selected = []  # 需要调整的 (shape, 显示标签, 类别, 边距)
 
-    # 第一遍：统计所有标签
+    # 第一遍：统计所有标签，并收集需要调整的矩形
     for shape in shapes:
         if not isinstance(shape, dict):
             non_rect_count += 1
@@ -244,80 +323,70 @@ def process_file(file_path, global_stats):
             continue
             
         class_id = get_class_id_for_shape(shape)
-        margins = class_margins(class_id)
+        margins = class_margin_row(class_id)
         
         # 若四边均为 0，则跳过
-        if margins["top"] == 0 and margins["bottom"] == 0 and margins["left"] == 0 and margins["right"] == 0:
+        if not any(margins):
             skipped_labels[label] += 1
             skipped_no_change += 1
         else:
             processed_labels[label] += 1
+            selected.append((shape, label, class_id, margins))
 
-    # 生成人性化的输出信息并先输出文件摘要
-    status_parts = []
-    
-    # 处理的标签
-    if processed_labels:
-        processed_info = []
-        for label, count in processed_labels.items():
-            processed_info.append(f"{label}({count}个已调整)")
-        status_parts.append("、".join(processed_info))
-    
-    # 跳过的标签
-    if skipped_labels:
-        skipped_info = []
-        for label, count in skipped_labels.items():
-            total_count = label_stats[label]
-            if count == total_count:  # 全部跳过
-                skipped_info.append(f"{label}({count}个跳过-无需调整)")
-            else:  # 部分跳过
-                skipped_info.append(f"{label}({count}个跳过)")
-        if skipped_info:
-            status_parts.append("、".join(skipped_info))
-    
-    # 非矩形框
-    if non_rect_count > 0:
-        status_parts.append(f"非矩形框({non_rect_count}个跳过)")
-    
-    # 组装最终输出
-    if not status_parts:
-        status_str = "无有效标注框"
-    else:
-        status_str = "、".join(status_parts)
-    
-    # 先输出文件摘要
-    print(f"  - 处理: {os.path.basename(file_path)} (图像尺寸: {img_size_str}, {status_str})")
-
-    # 第二遍：实际处理并输出详细信息
-    for idx, shape in enumerate(shapes, start=1):
-        if not isinstance(shape, dict):
-            continue
-
-        label = str(shape.get('label', '无标签')).strip()
-        if not label:
-            label = '无标签'
-        shape_type = str(shape.get('shape_type', '')).strip().lower()
-        points = shape.get('points', None)
+    if REPORT_OPTIONS["per_file_summary"]:
+        # 生成人性化的输出信息并先输出文件摘要
+        status_parts = []
+        
+        # 处理的标签
+        if processed_labels:
+            processed_info = []
+            for label, count in processed_labels.items():
+                processed_info.append(f"{label}({count}个已调整)")
+            status_parts.append("、".join(processed_info))
+        
+        # 跳过的标签
+        if skipped_labels:
+            skipped_info = []
+            for label, count in skipped_labels.items():
+                total_count = label_stats[label]
+                if count == total_count:  # 全部跳过
+                    skipped_info.append(f"{label}({count}个跳过-无需调整)")
+                else:  # 部分跳过
+                    skipped_info.append(f"{label}({count}个跳过)")
+            if skipped_info:
+                status_parts.append("、".join(skipped_info))
+        
+        # 非矩形框
+        if non_rect_count > 0:
+            status_parts.append(f"非矩形框({non_rect_count}个跳过)")
+        
+        # 组装最终输出
+        if not status_parts:
+            status_str = "无有效标注框"
+        else:
+            status_str = "、".join(status_parts)
+        
+        # 先输出文件摘要
+        print(f"  - 处理: {os.path.basename(file_path)} (图像尺寸: {img_size_str}, {status_str})")
 
-        if not shape_type and isinstance(points, list) and len(points) in (2, 4):
-            shape_type = 'rectangle'
+    if not selected:
+        return 0
 
-        if shape_type != 'rectangle' or not points:
-            continue
+    # 第二遍：所有需要调整的框一次性向量化计算，再写回新点
+    original_boxes = gather_boxes([item[0]['points'] for item in selected])
+    margin_array = np.array([item[3] for item in selected], dtype=np.float64)
+    new_boxes, constrained = adjust_boxes(original_boxes, margin_array, img_w, img_h)
+    for (shape, _, _, _), new_box in zip(selected, new_boxes):
+        shape['points'] = box_to_points(new_box)
 
-        class_id = get_class_id_for_shape(shape)
+    # 逐框详细输出（可选，按 REPORT_OPTIONS["sample_boxes"] 抽样）
+    sample = REPORT_OPTIONS["sample_boxes"]
+    report_count = len(selected) if sample < 0 else min(sample, len(selected))
+    for idx in range(report_count):
+        _, label, class_id, _ = selected[idx]
+        original_box = original_boxes[idx].tolist()
         margins = class_margins(class_id)
-
-        # 若四边均为 0，则跳过
-        if margins["top"] == 0 and margins["bottom"] == 0 and margins["left"] == 0 and margins["right"] == 0:
-            continue
-
-        original_box = get_box_from_points(points)
-        new_box, constrained, notes = adjust_box(original_box, margins, img_w, img_h)
-
-        # 写回新点
-        shape['points'] = box_to_points(new_box)
-        modified += 1
+        new_box, _, notes = adjust_box(original_box, margins, img_w, img_h)
 
         # 输出详细的处理信息
         print(f"    处理标签详情 {label if label != '无标签' else '(无标签)'} (class={class_id})")
@@ -326,34 +395,22 @@ def process_file(file_path, global_stats):
         print(f"    扩展值: {margins_str(margins)}")
 
         # 附加详细（可选）
-        if constrained or BOUNDARY_OPTIONS["debug_mode"]:
+        if constrained[idx] or BOUNDARY_OPTIONS["debug_mode"]:
             dx_left = original_box[0] - new_box[0]
             dy_top = original_box[1] - new_box[1]
             dx_right = new_box[2] - original_box[2]
             dy_bottom = new_box[3] - original_box[3]
-            print(f"      触发限制: {'是' if constrained else '否'}")
+            print(f"      触发限制: {'是' if constrained[idx] else '否'}")
             print(f"      变化量: 左{dx_left:.2f} 上{dy_top:.2f} 右{dx_right:.2f} 下{dy_bottom:.2f}")
             if notes:
                 print(f"      限制详情: " + "；".join(notes))
             if BOUNDARY_OPTIONS["keep_within_image"] and (img_w is None or img_h is None):
                 print("      提示: 缺少图像尺寸，已跳过边界裁剪")
+    if 0 < report_count < len(selected):  # sample_boxes = 0 时整段关闭，不提示省略
+        print(f"    （其余 {len(selected) - report_count} 个框的详情已省略，可在 REPORT_OPTIONS 中调整）")
 
-    # 写回 JSON：保持原结构
-    try:
-        if structure_type == 'dict':
-            root_ref['shapes'] = shapes
-        elif structure_type == 'list':
-            pass
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(root_ref, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        print(f"  - 错误: 写入文件 '{os.path.basename(file_path)}' 失败: {e}")
-        return False
-
-    # 更新全局计数
-    global_stats["processed_files"] += 1
-
-    return True
+    # shapes 是 data 中列表的引用，已原地修改，结构保持不变
+    return len(selected)
 
 
 def main():
@@ -383,6 +440,8 @@ def main():
     print(f"边界限制: {'开启' if BOUNDARY_OPTIONS['keep_within_image'] else '关闭'}")
     print(f"最小尺寸: {BOUNDARY_OPTIONS['min_width']} x {BOUNDARY_OPTIONS['min_height']}")
     print(f"调试模式: {'开启' if BOUNDARY_OPTIONS['debug_mode'] else '关闭'}")
+    sample = REPORT_OPTIONS['sample_boxes']
+    print(f"逐框详情: {'全部打印' if sample < 0 else (f'每个文件最多 {sample} 个' if sample > 0 else '关闭')}")
     print("="*70 + "\n")
 
     # 收集待处理 JSON
@@ -429,23 +488,11 @@ def main():
 
     print(f"\n总计找到 {len(targets)} 个 JSON 文件，开始处理...\n")
 
-    # 全局统计（仅计数）
-    global_stats = {
-        "processed_files": 0
-    }
-
-    for path in targets:
-        if path.endswith('.py'):
-            continue
-        
-        # 添加分隔线在前面
-        print("-" * 60)
-        
-        process_file(path, global_stats)
+    summary = run_bulk(targets, process_file)
 
     # 结尾仅保留三行 + "按 Enter 键退出..."
     print("\n" + "="*50)
-    print(f"处理完成！总共成功修改了 {global_stats['processed_files']} 个 JSON 文件。")
+    print(f"处理完成！总共成功修改了 {summary['written']} 个 JSON 文件（未变化 {summary['unchanged']} 个），耗时 {summary['elapsed']:.2f} 秒。")
     print("="*50)
     input("按 Enter 键退出...")
 
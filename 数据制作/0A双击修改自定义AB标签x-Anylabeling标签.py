@@ -1,7 +1,9 @@
 ﻿import os
-import json
+from functools import partial
 from typing import Dict, List
 
+from anylabeling_bulk import SkipFile, run_bulk
+
 # ====================== 可配置区域（直接在这里改） ======================
 # 映射关系：把键替换为值。按需增删即可。
 LABEL_MAP: Dict[str, str] = {
@@ -25,22 +27,16 @@ PAUSE_ON_EXIT: bool = True
 # =======================================================================
 
 
-def revert_json_file(json_path: str, labels_to_revert: Dict[str, str]):
+def revert_json_file(data, json_path: str, labels_to_revert: Dict[str, str]) -> int:
     """
-    处理单个 JSON 文件，根据 labels_to_revert 将标签替换。
+    处理单个 JSON 文件的数据，根据 labels_to_revert 将标签替换（读写由 anylabeling_bulk 统一完成）。
+    返回替换数量（0 表示无需修改，不会写回文件）。
     """
     print(f"--- 正在处理文件: {os.path.basename(json_path)} ---")
 
-    try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception as e:
-        print(f"错误：无法读取或解析 JSON 文件 {json_path}。原因: {e}")
-        return
-
     if 'shapes' not in data or not isinstance(data['shapes'], list):
         print(f"警告：在 {json_path} 中未找到 'shapes' 列表，已跳过。")
-        return
+        raise SkipFile()
 
     changes = 0
     for shape in data['shapes']:
@@ -51,15 +47,11 @@ def revert_json_file(json_path: str, labels_to_revert: Dict[str, str]):
             changes += 1
             print(f"  替换: '{label}' -> '{new_label}'")
 
-    try:
-        if changes > 0:
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            print(f"--- 完成：{os.path.basename(json_path)}（{changes} 处替换）---\n")
-        else:
-            print(f"--- 未发现可替换标签：{os.path.basename(json_path)} ---\n")
-    except Exception as e:
-        print(f"错误：无法写入文件 {json_path}。原因: {e}")
+    if changes > 0:
+        print(f"--- 完成：{os.path.basename(json_path)}（{changes} 处替换）---\n")
+    else:
+        print(f"--- 未发现可替换标签：{os.path.basename(json_path)} ---\n")
+    return changes
 
 
 def main():
@@ -96,7 +88,7 @@ def main():
             input("\n按 Enter 退出...")
         return
 
-    found_files = False
+    json_paths: List[str] = []
     for filename in filenames:
         base_name, extension = os.path.splitext(filename)
         if extension.lower() in image_exts:
@@ -104,13 +96,16 @@ def main():
             json_path = os.path.join(work_dir, json_filename)
 
             if os.path.exists(json_path):
-                found_files = True
-                revert_json_file(json_path, mapping)
+                json_paths.append(json_path)
             else:
                 print(f"未找到与图片 '{filename}' 对应的 JSON：'{json_filename}'，已跳过。\n")
 
-    if not found_files:
+    if not json_paths:
         print("未在目标目录中找到任何匹配的图片和 JSON 文件对。")
+    else:
+        transform = ("标签替换", partial(revert_json_file, labels_to_revert=mapping))
+        summary = run_bulk(json_paths, transform)
+        print(f"共修改 {summary['written']} 个文件，未变化 {summary['unchanged']} 个，失败 {summary['error']} 个。")
 
     if PAUSE_ON_EXIT:
         input("\n处理完成。按 Enter 退出...")
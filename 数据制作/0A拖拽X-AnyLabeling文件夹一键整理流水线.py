@@ -0,0 +1,130 @@
+import os
+import sys
+import importlib.util
+
+from anylabeling_bulk import collect_json_files, run_bulk, print_stage_report
+
+# ==============================================================================
+# ======================== 配置区: 流水线阶段 ========================
+# ==============================================================================
+
+# 按顺序执行的处理阶段：(显示名称, 同目录下的脚本文件名, 脚本中的处理函数名)
+# - 每个阶段仍然使用对应脚本顶部自己的配置区（EXPAND_VALUES / LABEL_TO_CLASS / SPATIAL_SORT_MODE 等），
+#   要调整规则请直接修改对应脚本
+# - 不需要的阶段注释掉即可，也可以调整顺序
+# - 每个 JSON 只读一次、在内存中依次执行全部阶段、最后只写一次（内容没变则不写）
+PIPELINE_STAGES = [
+    ("区域合并", "0A双击合并全部拖着执行部分x-Anylabeling区域合并.py", "merge_transform"),
+    ("区域扩展缩小", "0A双击修改全部拖着执行部分x-Anylabeling区域扩展缩小优化CMD显示细节.py", "process_file"),
+    ("标签排序", "0A双击x-Anylabelingjson标签排序排序依据.py", "sort_transform"),
+    ("双色标签", "0A双击修改X-AnyLabeling双色标签.py", "process_json_file"),
+]
+
+# 是否打印各阶段的逐文件详细输出（文件很多时建议关闭，只显示进度、错误和最终统计）
+SHOW_STAGE_OUTPUT = False
+
+# 关闭详细输出时，每处理多少个文件打印一次进度
+PROGRESS_EVERY = 500
+
+# 多进程设置（0 表示使用全部 CPU 核心）
+ENABLE_MULTIPROCESSING = True
+MAX_PROCESSES = 0
+# --- 配置区结束 ---
+# ==============================================================================
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_loaded_modules = {}
+
+
+def load_stage_module(script_name):
+    """按文件路径加载阶段脚本（文件名是中文，不能直接 import）。每个进程只加载一次。"""
+    module = _loaded_modules.get(script_name)
+    if module is None:
+        path = os.path.join(SCRIPT_DIR, script_name)
+        module_name = f"pipeline_stage_{len(_loaded_modules)}"
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _loaded_modules[script_name] = module
+    return module
+
+
+class StageTransform:
+    """
+    阶段处理函数的包装：只保存脚本名和函数名，在子进程中第一次调用时再加载脚本。
+    这样 Windows 的多进程（spawn 方式）也能正常传递，不需要 pickle 动态加载的模块。
+    """
+
+    def __init__(self, script_name, func_name):
+        self.script_name = script_name
+        self.func_name = func_name
+
+    def __call__(self, data, file_path):
+        return getattr(load_stage_module(self.script_name), self.func_name)(data, file_path)
+
+
+def build_pipeline():
+    """检查每个阶段的脚本和函数是否存在，返回 run_bulk 使用的 [(名称, transform), ...]。"""
+    transforms = []
+    for name, script_name, func_name in PIPELINE_STAGES:
+        if not os.path.isfile(os.path.join(SCRIPT_DIR, script_name)):
+            raise FileNotFoundError(f"阶段 '{name}' 的脚本不存在: {script_name}")
+        if not callable(getattr(load_stage_module(script_name), func_name, None)):
+            raise AttributeError(f"阶段 '{name}' 的脚本中没有处理函数: {func_name}")
+        transforms.append((name, StageTransform(script_name, func_name)))
+    return transforms
+
+
+def main():
+    print("=" * 60)
+    print("X-AnyLabeling 一键整理流水线（每个文件只读写一次）")
+    for i, (name, script_name, func_name) in enumerate(PIPELINE_STAGES, start=1):
+        print(f"  {i}. {name}  <- {script_name}")
+    print("=" * 60 + "\n")
+
+    if not PIPELINE_STAGES:
+        print("未配置任何处理阶段，请检查 PIPELINE_STAGES。")
+        input("按 Enter 键退出...")
+        return
+    try:
+        transforms = build_pipeline()
+    except Exception as e:
+        print(f"错误: {e}")
+        input("按 Enter 键退出...")
+        return
+
+    if len(sys.argv) > 1:
+        print("进入 [拖拽模式]...")
+        files_to_process = collect_json_files(sys.argv[1:])
+    else:
+        print("进入 [双击模式]...")
+        print(f"扫描目录: {SCRIPT_DIR}")
+        files_to_process = [os.path.join(SCRIPT_DIR, f) for f in os.listdir(SCRIPT_DIR) if f.lower().endswith('.json')]
+
+    if not files_to_process:
+        print("\n未找到任何 .json 文件进行处理。")
+        input("按 Enter 键退出...")
+        return
+    print(f"\n找到 {len(files_to_process)} 个目标JSON文件，开始处理...\n")
+
+    done = [0]
+
+    def report(result):
+        done[0] += 1
+        if SHOW_STAGE_OUTPUT or result["status"] == "error":
+            print(result.get("output", ""), end="")
+        elif done[0] % PROGRESS_EVERY == 0:
+            print(f"  进度: {done[0]}/{len(files_to_process)}")
+
+    processes = (MAX_PROCESSES if MAX_PROCESSES > 0 else (os.cpu_count() or 1)) if ENABLE_MULTIPROCESSING else 1
+    summary = run_bulk(files_to_process, transforms, processes=processes, on_result=report)
+
+    print("\n" + "=" * 60)
+    print_stage_report(summary)
+    print("=" * 60)
+    input("按 Enter 键退出...")
+
+
+if __name__ == "__main__":
+    main()
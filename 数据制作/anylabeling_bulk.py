@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+X-AnyLabeling JSON 批量改写引擎 - 供 数据制作 目录下的 X-AnyLabeling 标注脚本共用
+(区域合并 / 区域扩展缩小 / 标签排序 / 双色标签 / 改回单色 / 自定义AB标签)
+
+功能:
+- 每个文件只读一次、只写一次: 多个 transform 按顺序在内存中依次执行 (可串联多个脚本的处理)
+- 文件列表流式分发到进程池, 每个文件的控制台输出在子进程中收集, 按文件顺序统一打印
+- 安装了 orjson 时用 orjson 解析/序列化 (输出格式仍为 indent=2、中文不转义, 仅浮点数的指数写法略有不同, 如 1e-6 / 1e-06),
+  否则使用标准库 json
+- 写回前比较新旧内容的哈希, 内容没变就不写 (不改动文件修改时间)
+- 原子写入: 先写同目录下的临时文件并 fsync, 再 os.replace 覆盖原文件, 中途崩溃不会留下写了一半的 JSON
+以上行为对所有调用 run_bulk 的脚本都相同, 脚本中不再重复说明, 只写各自的处理规则。
+
+transform 的约定:
+    def my_transform(data, file_path):
+        ...直接修改 data...
+        return 修改数量 (int, 返回 None 视为 0)
+    需要跳过当前文件时抛出 SkipFile("原因")。串联多个 transform 时只跳过抛出异常的这一阶段,
+    后面的阶段照常执行; 所有阶段都跳过时文件才算 "skipped"。transform 必须是模块级函数 (多进程需要能 pickle)。
+    没有需要修改的内容时返回 0 即可, 不要抛出 SkipFile。
+"""
+
+import os
+import io
+import json
+import time
+import hashlib
+import tempfile
+import contextlib
+from multiprocessing import Pool, cpu_count
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ======================= 默认配置 =======================
+ENABLE_MULTIPROCESSING = True
+MAX_PROCESSES = 0          # 0 表示使用全部 CPU 核心
+CHUNK_SIZE = 8             # 每次分发给子进程的文件数
+MIN_FILES_FOR_POOL = 8     # 文件数少于此值时直接在当前进程处理 (启动进程池本身有开销)
+
+JSON_BOM = b'\xef\xbb\xbf'
+
+
+class SkipFile(Exception):
+    """transform 抛出此异常表示跳过当前文件 (不写回), 异常信息会作为跳过原因打印。"""
+
+
+# ======================= JSON 读写 =======================
+
+def load_json_bytes(raw):
+    if raw.startswith(JSON_BOM):
+        raw = raw[len(JSON_BOM):]
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw.decode('utf-8'))
+
+
+def dump_json_bytes(data):
+    """序列化为 indent=2、中文不转义的 UTF-8 字节, 与各脚本原来的 json.dump(indent=2, ensure_ascii=False) 一致。"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+        except TypeError:
+            pass  # 非字符串键、超大整数等 orjson 不支持的内容, 退回标准库
+    return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+def content_hash(raw):
+    return hashlib.sha1(raw).hexdigest()
+
+
+def atomic_write_bytes(file_path, payload):
+    """先写同目录临时文件, 再用 os.replace 原子替换原文件 (同一磁盘分区内替换是原子的)。"""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(file_path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            # mkstemp 创建的文件权限是 0600, 保持与原文件一致
+            os.chmod(tmp_path, os.stat(file_path).st_mode & 0o7777)
+        except OSError:
+            pass
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+# ======================= 文件收集 =======================
+
+def collect_json_files(paths, verbose=False):
+    """把拖拽进来的文件/文件夹展开为去重、排序后的 .json 文件列表 (文件夹递归扫描)。"""
+    unique = set()
+    for p in paths:
+        p = p.strip('"')
+        if os.path.isfile(p) and p.lower().endswith('.json'):
+            unique.add(os.path.abspath(p))
+            if verbose:
+                print(f"  添加文件: {os.path.basename(p)}")
+        elif os.path.isdir(p):
+            if verbose:
+                print(f"  扫描文件夹: {p}")
+            for root, _, filenames in os.walk(p):
+                for fn in filenames:
+                    if fn.lower().endswith('.json'):
+                        unique.add(os.path.abspath(os.path.join(root, fn)))
+    return sorted(unique)
+
+
+# ======================= 单文件处理 =======================
+
+def _stage_name(transform):
+    if isinstance(transform, tuple):
+        return transform[0]
+    return transform.__name__
+
+
+def _stage_func(transform):
+    if isinstance(transform, tuple):
+        return transform[1]
+    return transform
+
+
+def process_one(file_path, transforms):
+    """
+    读取一次 -> 依次执行 transforms -> 内容有变化才原子写回。
+    返回结果字典:
+      status: 'written' / 'unchanged' / 'skipped' / 'error'
+      stages: [(名称, 修改数量, 耗时ms), ...]
+      hash:   写回 (或未变化) 后文件内容的 sha1
+    """
+    result = {"path": file_path, "status": "error", "stages": [], "hash": None, "message": ""}
+    name = os.path.basename(file_path)
+    try:
+        with open(file_path, 'rb') as f:
+            raw = f.read()
+        data = load_json_bytes(raw)
+    except Exception as e:
+        print(f"  - 错误: 读取文件 '{name}' 失败: {e}")
+        result["message"] = str(e)
+        return result
+
+    total_changes = 0
+    skipped_stages = 0
+    for transform in transforms:
+        stage_start = time.perf_counter()
+        try:
+            changes = _stage_func(transform)(data, file_path) or 0
+        except SkipFile as e:
+            # 只跳过这一阶段, 串联的其他阶段继续处理
+            if str(e):
+                prefix = f"{_stage_name(transform)}: " if len(transforms) > 1 else ""
+                print(f"  - 跳过: {name} ({prefix}{e})")
+            result["message"] = str(e)
+            skipped_stages += 1
+            continue
+        except Exception as e:
+            print(f"  - 错误: 处理文件 '{name}' 时失败 ({_stage_name(transform)}): {e}")
+            result["message"] = str(e)
+            return result
+        result["stages"].append((_stage_name(transform), changes, (time.perf_counter() - stage_start) * 1000))
+        total_changes += changes
+
+    if skipped_stages == len(transforms):
+        result["status"] = "skipped"
+        return result
+
+    old_hash = content_hash(raw)
+    if total_changes == 0:
+        result["status"], result["hash"] = "unchanged", old_hash
+        return result
+
+    payload = dump_json_bytes(data)
+    new_hash = content_hash(payload)
+    if new_hash == old_hash:
+        result["status"], result["hash"] = "unchanged", old_hash
+        return result
+    try:
+        atomic_write_bytes(file_path, payload)
+    except Exception as e:
+        print(f"  - 错误: 写入文件 '{name}' 失败: {e}")
+        result["message"] = str(e)
+        return result
+    result["status"], result["hash"] = "written", new_hash
+    return result
+
+
+# ======================= 批量处理 =======================
+
+_WORKER_TRANSFORMS = None
+
+
+def _init_worker(transforms):
+    global _WORKER_TRANSFORMS
+    _WORKER_TRANSFORMS = transforms
+
+
+def _run_captured(file_path, transforms):
+    """执行单个文件并收集它的全部控制台输出, 避免多个进程的打印互相穿插。"""
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        result = process_one(file_path, transforms)
+    result["output"] = buffer.getvalue()
+    return result
+
+
+def _worker(file_path):
+    return _run_captured(file_path, _WORKER_TRANSFORMS)
+
+
+def run_bulk(files, transforms, processes=None, on_result=None):
+    """
+    对 files 中的每个 JSON 执行 transforms (一个或多个, 按顺序串联), 返回汇总字典:
+      written / unchanged / skipped / error: 文件数
+      stages: {名称: [修改数量合计, 耗时ms合计]}
+      elapsed: 总耗时 (秒)
+    processes: None 使用模块默认配置, 1 强制单进程。
+    on_result: 每个文件处理完后的回调 (按文件顺序调用), 默认打印该文件的输出。
+    """
+    if callable(transforms) or isinstance(transforms, tuple):
+        transforms = [transforms]
+    transforms = list(transforms)
+    files = list(files)
+
+    if processes is None:
+        processes = (MAX_PROCESSES if MAX_PROCESSES > 0 else cpu_count()) if ENABLE_MULTIPROCESSING else 1
+    processes = max(1, min(processes, len(files)))
+
+    summary = {"written": 0, "unchanged": 0, "skipped": 0, "error": 0, "files": len(files),
+               "stages": {_stage_name(t): [0, 0.0] for t in transforms}, "elapsed": 0.0}
+    start = time.time()
+
+    def collect(result):
+        summary[result["status"]] += 1
+        for stage, changes, ms in result["stages"]:
+            summary["stages"][stage][0] += changes
+            summary["stages"][stage][1] += ms
+        if on_result is not None:
+            on_result(result)
+        elif result.get("output"):
+            print(result["output"], end="")
+
+    if processes > 1 and len(files) >= MIN_FILES_FOR_POOL:
+        print(f"多进程模式: 开启（{processes}个进程）\n")
+        with Pool(processes=processes, initializer=_init_worker, initargs=(transforms,)) as pool:
+            # imap 按文件顺序返回结果, 输出与单进程模式一致
+            for result in pool.imap(_worker, files, chunksize=CHUNK_SIZE):
+                collect(result)
+    else:
+        for file_path in files:
+            collect(_run_captured(file_path, transforms))
+
+    summary["elapsed"] = time.time() - start
+    return summary
+
+
+def print_stage_report(summary):
+    """打印各处理阶段的修改数量与耗时 (串联多个 transform 时使用)。"""
+    print(f"{'阶段':<16} {'修改数':>8} {'耗时(秒)':>10}")
+    for stage, (changes, ms) in summary["stages"].items():
+        print(f"{stage:<16} {changes:>8} {ms / 1000:>10.2f}")
+    print(f"文件: 写回 {summary['written']}，未变化 {summary['unchanged']}，"
+          f"跳过 {summary['skipped']}，失败 {summary['error']}，总耗时 {summary['elapsed']:.2f} 秒")
+
+
+if __name__ == '__main__':
+    print("本文件是 X-AnyLabeling 标注脚本共用的批量处理引擎，请运行具体的处理脚本。")
+    input("按 Enter 键退出...")
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+X-AnyLabeling 区域合并引擎 - 供 区域合并 / 区域合并包含文字合并 两个脚本共用
+
+合并规则 (标签黑名单、标签组、是否要求相同标签、标签合并策略、垂直/水平几何判定) 由各脚本顶部的配置区决定,
+脚本把配置打包成 MergeRules 传进来; 本模块只负责把框聚成簇, 生成新 shape 由脚本自己完成
+(普通合并只取外接矩形, 文字合并还要按阅读方向拼接 description)。
+
+聚类结果与原来的"每次从头扫描、合并第一对可合并框、再从头扫描"完全一致, 但不再每次从头扫描:
+为每个框记录排在它后面的第一个可合并框 next[k], 每次取 next 不为空且位置最靠前的框合并
+(即原实现下一次会找到的那一对), 合并后只更新受影响的框:
+  - 新框之前的框: 合并前它们都没有可合并对象, 只需判断能否与新框合并;
+  - 新框本身: 重新查找排在它后面的第一个可合并框;
+  - 原来 next 指向被删除框的那些框: 重新查找。
+查找邻居时先用合并轴上的网格索引筛出间隙可能满足条件的框, 再用原来的规则精确判定。
+
+用法:
+    from region_merge import MergeRules, merge_clusters
+    clusters, merge_count = merge_clusters(shapes, "VERTICAL", rules)
+    for box, label, members in clusters:   # members: 簇内原始 shape 的下标 (升序), 只有 1 个时表示没有合并
+        ...
+"""
+
+import math
+import heapq
+
+# 合并轴索引的格子大小 (像素)。只影响速度, 不影响结果。
+MERGE_INDEX_CELL_SIZE = 64
+
+
+def get_bounding_box(shape):
+    """根据 shape['points'] 计算外接矩形 [x_min, y_min, x_max, y_max]。"""
+    points = shape['points']
+    x_coords = [p[0] for p in points]
+    y_coords = [p[1] for p in points]
+    return [min(x_coords), min(y_coords), max(x_coords), max(y_coords)]
+
+
+class MergeRules:
+    """一个脚本配置区中的合并规则 (标签规则 + 几何规则)。"""
+
+    def __init__(self, exclude_labels=(), use_specific_groups=False, specific_groups=(), require_same_label=True,
+                 label_strategy="FIRST", vertical_params=None, horizontal_params=None,
+                 allow_negative_gap=True, debug=False):
+        self.exclude_labels = set(exclude_labels)
+        self.use_specific_groups = use_specific_groups
+        self.specific_groups = [list(g) for g in specific_groups]
+        self.require_same_label = require_same_label
+        self.label_strategy = label_strategy
+        self.vertical_params = vertical_params or {}
+        self.horizontal_params = horizontal_params or {}
+        self.allow_negative_gap = allow_negative_gap
+        self.debug = debug
+
+    # ---------- 标签规则 ----------
+    def merge_group(self, label):
+        """label 所属的合并组编号; 未启用标签组或未命中任何组时返回 -1。"""
+        if not self.use_specific_groups:
+            return -1
+        for idx, group in enumerate(self.specific_groups):
+            if label in group:
+                return idx
+        return -1
+
+    def can_labels_merge(self, label1, label2):
+        """
+        仅进行标签层面的规则检查 (不包含几何关系):
+        1) 任一标签命中黑名单 -> 不允许合并
+        2) 启用"特定标签组"时: 仅当两标签处于同一组 -> 允许合并
+        3) 否则要求相同标签时: 两标签相同 -> 允许合并
+        4) 否则允许合并
+        """
+        if label1 in self.exclude_labels or label2 in self.exclude_labels:
+            return False
+        if self.use_specific_groups:
+            g1 = self.merge_group(label1)
+            g2 = self.merge_group(label2)
+            return g1 != -1 and g1 == g2
+        if self.require_same_label:
+            return label1 == label2
+        return True
+
+    def merge_labels(self, label1, label2):
+        """
+        按标签合并策略返回新标签:
+        - "FIRST": 第一个框的标签
+        - "COMBINE": 不同时使用 "label1+label2"
+        - "PREFER_NON_DEFAULT": 优先使用非默认/空标签
+        - "PREFER_SHORTER": 不同时取更短的标签
+        未知策略回退到第一个标签。
+        """
+        strategy = self.label_strategy
+        if strategy == "COMBINE":
+            return label1 if label1 == label2 else f"{label1}+{label2}"
+        if strategy == "PREFER_NON_DEFAULT":
+            default_labels = {"label", ""}
+            if label1 in default_labels and label2 not in default_labels:
+                return label2
+            if label2 in default_labels and label1 not in default_labels:
+                return label1
+            return label1
+        if strategy == "PREFER_SHORTER":
+            return label1 if len(label1) <= len(label2) else label2
+        return label1
+
+    # ---------- 几何规则 ----------
+    def _axis_can_merge(self, box1, box2, overlap_lo, overlap_hi, gap_lo, gap_hi, min_ratio, max_gap, eps, name):
+        """
+        重叠轴上的重叠比例 >= min_ratio (重叠长度 / 较短边长度 * 100%, 加 eps 容差),
+        且合并轴上的间隙 <= max_gap (不允许负间隙时还要求 >= 0)。
+        """
+        overlap = max(0.0, min(box1[overlap_hi], box2[overlap_hi]) - max(box1[overlap_lo], box2[overlap_lo]))
+        overlap_adj = max(0.0, overlap + eps)
+        length1 = max(0.0, box1[overlap_hi] - box1[overlap_lo])
+        length2 = max(0.0, box2[overlap_hi] - box2[overlap_lo])
+        overlap_ratio = (overlap_adj / max(1e-6, min(length1, length2))) * 100.0
+        # 间隙为负表示两个框在合并轴上已经重叠
+        gap = max(box1[gap_lo], box2[gap_lo]) - min(box1[gap_hi], box2[gap_hi])
+
+        if self.debug and name:
+            print(f"      {name}判定: overlap_w={overlap_ratio:.2f}%, gap={gap:.3f}")
+
+        if overlap_ratio < min_ratio:
+            return False
+        if self.allow_negative_gap:
+            return gap <= max_gap
+        return 0 <= gap <= max_gap
+
+    def can_merge(self, label1, box1, label2, box2, mode):
+        """先标签、后几何; box 为 [x_min, y_min, x_max, y_max]。"""
+        if not self.can_labels_merge(label1, label2):
+            if self.debug:
+                print(f"    跳过: 标签规则不允许 -> {label1} vs {label2}")
+            return False
+        if mode == "VERTICAL":
+            p = self.vertical_params
+            return self._axis_can_merge(box1, box2, 0, 2, 1, 3, p["min_width_overlap_ratio"],
+                                        p["max_vertical_gap"], p.get("overlap_epsilon", 0.0), "垂直")
+        p = self.horizontal_params
+        return self._axis_can_merge(box1, box2, 1, 3, 0, 2, p["min_height_overlap_ratio"],
+                                    p["max_horizontal_gap"], p.get("overlap_epsilon", 0.0), None)
+
+    def max_gap(self, mode):
+        if mode == "VERTICAL":
+            return self.vertical_params["max_vertical_gap"]
+        return self.horizontal_params["max_horizontal_gap"]
+
+
+class MergeAxisIndex:
+    """
+    合并轴上的一维网格索引 (垂直合并按 y 轴, 水平合并按 x 轴)。
+    每个框登记在它覆盖的所有格子里; 查询时只取出与 [lo, hi] 相交的格子中的框,
+    这样每个框只需要和合并轴上"够得着"的邻居做精确判定。
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def _cells(self, lo, hi):
+        return range(math.floor(lo / self.cell_size), math.floor(hi / self.cell_size) + 1)
+
+    def add(self, key, lo, hi):
+        for c in self._cells(lo, hi):
+            self.cells.setdefault(c, set()).add(key)
+
+    def remove(self, key, lo, hi):
+        for c in self._cells(lo, hi):
+            bucket = self.cells.get(c)
+            if bucket is not None:
+                bucket.discard(key)
+
+    def query(self, lo, hi):
+        found = set()
+        if lo > hi:
+            return found
+        for c in self._cells(lo, hi):
+            bucket = self.cells.get(c)
+            if bucket:
+                found |= bucket
+        return found
+
+
+def merge_clusters(shapes, mode, rules):
+    """
+    按 mode ("VERTICAL" / "HORIZONTAL") 把 shapes 合并到不动点, 不修改输入。
+    返回 (clusters, merge_count): clusters 按原顺序列出合并后剩下的每个框 (外接矩形, 标签, 成员下标列表)。
+    """
+    if mode == "VERTICAL":
+        lo_axis, hi_axis = 1, 3
+    else:
+        lo_axis, hi_axis = 0, 2
+    # 间隙 = max(两框起点) - min(两框终点) <= max_gap 的必要条件:
+    # 对方在合并轴上与 [自己起点 - max_gap, 自己终点 + max_gap] 相交 (多留 1 像素余量)
+    reach = rules.max_gap(mode) + 1
+    excluded = rules.exclude_labels
+
+    count = len(shapes)
+    boxes = [get_bounding_box(s) for s in shapes]
+    labels = [s.get('label', '') for s in shapes]
+    alive = [True] * count
+    members = [[k] for k in range(count)]  # 每个簇包含的原始框下标
+    nxt = [None] * count
+    pointed_by = {}  # key -> 所有 next 指向它的框
+    heap = []
+
+    index = MergeAxisIndex(MERGE_INDEX_CELL_SIZE)
+    for k in range(count):
+        # 黑名单标签永远不会参与合并, 标签也不会改变, 无需进索引
+        if labels[k] not in excluded:
+            index.add(k, boxes[k][lo_axis], boxes[k][hi_axis])
+
+    def neighbours(k, later):
+        box = boxes[k]
+        found = index.query(box[lo_axis] - reach, box[hi_axis] + reach)
+        return sorted(q for q in found if (q > k if later else q < k))
+
+    def check(p, q):
+        return rules.can_merge(labels[p], boxes[p], labels[q], boxes[q], mode)
+
+    def set_next(k, target):
+        old = nxt[k]
+        if old is not None:
+            pointed_by[old].discard(k)
+        nxt[k] = target
+        if target is not None:
+            pointed_by.setdefault(target, set()).add(k)
+            heapq.heappush(heap, k)
+
+    def find_next(k):
+        for q in neighbours(k, later=True):
+            if check(k, q):
+                return q
+        return None
+
+    for k in range(count):
+        if labels[k] not in excluded:
+            set_next(k, find_next(k))
+
+    merge_count = 0
+    while heap:
+        k = heapq.heappop(heap)
+        if not alive[k] or nxt[k] is None:
+            continue  # 过期的堆记录
+        m = nxt[k]
+        b1, b2 = boxes[k], boxes[m]
+        merged_box = [min(b1[0], b2[0]), min(b1[1], b2[1]), max(b1[2], b2[2]), max(b1[3], b2[3])]
+        new_label = rules.merge_labels(labels[k], labels[m])
+        if rules.debug:
+            print(f"    合并: '{labels[k]}' + '{labels[m]}' -> '{new_label}'")
+
+        # 删除 m, k 原地替换为合并后的框
+        index.remove(m, b2[lo_axis], b2[hi_axis])
+        index.remove(k, b1[lo_axis], b1[hi_axis])
+        alive[m] = False
+        set_next(m, None)
+        waiting = pointed_by.pop(m, set())
+        # 成员列表小的并入大的, 避免长簇被反复复制
+        if len(members[m]) > len(members[k]):
+            members[k], members[m] = members[m], members[k]
+        members[k].extend(members[m])
+        members[m] = None
+        boxes[k], labels[k] = merged_box, new_label
+        if new_label not in excluded:
+            index.add(k, merged_box[lo_axis], merged_box[hi_axis])
+        merge_count += 1
+
+        # 新框之前的框: 之前都没有可合并对象, 现在只可能与新框合并
+        for p in neighbours(k, later=False):
+            if check(p, k):
+                set_next(p, k)
+        # 新框本身以及原来指向 m 的框: 重新查找
+        nxt[k] = None
+        set_next(k, find_next(k))
+        for p in waiting:
+            if p != k and alive[p]:
+                nxt[p] = None
+                set_next(p, find_next(p))
+
+    clusters = [(boxes[k], labels[k], sorted(members[k])) for k in range(count) if alive[k]]
+    return clusters, merge_count
@@ -7,6 +7,13 @@ from datetime import datetime
 from pathlib import Path
 from PIL import Image
 
+try:
+    from image_dims import image_sizes
+except ImportError:
+    # 图片尺寸索引与其他脚本共用，放在 漫画软件 目录；脚本被复制到别处时请把 image_dims.py 一起复制过去
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "漫画软件"))
+    from image_dims import image_sizes
+
 
 IMAGE_EXTENSIONS = {
     ".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff", ".avif", ".jxl"
@@ -226,20 +233,28 @@ def transfer_file(source_path, target_path):
         shutil.copy2(str(source_path), str(target_path))
 
 
-def get_orientation_name(image_path):
-    with Image.open(image_path) as image:
-        width, height = image.size
+def get_orientation_name(image_path, size=None):
+    # size 为预先读取的 (宽, 高)；没有时 (文件头无法识别) 再用 PIL 打开
+    if size is None:
+        with Image.open(image_path) as image:
+            size = image.size
+    width, height = size
     return "横图" if width >= height else "竖图"
 
 
-def prepare_orientation_layout(chunk_names, image_map):
+def read_image_sizes(names, image_map):
+    tracker = ProgressTracker(len(names), "正在读取图片尺寸")
+    return image_sizes((str(image_map[name]) for name in names), on_progress=tracker.advance)
+
+
+def prepare_orientation_layout(chunk_names, image_map, sizes):
     orientation_groups = {
         "横图": [],
         "竖图": [],
     }
 
     for name in chunk_names:
-        orientation = get_orientation_name(image_map[name])
+        orientation = get_orientation_name(image_map[name], sizes.get(str(image_map[name])))
         orientation_groups[orientation].append(name)
 
     orientation_dirs = {}
@@ -371,6 +386,11 @@ def split_pairs(image_dir, label_dir, image_files, txt_files, group_size, output
         log("\n没有找到同名的图片和 TXT，本次只生成了补漏文件夹。")
         return
 
+    if ENABLE_ORIENTATION_SPLIT:
+        # 一次性读取全部图片的宽高 (只读文件头，多线程 + 尺寸索引)，不再在分组时逐张打开
+        log("\n正在读取图片尺寸...")
+        sizes = read_image_sizes(matched_names, image_map)
+
     log("\n开始处理正常配对的数据...")
     overall_tracker = ProgressTracker(len(matched_names), "正在处理正常配对数据")
 
@@ -380,7 +400,7 @@ def split_pairs(image_dir, label_dir, image_files, txt_files, group_size, output
         chunk_dir = output_root / str(end_number)
         chunk_dir.mkdir(parents=True, exist_ok=True)
         if ENABLE_ORIENTATION_SPLIT:
-            orientation_groups, orientation_dirs = prepare_orientation_layout(chunk_names, image_map)
+            orientation_groups, orientation_dirs = prepare_orientation_layout(chunk_names, image_map, sizes)
 
             for folder_name in orientation_dirs.values():
                 (chunk_dir / folder_name).mkdir(parents=True, exist_ok=True)
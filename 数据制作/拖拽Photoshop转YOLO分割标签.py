@@ -1,36 +1,193 @@
 ﻿import sys
 import os
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
 
 DEFAULT_CLASS_ID = 0
+
+# 曲线细分方式：True 按曲线弯曲程度自适应决定细分段数（平直的曲线只需很少的点）；False 每段曲线固定细分 BEZIER_CURVE_STEPS 段
+ADAPTIVE_BEZIER = True
 BEZIER_CURVE_STEPS = 15
+# 自适应细分时，折线与真实曲线之间允许的最大偏差（像素）
+BEZIER_FLATNESS = 0.5
+# 自适应细分时每段曲线最多细分的段数
+BEZIER_MAX_STEPS = 64
+
+# 多边形简化（Douglas-Peucker）容差（像素），删去偏离轮廓不超过该值的点；0 表示不简化
+SIMPLIFY_TOLERANCE = 1.0
+
+# 多进程设置（0 表示使用全部 CPU 核心）
+ENABLE_MULTIPROCESSING = True
+MAX_PROCESSES = 0
+# 文件数少于此值时直接在当前进程处理（启动进程池本身有开销）
+MIN_FILES_FOR_POOL = 8
+
+def bezier_steps(curves):
+    """
+    每段三次曲线需要的细分段数 (Wang 公式): 按控制点的二阶差分估算曲线弯曲程度,
+    保证折线与曲线的偏差不超过 BEZIER_FLATNESS。curves 形状为 (n, 4, 2)。
+    """
+    if not ADAPTIVE_BEZIER:
+        return np.full(len(curves), BEZIER_CURVE_STEPS, dtype=np.int64)
+    d = curves[:, :2] - 2 * curves[:, 1:3] + curves[:, 2:]
+    m = np.sqrt((d ** 2).sum(axis=2)).max(axis=1)
+    steps = np.ceil(np.sqrt(0.75 * m / BEZIER_FLATNESS))
+    return np.clip(steps, 1, BEZIER_MAX_STEPS).astype(np.int64)
+
+def flatten_paths(paths):
+    """
+    把一个文件中的全部路径展开为折线, 所有曲线一次性向量化求值。
+    paths 中每条路径为 (起点, 段列表), 直线段为 (x, y), 曲线段为 (x1, y1, x2, y2, x3, y3)。
+    返回 (points, bounds): 第 i 条路径的顶点为 points[bounds[i]:bounds[i + 1]]。
+    """
+    # 每条路径的起点也记作一项 "直线段", 这样每段曲线的起点都是上一项的终点
+    ends, is_curve, controls, path_starts = [], [], [], []
+    for start, segments in paths:
+        path_starts.append(len(ends))
+        ends.append(start)
+        is_curve.append(False)
+        for seg in segments:
+            ends.append(seg[-2:])
+            if len(seg) == 6:
+                is_curve.append(True)
+                controls.append(seg[:4])
+            else:
+                is_curve.append(False)
+    ends = np.array(ends, dtype=np.float64).reshape(-1, 2)
+    is_curve = np.array(is_curve, dtype=bool)
+    counts = np.ones(len(ends), dtype=np.int64)
+
+    curve_idx = np.flatnonzero(is_curve)
+    if len(curve_idx):
+        curves = np.empty((len(curve_idx), 4, 2), dtype=np.float64)
+        curves[:, 0] = ends[curve_idx - 1]
+        curves[:, 1:3] = np.array(controls, dtype=np.float64).reshape(-1, 2, 2)
+        curves[:, 3] = ends[curve_idx]
+        steps = bezier_steps(curves)
+        counts[curve_idx] = steps
+
+    offsets = np.cumsum(counts) - counts
+    points = np.empty((int(counts.sum()), 2), dtype=np.float64)
+    line_idx = np.flatnonzero(~is_curve)
+    points[offsets[line_idx]] = ends[line_idx]
+    if len(curve_idx):
+        # 曲线段在 t = 1/n, 2/n, ..., 1 处取点
+        owner = np.repeat(np.arange(len(curve_idx)), steps)
+        j = np.arange(len(owner)) - np.repeat(np.cumsum(steps) - steps, steps)
+        t = ((j + 1) / steps[owner])[:, None]
+        u = 1.0 - t
+        c = curves[owner]
+        points[np.repeat(offsets[curve_idx], steps) + j] = (
+            u ** 3 * c[:, 0] + 3 * u ** 2 * t * c[:, 1] + 3 * u * t ** 2 * c[:, 2] + t ** 3 * c[:, 3]
+        )
+    bounds = np.append(offsets[path_starts], len(points)) if paths else np.zeros(1, dtype=np.int64)
+    return points, bounds
 
-def cubic_bezier(p0, p1, p2, p3, t):
-    x = (1 - t) ** 3 * p0[0] + 3 * (1 - t) ** 2 * t * p1[0] + 3 * (1 - t) * t ** 2 * p2[0] + t ** 3 * p3[0]
-    y = (1 - t) ** 3 * p0[1] + 3 * (1 - t) ** 2 * t * p1[1] + 3 * (1 - t) * t ** 2 * p2[1] + t ** 3 * p3[1]
-    return (x, y)
+def simplify_paths(points, bounds, tolerance):
+    """
+    Douglas-Peucker 简化, 返回要保留的顶点掩码 (每条路径保留首尾点)。
+    逐层处理: 同一层所有路径的所有待分割区间一起向量化计算, 循环次数只与分割深度有关。
+    """
+    if tolerance <= 0:
+        return np.ones(len(points), dtype=bool)
+    keep = np.zeros(len(points), dtype=bool)
+    first, last = bounds[:-1], bounds[1:] - 1
+    keep[first] = keep[last] = True
+    while True:
+        sel = last - first >= 2
+        first, last = first[sel], last[sel]
+        if not len(first):
+            break
+        inner = last - first - 1
+        seg_starts = np.cumsum(inner) - inner
+        owner = np.repeat(np.arange(len(first)), inner)
+        idx = np.arange(len(owner)) - seg_starts[owner] + first[owner] + 1
+        a, ab = points[first][owner], (points[last] - points[first])[owner]
+        d = points[idx] - a
+        length = np.hypot(ab[:, 0], ab[:, 1])
+        degenerate = length == 0
+        # 点到弦所在直线的距离; 首尾重合 (闭合路径) 时取点到该点的距离
+        dist = np.where(degenerate, np.hypot(d[:, 0], d[:, 1]),
+                        np.abs(ab[:, 0] * d[:, 1] - ab[:, 1] * d[:, 0]) / np.where(degenerate, 1.0, length))
+        seg_max = np.maximum.reduceat(dist, seg_starts)
+        hit = np.flatnonzero(dist == seg_max[owner])
+        _, first_hit = np.unique(owner[hit], return_index=True)
+        split = seg_max > tolerance
+        mid = idx[hit[first_hit]][split]
+        keep[mid] = True
+        first, last = np.concatenate([first[split], mid]), np.concatenate([mid, last[split]])
+    return keep
 
 def parse_ai_file(file_path):
-    bbox_found = False
-    llx, lly, urx, ury = 0, 0, 0, 0
+    """
+    单遍流式读取 .ai 文件: 同时查找 BoundingBox 并收集 *u ... *U 中的路径 (坐标换算要等到读完才用到边界框)。
+    返回的每条路径为 (起点, 段列表); fixed_points 为固定细分 BEZIER_CURVE_STEPS 段时的顶点数 (用于统计)。
+    """
+    bbox = None
     paths = []
-    current_path = []
+    start, segments = None, []
+    fixed_points = 0
+
+    def finish_path():
+        nonlocal start, segments, fixed_points
+        if start is not None:
+            paths.append((start, segments))
+            fixed_points += 1 + sum(BEZIER_CURVE_STEPS if len(seg) == 6 else 1 for seg in segments)
+        start, segments = None, []
 
+    in_path_block = False
     with open(file_path, 'r', encoding='latin-1', errors='ignore') as f:
-        lines = f.readlines()
+        for line in f:
+            if bbox is None and (line.startswith('%%HiResBoundingBox:') or line.startswith('%%BoundingBox:')):
+                try:
+                    parts = line.split()
+                    bbox = tuple(map(float, parts[1:5]))
+                    if len(bbox) < 4:
+                        bbox = None
+                except ValueError:
+                    bbox = None
+                continue
 
-    for line in lines:
-        if line.startswith('%%HiResBoundingBox:') or line.startswith('%%BoundingBox:'):
-            try:
-                parts = line.split()
-                llx, lly, urx, ury = map(float, parts[1:5])
-                bbox_found = True
-                break
-            except:
+            line = line.strip()
+            if line == '*u':
+                in_path_block = True
+                continue
+            if line == '*U':
+                in_path_block = False
+                finish_path()
                 continue
 
-    if not bbox_found:
-        raise ValueError("未找到 BoundingBox")
+            if in_path_block:
+                parts = line.split()
+                if not parts:
+                    continue
+                command = parts[-1]
+                try:
+                    if command == 'm':
+                        point = (float(parts[0]), float(parts[1]))
+                        finish_path()
+                        start = point
+                    elif command == 'C':
+                        if start is None:
+                            continue
+                        segments.append(tuple(float(v) for v in parts[:6]))
+                    elif command == 'L':
+                        point = (float(parts[0]), float(parts[1]))
+                        if start is None:
+                            start = point
+                        else:
+                            segments.append(point)
+                    elif command == 'n':
+                        finish_path()
+                except (ValueError, IndexError):
+                    continue
 
+    finish_path()
+
+    if bbox is None:
+        raise ValueError("未找到 BoundingBox")
+    llx, lly, urx, ury = bbox
     width = urx - llx
     height = ury - lly
     if width <= 0 or height <= 0:
@@ -38,85 +195,36 @@ def parse_ai_file(file_path):
 
     target_width = width
     target_height = height
-
-    in_path_block = False
-    for line in lines:
-        line = line.strip()
-        if line == '*u':
-            in_path_block = True
-            continue
-        if line == '*U':
-            in_path_block = False
-            if current_path:
-                paths.append(current_path)
-            current_path = []
-            continue
-
-        if in_path_block:
-            parts = line.split()
-            if not parts:
-                continue
-            command = parts[-1]
-            try:
-                if command == 'm':
-                    if current_path:
-                        paths.append(current_path)
-                    current_path = [(float(parts[0]), float(parts[1]))]
-                elif command == 'C':
-                    if not current_path:
-                        continue
-                    p0 = current_path[-1]
-                    p1 = (float(parts[0]), float(parts[1]))
-                    p2 = (float(parts[2]), float(parts[3]))
-                    p3 = (float(parts[4]), float(parts[5]))
-                    for i in range(1, BEZIER_CURVE_STEPS + 1):
-                        t = i / float(BEZIER_CURVE_STEPS)
-                        current_path.append(cubic_bezier(p0, p1, p2, p3, t))
-                elif command == 'L':
-                    current_path.append((float(parts[0]), float(parts[1])))
-                elif command == 'n':
-                    if current_path:
-                        paths.append(current_path)
-                    current_path = []
-            except:
-                continue
-
-    if current_path:
-        paths.append(current_path)
-
-    return paths, llx, lly, width, height, target_width, target_height
+    return paths, llx, lly, width, height, target_width, target_height, fixed_points
 
 def convert_to_yolo_format(paths, llx, lly, width, height, target_width, target_height, class_id):
-    yolo_lines = []
-    for path in paths:
-        if not path:
-            continue
-        normalized_points = []
-        for x, y in path:
-            x_pixel = (x - llx)
-            y_pixel = (y - lly)
-            x_norm = x_pixel / target_width
-            y_norm = 1.0 - (y_pixel / target_height)
-            x_norm = max(0.0, min(1.0, x_norm))
-            y_norm = max(0.0, min(1.0, y_norm))
-            normalized_points.append(f"{x_norm:.6f} {y_norm:.6f}")
-        yolo_lines.append(f"{class_id} " + " ".join(normalized_points))
-    return "\n".join(yolo_lines), len(yolo_lines)
-
-def process_ai_file(file_path, output_dir):
+    points, bounds = flatten_paths(paths)
+    keep = simplify_paths(points, bounds, SIMPLIFY_TOLERANCE)
+    stats = {"flattened": len(points), "simplified": int(keep.sum())}
+    kept_bounds = np.concatenate([[0], np.cumsum(keep)])[bounds].tolist()
+    points = points[keep]
+    x_norm = np.clip((points[:, 0] - llx) / target_width, 0.0, 1.0)
+    y_norm = np.clip(1.0 - (points[:, 1] - lly) / target_height, 0.0, 1.0)
+    normalized_points = [f"{x:.6f} {y:.6f}" for x, y in zip(x_norm.tolist(), y_norm.tolist())]
+    yolo_lines = [f"{class_id} " + " ".join(normalized_points[kept_bounds[i]:kept_bounds[i + 1]])
+                  for i in range(len(paths))]
+    return "\n".join(yolo_lines), len(yolo_lines), stats
+
+def process_ai_file(task):
+    file_path, output_dir = task
     try:
-        paths, llx, lly, width, height, target_width, target_height = parse_ai_file(file_path)
-        yolo_data, label_count = convert_to_yolo_format(
+        paths, llx, lly, width, height, target_width, target_height, fixed_points = parse_ai_file(file_path)
+        yolo_data, label_count, stats = convert_to_yolo_format(
             paths, llx, lly, width, height, target_width, target_height, DEFAULT_CLASS_ID
         )
         base_name = os.path.splitext(os.path.basename(file_path))[0] + ".txt"
         output_path = os.path.join(output_dir, base_name)
         with open(output_path, 'w', encoding='utf-8') as f:
             f.write(yolo_data)
-        return label_count
+        stats["fixed"] = fixed_points
+        return file_path, label_count, stats, None
     except Exception as e:
-        print(f"❌ 跳过: {file_path} ({e})")
-        return 0
+        return file_path, 0, None, e
 
 def collect_ai_files(paths):
     ai_files = []
@@ -130,6 +238,16 @@ def collect_ai_files(paths):
                         ai_files.append(os.path.join(root, f))
     return ai_files
 
+def iter_results(ai_files, output_dir):
+    tasks = [(file_path, output_dir) for file_path in ai_files]
+    processes = (MAX_PROCESSES if MAX_PROCESSES > 0 else cpu_count()) if ENABLE_MULTIPROCESSING else 1
+    if processes > 1 and len(tasks) >= MIN_FILES_FOR_POOL:
+        with Pool(processes=processes) as pool:
+            yield from pool.imap_unordered(process_ai_file, tasks, chunksize=4)
+    else:
+        for task in tasks:
+            yield process_ai_file(task)
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("请将 .ai 文件或文件夹拖放到此脚本上。")
@@ -143,11 +261,21 @@ if __name__ == "__main__":
     print(f"共检测到 {len(ai_files)} 个 .ai 文件，开始转换...")
 
     total_labels = 0
-    for file_path in ai_files:
-        label_count = process_ai_file(file_path, output_dir)
+    totals = {"fixed": 0, "flattened": 0, "simplified": 0}
+    for file_path, label_count, stats, error in iter_results(ai_files, output_dir):
+        if error is not None:
+            print(f"❌ 跳过: {file_path} ({error})")
+            continue
         total_labels += label_count
+        for key in totals:
+            totals[key] += stats[key]
 
     print(f"\n✅ 全部转换完成，共生成标签 {total_labels} 个，处理文件 {len(ai_files)} 个。")
+    if totals["fixed"]:
+        print(f"多边形顶点数: 固定 {BEZIER_CURVE_STEPS} 段细分 {totals['fixed']} 个"
+              f" -> {'自适应细分' if ADAPTIVE_BEZIER else '细分'} {totals['flattened']} 个"
+              f" -> 简化后 {totals['simplified']} 个"
+              f"（减少 {100.0 * (1 - totals['simplified'] / totals['fixed']):.1f}%）")
 
     if os.name == 'nt':
         input("按 Enter 键退出...")
@@ -1,7 +1,15 @@
 ﻿import os
 import sys
-import json
-import copy
+import time
+
+try:
+    from anylabeling_bulk import SkipFile, collect_json_files, run_bulk
+    from region_merge import MergeRules, get_bounding_box, merge_clusters
+except ImportError:
+    # 批量读写引擎和区域合并引擎与 数据制作 目录下的区域合并脚本共用；脚本被复制到别处时请把这两个文件一起复制过去
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "数据制作"))
+    from anylabeling_bulk import SkipFile, collect_json_files, run_bulk
+    from region_merge import MergeRules, get_bounding_box, merge_clusters
 
 # ==============================================================================
 # ======================== 配置区: 在这里设置你的区域合并规则 ========================
@@ -81,192 +89,96 @@ ADVANCED_MERGE_OPTIONS = {
 # ==============================================================================
 
 
-def get_bounding_box(shape):
-    points = shape['points']
-    x_coords = [p[0] for p in points]
-    y_coords = [p[1] for p in points]
-    return [min(x_coords), min(y_coords), max(x_coords), max(y_coords)]
-
-def get_merge_group_for_label(label):
-    if not USE_SPECIFIC_MERGE_GROUPS:
-        return -1
-    for idx, group in enumerate(SPECIFIC_MERGE_GROUPS):
-        if label in group:
-            return idx
-    return -1
-
-def can_labels_merge(label1, label2):
-    if label1 in LABELS_TO_EXCLUDE_FROM_MERGE or label2 in LABELS_TO_EXCLUDE_FROM_MERGE:
-        return False
-    if USE_SPECIFIC_MERGE_GROUPS:
-        g1 = get_merge_group_for_label(label1)
-        g2 = get_merge_group_for_label(label2)
-        return g1 != -1 and g1 == g2
-    if REQUIRE_SAME_LABEL:
-        return label1 == label2
-    return True
-
-def merge_labels(label1, label2, strategy):
-    if strategy == "FIRST":
-        return label1
-    elif strategy == "COMBINE":
-        return label1 if label1 == label2 else f"{label1}+{label2}"
-    elif strategy == "PREFER_NON_DEFAULT":
-        default_labels = {"label", ""}
-        if label1 in default_labels and label2 not in default_labels: return label2
-        if label2 in default_labels and label1 not in default_labels: return label1
-        return label1
-    elif strategy == "PREFER_SHORTER":
-        return label1 if len(label1) <= len(label2) else label2
-    return label1
-
-def create_shape_from_box(box, shape1, shape2):
+def merge_rules():
+    """把配置区的合并规则打包给 region_merge 引擎（每次调用时读取，运行中修改配置同样生效）。"""
+    return MergeRules(
+        exclude_labels=LABELS_TO_EXCLUDE_FROM_MERGE,
+        use_specific_groups=USE_SPECIFIC_MERGE_GROUPS,
+        specific_groups=SPECIFIC_MERGE_GROUPS,
+        require_same_label=REQUIRE_SAME_LABEL,
+        label_strategy=LABEL_MERGE_STRATEGY,
+        vertical_params=VERTICAL_MERGE_PARAMS,
+        horizontal_params=HORIZONTAL_MERGE_PARAMS,
+        allow_negative_gap=ADVANCED_MERGE_OPTIONS["allow_negative_gap"],
+        debug=ADVANCED_MERGE_OPTIONS["debug_mode"],
+    )
+
+def reading_order_key(box):
+    """
+    返回按 TEXT_READING_DIRECTION 排序时使用的键（box 为 [x_min, y_min, x_max, y_max]）。
+    - VERTICAL_RTL: x_min 越大（越靠右）越先读，同一列再从上到下
+    - HORIZONTAL_TTB: y_min 越小（越靠上）越先读，同一行再从左到右
+    """
+    if TEXT_READING_DIRECTION == "VERTICAL_RTL":
+        return (-box[0], box[1])
+    if TEXT_READING_DIRECTION == "HORIZONTAL_TTB":
+        return (box[1], box[0])
+    return None
+
+
+def build_merged_shape(base_shape, box, label, members):
     """
-    根据合并后的外接矩形 box 与两个参考 shape 生成一个新的 shape。
-    - description 的合并逻辑现在由全局配置 TEXT_READING_DIRECTION 控制。
+    根据合并后的外接矩形 box 生成新的 shape（以 base_shape 为模板，不修改原 shape）。
+    members 为整个簇的 (外接矩形, shape) 列表：description 的合并不再依赖两两合并的先后顺序，
+    而是把簇内所有成员按 TEXT_READING_DIRECTION 一次排好序后，用对应分隔符一次性拼接。
     """
-    new_shape = copy.deepcopy(shape1)
+    new_shape = dict(base_shape)
     x_min, y_min, x_max, y_max = box
     new_shape['points'] = [[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]]
-    new_shape['label'] = merge_labels(shape1.get('label', ''), shape2.get('label', ''), LABEL_MERGE_STRATEGY)
+    new_shape['label'] = label
 
-    # ======================== 重构: 根据阅读方向合并 description 文本 ========================
     if MERGE_DESCRIPTIONS:
-        desc1 = shape1.get('description', '')
-        desc2 = shape2.get('description', '')
-
-        if desc1 and desc2:
-            merged_description = ""
+        if reading_order_key(box) is not None:
+            # sorted 是稳定排序，位置完全相同的框保持原来的先后顺序
+            members = sorted(members, key=lambda m: reading_order_key(m[0]))
+        texts = [shape.get('description', '') for _, shape in members]
+        texts = [t for t in texts if t]
+        if texts:
             separator = DESCRIPTION_SEPARATOR.get(TEXT_READING_DIRECTION, "")
-            b1 = get_bounding_box(shape1)
-            b2 = get_bounding_box(shape2)
-
-            if TEXT_READING_DIRECTION == "VERTICAL_RTL":
-                # 竖排模式：按从右到左的顺序拼接文本
-                # b[0] 是 x_min，值越大表示框越靠右
-                if b1[0] > b2[0]: # shape1 在右边, shape2 在左边
-                    merged_description = desc1 + separator + desc2
-                else: # shape2 在右边, shape1 在左边
-                    merged_description = desc2 + separator + desc1
-            
-            elif TEXT_READING_DIRECTION == "HORIZONTAL_TTB":
-                # 横排模式：按从上到下的顺序拼接文本
-                # b[1] 是 y_min, 值越小表示框越靠上
-                if b1[1] < b2[1]: # shape1 在上面, shape2 在下面
-                    merged_description = desc1 + separator + desc2
-                else: # shape2 在上面, shape1 在下面
-                    merged_description = desc2 + separator + desc1
-            
-            else:
-                # 未知模式，默认拼接并给出提示
-                print(f"警告: 未知的 TEXT_READING_DIRECTION '{TEXT_READING_DIRECTION}'，将执行默认拼接。")
-                merged_description = desc1 + desc2
-
-            new_shape['description'] = merged_description
-        
-        elif desc1 and not desc2:
-            new_shape['description'] = desc1
-        elif desc2 and not desc1:
-            new_shape['description'] = desc2
-    # ======================== 重构逻辑结束 ========================
+            new_shape['description'] = separator.join(texts)
 
     return new_shape
 
-def vertical_can_merge(box1, box2, params):
-    eps = params.get("overlap_epsilon", 0.0)
-    overlap_x = max(0.0, min(box1[2], box2[2]) - max(box1[0], box2[0]))
-    overlap_x_adj = max(0.0, overlap_x + eps)
-    width1 = max(0.0, box1[2] - box1[0])
-    width2 = max(0.0, box2[2] - box2[0])
-    min_width = max(1e-6, min(width1, width2))
-    overlap_ratio_w = (overlap_x_adj / min_width) * 100.0
-    vertical_gap = max(box1[1], box2[1]) - min(box1[3], box2[3])
-
-    if ADVANCED_MERGE_OPTIONS["debug_mode"]:
-        print(f"      垂直判定: overlap_w={overlap_ratio_w:.2f}%, gap={vertical_gap:.3f}")
-
-    if overlap_ratio_w < params["min_width_overlap_ratio"]:
-        return False
-
-    if ADVANCED_MERGE_OPTIONS["allow_negative_gap"]:
-        return vertical_gap <= params["max_vertical_gap"]
-    else:
-        return 0 <= vertical_gap <= params["max_vertical_gap"]
 
-def can_merge_shapes(shape1, shape2, mode, params):
-    if not can_labels_merge(shape1.get('label', ''), shape2.get('label', '')):
+def perform_merge(shapes, mode):
+    """
+    先聚类、后拼接文本：
+      1) 聚类：由 region_merge.merge_clusters 完成，几何合并结果与原来的“每次从头扫描、合并第一对可合并框”完全一致
+      2) 拼接：每个簇只在最后按阅读方向排序一次并一次性拼接 description，
+         文本顺序与合并的先后顺序无关，长文本也不会被反复复制。
+    返回新的 shapes 列表，不修改输入。
+    """
+    clusters, merge_count = merge_clusters(shapes, mode, merge_rules())
+    result = []
+    for box, label, members in clusters:
+        if len(members) == 1:
+            result.append(shapes[members[0]])
+            continue
+        cluster = [(get_bounding_box(shapes[i]), shapes[i]) for i in members]
+        new_shape = build_merged_shape(shapes[members[0]], box, label, cluster)
         if ADVANCED_MERGE_OPTIONS["debug_mode"]:
-            print(f"    跳过: 标签规则不允许 -> {shape1.get('label','')} vs {shape2.get('label','')}")
-        return False
-
-    box1, box2 = get_bounding_box(shape1), get_bounding_box(shape2)
-
-    if mode == "VERTICAL":
-        return vertical_can_merge(box1, box2, params)
-    else: # 水平模式逻辑 (此处未修改)
-        eps = HORIZONTAL_MERGE_PARAMS.get("overlap_epsilon", 0.0)
-        overlap_y = max(0.0, min(box1[3], box2[3]) - max(box1[1], box2[1]))
-        overlap_y_adj = max(0.0, overlap_y + eps)
-        height1 = max(0.0, box1[3] - box1[1])
-        height2 = max(0.0, box2[3] - box2[1])
-        min_height = max(1e-6, min(height1, height2))
-        overlap_ratio_h = (overlap_y_adj / min_height) * 100.0
-        horizontal_gap = max(box1[0], box2[0]) - min(box1[2], box2[2])
-        if overlap_ratio_h < HORIZONTAL_MERGE_PARAMS["min_height_overlap_ratio"]:
-            return False
-        if ADVANCED_MERGE_OPTIONS["allow_negative_gap"]:
-            return horizontal_gap <= HORIZONTAL_MERGE_PARAMS["max_horizontal_gap"]
-        else:
-            return 0 <= horizontal_gap <= HORIZONTAL_MERGE_PARAMS["max_horizontal_gap"]
+            print(f"      文本合并: {len(cluster)} 个框 -> '{new_shape.get('description', '')}'")
+        result.append(new_shape)
 
-def perform_merge(shapes, mode):
-    params = VERTICAL_MERGE_PARAMS if mode == "VERTICAL" else HORIZONTAL_MERGE_PARAMS
-    merge_count = 0
-    while True:
-        merged_in_pass = False
-        i = 0
-        while i < len(shapes):
-            j = i + 1
-            while j < len(shapes):
-                shape1, shape2 = shapes[i], shapes[j]
-                if can_merge_shapes(shape1, shape2, mode, params):
-                    b1, b2 = get_bounding_box(shape1), get_bounding_box(shape2)
-                    merged_box = [min(b1[0], b2[0]), min(b1[1], b2[1]), max(b1[2], b2[2]), max(b1[3], b2[3])]
-                    
-                    # <--- 修改: 调用 create_shape_from_box 时不再需要 merge_mode
-                    new_shape = create_shape_from_box(merged_box, shape1, shape2)
-
-                    shapes.pop(j)
-                    shapes.pop(i)
-                    shapes.insert(i, new_shape)
-                    merge_count += 1
-                    merged_in_pass = True
-                    if ADVANCED_MERGE_OPTIONS["debug_mode"]:
-                        print(f"    合并: '{shape1.get('label','')}' + '{shape2.get('label','')}' -> '{new_shape.get('label','')}'")
-                        print(f"      文本合并: '{shape1.get('description', '')}' + '{shape2.get('description', '')}' -> '{new_shape.get('description', '')}'")
-                    break
-                else:
-                    j += 1
-            if merged_in_pass: break
-            else: i += 1
-        if not merged_in_pass: break
     if merge_count > 0:
         print(f"    {mode} 合并: 执行了 {merge_count} 次合并操作")
-    return shapes
-
-def process_file(file_path):
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f: data = json.load(f)
-    except Exception as e:
-        print(f"  - 错误: 读取文件 '{os.path.basename(file_path)}' 时失败: {e}"); return False
-    if 'shapes' not in data or not data['shapes']:
-        print(f"  - 跳过: {os.path.basename(file_path)} (无标注框)"); return False
-    initial_shapes = copy.deepcopy(data['shapes'])
+    return result
+
+
+def merge_transform(data, file_path):
+    """
+    处理单个 JSON 文件的数据（读写由 anylabeling_bulk 统一完成）。
+    返回合并掉的框数；没有标注框或合并模式为 NONE 时返回 0（内容未变化，不会写回文件）。
+    """
+    if not isinstance(data, dict):
+        raise SkipFile("不支持的 JSON 结构")
+    if not data.get('shapes') or MERGE_MODE == "NONE":
+        return 0
+    initial_shapes = data['shapes']  # perform_merge 不修改输入，无需深拷贝
     initial_count = len(initial_shapes)
-    if MERGE_MODE == "NONE":
-        print(f"  - 跳过: {os.path.basename(file_path)} (合并模式为NONE)"); return False
     print(f"  - 处理: {os.path.basename(file_path)} (初始框数: {initial_count})")
 
+    merge_start = time.perf_counter()
     if MERGE_MODE == "VERTICAL":
         final_shapes = perform_merge(initial_shapes, "VERTICAL")
     elif MERGE_MODE == "HORIZONTAL":
@@ -278,14 +190,11 @@ def process_file(file_path):
         temp = perform_merge(initial_shapes, "HORIZONTAL")
         final_shapes = perform_merge(temp, "VERTICAL")
     else: final_shapes = initial_shapes
+    merge_ms = (time.perf_counter() - merge_start) * 1000
 
     data['shapes'] = final_shapes
-    try:
-        with open(file_path, 'w', encoding='utf-8') as f: json.dump(data, f, indent=2, ensure_ascii=False)
-        print(f"    完成: 框数 {initial_count} -> {len(final_shapes)} (减少了 {initial_count - len(final_shapes)} 个框)")
-        return True
-    except Exception as e:
-        print(f"  - 错误: 写入文件 '{os.path.basename(file_path)}' 时失败: {e}"); return False
+    print(f"    完成: 框数 {initial_count} -> {len(final_shapes)} (减少了 {initial_count - len(final_shapes)} 个框，合并耗时 {merge_ms:.1f} ms)")
+    return initial_count - len(final_shapes)
 
 def main():
     print("="*60)
@@ -294,19 +203,13 @@ def main():
     print(f"文本阅读方向 (内容): {TEXT_READING_DIRECTION}") # <--- 新增
     print(f"合并description文本: {'是' if MERGE_DESCRIPTIONS else '否'}")
     print(f"要求相同标签: {'是' if REQUIRE_SAME_LABEL else '否'}")
+    if MERGE_DESCRIPTIONS and reading_order_key([0, 0, 0, 0]) is None:
+        print(f"警告: 未知的 TEXT_READING_DIRECTION '{TEXT_READING_DIRECTION}'，将按原始顺序拼接文本。")
     print("="*60 + "\n")
 
-    files_to_process = []
     if len(sys.argv) > 1:
         print("进入 [拖拽模式]...")
-        unique_json_paths = set()
-        for path in sys.argv[1:]:
-            if os.path.isfile(path) and path.lower().endswith('.json'): unique_json_paths.add(os.path.abspath(path))
-            elif os.path.isdir(path):
-                for root, _, filenames in os.walk(path):
-                    for filename in filenames:
-                        if filename.lower().endswith('.json'): unique_json_paths.add(os.path.join(root, filename))
-        files_to_process = sorted(list(unique_json_paths))
+        files_to_process = collect_json_files(sys.argv[1:])
     else:
         print("进入 [双击模式]...")
         try: work_dir = os.path.dirname(os.path.abspath(__file__))
@@ -317,12 +220,10 @@ def main():
     if not files_to_process:
         print("\n未找到任何 .json 文件进行处理。"); input("按 Enter 键退出..."); return
     print(f"\n找到 {len(files_to_process)} 个目标JSON文件，开始处理...\n")
-    processed_count = 0
-    for file_path in files_to_process:
-        if file_path == os.path.abspath(__file__): continue
-        if process_file(file_path): processed_count += 1
-    print(f"\n处理完成！总共修改了 {processed_count} 个 JSON 文件。")
+    summary = run_bulk(files_to_process, merge_transform)
+    print(f"\n处理完成！总共修改了 {summary['written']} 个 JSON 文件（未变化 {summary['unchanged']} 个，"
+          f"失败 {summary['error']} 个），耗时 {summary['elapsed']:.2f} 秒。")
     input("按 Enter 键退出...")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -2,6 +2,11 @@
 import os
 import json
 
+from json_stream import rewrite_project
+
+# 输出紧凑格式（无缩进换行，文件更小、写得更快；ImageTrans 读取不受影响）
+COMPACT_OUTPUT = False
+
 def process_json(obj, fontstyle_counter):
     """
     递归处理 JSON 对象：
@@ -43,24 +48,24 @@ def main():
         return
 
     try:
-        # 读取整个 JSON 文件
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # 流式读取: 顶层字段逐个处理, images 中的页面逐页读取、处理、写出, 不把整个项目读进内存。
+        # 计数规则与原来相同: 每个顶层字段单独计数, images 下的全部页面共用一个计数器。
+        def process_field(key, value):
+            print(f"正在处理页面: {key}...")
+            process_json(value, [0])
+            print(f"页面 {key} 处理完成。")
+            return value
+
+        images_counter = [0]
 
-        # --- 核心修改部分 ---
-        # 遍历 JSON 数据中的每一个顶级键值对（我们假设每个键代表一页）
-        for page_name, page_data in data.items():
-            print(f"正在处理页面: {page_name}...")
-            # 为每一页创建一个新的、从0开始的计数器
-            fontstyle_counter = [0]
-            # 对当前页面的数据进行处理
-            process_json(page_data, fontstyle_counter)
-            print(f"页面 {page_name} 处理完成。")
+        def process_page(page_name, page_data):
+            process_json(page_data, images_counter)
+            return page_data
 
-        # 处理完成后，将修改后的 `data` 对象覆盖写回原文件
-        with open(file_path, 'w', encoding='utf-8') as f:
-            # 使用 indent=4 格式化输出，ensure_ascii=False 保证中文正常显示
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        # 逐页写到临时文件, 全部完成后再覆盖原文件
+        page_count = rewrite_project(file_path, file_path, page_fn=process_page, field_fn=process_field,
+                                     indent=None if COMPACT_OUTPUT else 4)
+        print(f"页面 images 处理完成（共 {page_count} 页）。")
 
         print("\n所有页面处理完成，已直接覆盖源文件。")
 
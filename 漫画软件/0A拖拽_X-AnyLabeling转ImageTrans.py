@@ -2,8 +2,12 @@
 import sys
 import json
 import math
+import time
+import hashlib
 from math import floor
 
+from json_stream import DROP_PAGE, ProjectWriter, read_fields, splice_project
+
 # ==============================================================================
 # --- 配置区: 在这里设置你要过滤掉的标签 ---
 #
@@ -11,9 +15,25 @@ from math import floor
 #
 LABELS_TO_EXCLUDE = {}
 #
+# 输出紧凑格式的 .itp（无缩进换行，文件更小、写得更快；ImageTrans 读取不受影响）
+COMPACT_OUTPUT = False
+#
+# 增量同步: 输出的 _converted.itp 已存在时，只重新转换内容有改动的 JSON，把这些页面的框写回项目，
+# 其余页面逐字节保持不变，项目中已有的译文、样式按框的位置沿用。False 时总是整体重新生成项目。
+# 模板 .itp 有改动 (大小或修改时间变化) 时自动整体重新生成；JSON 被删除或改指向其他图片时，项目中的旧页面一并移除。
+# (开启时也可以直接把 _converted.itp 拖到脚本上进行同步，此时使用同步记录中的模板)
+SYNC_MODE = True
+#
+# 同步时新框与该页旧框的重叠度 (IoU) 达到这个值，视为同一个框，保留旧框的文字、译文和样式
+SYNC_MATCH_IOU = 0.5
+#
 # --- 配置区结束 ---
 # ==============================================================================
 
+# 同步记录文件 (<项目>.itp.sync)：记录模板的路径、大小、修改时间，以及每个 JSON 的大小、修改时间、内容哈希和对应的图片，
+# 用来判断哪些页面需要更新
+MANIFEST_SUFFIX = ".sync"
+
 
 def convert_xal_to_itrans(xal_shapes):
     """
@@ -106,7 +126,205 @@ def convert_xal_to_itrans(xal_shapes):
         
     return itrans_boxes, filtered_count
 
-# --- main 函数部分保持不变 ---
+def file_digest(raw):
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if isinstance(manifest, dict) and isinstance(manifest.get("files"), dict):
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return None
+
+def template_record(template_path):
+    """模板的 [绝对路径, 大小, 修改时间]，与同步记录中的不同时说明模板改过，需要整体重新生成。"""
+    st = os.stat(template_path)
+    return [os.path.abspath(template_path), st.st_size, st.st_mtime_ns]
+
+def recorded_template(manifest_path):
+    """同步记录中的模板路径 (文件仍存在时)，拖入 _converted.itp 本身时用它来判断模板是否改过。"""
+    manifest = load_manifest(manifest_path)
+    record = manifest.get("template") if manifest else None
+    if isinstance(record, list) and record and os.path.isfile(record[0]):
+        return record[0]
+    return None
+
+def save_manifest(manifest_path, template, files):
+    manifest = {"template": template, "labels_to_exclude": sorted(LABELS_TO_EXCLUDE), "files": files}
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+def geometry_iou(a, b):
+    try:
+        ax, ay, aw, ah = a['X'], a['Y'], a['width'], a['height']
+        bx, by, bw, bh = b['X'], b['Y'], b['width'], b['height']
+        inter_w = min(ax + aw, bx + bw) - max(ax, bx)
+        inter_h = min(ay + ah, by + bh) - max(ay, by)
+        if inter_w <= 0 or inter_h <= 0:
+            return 0.0
+        inter = inter_w * inter_h
+        return inter / (aw * ah + bw * bh - inter)
+    except (KeyError, TypeError, ZeroDivisionError):
+        return 0.0
+
+def merge_boxes(old_boxes, new_boxes):
+    """
+    把新转换出的框合并到该页原有的框上: 与某个旧框重叠度达到 SYNC_MATCH_IOU 的新框沿用该旧框
+    (文字、译文、样式等保持不变)，只更新标签、位置和角度；匹配不上的新框直接写入，剩下的旧框删除。
+    返回 (合并后的框列表, 沿用的旧框数)。
+    """
+    merged = []
+    used = set()
+    for new_box in new_boxes:
+        best, best_iou = None, 0.0
+        for i, old_box in enumerate(old_boxes):
+            if i in used or not isinstance(old_box, dict):
+                continue
+            iou = geometry_iou(old_box.get('geometry'), new_box['geometry'])
+            if iou > best_iou:
+                best, best_iou = i, iou
+        if best is None or best_iou < SYNC_MATCH_IOU:
+            merged.append(new_box)
+            continue
+        used.add(best)
+        box = dict(old_boxes[best])
+        box['fontstyle'] = new_box['fontstyle']
+        box['geometry'] = new_box['geometry']
+        if 'degree' in new_box:
+            box['degree'] = new_box['degree']
+        else:
+            box.pop('degree', None)
+        merged.append(box)
+    return merged, len(used)
+
+def make_page_update(itrans_boxes, stats):
+    """返回 splice_project 使用的页面更新函数: 已有的页面只替换 boxes，项目中没有的页面新建。"""
+    def update(old_page):
+        if old_page is None:
+            return {"boxes": itrans_boxes} if itrans_boxes else None
+        page = dict(old_page) if isinstance(old_page, dict) else {}
+        old_boxes = page.get('boxes') if isinstance(page.get('boxes'), list) else []
+        page['boxes'], kept = merge_boxes(old_boxes, itrans_boxes)
+        stats['kept'] += kept
+        return page
+    return update
+
+def drop_stale_page(stats):
+    """返回 splice_project 使用的页面更新函数: 删除已经没有 JSON 对应的页面。"""
+    def update(old_page):
+        if old_page is not None:
+            stats['dropped'] += 1
+        return DROP_PAGE
+    return update
+
+def sync_project(output_itp_path, template, directory, json_files):
+    """
+    增量同步: 只转换内容有改动的 JSON，把这些页面写回已有的项目，其余页面原样保留。
+    template 为 template_record() 的结果 (不知道模板时为 None，沿用记录中的模板)。
+    模板改过时返回 False，由调用方整体重新生成项目。
+    """
+    start_time = time.perf_counter()
+    manifest_path = output_itp_path + MANIFEST_SUFFIX
+    manifest = load_manifest(manifest_path)
+    old_files = {}
+    if manifest is not None:
+        recorded = manifest.get("template")
+        if template is None:
+            template = recorded
+        elif recorded is not None and recorded != template:
+            print("模板文件已改动，将按新模板整体重新生成项目（项目中已有的译文和样式不会保留）。\n")
+            return False
+    if manifest is None:
+        print("没有找到同步记录，将把所有 JSON 逐页合并到项目中（已有的译文和样式按框的位置保留）。\n")
+    elif manifest.get("labels_to_exclude") != sorted(LABELS_TO_EXCLUDE):
+        print("标签过滤设置已改变，将重新合并所有 JSON。\n")
+    else:
+        old_files = manifest["files"]
+
+    files = {}
+    updates = {}
+    for filename in json_files:
+        json_path = os.path.join(directory, filename)
+        record = old_files.get(filename)
+        try:
+            st = os.stat(json_path)
+            # 大小和修改时间都没变，不读取文件
+            if record and record.get("size") == st.st_size and record.get("mtime_ns") == st.st_mtime_ns:
+                files[filename] = record
+                continue
+            with open(json_path, 'rb') as f:
+                raw = f.read()
+            files[filename] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": file_digest(raw), "image": None}
+            # 只是修改时间变了 (例如打开后原样保存)，内容相同
+            if record and record.get("hash") == files[filename]["hash"]:
+                files[filename]["image"] = record.get("image")
+                continue
+            xal_data = json.loads(raw)
+        except Exception as e:
+            if isinstance(e, json.JSONDecodeError):
+                print(f"  - 警告: 无法解析JSON文件 {filename}，已跳过。")
+            else:
+                print(f"  - 错误: 处理文件 {filename} 时发生错误: {e}")
+            # 保留旧记录: 该页不会被当作失效页面删除，下次运行时重新读取
+            if record:
+                files[filename] = record
+            else:
+                files.pop(filename, None)
+            continue
+
+        if 'imagePath' not in xal_data or 'shapes' not in xal_data:
+            continue
+        image_filename = xal_data['imagePath']
+        if image_filename in updates:
+            print(f"  - 警告: 图片 {image_filename} 已由其他 JSON 更新，{filename} 已跳过。")
+            continue
+
+        itrans_boxes, filtered_count = convert_xal_to_itrans(xal_data['shapes'])
+        updates[image_filename] = itrans_boxes
+        files[filename]["image"] = image_filename
+        info_str = f"{len(itrans_boxes)} 个标注"
+        if filtered_count > 0:
+            info_str += f"，过滤了 {filtered_count} 个"
+        print(f"  - 有改动: {filename} ({info_str})")
+
+    # JSON 已删除或改指向其他图片: 旧图片没有其他 JSON 对应时，从项目中移除该页
+    json_set = set(json_files)
+    claimed = {record.get("image") for record in files.values()}
+    stale = set()
+    for filename, record in (manifest["files"] if manifest else {}).items():
+        old_image = record.get("image")
+        if not old_image or old_image in claimed or old_image in stale:
+            continue
+        stale.add(old_image)
+        if filename not in json_set:
+            print(f"  - 已删除: {filename}，移除项目中的页面 {old_image}。")
+        else:
+            print(f"  - 不再对应: {filename} 已不指向 {old_image}，移除项目中的该页。")
+
+    if not updates and not stale:
+        save_manifest(manifest_path, template, files)
+        print(f"\n没有内容改动的 JSON，项目无需更新。（耗时 {time.perf_counter() - start_time:.2f} 秒）")
+        return True
+
+    stats = {"kept": 0, "dropped": 0}
+    page_updates = {image: make_page_update(boxes, stats) for image, boxes in updates.items()}
+    page_updates.update((image, drop_stale_page(stats)) for image in stale)
+    replaced, added = splice_project(output_itp_path, output_itp_path, page_updates)
+    # 项目写入成功后才更新同步记录，中途失败时下次会重新同步这些页面
+    save_manifest(manifest_path, template, files)
+
+    print("\n同步完成！")
+    print(f"项目文件: {output_itp_path}")
+    print(f"更新了 {replaced} 页，新增 {added} 页，移除 {stats['dropped']} 页，其余页面保持不变；"
+          f"沿用了 {stats['kept']} 个已有文本框的文字和样式。")
+    print(f"耗时 {time.perf_counter() - start_time:.2f} 秒")
+    return True
+
 def main():
     if len(sys.argv) < 2:
         print("错误：请将一个 .itp 模板文件拖拽到此脚本上。")
@@ -121,6 +339,13 @@ def main():
         return
         
     directory = os.path.dirname(template_itp_path)
+    base, ext = os.path.splitext(template_itp_path)
+    if SYNC_MODE and base.endswith('_converted'):
+        # 拖入的就是转换结果本身: 直接对它进行同步，模板使用同步记录中的那一个
+        output_itp_path = template_itp_path
+        template_itp_path = recorded_template(output_itp_path + MANIFEST_SUFFIX)
+    else:
+        output_itp_path = f"{base}_converted{ext}"
     print(f"正在扫描目录: {directory}")
     
     if LABELS_TO_EXCLUDE:
@@ -136,68 +361,111 @@ def main():
         input("按 Enter 键退出...")
         return
 
-    all_images_data = {}
-    processed_file_count = 0
-
-    for filename in json_files:
-        json_path = os.path.join(directory, filename)
-        
+    if SYNC_MODE and os.path.exists(output_itp_path):
         try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                xal_data = json.load(f)
-
-            if 'imagePath' in xal_data and 'shapes' in xal_data:
-                image_filename = xal_data['imagePath']
-                shapes = xal_data['shapes']
-                
-                itrans_boxes, filtered_count = convert_xal_to_itrans(shapes)
-                
-                info_str = f"转换了 {len(itrans_boxes)} 个标注"
-                if filtered_count > 0:
-                    info_str += f"，过滤了 {filtered_count} 个"
-                print(f"  - 已处理: {filename} ({info_str})")
-
-                if itrans_boxes:
-                    all_images_data[image_filename] = {"boxes": itrans_boxes}
-                    processed_file_count += 1
-
-        except json.JSONDecodeError:
-            print(f"  - 警告: 无法解析JSON文件 {filename}，已跳过。")
+            template = template_record(template_itp_path) if template_itp_path else None
+            synced = sync_project(output_itp_path, template, directory, json_files)
         except Exception as e:
-            print(f"  - 错误: 处理文件 {filename} 时发生错误: {e}")
+            print(f"错误：同步项目时发生错误: {e}")
+            synced = True
+        if synced:
+            input("\n按 Enter 键退出...")
+            return
 
-    if not all_images_data:
-        print("\n未找到任何有效的标注信息进行转换（或所有标注均被过滤）。")
+    # 模板只读取 images 以外的项目设置 (模板本身是大项目时也不会整个读进内存)
+    try:
+        template_fields = read_fields(template_itp_path)
+    except Exception as e:
+        print(f"错误：无法读取模板文件 '{template_itp_path}': {e}")
         input("按 Enter 键退出...")
         return
 
+    absolute_output_path = os.path.abspath(output_itp_path)
+    parent_dir = os.path.dirname(absolute_output_path)
+    # 字段顺序与原来的 template_data['images'] = ...; template_data['dirPath'] = ... 一致
+    template_fields.setdefault('images', None)
+    template_fields['dirPath'] = parent_dir
+    keys = list(template_fields)
+    images_index = keys.index('images')
+
+    # 逐个 JSON 转换后立即写出该页，不在内存中累积整个项目
+    processed_file_count = 0
+    written_images = set()
+    manifest_files = {}
     try:
-        with open(template_itp_path, 'r', encoding='utf-8') as f:
-            template_data = json.load(f)
+        writer = ProjectWriter(output_itp_path, indent=None if COMPACT_OUTPUT else 4)
     except Exception as e:
-        print(f"错误：无法读取模板文件 '{template_itp_path}': {e}")
+        print(f"错误：无法创建输出文件: {e}")
         input("按 Enter 键退出...")
         return
+    try:
+        for key in keys[:images_index]:
+            writer.field(key, template_fields[key])
+        writer.begin_pages('images')
 
-    template_data['images'] = all_images_data
+        for filename in json_files:
+            json_path = os.path.join(directory, filename)
+            
+            try:
+                st = os.stat(json_path)
+                with open(json_path, 'rb') as f:
+                    raw = f.read()
+                manifest_files[filename] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                                            "hash": file_digest(raw), "image": None}
+                xal_data = json.loads(raw)
 
-    base, ext = os.path.splitext(template_itp_path)
-    output_itp_path = f"{base}_converted{ext}"
+                if 'imagePath' in xal_data and 'shapes' in xal_data:
+                    image_filename = xal_data['imagePath']
+                    shapes = xal_data['shapes']
+                    
+                    itrans_boxes, filtered_count = convert_xal_to_itrans(shapes)
+                    
+                    info_str = f"转换了 {len(itrans_boxes)} 个标注"
+                    if filtered_count > 0:
+                        info_str += f"，过滤了 {filtered_count} 个"
+                    print(f"  - 已处理: {filename} ({info_str})")
+
+                    if itrans_boxes:
+                        if image_filename in written_images:
+                            print(f"  - 警告: 图片 {image_filename} 已由其他 JSON 写入，{filename} 已跳过。")
+                            continue
+                        writer.page(image_filename, {"boxes": itrans_boxes})
+                        written_images.add(image_filename)
+                        manifest_files[filename]["image"] = image_filename
+                        processed_file_count += 1
+
+            except json.JSONDecodeError:
+                print(f"  - 警告: 无法解析JSON文件 {filename}，已跳过。")
+            except Exception as e:
+                print(f"  - 错误: 处理文件 {filename} 时发生错误: {e}")
+                manifest_files.pop(filename, None)
+
+        writer.end_pages()
+        for key in keys[images_index + 1:]:
+            writer.field(key, template_fields[key])
+    except BaseException:
+        writer.abort()
+        raise
+
+    if not processed_file_count:
+        writer.abort()
+        print("\n未找到任何有效的标注信息进行转换（或所有标注均被过滤）。")
+        input("按 Enter 键退出...")
+        return
 
-    absolute_output_path = os.path.abspath(output_itp_path)
-    parent_dir = os.path.dirname(absolute_output_path)
-    template_data['dirPath'] = parent_dir
     print(f"\n已更新项目图片路径 (dirPath) 为: {parent_dir}\n")
     
     try:
-        with open(output_itp_path, 'w', encoding='utf-8') as f:
-            json.dump(template_data, f, indent=4, ensure_ascii=False)
+        writer.close()
+        if SYNC_MODE:
+            save_manifest(output_itp_path + MANIFEST_SUFFIX, template_record(template_itp_path), manifest_files)
         
         print("转换完成！")
         print(f"新的 ImageTrans 项目文件已保存为: {output_itp_path}")
         print(f"总计成功转换了 {processed_file_count} 个文件中的标注。")
 
     except Exception as e:
+        writer.abort()
         print(f"错误：保存新文件时发生错误: {e}")
 
     input("\n按 Enter 键退出...")
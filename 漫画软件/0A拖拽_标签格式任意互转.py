@@ -0,0 +1,129 @@
+import os
+import sys
+
+from label_convert import FORMATS, FORMAT_NAMES, convert, detect_format
+
+# ==============================================================================
+# ======================== 配置区: 标签格式任意互转 ========================
+# ==============================================================================
+
+# 目标格式：
+#   "xal"  X-AnyLabeling 标注文件夹（输出到图片所在目录）
+#   "itp"  ImageTrans 项目文件（<源名称>_converted.itp）
+#   "bt"   BallonsTranslator 项目 JSON（output_ballons.json）
+#   "mtu"  manga-translator-ui 的 JSON 文件夹（manga_translator_work/json）
+#   "yolo" YOLO TXT 标签文件夹（biaoqianTXT）
+TARGET_FORMAT = "bt"
+
+# 源格式：None 表示根据拖入的文件 / 文件夹自动判断
+#   .itp 文件 -> itp；包含 pages 的 JSON -> bt；包含 *_translations.json 的文件夹 -> mtu；
+#   包含 X-AnyLabeling JSON 的文件夹 -> xal；包含 .txt 的文件夹 -> yolo
+SOURCE_FORMAT = None
+
+# 转换时要过滤掉的标签，例如 {"other", "ignore"}
+LABELS_TO_EXCLUDE = set()
+
+# YOLO 类别名列表（按类别编号顺序），None 表示读取标签文件夹中的 classes.txt，找不到时直接使用数字编号
+YOLO_CLASSES = None
+# 写 YOLO 时是否输出 9 列 OBB 旋转框（False 时旋转框写成水平外接矩形）
+YOLO_OBB = False
+
+# 找不到图片时使用的 (宽, 高)，例如 (2402, 1799)；None 表示跳过无法确定尺寸的页面
+DEFAULT_IMAGE_SIZE = None
+
+# 写 ImageTrans 时使用的 .itp 模板（复制项目设置）；None 表示自动使用源文件夹中的第一个 .itp（源是 .itp 时沿用源项目）
+ITP_TEMPLATE = None
+
+# 多进程设置（0 表示使用全部 CPU 核心）
+ENABLE_MULTIPROCESSING = True
+MAX_PROCESSES = 0
+
+# 是否逐页打印转换结果（页数很多时建议关闭，只显示进度、错误和最终统计）
+VERBOSE = False
+# 关闭逐页输出时，每转换多少页打印一次进度
+PROGRESS_EVERY = 500
+# --- 配置区结束 ---
+# ==============================================================================
+
+
+def find_itp_template(path):
+    folder = path if os.path.isdir(path) else os.path.dirname(path)
+    for name in sorted(os.listdir(folder)):
+        if name.lower().endswith('.itp') and not name.lower().endswith('_converted.itp'):
+            return os.path.join(folder, name)
+    return None
+
+
+def convert_one(path):
+    source_format = SOURCE_FORMAT or detect_format(path)
+    print(f"\n源: {path}")
+    print(f"格式: {FORMAT_NAMES[source_format]} -> {FORMAT_NAMES[TARGET_FORMAT]}")
+
+    options = {
+        "labels_to_exclude": LABELS_TO_EXCLUDE,
+        "yolo_classes": YOLO_CLASSES,
+        "yolo_obb": YOLO_OBB,
+        "default_image_size": DEFAULT_IMAGE_SIZE,
+        "itp_template": ITP_TEMPLATE,
+    }
+    if TARGET_FORMAT == "itp" and not ITP_TEMPLATE and source_format != "itp":
+        options["itp_template"] = find_itp_template(path)
+        if options["itp_template"]:
+            print(f"使用模板: {os.path.basename(options['itp_template'])}")
+
+    done = [0]
+
+    def report(result):
+        done[0] += 1
+        if result["status"] == "error":
+            print(f"  - 错误: {result['name']}: {result['message']}")
+        elif VERBOSE:
+            info = f"{result['boxes']} 个标注"
+            if result["excluded"]:
+                info += f"，过滤了 {result['excluded']} 个"
+            if result["status"] == "skipped":
+                info = f"跳过 ({result['message']})"
+            print(f"  - 已处理: {result['name']} ({info})")
+        elif done[0] % PROGRESS_EVERY == 0:
+            print(f"  进度: {done[0]} 页")
+
+    processes = (MAX_PROCESSES if MAX_PROCESSES > 0 else (os.cpu_count() or 1)) if ENABLE_MULTIPROCESSING else 1
+    summary = convert(path, TARGET_FORMAT, source_format=source_format, options=options,
+                      processes=processes, on_page=report)
+
+    print(f"完成: {summary['pages']} 页 / {summary['boxes']} 个标注"
+          + (f"，过滤 {summary['excluded']} 个" if summary['excluded'] else "")
+          + (f"，跳过 {summary['skipped']} 个文件" if summary['skipped'] else "")
+          + (f"，失败 {summary['error']} 页" if summary['error'] else ""))
+    print(f"耗时 {summary['elapsed']:.2f} 秒（{summary['processes']} 个进程）")
+    print(f"输出: {summary['output']}")
+
+
+def main():
+    print("=" * 60)
+    print(f"标签格式任意互转 -> {FORMAT_NAMES.get(TARGET_FORMAT, TARGET_FORMAT)}")
+    print("=" * 60)
+
+    if TARGET_FORMAT not in FORMATS:
+        print(f"错误: 未知的目标格式 '{TARGET_FORMAT}'，可选: {', '.join(FORMATS)}")
+        input("按 Enter 键退出...")
+        return
+
+    if len(sys.argv) < 2:
+        print("用法：把标注文件夹或项目文件（.itp / BallonsTranslator JSON）拖到本脚本上。")
+        input("按 Enter 键退出...")
+        return
+
+    for path in sys.argv[1:]:
+        path = path.strip('"')
+        try:
+            convert_one(path)
+        except Exception as e:
+            print(f"错误: 转换 '{path}' 失败: {e}")
+
+    print("\n所有转换已完成！")
+    input("按 Enter 键退出...")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 ﻿import os
 import sys
 import json
-from PIL import Image
+
+from image_dims import image_sizes
 
 def yolo_txt_to_json_folder(txt_dir, images_dir, output_json_path):
     all_data = {
@@ -10,20 +11,21 @@ def yolo_txt_to_json_folder(txt_dir, images_dir, output_json_path):
         "current_img": ""
     }
 
-    for filename in sorted(os.listdir(txt_dir)):
-        if not filename.endswith(".txt"):
-            continue
+    txt_files = [f for f in sorted(os.listdir(txt_dir)) if f.endswith(".txt")]
+    # 先一次性读取全部对应图片的宽高 (只读文件头，多线程 + 尺寸索引)
+    sizes = image_sizes(os.path.join(images_dir, os.path.splitext(f)[0] + ".jpg") for f in txt_files)
+
+    for filename in txt_files:
         txt_path = os.path.join(txt_dir, filename)
         name, _ = os.path.splitext(filename)
         img_name = name + ".jpg"
         img_path = os.path.join(images_dir, img_name)
 
         # 自动读取图片宽高
-        if not os.path.exists(img_path):
+        if sizes.get(img_path) is None:
             print(f"警告：找不到对应图片 {img_path}，跳过该文件")
             continue
-        with Image.open(img_path) as img:
-            image_width, image_height = img.width, img.height
+        image_width, image_height = sizes[img_path]
 
         all_data["current_img"] = img_name  # 最后一个作为 current_img
 
@@ -3,10 +3,16 @@
 import os
 from PIL import Image, ImageDraw
 from io import BytesIO
-from bottle import BaseRequest, route, run, request, static_file
+from bottle import BaseRequest, route, run, request, response, static_file
 import base64
 from ultralytics import YOLO
 import logging
+import threading
+import time
+import copy
+from box_merge import cluster_and_merge
+from reading_order import order_detections
+from request_overrides import apply_request_overrides
 
 # --- 基础配置 ---
 BaseRequest.MEMFILE_MAX = 10 * 1024 * 1024
@@ -90,105 +96,139 @@ EXPAND_VALUES = {
 CLASS_NAME_MAP = {}               # 可选：将原始类别名映射为更友好的名字。{'原始名': '新名字'}
 
 
-# ======================= 核心辅助函数 (已彻底重构) =======================
+# --- 6.1 结果排序 ---
+# 返回之前按阅读顺序排列检测框 (reading_order.py)，让 ImageTrans 收到的文本框顺序与阅读顺序一致。
+# 可选: "COLUMNS_RTL" (竖排漫画: 自动分列, 列从右到左, 列内从上到下) / "COLUMNS_LTR" / "ROWS_TTB" (横排: 自动分行),
+#       也可以使用标签排序脚本中的旧模式 ("REV_X_THEN_Y" 等)；None 表示保持模型输出顺序。
+RESULT_ORDER = "COLUMNS_RTL"
+# 自动分栏时两个框被视为同一列 (行) 所需的最小重叠比例 (重叠宽度 / 自身宽度)。
+RESULT_ORDER_MIN_OVERLAP = 0.5
 
-def are_boxes_aligned(b1, b2, direction):
-    """全新的、更健壮的对齐判断函数，同时考虑对齐度和邻近度。"""
-    if direction == 'horizontal':
-        # 判断是否在同一行：1. 垂直重叠度足够高；2. 水平间隙足够小。
-        if calculate_vertical_overlap_ratio(b1, b2) < VERTICAL_OVERLAP_FOR_HORIZONTAL_MERGE:
-            return False
-        horizontal_gap = max(b1['left'], b2['left']) - min(b1['left'] + b1['width'], b2['left'] + b2['width'])
-        return horizontal_gap < MAX_HORIZONTAL_GAP_FOR_HORIZONTAL_MERGE
-        
-    elif direction == 'vertical':
-        # 判断是否在同一列：1. 水平IoU足够高；2. 垂直间隙足够小。
-        if calculate_horizontal_iou(b1, b2) < HORIZONTAL_IOU_FOR_VERTICAL_MERGE:
-            return False
-        vertical_gap = max(b1['top'], b2['top']) - min(b1['top'] + b1['height'], b2['top'] + b2['height'])
-        return vertical_gap < MAX_VERTICAL_GAP_FOR_VERTICAL_MERGE
-        
-    return False
-
-def calculate_horizontal_iou(b1, b2):
-    x1_min, x1_max = b1['left'], b1['left'] + b1['width']
-    x2_min, x2_max = b2['left'], b2['left'] + b2['width']
-    i_w = max(0, min(x1_max, x2_max) - max(x1_min, x2_min))
-    if i_w == 0: return 0.0
-    u_w = (x1_max - x1_min) + (x2_max - x2_min) - i_w
-    return i_w / u_w if u_w > 0 else 0.0
-
-def calculate_vertical_overlap_ratio(b1, b2):
-    y1_min, y1_max = b1['top'], b1['top'] + b1['height']
-    y2_min, y2_max = b2['top'], b2['top'] + b2['height']
-    intersection_height = max(0, min(y1_max, y2_max) - max(y1_min, y2_min))
-    if intersection_height == 0: return 0.0
-    min_height = min(b1['height'], b2['height'])
-    if min_height == 0: return 0.0
-    return intersection_height / min_height
-
-def merge_cluster(cluster):
-    if not cluster: return None
-    locs = [b['location'] for b in cluster]
-    min_left = min(l['left'] for l in locs)
-    min_top = min(l['top'] for l in locs)
-    max_right = max(l['left'] + l['width'] for l in locs)
-    max_bottom = max(l['top'] + l['height'] for l in locs)
-    return {
-        "location": {
-            "left": int(min_left), "top": int(min_top),
-            "width": int(max_right - min_left), "height": int(max_bottom - min_top),
-            "className": locs[0]['className']
-        }, "confidence": round(max(b['confidence'] for b in cluster), 4)
-    }
-
-def cluster_and_merge(boxes, is_aligned_func):
-    """通用的聚类和合并逻辑 (使用图算法，健壮且无bug)。"""
-    if not boxes: return []
-    num_boxes = len(boxes)
-    parent = list(range(num_boxes))
-    def find(i):
-        if parent[i] == i: return i
-        parent[i] = find(parent[i]); return parent[i]
-    def union(i, j):
-        root_i, root_j = find(i), find(j)
-        if root_i != root_j: parent[root_j] = root_i
-
-    for i in range(num_boxes):
-        for j in range(i + 1, num_boxes):
-            if is_aligned_func(boxes[i]['location'], boxes[j]['location']):
-                union(i, j)
-
-    clusters = {}
-    for i in range(num_boxes):
-        root = find(i)
-        if root not in clusters: clusters[root] = []
-        clusters[root].append(boxes[i])
-        
-    return [merge_cluster(c) for c in clusters.values() if c]
 
-# ======================= Web 服务逻辑区 (无需修改) =======================
+# --- 7. 热更新与单次请求覆盖 ---
+# 管理接口的总开关：POST /admin/reload 在后台加载新模型/新参数，加载预热完成后再原子替换，
+# 替换前旧模型继续正常服务，正在进行的 ImageTrans 会话不会中断。
+ENABLE_ADMIN_API = True
+# 是否允许 /detect 请求体中携带单次覆盖参数 (conf / classes / merge / expand)，只影响当前请求。
+ALLOW_REQUEST_OVERRIDES = True
+# 新模型加载后用一张空白图预热一次，避免第一个真实请求承担 CUDA 初始化的延迟。
+WARMUP_IMAGE_SIZE = 640
+
+# 可以通过 /admin/reload 的 "config" 字段热更新的参数 (与上面配置区同名)。
+RUNTIME_CONFIG_KEYS = (
+    "PER_CLASS_CONF_CONFIG", "DEFAULT_INITIAL_CONF", "IOU_THRESHOLD", "FINAL_CONF_THRESHOLD",
+    "ENABLE_FILTER", "FILTER_CLASSES", "MERGE_CONFIG",
+    "HORIZONTAL_IOU_FOR_VERTICAL_MERGE", "MAX_VERTICAL_GAP_FOR_VERTICAL_MERGE",
+    "VERTICAL_OVERLAP_FOR_HORIZONTAL_MERGE", "MAX_HORIZONTAL_GAP_FOR_HORIZONTAL_MERGE",
+    "ENABLE_STANDARDIZED_WIDTH", "STANDARDIZED_WIDTHS", "ENABLE_STANDARDIZED_HEIGHT", "STANDARDIZED_HEIGHTS",
+    "ENABLE_EXPANSION", "EXPAND_VALUES", "CLASS_NAME_MAP", "RESULT_ORDER", "RESULT_ORDER_MIN_OVERLAP",
+)
+
+
+# ======================= 热更新: 服务状态与单次覆盖 =======================
+
+class ServiceState:
+    """一份不可变的“模型 + 参数”快照。每个请求开始时取一次引用，整个请求只使用这一份，
+    热更新只是把全局引用换成新的快照 (Python 中引用赋值是原子的)，因此检测路径上不需要任何全局锁。"""
+
+    def __init__(self, model, model_path, config):
+        self.model = model
+        self.model_path = model_path
+        self.model_stamp = model_file_stamp(model_path)
+        self.config = config
+        self.loaded_at = time.time()
+
+
+def model_file_stamp(model_path):
+    """模型文件的 (修改时间, 大小)；同一路径下的 .pt 被重新训练覆盖后会变化。文件不存在时返回 None。"""
+    try:
+        st = os.stat(model_path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+SERVICE_STATE = None                 # 当前正在服务的快照
+RELOAD_LOCK = threading.Lock()       # 只用于保证同一时间只有一个后台加载任务，检测请求从不获取
+RELOAD_STATUS = {"state": "idle", "message": "", "started_at": None}
+
+
+def config_from_globals():
+    """把配置区的常量收集成一份配置字典。"""
+    return {key: copy.deepcopy(globals()[key]) for key in RUNTIME_CONFIG_KEYS}
+
+
+def config_value_error(key, value, current):
+    """热更新的参数值必须与当前值类型一致 (整数/小数可以互换，字符串参数允许 null)。合法时返回 None，否则返回错误说明。"""
+    if isinstance(current, bool):
+        ok = isinstance(value, bool)
+    elif isinstance(current, (int, float)):
+        ok = isinstance(value, (int, float)) and not isinstance(value, bool)
+    elif isinstance(current, dict):
+        ok = isinstance(value, dict)
+    elif isinstance(current, (list, tuple)):
+        ok = isinstance(value, (list, tuple))
+    elif current is None or isinstance(current, str):
+        ok = value is None or isinstance(value, str)
+    else:
+        ok = True
+    return None if ok else f"{key} 需要 {type(current).__name__} 类型，收到: {value!r}"
+
+
+def load_and_warm_model(model_path):
+    model = YOLO(model_path)
+    model.predict(source=Image.new("RGB", (WARMUP_IMAGE_SIZE, WARMUP_IMAGE_SIZE)), conf=0.5, imgsz=1280, verbose=False)
+    return model
+
+
+def background_reload(model_path, config):
+    """后台线程: 加载并预热新模型，成功后原子替换；失败则旧模型继续服务。"""
+    global SERVICE_STATE
+    try:
+        start = time.perf_counter()
+        model = load_and_warm_model(model_path)
+        SERVICE_STATE = ServiceState(model, model_path, config)
+        RELOAD_STATUS.update(state="idle", message=f"已切换到新模型: {model_path} (加载+预热 {time.perf_counter() - start:.2f}s)")
+        logger.info(RELOAD_STATUS["message"] + f" | 类别: {model.names}")
+    except Exception as e:
+        RELOAD_STATUS.update(state="failed", message=f"新模型加载失败，继续使用旧模型: {e}")
+        logger.error(RELOAD_STATUS["message"], exc_info=True)
+    finally:
+        RELOAD_LOCK.release()
+
+
+# ======================= Web 服务逻辑区 =======================
 
 @route('/detect', method='POST')
 def detect():
     logger.info("开始处理检测请求...")
+    state = SERVICE_STATE  # 取一次快照，热更新不会影响正在处理的请求
+    model = state.model
     try:
         json_data = request.json; image_b64 = json_data.get("image")
         if not image_b64: return {"error": "请求中未找到图像数据"}
+        cfg = state.config
+        if ALLOW_REQUEST_OVERRIDES:
+            try:
+                cfg = apply_request_overrides(cfg, json_data)
+            except (ValueError, TypeError, AttributeError) as e:
+                response.status = 400
+                return {"error": f"覆盖参数不合法: {e}"}
 
         net_img = Image.open(BytesIO(base64.b64decode(image_b64))).convert("RGB")
-        prediction = model.predict(source=net_img, conf=0.01, iou=IOU_THRESHOLD, imgsz=1280, agnostic_nms=True)[0]
+        prediction = model.predict(source=net_img, conf=0.01, iou=cfg["IOU_THRESHOLD"], imgsz=1280, agnostic_nms=True)[0]
 
         initial_filtered_boxes = []
         if prediction.boxes is not None:
             for box in prediction.boxes:
                 class_name = model.names[int(box.cls)]
                 confidence = float(box.conf[0].item())
-                class_specific_conf = PER_CLASS_CONF_CONFIG.get(class_name, DEFAULT_INITIAL_CONF)
+                class_specific_conf = cfg["PER_CLASS_CONF_CONFIG"].get(class_name, cfg["DEFAULT_INITIAL_CONF"])
                 if confidence >= class_specific_conf:
-                    if not ENABLE_FILTER or (ENABLE_FILTER and class_name in FILTER_CLASSES):
+                    if not cfg["ENABLE_FILTER"] or class_name in cfg["FILTER_CLASSES"]:
                         initial_filtered_boxes.append(box)
 
+        postprocess_start = time.perf_counter()
         raw_results_by_class = {}
         for box in initial_filtered_boxes:
             class_name = model.names[int(box.cls)]
@@ -201,26 +241,23 @@ def detect():
         
         processed_results = []
         for class_name, bboxes in raw_results_by_class.items():
-            direction = MERGE_CONFIG.get(class_name)
-            if direction == 'vertical':
-                merged = cluster_and_merge(bboxes, lambda b1, b2: are_boxes_aligned(b1, b2, 'vertical'))
-                processed_results.extend(merged)
-            elif direction == 'horizontal':
-                merged = cluster_and_merge(bboxes, lambda b1, b2: are_boxes_aligned(b1, b2, 'horizontal'))
-                processed_results.extend(merged)
+            direction = cfg["MERGE_CONFIG"].get(class_name)
+            if direction in ('vertical', 'horizontal'):
+                # 扫描线 + 向量化对齐判断 (box_merge.py)，结果与原来的两两比较一致
+                processed_results.extend(cluster_and_merge(bboxes, direction, cfg))
             else:
                 processed_results.extend(bboxes)
 
-        confident_results = [res for res in processed_results if res['confidence'] >= FINAL_CONF_THRESHOLD]
+        confident_results = [res for res in processed_results if res['confidence'] >= cfg["FINAL_CONF_THRESHOLD"]]
 
         final_results = []
         for res in confident_results:
             original_loc = res['location']
             c_name = original_loc['className']
             x_c, y_c = original_loc['left'] + original_loc['width']/2, original_loc['top'] + original_loc['height']/2
-            base_w = STANDARDIZED_WIDTHS.get(c_name, original_loc['width']) if ENABLE_STANDARDIZED_WIDTH else original_loc['width']
-            base_h = STANDARDIZED_HEIGHTS.get(c_name, original_loc['height']) if ENABLE_STANDARDIZED_HEIGHT else original_loc['height']
-            t_e, b_e, l_e, r_e = EXPAND_VALUES.get(c_name, (0,0,0,0)) if ENABLE_EXPANSION else (0,0,0,0)
+            base_w = cfg["STANDARDIZED_WIDTHS"].get(c_name, original_loc['width']) if cfg["ENABLE_STANDARDIZED_WIDTH"] else original_loc['width']
+            base_h = cfg["STANDARDIZED_HEIGHTS"].get(c_name, original_loc['height']) if cfg["ENABLE_STANDARDIZED_HEIGHT"] else original_loc['height']
+            t_e, b_e, l_e, r_e = cfg["EXPAND_VALUES"].get(c_name, (0,0,0,0)) if cfg["ENABLE_EXPANSION"] else (0,0,0,0)
             f_w = base_w + l_e + r_e
             f_h = base_h + t_e + b_e
             final_x_c = x_c + (r_e - l_e) / 2
@@ -235,28 +272,96 @@ def detect():
             )
             
             # 1. 将类别名添加到 location 字典中
-            final_loc["className"] = CLASS_NAME_MAP.get(c_name, c_name)
+            final_loc["className"] = cfg["CLASS_NAME_MAP"].get(c_name, c_name)
             
             # 2. 构建符合 ImageTrans 要求的最终字典结构
             final_results.append({
                 "location": final_loc, 
                 "confidence": res['confidence']
             })
+        final_results = order_detections(final_results, cfg["RESULT_ORDER"], cfg["RESULT_ORDER_MIN_OVERLAP"])
+        logger.info(f"候选框 {len(initial_filtered_boxes)} -> 输出 {len(final_results)}，"
+                    f"后处理耗时 {(time.perf_counter() - postprocess_start) * 1000:.1f} ms")
         return {"results": final_results}
 
     except Exception as e:
         logger.error(f"检测过程中发生错误: {e}", exc_info=True)
         return {"error": f"服务器内部错误: {e}"}
 
+@route('/admin/reload', method='POST')
+def admin_reload():
+    """热更新模型和/或参数。请求体示例:
+    {"model_path": "D:\\新模型\\best.pt", "config": {"FINAL_CONF_THRESHOLD": 0.4, "MERGE_CONFIG": {"balloon": "vertical"}}}
+    只改参数时立即生效；model_path 指向新文件、当前模型文件被覆盖 (修改时间或大小变化) 或带 "force": true 时，
+    在后台加载预热，完成前旧模型继续服务。"""
+    global SERVICE_STATE
+    if not ENABLE_ADMIN_API:
+        response.status = 403
+        return {"error": "管理接口未开启 (ENABLE_ADMIN_API = False)"}
+    json_data = request.json or {}
+    if not isinstance(json_data, dict):
+        response.status = 400
+        return {"error": "请求体必须是 JSON 对象"}
+    new_values = json_data.get("config") or {}
+    if not isinstance(new_values, dict):
+        response.status = 400
+        return {"error": f"config 必须是 {{参数名: 值}} 对象，收到: {new_values!r}"}
+    unknown = [k for k in new_values if k not in RUNTIME_CONFIG_KEYS]
+    if unknown:
+        response.status = 400
+        return {"error": f"不支持热更新的参数: {unknown}", "supported": list(RUNTIME_CONFIG_KEYS)}
+    current_config = SERVICE_STATE.config
+    invalid = [e for e in (config_value_error(k, v, current_config[k]) for k, v in new_values.items()) if e]
+    if invalid:
+        response.status = 400
+        return {"error": "参数类型不正确", "details": invalid}
+    model_path = json_data.get("model_path")
+    if model_path is not None and not isinstance(model_path, str):
+        response.status = 400
+        return {"error": f"model_path 必须是字符串，收到: {model_path!r}"}
+    if not RELOAD_LOCK.acquire(blocking=False):
+        response.status = 409
+        return {"error": "已有一个模型正在后台加载，请稍后再试", "reload": RELOAD_STATUS}
+
+    # 锁交给后台线程之前发生任何异常都要释放，否则之后的 /admin/reload 会一直返回 409
+    handed_off = False
+    try:
+        current = SERVICE_STATE
+        new_config = dict(current.config)
+        new_config.update(copy.deepcopy(new_values))
+        model_path = model_path or current.model_path
+        same_file = model_path == current.model_path and model_file_stamp(model_path) == current.model_stamp
+        if same_file and not json_data.get("force"):
+            SERVICE_STATE = ServiceState(current.model, current.model_path, new_config)
+            logger.info(f"参数已热更新: {list(new_values)}")
+            return {"status": "applied", "updated": list(new_values)}
+
+        RELOAD_STATUS.update(state="loading", message=f"正在后台加载: {model_path}", started_at=time.time())
+        logger.info(RELOAD_STATUS["message"] + "，加载完成前继续使用旧模型")
+        threading.Thread(target=background_reload, args=(model_path, new_config), daemon=True).start()
+        handed_off = True
+    finally:
+        if not handed_off:
+            RELOAD_LOCK.release()
+    response.status = 202
+    return {"status": "loading", "model_path": model_path}
+
+@route('/admin/status', method='GET')
+def admin_status():
+    state = SERVICE_STATE
+    return {"model_path": state.model_path, "loaded_at": state.loaded_at, "classes": state.model.names,
+            "reload": RELOAD_STATUS, "config": state.config}
+
 @route('/<filepath:path>')
 def server_static(filepath): return static_file(filepath, root='www')
 
 # ======================= 模型加载与启动 =======================
 if __name__ == '__main__':
     try:
-        model = YOLO(YOLO_MODEL_PATH)
+        model = load_and_warm_model(YOLO_MODEL_PATH)
+        SERVICE_STATE = ServiceState(model, YOLO_MODEL_PATH, config_from_globals())
         logger.info(f"YOLO模型加载成功: {YOLO_MODEL_PATH} | 类别: {model.names}")
     except Exception as e:
         logger.error(f"模型加载失败，请检查路径: '{YOLO_MODEL_PATH}'. 错误: {e}", exc_info=True); exit(1)
     logger.info("启动Web服务器，监听地址: http://127.0.0.1:8085")
-    run(server="paste", host='127.0.0.1', port=8085)
\ No newline at end of file
+    run(server="paste", host='127.0.0.1', port=8085)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+检测框聚类合并引擎 - 供 YOLO后处理.py / yolo_RTDETR后处理.PY / detect_gateway.py 共用
+功能:
+- 沿合并方向排序后做扫描线，只对间距在 MAX_*_GAP 以内的框计算对齐指标，不再两两比较所有框
+- 对齐指标 (水平IoU / 垂直重叠率 / 间隙) 用 numpy 一次性向量化计算
+- 并查集聚类，聚类结果、输出顺序与原来的两两比较完全一致
+
+直接运行本文件会生成密集的模拟页面，对比新旧两种实现的结果和耗时:
+    python box_merge.py
+"""
+
+import time
+import random
+import numpy as np
+
+# 对齐判断需要的 4 个参数 (与 YOLO后处理.py 配置区同名)
+ALIGNMENT_KEYS = (
+    "HORIZONTAL_IOU_FOR_VERTICAL_MERGE", "MAX_VERTICAL_GAP_FOR_VERTICAL_MERGE",
+    "VERTICAL_OVERLAP_FOR_HORIZONTAL_MERGE", "MAX_HORIZONTAL_GAP_FOR_HORIZONTAL_MERGE",
+)
+
+# 扫描线候选范围的额外余量 (像素)。只会多取候选，最终仍按精确条件判断，保证结果不变。
+SWEEP_SLACK = 1.0
+
+
+def merge_cluster(cluster):
+    if not cluster: return None
+    locs = [b['location'] for b in cluster]
+    min_left = min(l['left'] for l in locs)
+    min_top = min(l['top'] for l in locs)
+    max_right = max(l['left'] + l['width'] for l in locs)
+    max_bottom = max(l['top'] + l['height'] for l in locs)
+    return {
+        "location": {
+            "left": int(min_left), "top": int(min_top),
+            "width": int(max_right - min_left), "height": int(max_bottom - min_top),
+            "className": locs[0]['className']
+        }, "confidence": round(max(b['confidence'] for b in cluster), 4)
+    }
+
+
+def _box_arrays(boxes):
+    arr = np.array([(b['location']['left'], b['location']['top'], b['location']['width'], b['location']['height'])
+                    for b in boxes], dtype=np.float64)
+    return arr[:, 0], arr[:, 1], arr[:, 2], arr[:, 3]
+
+
+def _candidate_pairs(start, end, max_gap):
+    """扫描线: 按起点排序，每个框只与起点落在 [自己的起点, 自己的终点 + max_gap) 内的框配对。
+    两框间隙 = 后者起点 - min(两者终点) >= 后者起点 - 前者终点，所以间隙 < max_gap 的框对一定在候选中。"""
+    n = len(start)
+    order = np.argsort(start, kind='stable')
+    sorted_start = start[order]
+    stop = np.searchsorted(sorted_start, end[order] + max_gap + SWEEP_SLACK, side='left')
+    counts = np.maximum(stop - np.arange(n) - 1, 0)
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    first = np.repeat(np.arange(n), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return order[first], order[first + 1 + offsets]
+
+
+def aligned_pairs(boxes, direction, cfg):
+    """返回满足对齐条件的框对 (i, j)。判断规则与原 are_boxes_aligned 完全相同:
+    - vertical:   水平IoU >= HORIZONTAL_IOU_FOR_VERTICAL_MERGE 且 垂直间隙 < MAX_VERTICAL_GAP_FOR_VERTICAL_MERGE
+    - horizontal: 垂直重叠率 >= VERTICAL_OVERLAP_FOR_HORIZONTAL_MERGE 且 水平间隙 < MAX_HORIZONTAL_GAP_FOR_HORIZONTAL_MERGE
+    """
+    left, top, width, height = _box_arrays(boxes)
+    right, bottom = left + width, top + height
+    if direction == 'vertical':
+        i, j = _candidate_pairs(top, bottom, cfg["MAX_VERTICAL_GAP_FOR_VERTICAL_MERGE"])
+        # 水平IoU
+        i_w = np.maximum(0, np.minimum(right[i], right[j]) - np.maximum(left[i], left[j]))
+        u_w = (right[i] - left[i]) + (right[j] - left[j]) - i_w
+        valid = (i_w != 0) & (u_w > 0)
+        ratio = np.where(valid, i_w / np.where(valid, u_w, 1.0), 0.0)
+        gap = np.maximum(top[i], top[j]) - np.minimum(bottom[i], bottom[j])
+        ok = ~(ratio < cfg["HORIZONTAL_IOU_FOR_VERTICAL_MERGE"]) & (gap < cfg["MAX_VERTICAL_GAP_FOR_VERTICAL_MERGE"])
+    elif direction == 'horizontal':
+        i, j = _candidate_pairs(left, right, cfg["MAX_HORIZONTAL_GAP_FOR_HORIZONTAL_MERGE"])
+        # 垂直重叠率 = 重叠高度 / 较矮框的高度
+        inter_h = np.maximum(0, np.minimum(bottom[i], bottom[j]) - np.maximum(top[i], top[j]))
+        min_h = np.minimum(height[i], height[j])
+        valid = (inter_h != 0) & (min_h != 0)
+        ratio = np.where(valid, inter_h / np.where(valid, min_h, 1.0), 0.0)
+        gap = np.maximum(left[i], left[j]) - np.minimum(right[i], right[j])
+        ok = ~(ratio < cfg["VERTICAL_OVERLAP_FOR_HORIZONTAL_MERGE"]) & (gap < cfg["MAX_HORIZONTAL_GAP_FOR_HORIZONTAL_MERGE"])
+    else:
+        return []
+    return list(zip(i[ok].tolist(), j[ok].tolist()))
+
+
+def _group_clusters(boxes, pairs):
+    num_boxes = len(boxes)
+    parent = list(range(num_boxes))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for i, j in pairs:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j: parent[root_j] = root_i
+
+    # 按原始下标遍历分组，保证每个簇内的顺序和簇之间的顺序都与原实现一致
+    clusters = {}
+    for i in range(num_boxes):
+        clusters.setdefault(find(i), []).append(boxes[i])
+    return [merge_cluster(c) for c in clusters.values() if c]
+
+
+def cluster_and_merge(boxes, direction, cfg):
+    """按 direction ('vertical' / 'horizontal') 聚类合并同一类别的框。"""
+    if not boxes: return []
+    return _group_clusters(boxes, aligned_pairs(boxes, direction, cfg))
+
+
+# ======================= 原始实现 (仅用于对比测试) =======================
+
+def _are_boxes_aligned_reference(b1, b2, direction, cfg):
+    if direction == 'horizontal':
+        y1_min, y1_max = b1['top'], b1['top'] + b1['height']
+        y2_min, y2_max = b2['top'], b2['top'] + b2['height']
+        inter = max(0, min(y1_max, y2_max) - max(y1_min, y2_min))
+        min_h = min(b1['height'], b2['height'])
+        ratio = inter / min_h if inter != 0 and min_h != 0 else 0.0
+        if ratio < cfg["VERTICAL_OVERLAP_FOR_HORIZONTAL_MERGE"]:
+            return False
+        gap = max(b1['left'], b2['left']) - min(b1['left'] + b1['width'], b2['left'] + b2['width'])
+        return gap < cfg["MAX_HORIZONTAL_GAP_FOR_HORIZONTAL_MERGE"]
+    elif direction == 'vertical':
+        x1_min, x1_max = b1['left'], b1['left'] + b1['width']
+        x2_min, x2_max = b2['left'], b2['left'] + b2['width']
+        i_w = max(0, min(x1_max, x2_max) - max(x1_min, x2_min))
+        u_w = (x1_max - x1_min) + (x2_max - x2_min) - i_w
+        iou = i_w / u_w if i_w != 0 and u_w > 0 else 0.0
+        if iou < cfg["HORIZONTAL_IOU_FOR_VERTICAL_MERGE"]:
+            return False
+        gap = max(b1['top'], b2['top']) - min(b1['top'] + b1['height'], b2['top'] + b2['height'])
+        return gap < cfg["MAX_VERTICAL_GAP_FOR_VERTICAL_MERGE"]
+    return False
+
+
+def cluster_and_merge_reference(boxes, direction, cfg):
+    """原来的 O(n²) 两两比较实现。"""
+    if not boxes: return []
+    pairs = [(i, j) for i in range(len(boxes)) for j in range(i + 1, len(boxes))
+             if _are_boxes_aligned_reference(boxes[i]['location'], boxes[j]['location'], direction, cfg)]
+    return _group_clusters(boxes, pairs)
+
+
+# ======================= 密集页面基准测试 =======================
+
+def make_dense_page(num_boxes, seed, page_w=2400, page_h=3400):
+    """模拟 balloon 在 conf=0.01 下的输出: 多列竖排文字，每列被切成很多碎片，外加随机噪点框。"""
+    rng = random.Random(seed)
+    boxes = []
+    while len(boxes) < num_boxes:
+        col_w = rng.uniform(25, 45)
+        left = rng.uniform(0, page_w - col_w)
+        top = rng.uniform(0, page_h * 0.8)
+        for _ in range(rng.randint(3, 15)):
+            h = rng.uniform(15, 80)
+            boxes.append({"location": {"left": left + rng.uniform(-3, 3), "top": top, "width": col_w + rng.uniform(-4, 4),
+                                       "height": h, "className": "balloon"}, "confidence": rng.uniform(0.01, 0.99)})
+            top += h + rng.uniform(-5, 40)
+        if rng.random() < 0.3:
+            boxes.append({"location": {"left": rng.uniform(0, page_w), "top": rng.uniform(0, page_h), "width": rng.uniform(5, 300),
+                                       "height": rng.uniform(5, 300), "className": "balloon"}, "confidence": rng.uniform(0.01, 0.99)})
+    return boxes[:num_boxes]
+
+
+def benchmark(sizes=(100, 500, 1000, 3000), repeats=3):
+    cfg = {"HORIZONTAL_IOU_FOR_VERTICAL_MERGE": 0.7, "MAX_VERTICAL_GAP_FOR_VERTICAL_MERGE": 30,
+           "VERTICAL_OVERLAP_FOR_HORIZONTAL_MERGE": 0.8, "MAX_HORIZONTAL_GAP_FOR_HORIZONTAL_MERGE": 5}
+    print(f"{'框数':>6} {'方向':>10} {'原实现(ms)':>12} {'扫描线(ms)':>12} {'加速':>8}  结果一致")
+    for n in sizes:
+        for direction in ('vertical', 'horizontal'):
+            boxes = make_dense_page(n, seed=n)
+            start = time.perf_counter()
+            expected = cluster_and_merge_reference(boxes, direction, cfg)
+            reference_ms = (time.perf_counter() - start) * 1000
+            best_ms = float('inf')
+            for _ in range(repeats):
+                start = time.perf_counter()
+                merged = cluster_and_merge(boxes, direction, cfg)
+                best_ms = min(best_ms, (time.perf_counter() - start) * 1000)
+            same = merged == expected
+            print(f"{n:>6} {direction:>10} {reference_ms:>12.1f} {best_ms:>12.2f} {reference_ms / best_ms:>7.1f}x  {'是' if same else '否'}")
+            assert same, f"{n} 个框 {direction} 合并结果不一致"
+
+
+if __name__ == '__main__':
+    benchmark()
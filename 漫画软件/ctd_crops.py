@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CTD 裁剪推理 - 供 yolo_to_mask_ctd.py / yolo_to_mask_gui.py 共用
+整页模式下 CTD 把整页缩放到 detect_size (1024) 再推理, 之后 YOLO 框外的结果全部丢弃;
+文字框只占页面 10~20% 时大部分计算是浪费的, 而且小字在缩放中丢失细节。
+裁剪模式:
+- 把 YOLO 框向外扩 CROP_PADDING 像素, 重叠的区域合并
+- 以整页模式 1.5 倍的分辨率缩放后, 用货架算法 (shelf packing) 把多个区域 (可以来自多页)
+  拼进 detect_size x detect_size 的画布, 一张画布 = 一次 CTD 前向;
+  区域之间留空白间隔, 避免相邻文字被连在一起
+- 每个区域的掩膜从画布中切出、缩放回原尺寸, 贴回整页掩膜 (框外为 0, 与整页模式 + YOLO 过滤一致)
+- 超出画布的大区域单独推理 (由 CTD 自己缩放)
+
+用法:
+    from ctd_crops import crop_ctd_mask, crop_ctd_masks, mask_iou
+    page_mask, stats = crop_ctd_mask(image_bgr, yolo_boxes, lambda img: ctd_model(img, refine_mode=0)[1])
+    masks, stats = crop_ctd_masks([(图片1, 框1), (图片2, 框2), ...], run_ctd)   # 多页共用画布
+
+直接运行本文件会用一个模拟检测器 (缩放到 detect_size 后按亮度阈值取文字) 对比两种模式的前向次数和精度:
+    python ctd_crops.py
+"""
+
+import time
+import cv2
+import numpy as np
+
+DEFAULT_CANVAS_SIZE = 1024   # 与 CTDModel 的 detect_size 相同, 画布内的像素 1:1 进入网络
+DEFAULT_PADDING = 16         # YOLO 框外扩像素, 给 CTD 留一点上下文
+DEFAULT_DETAIL = 1.5         # 裁剪区域的分辨率 = 整页模式的 1.5 倍 (整页模式缩放为 detect_size / 长边, 4000 像素的页面约 0.26)
+DEFAULT_GAP = 16             # 画布上区域之间的空白
+DEFAULT_FILL = 255           # 画布底色 (漫画页面多为白底)
+
+
+def merge_regions(boxes, img_w, img_h, padding):
+    """YOLO 像素框 (x1, y1, x2, y2) -> 外扩并合并重叠后的区域列表"""
+    rects = []
+    for x1, y1, x2, y2 in boxes:
+        if x2 <= x1 or y2 <= y1:
+            continue
+        rects.append([max(0, x1 - padding), max(0, y1 - padding),
+                      min(img_w, x2 + padding), min(img_h, y2 + padding)])
+    merged = True
+    while merged:
+        merged = False
+        out = []
+        for r in rects:
+            for o in out:
+                if r[0] < o[2] and o[0] < r[2] and r[1] < o[3] and o[1] < r[3]:
+                    o[0], o[1] = min(o[0], r[0]), min(o[1], r[1])
+                    o[2], o[3] = max(o[2], r[2]), max(o[3], r[3])
+                    merged = True
+                    break
+            else:
+                out.append(r)
+        rects = out
+    return [tuple(r) for r in rects]
+
+
+def pack_regions(sizes, canvas_size, gap):
+    """
+    货架算法: sizes 为 [(w, h)], 返回画布列表 [[(下标, x, y), ...], ...]。
+    宽或高超过画布的区域单独占一张画布 (位置 (0, 0))。
+    """
+    canvases = []
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i][1])
+    current = None
+    x = y = shelf_h = 0
+    for i in order:
+        w, h = sizes[i]
+        if w > canvas_size or h > canvas_size:
+            canvases.append([(i, 0, 0)])
+            continue
+        if current is not None and x + w > canvas_size:
+            # 换到下一层货架
+            x, y, shelf_h = 0, y + shelf_h + gap, 0
+        if current is None or y + h > canvas_size:
+            current = []
+            canvases.append(current)
+            x = y = shelf_h = 0
+        current.append((i, x, y))
+        x += w + gap
+        shelf_h = max(shelf_h, h)
+    return canvases
+
+
+def crop_ctd_masks(pages, run_ctd, canvas_size=DEFAULT_CANVAS_SIZE, padding=DEFAULT_PADDING,
+                   scale=None, detail=DEFAULT_DETAIL, gap=DEFAULT_GAP, fill=DEFAULT_FILL):
+    """
+    只在 YOLO 框附近运行 CTD, 多页的裁剪区域拼进同一批画布。
+    pages: [(图片, YOLO像素框列表)]; run_ctd(图片) -> 与输入同尺寸的 uint8 掩膜 (通常是 CTDModel 返回的 mask_refined)。
+    scale 为 None 时每页使用 整页模式缩放 x detail (不超过 1.0)。
+    返回 ([整页掩膜, ...], 统计信息)。
+    """
+    masks, crops = [], []  # crops: (页下标, 区域, 缩放后的裁剪图)
+    stats = {"pages": len(pages), "regions": 0, "forwards": 0, "region_pixels": 0, "page_pixels": 0}
+    for p, (image, boxes) in enumerate(pages):
+        img_h, img_w = image.shape[:2]
+        masks.append(np.zeros((img_h, img_w), np.uint8))
+        stats["page_pixels"] += img_w * img_h
+        s = scale if scale is not None else min(1.0, full_page_scale(img_w, img_h, canvas_size) * detail)
+        for x1, y1, x2, y2 in merge_regions(boxes, img_w, img_h, padding):
+            crop = image[y1:y2, x1:x2]
+            if s != 1.0:
+                size = (max(1, round((x2 - x1) * s)), max(1, round((y2 - y1) * s)))
+                crop = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+            crops.append((p, (x1, y1, x2, y2), crop))
+            stats["regions"] += 1
+            stats["region_pixels"] += (x2 - x1) * (y2 - y1)
+    if not crops:
+        return masks, stats
+
+    sample = crops[0][2]
+    for placements in pack_regions([(c.shape[1], c.shape[0]) for _, _, c in crops], canvas_size, gap):
+        first = crops[placements[0][0]][2]
+        if len(placements) == 1 and max(first.shape[:2]) > canvas_size:
+            canvas = first
+        else:
+            canvas = np.full((canvas_size, canvas_size) + sample.shape[2:], fill, dtype=sample.dtype)
+            for i, cx, cy in placements:
+                crop = crops[i][2]
+                canvas[cy:cy + crop.shape[0], cx:cx + crop.shape[1]] = crop
+        canvas_mask = run_ctd(canvas)
+        stats["forwards"] += 1
+
+        # 切回各区域, 缩放回原尺寸后贴回所属页面
+        for i, cx, cy in placements:
+            p, (x1, y1, x2, y2), crop = crops[i]
+            ch, cw = crop.shape[:2]
+            region_mask = canvas_mask[cy:cy + ch, cx:cx + cw]
+            if (cw, ch) != (x2 - x1, y2 - y1):
+                region_mask = cv2.resize(region_mask, (x2 - x1, y2 - y1), interpolation=cv2.INTER_LINEAR)
+                region_mask = np.where(region_mask > 127, 255, 0).astype(np.uint8)
+            target = masks[p][y1:y2, x1:x2]
+            np.maximum(target, region_mask, out=target)
+    return masks, stats
+
+
+def crop_ctd_mask(image, boxes, run_ctd, **kwargs):
+    """单页版本, 返回 (整页掩膜, 统计信息)"""
+    masks, stats = crop_ctd_masks([(image, boxes)], run_ctd, **kwargs)
+    return masks[0], stats
+
+
+def mask_iou(a, b):
+    """两个掩膜 (>127 视为前景) 的 IoU; 都为空时返回 1.0"""
+    fa, fb = a > 127, b > 127
+    union = np.count_nonzero(fa | fb)
+    return np.count_nonzero(fa & fb) / union if union else 1.0
+
+
+def full_page_scale(img_w, img_h, canvas_size=DEFAULT_CANVAS_SIZE):
+    """整页模式下 CTD 的缩放比例"""
+    return min(1.0, canvas_size / max(img_w, img_h))
+
+
+def _fake_ctd(image, detect_size=DEFAULT_CANVAS_SIZE):
+    """模拟检测器: 缩放到 detect_size 后按亮度阈值取文字, 再放大回原尺寸 (模拟整页缩放造成的细节损失)"""
+    h, w = image.shape[:2]
+    s = detect_size / max(h, w)
+    small = cv2.resize(image, (max(1, round(w * s)), max(1, round(h * s))), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    mask = np.where(gray < 128, 255, 0).astype(np.uint8)
+    mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_LINEAR)
+    return np.where(mask > 127, 255, 0).astype(np.uint8)
+
+
+def _make_page(seed, width=3000, height=4200, num_boxes=30):
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width, 3), 255, np.uint8)
+    truth = np.zeros((height, width), np.uint8)
+    boxes = []
+    for _ in range(num_boxes):
+        bw, bh = int(rng.integers(80, 260)), int(rng.integers(150, 500))
+        x, y = int(rng.integers(0, width - bw)), int(rng.integers(0, height - bh))
+        boxes.append((x, y, x + bw, y + bh))
+        # 细笔画文字: 2~4 像素宽的竖排短线
+        for cx in range(x + 10, x + bw - 10, 28):
+            for cy in range(y + 10, y + bh - 20, 30):
+                t = int(rng.integers(2, 5))
+                cv2.line(page, (cx, cy), (cx + 12, cy + 16), (0, 0, 0), t)
+                cv2.line(truth, (cx, cy), (cx + 12, cy + 16), 255, t)
+    return page, truth, boxes
+
+
+def benchmark(num_pages=5):
+    def filtered(mask, boxes):
+        keep = np.zeros_like(mask)
+        for x1, y1, x2, y2 in boxes:
+            keep[y1:y2, x1:x2] = 255
+        return cv2.bitwise_and(mask, keep)
+
+    pages, truths = [], []
+    for seed in range(num_pages):
+        page, truth, boxes = _make_page(seed)
+        pages.append((page, boxes))
+        truths.append(truth)
+
+    t0 = time.perf_counter()
+    full_masks = [filtered(_fake_ctd(page), boxes) for page, boxes in pages]
+    t_full = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    crop_masks, stats = crop_ctd_masks(pages, _fake_ctd)
+    t_crop = time.perf_counter() - t0
+    crop_masks = [filtered(m, boxes) for m, (_, boxes) in zip(crop_masks, pages)]
+
+    h, w = pages[0][0].shape[:2]
+    ious = [mask_iou(a, b) for a, b in zip(full_masks, crop_masks)]
+    print(f"{num_pages} 页, 区域占页面 {stats['region_pixels'] / stats['page_pixels']:.0%}, "
+          f"整页缩放 {full_page_scale(w, h):.2f}, 裁剪缩放 {full_page_scale(w, h) * DEFAULT_DETAIL:.2f}")
+    print(f"前向次数: 整页 {num_pages}, 裁剪 {stats['forwards']} "
+          f"(节省 {1 - stats['forwards'] / num_pages:.0%}); 耗时 整页 {t_full:.2f}s, 裁剪 {t_crop:.2f}s")
+    print(f"两种模式掩膜 IoU: 平均 {np.mean(ious):.3f}, 最低 {np.min(ious):.3f}")
+    print(f"与真实笔画的 IoU: 整页 {np.mean([mask_iou(m, t) for m, t in zip(full_masks, truths)]):.3f}, "
+          f"裁剪 {np.mean([mask_iou(m, t) for m, t in zip(crop_masks, truths)]):.3f}")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,720 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多模型检测网关 - 一个进程托管多个检测模型
+功能:
+- 同一个端口(8085)下按路由区分模型: /detect/yolo, /detect/rtdetr, /detect/rtdetrv2 ...
+- /detect 保持与 ImageTrans / BallonsTranslator 原有接口一致，转发到默认模型
+- 模型首次使用时才加载(懒加载)，超出显存/内存预算时卸载最久未使用的模型(LRU)
+- 每个模型的后处理参数放在 gateway_models/<模型名>.json 中，修改保存后下一次请求自动生效，无需重启
+- 修改模型路径或调用 /admin/reload/<模型名> 时在后台加载新模型，预热完成前旧模型继续服务
+- /detect 请求体可携带 conf / classes / merge / expand 字段，只覆盖本次请求的后处理参数
+- 每个模型一个有界准入队列，队列满回复 429、排队超时回复 503，均带 Retry-After
+
+配置文件格式 (gateway_models/yolo.json):
+{
+    "type": "yolo",                # yolo / rtdetr (ultralytics) / hf_rtdetr / hf_rtdetr_v2 (HuggingFace) / mock (压测用)
+    "model_path": "D:\\...\\best.pt",
+    "imgsz": 1280,                 # 推理尺寸
+    "iou": 0.91,                   # NMS 的 IoU 阈值 (仅 ultralytics 模型)
+    "agnostic_nms": true,
+    "memory_mb": 0,                # 可选: 手动指定模型占用(MB)，0 = 加载后按参数量自动统计
+    "postprocess": {               # 与 YOLO后处理.py 配置区同名的参数，未写的使用默认值
+        "PER_CLASS_CONF_CONFIG": {"balloon": 0.01},
+        "FINAL_CONF_THRESHOLD": 0.5,
+        "MERGE_CONFIG": {"balloon": "vertical"},
+        ...
+    }
+}
+"""
+
+import os
+import json
+import time
+import base64
+import random
+import logging
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from PIL import Image
+from bottle import BaseRequest, route, run, request, response, static_file
+from box_merge import cluster_and_merge
+from reading_order import order_detections
+from request_overrides import apply_request_overrides
+
+# --- 基础配置 ---
+BaseRequest.MEMFILE_MAX = 10 * 1024 * 1024
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger()
+
+# ======================= 功能配置区 =======================
+
+# --- 1. 模型配置文件目录 ---
+# 目录下每个 .json 文件就是一个模型，文件名(不含扩展名)即路由名，例如 yolo.json -> /detect/yolo
+MODEL_CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gateway_models")
+
+# --- 2. 默认模型 ---
+# 访问 /detect (不带模型名) 时使用的模型，兼容 ImageTrans / BallonsTranslator 现有设置。
+DEFAULT_MODEL = "yolo"
+
+# --- 3. 模型常驻预算 ---
+# 所有已加载模型的总占用上限 (单位: MB)。超出时按“最久未使用”顺序卸载其他模型。
+# 至少会保留刚加载的那一个模型，即使它本身就超过预算。
+MODEL_MEMORY_BUDGET_MB = 6144
+
+# --- 4. 热更新与单次请求覆盖 ---
+# 管理接口的总开关：POST /admin/reload/<模型名> 在后台重新加载模型，完成前旧模型继续服务。
+ENABLE_ADMIN_API = True
+# 是否允许 /detect 请求体中携带单次覆盖参数 (conf / classes / merge / expand)，只影响当前请求。
+ALLOW_REQUEST_OVERRIDES = True
+# 新模型加载后用一张空白图预热一次。
+WARMUP_IMAGE_SIZE = 640
+
+# --- 5. 背压与过载保护 ---
+# 每个模型同时只有 1 个请求在推理，其余请求在有界队列中等待。
+# 队列已满时直接回复 429 (不读取请求体)，避免整本漫画的几 MB base64 请求全部堆在内存里。
+MAX_QUEUE_DEPTH = 8
+# 请求的最长等待时间 (秒)，从到达服务器开始计算。还没轮到推理就超时的请求直接丢弃并回复 503。
+# 客户端也可以通过请求头 X-Deadline-Ms 指定更短的期限。
+REQUEST_DEADLINE_SECONDS = 30
+# 请求体大小上限 (MB)，超出直接回复 413。
+MAX_BODY_MB = 32
+
+# --- 6. 服务地址 ---
+HOST = "127.0.0.1"
+PORT = 8085
+
+
+# ======================= 后处理参数默认值 =======================
+# 与 YOLO后处理.py 配置区保持一致；配置文件中的 "postprocess" 只需写需要改动的项。
+DEFAULT_POSTPROCESS = {
+    "PER_CLASS_CONF_CONFIG": {},
+    "DEFAULT_INITIAL_CONF": 0.01,
+    "FINAL_CONF_THRESHOLD": 0.5,
+    "ENABLE_FILTER": False,
+    "FILTER_CLASSES": [],
+    "MERGE_CONFIG": {},
+    "HORIZONTAL_IOU_FOR_VERTICAL_MERGE": 0.7,
+    "MAX_VERTICAL_GAP_FOR_VERTICAL_MERGE": 30,
+    "VERTICAL_OVERLAP_FOR_HORIZONTAL_MERGE": 0.8,
+    "MAX_HORIZONTAL_GAP_FOR_HORIZONTAL_MERGE": 5,
+    "ENABLE_STANDARDIZED_WIDTH": False,
+    "STANDARDIZED_WIDTHS": {},
+    "ENABLE_STANDARDIZED_HEIGHT": False,
+    "STANDARDIZED_HEIGHTS": {},
+    "ENABLE_EXPANSION": False,
+    "EXPAND_VALUES": {},
+    "CLASS_NAME_MAP": {},
+    # 返回前按阅读顺序排列 (reading_order.py)：COLUMNS_RTL / COLUMNS_LTR / ROWS_TTB / 旧排序模式，null 保持模型输出顺序
+    "RESULT_ORDER": "COLUMNS_RTL",
+    "RESULT_ORDER_MIN_OVERLAP": 0.5,
+}
+
+# 改动后需要重新加载模型的字段；其余字段(后处理参数、推理尺寸等)修改后直接生效。
+MODEL_IDENTITY_KEYS = ("type", "model_path", "device")
+
+
+# ======================= 模型配置 (文件热更新) =======================
+
+class ModelConfigError(Exception):
+    """模型配置文件无法读取或格式不正确 (例如保存到一半)，且没有上一次能用的配置。"""
+
+
+class ModelConfigStore:
+    """读取 gateway_models/*.json，按文件修改时间自动重新读取。
+    文件损坏时继续使用上一次读取成功的配置，只有从未读取成功时才报错。"""
+
+    def __init__(self, config_dir):
+        self.config_dir = config_dir
+        self._lock = threading.Lock()
+        self._cache = {}  # name -> (mtime, config)
+        self._bad = {}    # name -> (mtime, 错误说明)，同一个损坏版本只解析、记录一次
+
+    def names(self):
+        if not os.path.isdir(self.config_dir):
+            return []
+        return sorted(os.path.splitext(f)[0] for f in os.listdir(self.config_dir) if f.lower().endswith(".json"))
+
+    def get(self, name):
+        """返回模型配置字典；文件不存在时返回 None。
+        文件无法解析时返回上一次的有效配置，没有时抛出 ModelConfigError。"""
+        path = os.path.join(self.config_dir, f"{name}.json")
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._cache.get(name)
+            if cached and cached[0] == mtime:
+                return cached[1]
+            bad = self._bad.get(name)
+        if bad is None or bad[0] != mtime:
+            try:
+                config = self._parse(name, path)
+            except (ValueError, OSError, TypeError) as e:
+                bad = (mtime, f"模型配置文件无效: {path} ({e})")
+                with self._lock:
+                    self._bad[name] = bad
+                logger.error(f"[{name}] {bad[1]}" + ("，继续使用上一次的有效配置" if cached else ""))
+            else:
+                bad = None
+        if bad is not None:
+            if cached:
+                return cached[1]
+            raise ModelConfigError(bad[1])
+        with self._lock:
+            self._bad.pop(name, None)
+            if cached:
+                logger.info(f"[{name}] 配置文件已更新，新参数立即生效")
+            self._cache[name] = (mtime, config)
+        return config
+
+    @staticmethod
+    def _parse(name, path):
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        if not isinstance(raw, dict):
+            raise TypeError("顶层必须是 JSON 对象")
+        raw_postprocess = raw.get("postprocess", {})
+        if not isinstance(raw_postprocess, dict):
+            raise TypeError("postprocess 必须是 JSON 对象")
+        config = dict(raw)
+        config["name"] = name
+        postprocess = dict(DEFAULT_POSTPROCESS)
+        postprocess.update(raw_postprocess)
+        config["postprocess"] = postprocess
+        return config
+
+
+def model_identity(config):
+    return tuple(config.get(k) for k in MODEL_IDENTITY_KEYS)
+
+
+# ======================= 模型后端 =======================
+# 每个后端统一返回原始检测框列表:
+#   [{"location": {"left", "top", "width", "height", "className"}, "confidence": float}, ...]
+
+def _torch_module_bytes(module):
+    total = 0
+    for t in list(module.parameters()) + list(module.buffers()):
+        total += t.numel() * t.element_size()
+    return total
+
+
+class UltralyticsBackend:
+    """ultralytics 的 YOLO / RTDETR 模型。"""
+
+    def __init__(self, config):
+        from ultralytics import YOLO, RTDETR
+        model_cls = RTDETR if config["type"] == "rtdetr" else YOLO
+        self.model = model_cls(config["model_path"])
+        self.names = self.model.names
+
+    def memory_bytes(self):
+        return _torch_module_bytes(self.model.model)
+
+    def predict(self, image, config, conf):
+        prediction = self.model.predict(source=image, conf=conf, iou=config.get("iou", 0.7),
+                                        imgsz=config.get("imgsz", 1280),
+                                        agnostic_nms=config.get("agnostic_nms", True), verbose=False)
+        boxes = []
+        if not prediction or prediction[0].boxes is None:
+            return boxes
+        for box in prediction[0].boxes:
+            class_name = self.names[int(box.cls)]
+            x_c, y_c, w, h = box.xywh[0].tolist()
+            boxes.append({
+                "location": {"left": x_c - w / 2, "top": y_c - h / 2, "width": w, "height": h, "className": class_name},
+                "confidence": min(max(float(box.conf[0].item()), 0.0), 1.0)
+            })
+        return boxes
+
+
+class HuggingFaceRTDetrBackend:
+    """HuggingFace 格式的 RT-DETR (v1 / v2) 模型，对应 YESREDEV2.py / Huggingv2.py。"""
+
+    def __init__(self, config):
+        import torch
+        from transformers import RTDetrImageProcessor
+        if config["type"] == "hf_rtdetr_v2":
+            from transformers import RTDetrV2ForObjectDetection as model_cls
+        else:
+            from transformers import RTDetrForObjectDetection as model_cls
+        self.torch = torch
+        self.device = torch.device(config.get("device") or ("cuda" if torch.cuda.is_available() else "cpu"))
+        self.model = model_cls.from_pretrained(config["model_path"]).to(self.device)
+        self.image_processor = RTDetrImageProcessor.from_pretrained(config["model_path"])
+        self.names = self.model.config.id2label
+
+    def memory_bytes(self):
+        return _torch_module_bytes(self.model)
+
+    def predict(self, image, config, conf):
+        torch = self.torch
+        size = config.get("imgsz", 640)
+        inputs = self.image_processor(images=image, return_tensors="pt", size={"height": size, "width": size})
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        with torch.no_grad():
+            outputs = self.model(**inputs)
+        results = self.image_processor.post_process_object_detection(
+            outputs, target_sizes=torch.tensor([image.size[::-1]]).to(self.device), threshold=conf)
+        boxes = []
+        for res in results:
+            for score, label_id, box in zip(res["scores"], res["labels"], res["boxes"]):
+                x1, y1, x2, y2 = box.tolist()
+                boxes.append({
+                    "location": {"left": x1, "top": y1, "width": x2 - x1, "height": y2 - y1,
+                                 "className": self.names[label_id.item()]},
+                    "confidence": float(score.item())
+                })
+        return boxes
+
+
+class MockBackend:
+    """模拟模型 (不需要 torch)，用于压测 HTTP 层和后处理层。
+    按图片尺寸生成固定的一组候选框: 若干竖排文字列，每列切成多个碎片，和 balloon 的低阈值输出类似，
+    可以完整走一遍合并逻辑。配置项:
+      "mock_latency_ms": 模拟推理耗时，默认 0
+      "mock_columns":    每页的文字列数，默认 20
+      "mock_fragments":  每列的碎片数，默认 8
+      "mock_classes":    类别名列表，默认 ["balloon", "qipao", "changfangtiao"]
+    """
+
+    def __init__(self, config):
+        self.names = dict(enumerate(config.get("mock_classes", ["balloon", "qipao", "changfangtiao"])))
+
+    def memory_bytes(self):
+        return 0
+
+    def predict(self, image, config, conf):
+        latency_ms = config.get("mock_latency_ms", 0)
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        width, height = image.size
+        rng = random.Random(width * 100003 + height)
+        boxes = []
+        for _ in range(config.get("mock_columns", 20)):
+            class_name = self.names[rng.randrange(len(self.names))]
+            col_w = rng.uniform(20, 40)
+            left = rng.uniform(0, max(1, width - col_w))
+            top = rng.uniform(0, height * 0.7)
+            for _ in range(config.get("mock_fragments", 8)):
+                frag_h = rng.uniform(20, 60)
+                confidence = rng.uniform(0.01, 0.99)
+                if confidence >= conf:
+                    boxes.append({
+                        "location": {"left": left + rng.uniform(-2, 2), "top": top, "width": col_w, "height": frag_h,
+                                     "className": class_name},
+                        "confidence": confidence
+                    })
+                top += frag_h + rng.uniform(0, 40)
+        return boxes
+
+
+BACKENDS = {
+    "mock": MockBackend,
+    "yolo": UltralyticsBackend,
+    "rtdetr": UltralyticsBackend,
+    "hf_rtdetr": HuggingFaceRTDetrBackend,
+    "hf_rtdetr_v2": HuggingFaceRTDetrBackend,
+}
+
+
+# ======================= 模型常驻池 (LRU) =======================
+
+class ModelSlot:
+    """一个已加载的模型。推理锁只锁这一个模型，不影响其他模型的请求。"""
+
+    def __init__(self, name, identity, backend, size_bytes):
+        self.name = name
+        self.identity = identity
+        self.backend = backend
+        self.size_bytes = size_bytes
+        self.infer_lock = threading.Lock()
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.requests = 0
+
+
+class ModelPool:
+    """按需加载模型，总占用超过预算时卸载最久未使用的模型。"""
+
+    def __init__(self, config_store, budget_mb):
+        self.config_store = config_store
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self._slots = OrderedDict()  # name -> ModelSlot，末尾是最近使用的
+        self._lock = threading.Lock()  # 只保护 _slots，加载模型时不持有
+        self._load_locks = {}
+        self._swapping = set()  # 正在后台加载新版本的模型名
+        self._failed = {}  # name -> 加载失败的 identity
+
+    def _load_lock(self, name):
+        with self._lock:
+            return self._load_locks.setdefault(name, threading.Lock())
+
+    def acquire(self, name, config):
+        """返回可用的 ModelSlot，必要时加载模型。
+        配置文件中的模型路径被修改时，旧模型继续服务，新模型在后台加载预热完成后再替换。"""
+        identity = model_identity(config)
+        with self._lock:
+            slot = self._slots.get(name)
+            if slot is not None:
+                self._slots.move_to_end(name)
+                slot.last_used = time.time()
+                if slot.identity != identity:
+                    self._start_swap_locked(name, config, identity)
+                return slot
+
+        # 同一个模型只加载一次；其他模型的请求不受影响
+        with self._load_lock(name):
+            with self._lock:
+                slot = self._slots.get(name)
+                if slot is not None:
+                    return slot
+            slot = self._load(name, config, identity)
+            self._install(name, slot)
+            return slot
+
+    def _install(self, name, slot):
+        with self._lock:
+            self._slots[name] = slot
+            self._slots.move_to_end(name)
+            self._evict_locked(keep=name)
+
+    def _start_swap_locked(self, name, config, identity):
+        if name in self._swapping or self._failed.get(name) == identity:
+            return
+        self._swapping.add(name)
+        logger.info(f"[{name}] 模型配置已修改，后台加载新模型，加载完成前继续使用旧模型")
+        threading.Thread(target=self._swap_worker, args=(name, config, identity), daemon=True).start()
+
+    def _swap_worker(self, name, config, identity):
+        try:
+            with self._load_lock(name):
+                slot = self._load(name, config, identity)
+            self._install(name, slot)
+            logger.info(f"[{name}] 新模型已预热完成并切换")
+        except Exception as e:
+            # 记住失败的配置，避免每个请求都重试；配置文件再次修改后才会重新尝试
+            self._failed[name] = identity
+            logger.error(f"[{name}] 新模型加载失败，继续使用旧模型: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._swapping.discard(name)
+
+    def reload(self, name, config):
+        """管理接口: 强制在后台重新加载模型 (即使配置未变)，完成前旧模型继续服务。"""
+        identity = model_identity(config)
+        with self._lock:
+            self._failed.pop(name, None)
+            if name in self._swapping:
+                return False
+            self._start_swap_locked(name, config, identity)
+            return True
+
+    def _load(self, name, config, identity):
+        backend_cls = BACKENDS.get(config.get("type"))
+        if backend_cls is None:
+            raise ValueError(f"未知的模型类型: {config.get('type')} (可选: {', '.join(BACKENDS)})")
+        logger.info(f"[{name}] 正在加载模型: {config.get('model_path')}")
+        start = time.perf_counter()
+        backend = backend_cls(config)
+        # 用一张空白图预热，避免第一个真实请求承担 CUDA 初始化的延迟
+        backend.predict(Image.new("RGB", (WARMUP_IMAGE_SIZE, WARMUP_IMAGE_SIZE)), config, 0.5)
+        size_bytes = int(config.get("memory_mb", 0) * 1024 * 1024) or backend.memory_bytes()
+        logger.info(f"[{name}] 模型加载完成，用时 {time.perf_counter() - start:.2f}s，"
+                    f"占用约 {size_bytes / 1024 / 1024:.1f} MB | 类别: {backend.names}")
+        return ModelSlot(name, identity, backend, size_bytes)
+
+    def _evict_locked(self, keep):
+        total = sum(s.size_bytes for s in self._slots.values())
+        evicted = False
+        for name in list(self._slots):
+            if total <= self.budget_bytes:
+                break
+            if name == keep:
+                continue
+            slot = self._slots.pop(name)
+            total -= slot.size_bytes
+            evicted = True
+            logger.info(f"[{name}] 超出模型预算，卸载最久未使用的模型 (释放约 {slot.size_bytes / 1024 / 1024:.1f} MB)")
+        if evicted:
+            _release_cuda_cache()
+
+    def status(self):
+        with self._lock:
+            return [{
+                "name": s.name,
+                "memory_mb": round(s.size_bytes / 1024 / 1024, 1),
+                "requests": s.requests,
+                "idle_seconds": round(time.time() - s.last_used, 1),
+            } for s in self._slots.values()]
+
+
+def _release_cuda_cache():
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+
+
+# ======================= 后处理 (与 YOLO后处理.py 相同的流程) =======================
+
+def postprocess(raw_boxes, pp):
+    """初筛 -> 类别过滤 -> 按类别合并 -> 最终置信度过滤 -> 统一尺寸/扩展 -> 类别名映射 -> 按阅读顺序排列。"""
+    raw_results_by_class = {}
+    for box in raw_boxes:
+        class_name = box['location']['className']
+        if box['confidence'] < pp["PER_CLASS_CONF_CONFIG"].get(class_name, pp["DEFAULT_INITIAL_CONF"]):
+            continue
+        if pp["ENABLE_FILTER"] and class_name not in pp["FILTER_CLASSES"]:
+            continue
+        raw_results_by_class.setdefault(class_name, []).append(box)
+
+    processed_results = []
+    for class_name, bboxes in raw_results_by_class.items():
+        direction = pp["MERGE_CONFIG"].get(class_name)
+        if direction in ('vertical', 'horizontal'):
+            processed_results.extend(cluster_and_merge(bboxes, direction, pp))
+        else:
+            processed_results.extend(bboxes)
+
+    final_results = []
+    for res in processed_results:
+        if res['confidence'] < pp["FINAL_CONF_THRESHOLD"]:
+            continue
+        original_loc = res['location']
+        c_name = original_loc['className']
+        x_c, y_c = original_loc['left'] + original_loc['width'] / 2, original_loc['top'] + original_loc['height'] / 2
+        base_w = pp["STANDARDIZED_WIDTHS"].get(c_name, original_loc['width']) if pp["ENABLE_STANDARDIZED_WIDTH"] else original_loc['width']
+        base_h = pp["STANDARDIZED_HEIGHTS"].get(c_name, original_loc['height']) if pp["ENABLE_STANDARDIZED_HEIGHT"] else original_loc['height']
+        t_e, b_e, l_e, r_e = pp["EXPAND_VALUES"].get(c_name, (0, 0, 0, 0)) if pp["ENABLE_EXPANSION"] else (0, 0, 0, 0)
+        f_w = base_w + l_e + r_e
+        f_h = base_h + t_e + b_e
+        final_x_c = x_c + (r_e - l_e) / 2
+        final_y_c = y_c + (b_e - t_e) / 2
+        final_loc = {"left": final_x_c - f_w / 2, "top": final_y_c - f_h / 2, "width": f_w, "height": f_h,
+                     "className": pp["CLASS_NAME_MAP"].get(c_name, c_name)}
+        final_results.append({"location": final_loc, "confidence": res['confidence']})
+    return order_detections(final_results, pp["RESULT_ORDER"], pp["RESULT_ORDER_MIN_OVERLAP"])
+
+
+def initial_conf(pp):
+    """模型推理时使用的最低置信度 = 所有初筛阈值中的最小值，保证后处理能拿到全部候选框。"""
+    return min([pp["DEFAULT_INITIAL_CONF"]] + list(pp["PER_CLASS_CONF_CONFIG"].values()))
+
+
+# ======================= 背压: 有界准入队列 =======================
+
+class AdmissionController:
+    """单个模型的准入队列: 1 个推理位 + MAX_QUEUE_DEPTH 个等待位。
+    排队时间与服务时间分开统计，Retry-After 按最近的平均服务时间估算。"""
+
+    def __init__(self, name, max_queue):
+        self.name = name
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self.running = 0
+        self.waiting = 0
+        self.avg_service_s = 1.0  # 服务时间的指数滑动平均
+        self.stats = {"accepted": 0, "rejected_full": 0, "dropped_deadline": 0,
+                      "total_queue_ms": 0.0, "total_service_ms": 0.0, "completed": 0}
+
+    def retry_after(self):
+        """预计多少秒后可以重试 (至少 1 秒)。"""
+        return max(1, int(round((self.waiting + self.running) * self.avg_service_s)))
+
+    def try_admit(self):
+        """立即判断能否进入队列；队列已满返回 False。"""
+        with self._cond:
+            if self.running + self.waiting >= 1 + self.max_queue:
+                self.stats["rejected_full"] += 1
+                return False
+            self.waiting += 1
+            self.stats["accepted"] += 1
+            return True
+
+    def wait_turn(self, deadline):
+        """等待推理位；在 deadline (time.monotonic) 之前没轮到则退出队列并返回 False。"""
+        with self._cond:
+            while self.running >= 1:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.waiting -= 1
+                    self.stats["dropped_deadline"] += 1
+                    self._cond.notify()
+                    return False
+                self._cond.wait(remaining)
+            self.waiting -= 1
+            self.running += 1
+            return True
+
+    def release(self, queue_ms, service_ms):
+        with self._cond:
+            self.running -= 1
+            self.avg_service_s = 0.8 * self.avg_service_s + 0.2 * (service_ms / 1000)
+            self.stats["completed"] += 1
+            self.stats["total_queue_ms"] += queue_ms
+            self.stats["total_service_ms"] += service_ms
+            self._cond.notify()
+
+    def status(self):
+        with self._cond:
+            done = max(self.stats["completed"], 1)
+            return {"running": self.running, "waiting": self.waiting, "max_queue": self.max_queue,
+                    "avg_queue_ms": round(self.stats["total_queue_ms"] / done, 1),
+                    "avg_service_ms": round(self.stats["total_service_ms"] / done, 1),
+                    **{k: v for k, v in self.stats.items() if not k.startswith("total_")}}
+
+
+_admission = {}
+_admission_lock = threading.Lock()
+
+
+def admission_for(name):
+    with _admission_lock:
+        if name not in _admission:
+            _admission[name] = AdmissionController(name, MAX_QUEUE_DEPTH)
+        return _admission[name]
+
+
+def request_deadline(arrived):
+    """请求的截止时间: 服务器默认期限与客户端 X-Deadline-Ms 中较短的一个。"""
+    seconds = REQUEST_DEADLINE_SECONDS
+    header = request.get_header("X-Deadline-Ms")
+    if header:
+        try:
+            seconds = min(seconds, int(header) / 1000)
+        except ValueError:
+            pass
+    return arrived + seconds
+
+
+def overloaded(status, retry_after, message):
+    response.status = status
+    response.set_header("Retry-After", str(retry_after))
+    return {"error": message, "retry_after": retry_after}
+
+
+# ======================= Web 服务逻辑区 =======================
+
+config_store = ModelConfigStore(MODEL_CONFIG_DIR)
+model_pool = ModelPool(config_store, MODEL_MEMORY_BUDGET_MB)
+
+
+def handle_detect(name):
+    arrived = time.monotonic()
+    try:
+        config = config_store.get(name)
+    except ModelConfigError as e:
+        response.status = 500
+        return {"error": str(e)}
+    if config is None:
+        response.status = 404
+        return {"error": f"未找到模型配置: {name} (可用: {', '.join(config_store.names())})"}
+    if (request.content_length or 0) > MAX_BODY_MB * 1024 * 1024:
+        response.status = 413
+        return {"error": f"请求体超过 {MAX_BODY_MB} MB"}
+
+    # 先判断队列是否已满，满了就不读取请求体，直接让客户端稍后重试
+    admission = admission_for(name)
+    if not admission.try_admit():
+        logger.warning(f"[{name}] 队列已满 ({admission.max_queue})，拒绝请求")
+        return overloaded(429, admission.retry_after(), "服务器繁忙，队列已满，请稍后重试")
+    if not admission.wait_turn(request_deadline(arrived)):
+        logger.warning(f"[{name}] 请求排队超时，未进入推理即丢弃")
+        return overloaded(503, admission.retry_after(), "请求排队超时，已丢弃，请稍后重试")
+
+    started = time.monotonic()
+    queue_ms = (started - arrived) * 1000
+    try:
+        json_data = request.json
+        image_b64 = json_data.get("image") if json_data else None
+        if not image_b64:
+            return {"error": "请求中未找到图像数据"}
+        net_img = Image.open(BytesIO(base64.b64decode(image_b64))).convert("RGB")
+
+        pp = config["postprocess"]
+        if ALLOW_REQUEST_OVERRIDES:
+            try:
+                pp = apply_request_overrides(pp, json_data)
+            except (ValueError, TypeError, AttributeError) as e:
+                response.status = 400
+                return {"error": f"覆盖参数不合法: {e}"}
+        slot = model_pool.acquire(name, config)
+        start = time.perf_counter()
+        with slot.infer_lock:
+            raw_boxes = slot.backend.predict(net_img, config, initial_conf(pp))
+            slot.requests += 1
+        infer_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        results = postprocess(raw_boxes, pp)
+        postprocess_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"[{name}] 候选框 {len(raw_boxes)} -> 输出 {len(results)}，"
+                    f"排队 {queue_ms:.1f} ms，推理 {infer_ms:.1f} ms，后处理 {postprocess_ms:.1f} ms")
+        return {"results": results}
+    except Exception as e:
+        logger.error(f"[{name}] 检测过程中发生错误: {e}", exc_info=True)
+        return {"error": f"服务器内部错误: {e}"}
+    finally:
+        service_ms = (time.monotonic() - started) * 1000
+        admission.release(queue_ms, service_ms)
+        # 排队时间与服务时间分开返回，便于客户端/压测工具区分
+        response.set_header("X-Queue-Time-Ms", f"{queue_ms:.1f}")
+        response.set_header("X-Service-Time-Ms", f"{service_ms:.1f}")
+
+
+@route('/detect', method='POST')
+def detect_default():
+    return handle_detect(DEFAULT_MODEL)
+
+
+@route('/detect/<name>', method='POST')
+def detect_named(name):
+    return handle_detect(name)
+
+
+@route('/models', method='GET')
+def list_models():
+    return {"available": config_store.names(), "default": DEFAULT_MODEL,
+            "budget_mb": MODEL_MEMORY_BUDGET_MB, "loaded": model_pool.status(),
+            "queues": {name: a.status() for name, a in list(_admission.items())}}
+
+
+@route('/admin/reload/<name>', method='POST')
+def admin_reload(name):
+    """重新读取配置文件并在后台重新加载该模型；加载预热完成前旧模型继续服务。
+    只修改后处理参数时不需要调用，保存配置文件后下一次请求即生效。"""
+    if not ENABLE_ADMIN_API:
+        response.status = 403
+        return {"error": "管理接口未开启 (ENABLE_ADMIN_API = False)"}
+    try:
+        config = config_store.get(name)
+    except ModelConfigError as e:
+        response.status = 500
+        return {"error": str(e)}
+    if config is None:
+        response.status = 404
+        return {"error": f"未找到模型配置: {name}"}
+    if not model_pool.reload(name, config):
+        response.status = 409
+        return {"error": f"模型 {name} 正在后台加载，请稍后再试"}
+    response.status = 202
+    return {"status": "loading", "model": name, "model_path": config.get("model_path")}
+
+
+@route('/<filepath:path>')
+def server_static(filepath): return static_file(filepath, root='www')
+
+
+# ======================= 启动 =======================
+if __name__ == '__main__':
+    names = config_store.names()
+    if not names:
+        logger.error(f"未找到任何模型配置文件，请在 {MODEL_CONFIG_DIR} 中放置 <模型名>.json"); exit(1)
+    logger.info(f"可用模型: {names} | 默认模型: {DEFAULT_MODEL} | 模型预算: {MODEL_MEMORY_BUDGET_MB} MB")
+    logger.info(f"启动Web服务器，监听地址: http://{HOST}:{PORT}")
+    run(server="paste", host=HOST, port=PORT)
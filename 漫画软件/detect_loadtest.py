@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/detect 服务压测工具 - 模拟 ImageTrans / BallonsTranslator 的真实请求
+功能:
+- 把一个文件夹里的漫画页按 ImageTrans 的格式 ({"image": base64}) 发送到任意检测服务
+  (YESNEWYOLO.py / YOLO后处理.py / YESrtDETR.PY / Huggingv2.py / detect_gateway.py ...)
+- 可设置并发数、到达速率 (每秒请求数) 和重复率 (重复发送已经发过的页面，模拟重新检测)
+- 统计吞吐量、p50/p95/p99 延迟、错误率、状态码分布，以及服务进程的内存 (RSS) 变化
+- 服务端返回 X-Queue-Time-Ms / X-Service-Time-Ms 时 (detect_gateway.py)，分别统计排队时间与服务时间
+
+不想加载 torch 时，用 detect_gateway.py 的 mock 模型压测 HTTP 层和后处理层:
+    python detect_gateway.py
+    python detect_loadtest.py 漫画文件夹 --url http://127.0.0.1:8085/detect/mock --concurrency 8
+
+用法: 把图片文件夹拖到脚本上，或在命令行指定参数。
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# ======================= 功能配置区 =======================
+
+# 检测服务地址
+DEFAULT_URL = "http://127.0.0.1:8085/detect"
+# 同时在途的请求数 (ImageTrans 默认逐页发送，相当于 1)
+DEFAULT_CONCURRENCY = 4
+# 到达速率 (每秒请求数)。0 = 闭环模式，每个并发位收到响应后立刻发下一个
+DEFAULT_RATE = 0.0
+# 总请求数。0 = 文件夹中每页发送一次
+DEFAULT_REQUESTS = 0
+# 重复率 (0.0-1.0)：每个请求以该概率重发一个已经发过的页面
+DEFAULT_REPEAT_RATIO = 0.0
+# 单个请求的超时 (秒)
+DEFAULT_TIMEOUT = 120
+# 内存采样间隔 (秒)
+RSS_SAMPLE_INTERVAL = 1.0
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+# ======================= 页面加载 =======================
+
+def load_pages(folder):
+    """读取文件夹中的图片并预先编码成 base64，避免编码耗时算进延迟。"""
+    files = sorted(f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+    pages = []
+    for name in files:
+        with open(os.path.join(folder, name), "rb") as f:
+            body = json.dumps({"image": base64.b64encode(f.read()).decode("ascii")}).encode("utf-8")
+        pages.append((name, body))
+    return pages
+
+
+def build_schedule(pages, total, repeat_ratio, seed=0):
+    """生成发送顺序：按顺序翻页，以 repeat_ratio 的概率重发一个已发过的页面。"""
+    rng = random.Random(seed)
+    order, sent, next_index = [], [], 0
+    for _ in range(total):
+        if sent and rng.random() < repeat_ratio:
+            index = rng.choice(sent)
+        else:
+            index = next_index % len(pages)
+            next_index += 1
+            sent.append(index)
+        order.append(index)
+    return order
+
+
+# ======================= 服务进程内存采样 =======================
+
+def read_rss_mb(pid):
+    """读取进程 RSS (MB)。优先使用 psutil，Linux 下退回读取 /proc。"""
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / 1024 / 1024
+    except ImportError:
+        pass
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid, interval):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []  # (相对时间秒, RSS MB)
+        self._stop_event = threading.Event()
+        self._start = time.perf_counter()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            rss = read_rss_mb(self.pid)
+            if rss is not None:
+                self.samples.append((time.perf_counter() - self._start, rss))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+# ======================= 发送请求 =======================
+
+def send_request(url, body, timeout):
+    """返回 (状态码, 响应里的框数量或 None, 排队ms, 服务ms, 错误信息)。"""
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            payload = json.loads(resp.read().decode("utf-8"))
+            headers = resp.headers
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        return e.code, None, _header_ms(e.headers, "X-Queue-Time-Ms"), _header_ms(e.headers, "X-Service-Time-Ms"), f"HTTP {e.code}"
+    except Exception as e:
+        return 0, None, None, None, f"{type(e).__name__}: {e}"
+    if "error" in payload:
+        return status, None, _header_ms(headers, "X-Queue-Time-Ms"), _header_ms(headers, "X-Service-Time-Ms"), payload["error"]
+    return status, len(payload.get("results", [])), _header_ms(headers, "X-Queue-Time-Ms"), _header_ms(headers, "X-Service-Time-Ms"), None
+
+
+def _header_ms(headers, name):
+    value = headers.get(name) if headers else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def run_load(pages, schedule, url, concurrency, rate, timeout, seed=0):
+    """按计划发送请求。开环模式 (rate > 0) 下延迟从“计划发送时间”算起，
+    客户端并发位不够导致的等待也计入延迟，避免低估服务过载时的真实延迟。"""
+    results = []
+    lock = threading.Lock()
+    rng = random.Random(seed + 1)
+    start = time.perf_counter()
+
+    def task(index, scheduled_at):
+        # 闭环模式没有计划时间，从真正开始发送时计时
+        sent_at = scheduled_at if scheduled_at is not None else time.perf_counter()
+        name, body = pages[index]
+        status, boxes, queue_ms, service_ms, error = send_request(url, body, timeout)
+        finished = time.perf_counter()
+        with lock:
+            results.append({"page": name, "status": status, "boxes": boxes, "error": error,
+                            "latency_ms": (finished - sent_at) * 1000,
+                            "queue_ms": queue_ms, "service_ms": service_ms,
+                            "finished_s": finished - start})
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        next_at = start
+        for index in schedule:
+            if rate > 0:
+                next_at += rng.expovariate(rate)  # 泊松到达
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(task, index, next_at)
+            else:
+                pool.submit(task, index, None)
+    elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+# ======================= 统计报告 =======================
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def summarize(results, elapsed, rss_samples):
+    latencies = [r["latency_ms"] for r in results if r["error"] is None]
+    errors = [r for r in results if r["error"] is not None]
+    status_counts = {}
+    for r in results:
+        status_counts[str(r["status"])] = status_counts.get(str(r["status"]), 0) + 1
+    queue = [r["queue_ms"] for r in results if r["queue_ms"] is not None]
+    service = [r["service_ms"] for r in results if r["service_ms"] is not None]
+    report = {
+        "requests": len(results),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed > 0 else 0.0,
+        "error_rate": round(len(errors) / len(results), 4) if results else 0.0,
+        "status_counts": status_counts,
+        "latency_ms": {f"p{p}": _round(percentile(latencies, p)) for p in (50, 95, 99)},
+        "server_queue_ms": {f"p{p}": _round(percentile(queue, p)) for p in (50, 95, 99)} if queue else None,
+        "server_service_ms": {f"p{p}": _round(percentile(service, p)) for p in (50, 95, 99)} if service else None,
+        "rss_mb": None,
+        "errors_sample": sorted({r["error"] for r in errors})[:10],
+    }
+    if rss_samples:
+        values = [v for _, v in rss_samples]
+        report["rss_mb"] = {"start": round(values[0], 1), "peak": round(max(values), 1), "end": round(values[-1], 1),
+                            "timeline": [[round(t, 1), round(v, 1)] for t, v in rss_samples]}
+    return report
+
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+
+def print_report(report):
+    print("\n" + "=" * 60)
+    print(f"请求数: {report['requests']}    用时: {report['elapsed_s']} s    吞吐量: {report['throughput_rps']} 请求/秒")
+    print(f"错误率: {report['error_rate'] * 100:.2f}%    状态码: {report['status_counts']}")
+    lat = report["latency_ms"]
+    print(f"端到端延迟 (ms): p50={lat['p50']}  p95={lat['p95']}  p99={lat['p99']}")
+    if report["server_queue_ms"]:
+        q, s = report["server_queue_ms"], report["server_service_ms"]
+        print(f"服务端排队 (ms): p50={q['p50']}  p95={q['p95']}  p99={q['p99']}")
+        print(f"服务端处理 (ms): p50={s['p50']}  p95={s['p95']}  p99={s['p99']}")
+    if report["rss_mb"]:
+        rss = report["rss_mb"]
+        print(f"服务进程内存 (MB): 开始={rss['start']}  峰值={rss['peak']}  结束={rss['end']}")
+        for t, v in rss["timeline"]:
+            print(f"    {t:7.1f}s  {v:9.1f} MB")
+    if report["errors_sample"]:
+        print("错误示例:")
+        for e in report["errors_sample"]:
+            print(f"    {e}")
+    print("=" * 60)
+
+
+# ======================= 主程序 =======================
+
+def main():
+    parser = argparse.ArgumentParser(description="用文件夹中的漫画页压测 /detect 检测服务。")
+    parser.add_argument("input_folder", nargs="?", default="", help="(拖拽模式) 图片文件夹")
+    parser.add_argument("--url", default=DEFAULT_URL, help="检测服务地址")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="并发数")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="到达速率 (请求/秒)，0 = 闭环")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="总请求数，0 = 每页一次")
+    parser.add_argument("--repeat-ratio", type=float, default=DEFAULT_REPEAT_RATIO, help="重复发送已发页面的概率")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="单个请求超时 (秒)")
+    parser.add_argument("--server-pid", type=int, default=0, help="服务进程 PID，用于采样内存 (RSS)")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，保证多次压测的请求顺序一致")
+    parser.add_argument("--report", default="", help="把统计结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    folder = args.input_folder or input("请输入图片文件夹路径: ").strip().strip('"')
+    if not os.path.isdir(folder):
+        print(f"错误: 文件夹不存在: {folder}")
+        return
+    pages = load_pages(folder)
+    if not pages:
+        print(f"错误: 文件夹中没有图片: {folder}")
+        return
+
+    total = args.requests or len(pages)
+    schedule = build_schedule(pages, total, args.repeat_ratio, args.seed)
+    print(f"页面: {len(pages)}  请求: {total}  并发: {args.concurrency}  "
+          f"速率: {args.rate or '闭环'}  重复率: {args.repeat_ratio}  目标: {args.url}")
+
+    sampler = None
+    if args.server_pid:
+        sampler = RssSampler(args.server_pid, RSS_SAMPLE_INTERVAL)
+        sampler.start()
+    results, elapsed = run_load(pages, schedule, args.url, args.concurrency, args.rate, args.timeout, args.seed)
+    if sampler:
+        sampler.stop()
+        sampler.join()
+
+    report = summarize(results, elapsed, sampler.samples if sampler else [])
+    print_report(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"统计结果已保存: {args.report}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        traceback.print_exc()
+    if os.name == "nt" and not sys.stdin.isatty():
+        try:
+            input("\n按回车键退出...")
+        except EOFError:
+            pass
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片宽高索引 - 只需要图片尺寸的脚本共用 (BallonsTranslator/YOLO 互转、反向生成掩膜、横竖图分组、宽高比统计等)
+- 只解析文件头, 不解码像素: JPEG / PNG / WebP / BMP / GIF / AVIF(HEIF) 直接读取头部字段,
+  其他格式 (TIFF、JXL 等) 退回 PIL.Image.open (同样只读文件头)
+- 多线程批量读取 (读文件头主要是磁盘 IO, 线程即可并行)
+- 结果保存在 SQLite 索引中, 以 路径 + 文件大小 + 修改时间 为键; 文件没变时第二次运行不再读取图片
+
+得到的是文件中存储的宽高, 与 PIL 的 Image.size 一致 (不按 EXIF 方向旋转)。
+
+用法:
+    from image_dims import image_sizes, image_size
+    sizes = image_sizes(图片路径列表)      # {路径: (宽, 高)}, 无法识别的图片为 None
+    w, h = image_size(path)                # 单张图片 (不使用索引)
+    python image_dims.py <文件夹>          # 测试: 统计文件夹内全部图片的尺寸与耗时
+
+漫画软件 目录下的脚本直接 import 本模块; 数据制作 目录下的脚本找不到时把 漫画软件 目录加入 sys.path 再 import。
+脚本被单独复制到别处时请把 image_dims.py 一起复制过去。
+"""
+
+import os
+import sys
+import time
+import struct
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 索引文件位置 (所有脚本共用一个); None 表示不使用索引, 每次都读取文件头
+DEFAULT_DB_PATH = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache"),
+                               "YSG", "image_dims.sqlite3")
+# 读取线程数 (0 表示按 CPU 核心数自动决定)
+MAX_WORKERS = 0
+# 每个线程任务处理的图片数
+CHUNK_SIZE = 256
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif', '.avif', '.heic', '.heif', '.tif', '.tiff', '.jxl')
+
+# JPEG 中携带图像尺寸的 SOF 段 (C4 / C8 / CC 不是)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# 不带长度字段的 JPEG 标记
+_JPEG_STANDALONE = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+
+# ======================= 文件头解析 =======================
+
+def _jpeg_size(f):
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':      # 跳过段之间的垃圾数据
+            byte = f.read(1)
+        while byte == b'\xff':               # 跳过填充的 0xFF
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in _JPEG_STANDALONE:
+            continue
+        if marker == 0xD9 or marker == 0xDA:   # 图像结束 / 扫描数据开始之前都没有 SOF
+            return None
+        head = f.read(2)
+        if len(head) < 2:
+            return None
+        length = struct.unpack('>H', head)[0]
+        if marker in _JPEG_SOF:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack('>HH', data[1:5])
+            return width, height
+        f.seek(length - 2, 1)
+
+
+def _webp_size(head):
+    chunk = head[12:16]
+    if chunk == b'VP8 ' and len(head) >= 30:
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(head) >= 25:
+        b0, b1, b2, b3 = head[21:25]
+        return 1 + (b0 | (b1 & 0x3F) << 8), 1 + (b1 >> 6 | b2 << 2 | (b3 & 0x0F) << 10)
+    if chunk == b'VP8X' and len(head) >= 30:
+        return 1 + int.from_bytes(head[24:27], 'little'), 1 + int.from_bytes(head[27:30], 'little')
+    return None
+
+
+def _bmff_boxes(data, start=0, end=None):
+    """遍历 ISO BMFF 盒子, 产出 (类型, 内容起点, 内容终点)。"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack('>Q', data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _avif_size(f):
+    """AVIF / HEIF: 读取 meta 盒子, 取主图像 (pitm) 关联的 ispe 属性; 找不到关联时取最大的 ispe。"""
+    f.seek(0)
+    data = b''
+    meta = None
+    pos = 0
+    while meta is None:
+        f.seek(pos)
+        header = f.read(16)
+        if len(header) < 8:
+            return None
+        size, kind = struct.unpack('>I4s', header[:8])
+        if size == 1:
+            size = struct.unpack('>Q', header[8:16])[0]
+        elif size == 0:
+            size = os.fstat(f.fileno()).st_size - pos
+        if size < 8:
+            return None
+        if kind == b'meta':
+            f.seek(pos)
+            data = f.read(size)
+            meta = next(_bmff_boxes(data), None)
+        pos += size
+    _, start, end = meta
+    primary = None
+    properties = []
+    associations = {}
+    for kind, s, e in _bmff_boxes(data, start + 4, end):     # meta 是 FullBox, 跳过 version/flags
+        if kind == b'pitm':
+            primary = struct.unpack('>H', data[s + 4:s + 6])[0] if data[s] == 0 else struct.unpack('>I', data[s + 4:s + 8])[0]
+        elif kind == b'iprp':
+            for sub, ss, se in _bmff_boxes(data, s, e):
+                if sub == b'ipco':
+                    properties = [(k, data[ps:pe]) for k, ps, pe in _bmff_boxes(data, ss, se)]
+                elif sub == b'ipma':
+                    version, flags = data[ss], int.from_bytes(data[ss + 1:ss + 4], 'big')
+                    p = ss + 8
+                    for _ in range(struct.unpack('>I', data[ss + 4:ss + 8])[0]):
+                        if version < 1:
+                            item = struct.unpack('>H', data[p:p + 2])[0]
+                            p += 2
+                        else:
+                            item = struct.unpack('>I', data[p:p + 4])[0]
+                            p += 4
+                        count = data[p]
+                        p += 1
+                        indexes = []
+                        for _ in range(count):
+                            if flags & 1:
+                                indexes.append(struct.unpack('>H', data[p:p + 2])[0] & 0x7FFF)
+                                p += 2
+                            else:
+                                indexes.append(data[p] & 0x7F)
+                                p += 1
+                        associations[item] = indexes
+    sizes = [struct.unpack('>II', body[4:12]) if kind == b'ispe' and len(body) >= 12 else None
+             for kind, body in properties]
+    for index in associations.get(primary, ()):
+        if 0 < index <= len(sizes) and sizes[index - 1]:
+            return sizes[index - 1]
+    sizes = [s for s in sizes if s]
+    return max(sizes, key=lambda s: s[0] * s[1]) if sizes else None
+
+
+def _header_size(f):
+    head = f.read(32)
+    if head.startswith(b'\x89PNG\r\n\x1a\n') and len(head) >= 24:
+        return struct.unpack('>II', head[16:24])
+    if head.startswith(b'\xff\xd8'):
+        return _jpeg_size(f)
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return _webp_size(head)
+    if head.startswith(b'BM') and len(head) >= 26:
+        if struct.unpack('<I', head[14:18])[0] == 12:    # OS/2 BITMAPCOREHEADER
+            return struct.unpack('<HH', head[18:22])
+        width, height = struct.unpack('<ii', head[18:26])
+        return abs(width), abs(height)
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return struct.unpack('<HH', head[6:10])
+    if head[4:8] == b'ftyp':
+        return _avif_size(f)
+    return None
+
+
+def image_size(path):
+    """读取一张图片的 (宽, 高); 文件不存在或无法识别时返回 None。"""
+    try:
+        with open(path, 'rb') as f:
+            size = _header_size(f)
+    except (OSError, struct.error, IndexError, ValueError):
+        size = None
+    if size and size[0] > 0 and size[1] > 0:
+        return int(size[0]), int(size[1])
+    if Image is None or not os.path.isfile(path):
+        return None
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+# ======================= 尺寸索引 =======================
+
+def _key(path):
+    full = os.path.normcase(os.path.abspath(path))
+    return os.path.dirname(full), os.path.basename(full)
+
+
+def _open_db(db_path):
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    db = sqlite3.connect(db_path, timeout=30)
+    db.execute("CREATE TABLE IF NOT EXISTS dims (dir TEXT NOT NULL, name TEXT NOT NULL, size INTEGER, "
+               "mtime_ns INTEGER, width INTEGER, height INTEGER, PRIMARY KEY (dir, name))")
+    return db
+
+
+def _probe_chunk(chunk, cached):
+    """线程任务: stat 每个文件, 与索引记录比较, 变化了才读取文件头。返回 [(路径, 键, 大小, 修改时间, 尺寸, 是否新读取)]。"""
+    results = []
+    for path, key in chunk:
+        try:
+            st = os.stat(path)
+        except OSError:
+            results.append((path, key, None, None, None, False))
+            continue
+        row = cached.get(key)
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            results.append((path, key, st.st_size, st.st_mtime_ns, row[2], False))
+        else:
+            results.append((path, key, st.st_size, st.st_mtime_ns, image_size(path), True))
+    return results
+
+
+def image_sizes(paths, db_path=DEFAULT_DB_PATH, workers=MAX_WORKERS, on_progress=None):
+    """
+    批量读取图片尺寸, 返回 {路径: (宽, 高)} (键与传入的路径相同, 无法识别或不存在的图片为 None)。
+    db_path 为 None 时不使用索引; 索引无法打开或写入 (只读目录、被占用等) 时照常读取, 只是不保存。
+    on_progress(n) 在每完成 n 张图片后调用, 可用于显示进度。
+    """
+    paths = list(dict.fromkeys(str(p) for p in paths))
+    if not paths:
+        return {}
+    keyed = [(path, _key(path)) for path in paths]
+
+    db = None
+    cached = {}
+    if db_path:
+        try:
+            db = _open_db(db_path)
+            for directory in {key[0] for _, key in keyed}:
+                for name, size, mtime_ns, width, height in db.execute(
+                        "SELECT name, size, mtime_ns, width, height FROM dims WHERE dir = ?", (directory,)):
+                    cached[(directory, name)] = (size, mtime_ns, (width, height) if width is not None else None)
+        except sqlite3.Error as e:
+            print(f"[提示] 尺寸索引不可用，本次不使用索引：{e}")
+            db = None
+
+    chunks = [keyed[i:i + CHUNK_SIZE] for i in range(0, len(keyed), CHUNK_SIZE)]
+    workers = workers if workers and workers > 0 else min(32, (os.cpu_count() or 1) * 4)
+    sizes = {}
+    fresh = []
+    with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+        for results in pool.map(lambda chunk: _probe_chunk(chunk, cached), chunks):
+            for path, key, size, mtime_ns, dims, is_new in results:
+                sizes[path] = dims
+                if is_new:
+                    fresh.append((key[0], key[1], size, mtime_ns) + (dims if dims else (None, None)))
+            if on_progress:
+                on_progress(len(results))
+
+    if db is not None:
+        try:
+            if fresh:
+                with db:
+                    db.executemany("INSERT OR REPLACE INTO dims VALUES (?, ?, ?, ?, ?, ?)", fresh)
+            db.close()
+        except sqlite3.Error as e:
+            print(f"[提示] 尺寸索引保存失败（不影响本次结果）：{e}")
+    return sizes
+
+
+def main():
+    folder = sys.argv[1] if len(sys.argv) > 1 else os.getcwd()
+    paths = [os.path.join(root, name) for root, _, files in os.walk(folder)
+             for name in files if name.lower().endswith(IMAGE_EXTS)]
+    for label in ("第一次", "第二次 (索引)"):
+        start = time.perf_counter()
+        sizes = image_sizes(paths)
+        elapsed = time.perf_counter() - start
+        ok = sum(1 for s in sizes.values() if s)
+        print(f"{label}: {len(paths)} 张图片，识别 {ok} 张，耗时 {elapsed:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+项目 JSON 流式读写 - 供 ImageTrans .itp / BallonsTranslator 项目相关脚本 (以及 label_convert.py) 共用
+几千页的 .itp 可达几百 MB, json.load 整个项目再 json.dump 回去, 内存占用是文件大小的好几倍。这里:
+- 读取: 分块读文件, 顶层字段逐个解析, 页面对象 (.itp 的 images / BallonsTranslator 的 pages) 逐页解析产出,
+  任何时候只有一页在内存中
+- 写出: 按 字段 -> 逐页 -> 字段 的顺序流式写出, 输出与 json.dump(整个项目, indent=...) 逐字节相同;
+  indent=None 时输出紧凑格式 (无空格无换行, 文件更小、写得更快)
+- 局部替换: 只重新序列化指定的页面 (或在末尾追加新页), 其余内容按原文逐字节复制
+- 先写同目录临时文件, 完成后再 os.replace 覆盖目标, 可以直接覆盖正在读取的源文件
+
+用法:
+    for name, page in iter_pages(path):                       # 逐页读取
+        ...
+    rewrite_project(path, path, page_fn=修改函数)              # 逐页修改后原地写回
+    with ProjectWriter(out_path, indent=4) as w:               # 逐页写出新项目
+        w.field("dirPath", ...); w.begin_pages("images"); w.page(name, page); w.end_pages()
+    splice_project(path, path, {页名: 修改函数})                # 只改动指定页面, 其余部分保持原样 (返回 DROP_PAGE 删除该页)
+    splice_project(path, path, {...}, fields={字段名: 修改函数})  # 同时改动页面以外的顶层字段
+"""
+
+import os
+import json
+import tempfile
+
+READ_CHUNK_SIZE = 1 << 20      # 每次从文件读取的字符数 (页面比这更大时会自动加倍)
+ITP_PAGES_KEY = "images"       # ImageTrans 项目中存放页面的字段
+BT_PAGES_KEY = "pages"         # BallonsTranslator 项目中存放页面的字段
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',:]}'
+COMPACT_SEPARATORS = (',', ':')
+DROP_PAGE = object()           # splice_project 的修改函数返回它时, 从项目中删除该页
+
+
+# ======================= 流式读取 =======================
+
+class _ChunkReader:
+    """在分块读入的缓冲区上逐个解析 JSON 值, 已解析的部分会被丢弃。"""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _drop(self):
+        """丢弃已解析的部分。"""
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+
+    def _fill(self):
+        self._drop()
+        # 至少读入与当前缓冲区等长的内容, 超大页面也只需重试 O(log n) 次
+        data = self.f.read(max(self.chunk_size, len(self.buf)))
+        if not data:
+            self.eof = True
+            return False
+        self.buf += data
+        return True
+
+    def peek(self):
+        while True:
+            n = len(self.buf)
+            while self.pos < n and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < n:
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON 格式错误: 期望 '{char}'，实际为 '{found or '文件结尾'}'")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+                # 值后面必须紧跟分隔符才算完整: 缓冲区可能恰好截断在数字中间 (123 只读到 12、1e-7 只读到 1e),
+                # 这时读入更多内容再重新解析
+                if self.eof or (end < len(self.buf) and self.buf[end] in _DELIMITERS):
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def separator(self, closing):
+        """读取 ',' 或结束符, 返回是否还有下一项。"""
+        char = self.peek()
+        self.pos += 1
+        if char == ',':
+            return True
+        if char == closing:
+            return False
+        raise ValueError(f"JSON 格式错误: 期望 ',' 或 '{closing}'，实际为 '{char or '文件结尾'}'")
+
+
+class _SpliceReader(_ChunkReader):
+    """
+    边解析边把原文写到 out: 除了 replace() 指定的区间, 其余文本原样复制 (包括空白和换行)。
+    hold 不为 None 时, 该位置之后的内容暂不写出, 之后还可以在这里插入文本。
+    """
+
+    def __init__(self, f, chunk_size, out):
+        super().__init__(f, chunk_size)
+        self.out = out
+        self.mark = 0       # buf[mark:] 尚未写出
+        self.hold = None
+
+    def _drop(self):
+        cut = self.pos if self.hold is None else min(self.pos, self.hold)
+        if cut > self.mark:
+            self.out.write(self.buf[self.mark:cut])
+            self.mark = cut
+        if cut:
+            self.buf = self.buf[cut:]
+            self.pos -= cut
+            self.mark -= cut
+            if self.hold is not None:
+                self.hold -= cut
+
+    def replace(self, start, end, text):
+        """把 buf[start:end] 替换为 text (start == end 时为插入)。"""
+        self.out.write(self.buf[self.mark:start])
+        self.out.write(text)
+        self.mark = end
+
+    def finish(self):
+        self.out.write(self.buf[self.mark:])
+        self.buf, self.pos, self.mark = '', 0, 0
+        while True:
+            data = self.f.read(self.chunk_size)
+            if not data:
+                break
+            self.out.write(data)
+
+
+def iter_project(path, pages_key=ITP_PAGES_KEY, chunk_size=READ_CHUNK_SIZE):
+    """
+    按文件顺序产出事件:
+      ("field", 键, 值)        顶层普通字段
+      ("begin", 键, None)      页面对象开始
+      ("page", 页名, 页数据)   逐页产出
+      ("end", 键, None)        页面对象结束
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = _ChunkReader(f, chunk_size)
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            key = reader.value()
+            reader.expect(':')
+            if key == pages_key and reader.peek() == '{':
+                reader.pos += 1
+                yield "begin", key, None
+                if reader.peek() == '}':
+                    reader.pos += 1
+                else:
+                    while True:
+                        name = reader.value()
+                        reader.expect(':')
+                        yield "page", name, reader.value()
+                        if not reader.separator('}'):
+                            break
+                yield "end", key, None
+            else:
+                yield "field", key, reader.value()
+            if not reader.separator('}'):
+                break
+
+
+def iter_pages(path, pages_key=ITP_PAGES_KEY):
+    """逐页产出 (页名, 页数据)。"""
+    for kind, key, value in iter_project(path, pages_key):
+        if kind == "page":
+            yield key, value
+
+
+def read_fields(path, pages_key=ITP_PAGES_KEY):
+    """
+    读取除页面以外的全部顶层字段 (按原顺序), 页面对象的位置用 None 占位。
+    页面只解析不保留, 内存占用与页数无关。
+    """
+    fields = {}
+    for kind, key, value in iter_project(path, pages_key):
+        if kind == "field":
+            fields[key] = value
+        elif kind == "begin":
+            fields[key] = None
+    return fields
+
+
+# ======================= 流式写出 =======================
+
+def dump_json(value, indent, prefix=0):
+    """序列化为 JSON 文本; prefix 为所在嵌套层级的额外缩进。indent=None 时输出紧凑格式。"""
+    if indent is None:
+        return json.dumps(value, ensure_ascii=False, separators=COMPACT_SEPARATORS)
+    text = json.dumps(value, ensure_ascii=False, indent=indent)
+    return text.replace('\n', '\n' + ' ' * prefix) if prefix else text
+
+
+def encode_page(value, indent):
+    """把一页的数据预先序列化为 ProjectWriter.page(fragment=...) 可用的片段 (可以在子进程中完成)。"""
+    return dump_json(value, indent, prefix=2 * indent if indent else 0)
+
+
+def _open_temp(path, newline=None):
+    """在目标文件同目录创建临时文件, 返回 (文件对象, 临时路径)。"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    return os.fdopen(fd, 'w', encoding='utf-8', newline=newline), tmp_path
+
+
+def _commit_temp(f, tmp_path, path):
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    try:
+        # mkstemp 创建的文件权限是 0600, 覆盖已有文件时保持原权限
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+    except OSError:
+        pass
+    os.replace(tmp_path, path)
+
+
+def _discard_temp(f, tmp_path):
+    f.close()
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+
+
+class ProjectWriter:
+    """
+    项目 JSON 的流式写出。调用顺序: field()* -> begin_pages() -> page()* -> end_pages() -> field()* -> close()。
+    输出与 json.dump(整个项目, ensure_ascii=False, indent=indent) 完全相同。
+    """
+
+    def __init__(self, path, indent=4):
+        self.path, self.indent = path, indent
+        self.f, self.tmp_path = _open_temp(path)
+        self.keys = 0
+        self.pages = 0
+        self.f.write('{')
+
+    def _newline(self, level):
+        return '' if self.indent is None else '\n' + ' ' * (self.indent * level)
+
+    def _key(self, key):
+        sep = ':' if self.indent is None else ': '
+        self.f.write((',' if self.keys else '') + self._newline(1) + json.dumps(key, ensure_ascii=False) + sep)
+        self.keys += 1
+
+    def field(self, key, value):
+        self._key(key)
+        self.f.write(dump_json(value, self.indent, prefix=self.indent or 0))
+
+    def begin_pages(self, key):
+        self._key(key)
+        self.f.write('{')
+        self.pages = 0
+
+    def page(self, name, value=None, fragment=None):
+        """写入一页; fragment 为 encode_page() 预先序列化的结果 (给出时忽略 value)。"""
+        if fragment is None:
+            fragment = encode_page(value, self.indent)
+        sep = ':' if self.indent is None else ': '
+        self.f.write((',' if self.pages else '') + self._newline(2) + json.dumps(name, ensure_ascii=False) + sep + fragment)
+        self.pages += 1
+
+    def end_pages(self):
+        self.f.write((self._newline(1) + '}') if self.pages else '}')
+
+    def close(self):
+        self.f.write((self._newline(0) + '}') if self.keys else '}')
+        _commit_temp(self.f, self.tmp_path, self.path)
+
+    def abort(self):
+        _discard_temp(self.f, self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def rewrite_project(src_path, dst_path, page_fn=None, field_fn=None, pages_key=ITP_PAGES_KEY, indent=4):
+    """
+    逐页读取 src_path, 用 page_fn(页名, 页数据) / field_fn(键, 值) 修改 (返回新值), 流式写到 dst_path。
+    dst_path 可以与 src_path 相同 (读完后才替换)。返回处理的页数。
+    """
+    with ProjectWriter(dst_path, indent=indent) as writer:
+        for kind, key, value in iter_project(src_path, pages_key):
+            if kind == "field":
+                writer.field(key, field_fn(key, value) if field_fn else value)
+            elif kind == "begin":
+                writer.begin_pages(key)
+            elif kind == "page":
+                writer.page(key, page_fn(key, value) if page_fn else value)
+            else:
+                writer.end_pages()
+        pages = writer.pages
+    return pages
+
+
+def _layout(whitespace):
+    """由顶层第一个键前的空白推断缩进宽度和换行符; 没有换行时视为紧凑格式。"""
+    if '\n' not in whitespace:
+        return None, '\n'
+    return len(whitespace.rsplit('\n', 1)[1]), '\r\n' if '\r\n' in whitespace else '\n'
+
+
+def splice_project(src_path, dst_path, updates, pages_key=ITP_PAGES_KEY, chunk_size=READ_CHUNK_SIZE,
+                   fields=None):
+    """
+    只改动项目中的部分页面: updates 为 {页名: 函数(旧页数据) -> 新页数据}。
+    - 项目中已有的页: 用函数的返回值替换该页, 其余页面和字段按原文逐字节复制
+    - 项目中没有的页: 以 函数(None) 的返回值追加到页面对象末尾 (返回 None 则不追加)
+    - 函数返回 DROP_PAGE 时删除该页 (项目中没有该页时什么也不做)
+    fields 为 {顶层字段名: 函数(旧值) -> 新值}, 用于同时改动页面以外的字段 (如 BallonsTranslator 的 image_info);
+    项目中没有的字段不会新增。
+    新写入的内容沿用原文件的缩进和换行风格。dst_path 可以与 src_path 相同。返回 (替换页数, 追加页数)。
+    """
+    pending = dict(updates)
+    field_fns = dict(fields or {})
+    replaced = added = 0
+    with open(src_path, 'rb') as f:
+        bom = f.read(3) == b'\xef\xbb\xbf'
+    out, tmp_path = _open_temp(dst_path, newline='')
+    try:
+        if bom:
+            out.write('\ufeff')
+        with open(src_path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = _SpliceReader(f, chunk_size, out)
+            reader.expect('{')
+            reader.hold = reader.pos
+            reader.peek()
+            indent, newline = _layout(reader.buf[reader.hold:reader.pos])
+            reader.hold = None
+            sep = ':' if indent is None else ': '
+            page_prefix = '' if indent is None else newline + ' ' * (2 * indent)
+
+            def encode(value, level=2):
+                text = dump_json(value, indent, prefix=level * indent if indent else 0)
+                return text.replace('\n', newline) if newline != '\n' else text
+
+            found = False
+            if reader.peek() != '}':
+                while True:
+                    key = reader.value()
+                    reader.expect(':')
+                    if key == pages_key and not found and reader.peek() == '{':
+                        found = True
+                        reader.pos += 1
+                        reader.hold = reader.pos
+                        empty = reader.peek() == '}'
+                        kept = 0    # 输出中保留下来的页数
+                        if not empty:
+                            while True:
+                                # hold 在上一页的结尾 (第一页时是 '{' 之后), 删除页面时从这里开始删
+                                name = reader.value()
+                                reader.expect(':')
+                                reader.peek()
+                                value_offset = reader.pos - reader.hold  # 缓冲区丢弃前部时 hold 与 pos 同步平移
+                                value = reader.value()
+                                fn = pending.pop(name, None)
+                                new_value = fn(value) if fn is not None else None
+                                if fn is not None and new_value is DROP_PAGE:
+                                    if kept:
+                                        # 连同前面的 ',' 一起删除
+                                        reader.replace(reader.hold, reader.pos, '')
+                                        reader.hold = reader.pos
+                                        more = reader.separator('}')
+                                    else:
+                                        # 前面没有保留的页: 连同后面的 ',' 一起删除, 下一页前的空白保留
+                                        more = reader.separator('}')
+                                        if more:
+                                            reader.replace(reader.hold, reader.pos, '')
+                                            reader.hold = reader.pos
+                                    if not more:
+                                        break
+                                    continue
+                                if fn is not None:
+                                    reader.replace(reader.hold + value_offset, reader.pos, encode(new_value))
+                                    replaced += 1
+                                kept += 1
+                                reader.hold = reader.pos    # 新页插在最后一页之后
+                                if not reader.separator('}'):
+                                    break
+                        else:
+                            reader.pos += 1
+                        # 此时 buf[pos - 1] 是页面对象的 '}', hold 是最后一页的结尾 (没有保留的页时是 '{' 之后)
+                        extra = [page_prefix + json.dumps(name, ensure_ascii=False) + sep + encode(value) for name, value in
+                                 ((name, fn(None)) for name, fn in pending.items())
+                                 if value is not None and value is not DROP_PAGE]
+                        pending.clear()
+                        if not empty and not kept:
+                            # 原有的页全部删除: 与空页面对象一样处理, 没有新页时写成 {}
+                            closing = '' if indent is None or not extra else newline + ' ' * indent
+                            reader.replace(reader.hold, reader.pos - 1, ','.join(extra) + closing)
+                            added = len(extra)
+                        elif extra:
+                            if empty:
+                                closing = '' if indent is None else newline + ' ' * indent
+                                reader.replace(reader.hold, reader.pos - 1, ','.join(extra) + closing)
+                            else:
+                                reader.replace(reader.hold, reader.hold, ',' + ','.join(extra))
+                            added = len(extra)
+                        reader.hold = None
+                    elif key in field_fns and key != pages_key:
+                        reader.peek()
+                        reader.hold = reader.pos
+                        value = reader.value()
+                        reader.replace(reader.hold, reader.pos, encode(field_fns.pop(key)(value), level=1))
+                        reader.hold = None
+                    else:
+                        reader.value()
+                    if not reader.separator('}'):
+                        break
+            if pending and not found:
+                raise ValueError(f"项目中没有页面对象 '{pages_key}'，无法写入页面")
+            reader.finish()
+    except BaseException:
+        _discard_temp(out, tmp_path)
+        raise
+    _commit_temp(out, tmp_path, dst_path)
+    return replaced, added
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+标签转换往返校验与测速 - 检查各个转换脚本 / label_convert.py 改动后坐标有没有漂移、字段有没有丢、速度有没有变慢
+功能:
+- 用 label_convert.make_synthetic_pages 生成模拟漫画页 (随机水平框 / 旋转框、标签、原文、译文、文字颜色)
+- 按转换链逐步转换, 每一步都在单独的文件夹中进行:
+    XAL -> IT -> BT -> XAL    YOLO -> BT -> YOLO    MTU -> BT -> MTU
+  每条链分别用原来的拖拽脚本 (复制到工作目录后以子进程运行, 与双击 / 拖拽时相同) 和 label_convert 引擎各跑一遍
+- 链的最终输出与链的源文件都用 label_convert 的读取器读成中间表示后逐框比较, 统计:
+  最大坐标误差 (像素, 旋转后 4 个顶点)、最大角度误差 (度)、丢失的页 / 框、丢失的字段 (标签、原文、译文、文字颜色),
+  以及每一步的速度 (页/秒, 脚本步骤包含启动解释器的时间)
+- 与保存的基准 (label_bench_baseline.json) 比较: 误差变大、丢失变多或速度低于基准的一定比例时判为退化, 退出码为 1
+
+用法:
+    python label_bench.py                     # 与基准比较
+    python label_bench.py --update-baseline   # 确认改动无误后更新基准
+    python label_bench.py --pages 500 --no-speed-check
+速度与机器有关: 换了电脑后先运行一次 --update-baseline。
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+import numpy as np
+
+import label_convert
+from label_convert import DEFAULT_OPTIONS, READERS, make_synthetic_pages, open_source, run_conversion
+
+# ======================= 功能配置区 =======================
+
+# 模拟页数与随机种子 (与基准不同时只打印结果, 不做比较)
+DEFAULT_PAGES = 200
+DEFAULT_SEED = 0
+# 模拟页面的尺寸
+IMAGE_SIZE = (1600, 2400)
+# 基准文件 (与本脚本放在同一目录)
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "label_bench_baseline.json")
+# 允许的误差增量: 坐标 (像素) / 角度 (度)
+COORD_TOLERANCE = 0.01
+ANGLE_TOLERANCE = 0.01
+# 速度低于基准的 (1 - SPEED_TOLERANCE) 倍时判为退化
+SPEED_TOLERANCE = 0.5
+# 单个脚本的超时 (秒)
+SCRIPT_TIMEOUT = 600
+
+LABELS = ["balloon", "qipao", "changfangtiao", "fangkuai", "kuangwai"]
+# 参与比较的字段
+FIELDS = ("label", "text", "translation", "color")
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_EXT = {"itp": ".itp", "bt": ".json"}
+
+# 转换链: (名称, 源格式, [(方式, 目标格式), ...]), 方式为 "script" (原拖拽脚本) 或 "engine" (label_convert)
+CHAINS = [
+    ("XAL->IT->BT->XAL (脚本)", "xal", [("script", "itp"), ("script", "bt"), ("script", "xal")]),
+    ("YOLO->BT->YOLO (脚本)", "yolo", [("script", "bt"), ("script", "yolo")]),
+    ("MTU->BT->MTU (脚本)", "mtu", [("script", "bt"), ("script", "mtu")]),
+    ("XAL->IT->BT->XAL (引擎)", "xal", [("engine", "itp"), ("engine", "bt"), ("engine", "xal")]),
+    ("YOLO->BT->YOLO (引擎)", "yolo", [("engine", "bt"), ("engine", "yolo")]),
+    ("MTU->BT->MTU (引擎)", "mtu", [("engine", "bt"), ("engine", "mtu")]),
+]
+
+
+# ======================= 工作目录 =======================
+
+def make_options(image_dir, yolo_classes=LABELS):
+    """生成源文件和读回结果时按 LABELS 映射 YOLO 类别; 转换步骤与拖拽工具的默认设置一致 (yolo_classes=None)。"""
+    return dict(DEFAULT_OPTIONS, default_image_size=IMAGE_SIZE, image_dir=image_dir,
+                yolo_classes=list(yolo_classes) if yolo_classes else None, labels_to_exclude=frozenset())
+
+
+def link_images(image_dir, dst_dir):
+    """把模拟图片硬链接 (不支持时复制) 到 dst_dir, 各脚本都按 "图片与标注在同一文件夹" 的方式查找图片。"""
+    os.makedirs(dst_dir, exist_ok=True)
+    for name in os.listdir(image_dir):
+        dst = os.path.join(dst_dir, name)
+        if os.path.exists(dst):
+            continue
+        try:
+            os.link(os.path.join(image_dir, name), dst)
+        except OSError:
+            shutil.copyfile(os.path.join(image_dir, name), dst)
+
+
+def copy_files(src_dir, dst_dir, suffix):
+    os.makedirs(dst_dir, exist_ok=True)
+    for name in os.listdir(src_dir):
+        if name.lower().endswith(suffix):
+            shutil.copyfile(os.path.join(src_dir, name), os.path.join(dst_dir, name))
+
+
+def prepare_sources(work_dir, num_pages, seed):
+    """生成模拟页面、图片和三种源格式 (XAL / YOLO / MTU)。返回 (图片目录, {格式: 源路径})。"""
+    from PIL import Image
+    pages = make_synthetic_pages(num_pages, seed=seed, width=IMAGE_SIZE[0], height=IMAGE_SIZE[1])
+    image_dir = os.path.join(work_dir, "images")
+    os.makedirs(image_dir)
+    blank = os.path.join(work_dir, "blank.jpg")
+    Image.new("L", IMAGE_SIZE, 255).save(blank, quality=50)
+    for page in pages:
+        dst = os.path.join(image_dir, page.name)
+        try:
+            os.link(blank, dst)
+        except OSError:
+            shutil.copyfile(blank, dst)
+
+    options = make_options(image_dir)
+    sources = {}
+    for fmt in ("xal", "yolo", "mtu"):
+        src_dir = os.path.join(work_dir, "src_" + fmt)
+        link_images(image_dir, src_dir)
+        out = os.path.join(src_dir, "json") if fmt == "mtu" else src_dir
+        run_conversion(pages, None, fmt, out, src_dir, options, processes=1)
+        sources[fmt] = out
+    return image_dir, sources
+
+
+# ======================= 转换步骤 =======================
+
+def run_script(script_name, args, step_dir):
+    """把脚本复制到 step_dir 后运行 (输出到脚本所在目录的脚本也不会写进仓库), 返回耗时 (秒)。"""
+    script = os.path.join(step_dir, script_name)
+    shutil.copyfile(os.path.join(SCRIPT_DIR, script_name), script)
+    env = dict(os.environ, PYTHONPATH=SCRIPT_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""),
+               PYTHONIOENCODING="utf-8")
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, script, *args], cwd=step_dir, env=env, input="\n" * 16,
+                          capture_output=True, text=True, encoding="utf-8", errors="replace",
+                          timeout=SCRIPT_TIMEOUT)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"{script_name} 运行失败 (退出码 {proc.returncode}):\n{proc.stdout[-2000:]}{proc.stderr[-2000:]}")
+    return elapsed
+
+
+def script_step(src_fmt, dst_fmt, src, step_dir, image_dir):
+    """用原拖拽脚本转换一步, 返回 (输出路径, 耗时)。每个脚本的输入 / 输出位置与拖拽使用时相同。"""
+    link_images(image_dir, step_dir)
+    if (src_fmt, dst_fmt) == ("xal", "itp"):
+        copy_files(src, step_dir, ".json")
+        template = os.path.join(step_dir, "bench.itp")
+        with open(template, "w", encoding="utf-8") as f:
+            json.dump({"images": {}, "dirPath": step_dir}, f)
+        elapsed = run_script("0A拖拽_X-AnyLabeling转ImageTrans.py", [template], step_dir)
+        return os.path.join(step_dir, "bench_converted.itp"), elapsed
+    if (src_fmt, dst_fmt) == ("itp", "bt"):
+        itp = os.path.join(step_dir, "bench.itp")
+        shutil.copyfile(src, itp)
+        elapsed = run_script("0A拖拽_ImageTrans转BallonTranslator.py", [itp], step_dir)
+        return os.path.join(step_dir, "bench_balloons.json"), elapsed
+    if (src_fmt, dst_fmt) == ("bt", "xal"):
+        bt = os.path.join(step_dir, "bench_balloons.json")
+        shutil.copyfile(src, bt)
+        elapsed = run_script("0A拖拽_BallonTranslator转X-AnyLabeling.py", [bt], step_dir)
+        return step_dir, elapsed
+    if (src_fmt, dst_fmt) == ("yolo", "bt"):
+        txt_dir = os.path.join(step_dir, "labels")
+        copy_files(src, txt_dir, ".txt")
+        link_images(image_dir, txt_dir)
+        elapsed = run_script("YOLOTXT转成BallonsTranslatorJSON自动遍历图片.py", [txt_dir], step_dir)
+        return os.path.join(step_dir, "output_ballons.json"), elapsed
+    if (src_fmt, dst_fmt) == ("bt", "yolo"):
+        bt = os.path.join(step_dir, "project.json")
+        shutil.copyfile(src, bt)
+        elapsed = run_script("BallonsTranslator JSON → YOLO TXT 文件夹.PY", [bt], step_dir)
+        return os.path.join(step_dir, "biaoqianTXT"), elapsed
+    if (src_fmt, dst_fmt) == ("mtu", "bt"):
+        json_dir = os.path.join(step_dir, "json")
+        copy_files(src, json_dir, "_translations.json")
+        elapsed = run_script("拖拽mtuJSON文件夹转BallonsTranslator单JSON文件.py", [json_dir, "--full"], step_dir)
+        return os.path.join(step_dir, "imgtrans_from_mtu.json"), elapsed
+    if (src_fmt, dst_fmt) == ("bt", "mtu"):
+        bt = os.path.join(step_dir, "project.json")
+        shutil.copyfile(src, bt)
+        elapsed = run_script("拖拽BallonsTranslator单JSON转MTUjson项目文件夹.py", [bt], step_dir)
+        return os.path.join(step_dir, "manga_translator_work", "json"), elapsed
+    raise ValueError(f"没有 {src_fmt} -> {dst_fmt} 的转换脚本")
+
+
+def engine_step(src_fmt, dst_fmt, src, step_dir, image_dir):
+    """用 label_convert 引擎转换一步, 返回 (输出路径, 耗时)。"""
+    link_images(image_dir, step_dir)
+    output = os.path.join(step_dir, "out" + PROJECT_EXT.get(dst_fmt, ""))
+    summary = label_convert.convert(src, dst_fmt, output=output, source_format=src_fmt,
+                                    options=make_options(image_dir, yolo_classes=None))
+    if summary["error"]:
+        raise RuntimeError(f"label_convert {src_fmt} -> {dst_fmt}: {summary['error']} 页转换失败")
+    return output, summary["elapsed"]
+
+
+# ======================= 比较 =======================
+
+def read_pages(path, fmt, image_dir):
+    """用 label_convert 的读取器把任意格式读成 {页名: Page}。"""
+    options = make_options(image_dir)
+    source = open_source(path, fmt, options)
+    ctx = {"options": options, "directory": source["directory"], "output": None, "indent": None}
+    pages = {}
+    for item in source["items"]:
+        builder = READERS[fmt](item, ctx)
+        if builder is not None:
+            page = builder.build()
+            pages[page.name] = page
+    return pages
+
+
+def _box_fields(page, i):
+    style = page.styles.get(i) or {}
+    return {"label": page.label(i), "text": page.texts.get(i, ""), "translation": page.translations.get(i, ""),
+            "color": style.get("frgb")}
+
+
+def compare_pages(expected, actual):
+    """逐页按中心点最近的原则一一配对后比较, 返回统计字典。"""
+    stats = {"pages": len(expected), "lost_pages": 0, "boxes": 0, "lost_boxes": 0, "extra_boxes": 0,
+             "max_coord_error": 0.0, "mean_coord_error": 0.0, "max_angle_error": 0.0,
+             "lost_fields": {field: 0 for field in FIELDS}}
+    errors = []
+    for name, src in expected.items():
+        stats["boxes"] += len(src)
+        dst = actual.get(name)
+        if dst is None:
+            stats["lost_pages"] += 1
+            stats["lost_boxes"] += len(src)
+            continue
+        src_corners, dst_corners = src.corners(), dst.corners()
+        src_center, dst_center = src_corners.mean(axis=1), dst_corners.mean(axis=1)
+        dist = np.hypot(src_center[:, None, 0] - dst_center[None, :, 0], src_center[:, None, 1] - dst_center[None, :, 1])
+        used_src, used_dst = np.zeros(len(src), dtype=bool), np.zeros(len(dst), dtype=bool)
+        # 按距离从小到大贪心配对
+        pairs = []
+        for flat in np.argsort(dist, axis=None, kind="stable") if dist.size else ():
+            i, j = divmod(int(flat), len(dst))
+            if used_src[i] or used_dst[j]:
+                continue
+            used_src[i] = used_dst[j] = True
+            pairs.append((i, j))
+            if len(pairs) == min(len(src), len(dst)):
+                break
+        stats["lost_boxes"] += len(src) - len(pairs)
+        stats["extra_boxes"] += len(dst) - len(pairs)
+        for i, j in pairs:
+            # 顶点误差: 每个源顶点到结果中最近顶点的距离 (不受顶点起始顺序影响)
+            d = np.hypot(src_corners[i, :, None, 0] - dst_corners[j, None, :, 0],
+                         src_corners[i, :, None, 1] - dst_corners[j, None, :, 1])
+            errors.append(float(d.min(axis=1).max()))
+            diff = (float(src.angles[i]) - float(dst.angles[j]) + 90.0) % 180.0 - 90.0
+            stats["max_angle_error"] = max(stats["max_angle_error"], abs(diff))
+            want, got = _box_fields(src, i), _box_fields(dst, j)
+            for field in FIELDS:
+                if want[field] and want[field] != got[field]:
+                    stats["lost_fields"][field] += 1
+    if errors:
+        stats["max_coord_error"] = max(errors)
+        stats["mean_coord_error"] = sum(errors) / len(errors)
+    return stats
+
+
+# ======================= 运行与基准 =======================
+
+def run_chain(chain_dir, src_fmt, steps, sources, image_dir, num_pages):
+    src, fmt = sources[src_fmt], src_fmt
+    timings = []
+    for k, (mode, dst_fmt) in enumerate(steps):
+        step_dir = os.path.join(chain_dir, f"step{k + 1}_{fmt}_{dst_fmt}")
+        os.makedirs(step_dir)
+        step = script_step if mode == "script" else engine_step
+        src, elapsed = step(fmt, dst_fmt, src, step_dir, image_dir)
+        timings.append({"step": f"{fmt}->{dst_fmt}", "seconds": elapsed,
+                        "pages_per_sec": num_pages / elapsed if elapsed > 0 else 0.0})
+        fmt = dst_fmt
+    result = compare_pages(read_pages(sources[src_fmt], src_fmt, image_dir), read_pages(src, fmt, image_dir))
+    result["steps"] = timings
+    return result
+
+
+def check_regressions(results, baseline, speed_check):
+    """返回退化说明列表 (空列表表示没有退化)。"""
+    problems = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result.get("error"):
+            problems.append(f"{name}: 运行失败")
+            continue
+        if base.get("error"):
+            continue
+        if result["max_coord_error"] > base["max_coord_error"] + COORD_TOLERANCE:
+            problems.append(f"{name}: 最大坐标误差 {base['max_coord_error']:.3f} -> {result['max_coord_error']:.3f} 像素")
+        if result["max_angle_error"] > base["max_angle_error"] + ANGLE_TOLERANCE:
+            problems.append(f"{name}: 最大角度误差 {base['max_angle_error']:.3f} -> {result['max_angle_error']:.3f} 度")
+        for key in ("lost_pages", "lost_boxes", "extra_boxes"):
+            if result[key] > base[key]:
+                problems.append(f"{name}: {key} {base[key]} -> {result[key]}")
+        for field in FIELDS:
+            if result["lost_fields"][field] > base["lost_fields"][field]:
+                problems.append(f"{name}: 丢失字段 {field} {base['lost_fields'][field]} -> {result['lost_fields'][field]}")
+        if speed_check:
+            for step, base_step in zip(result["steps"], base["steps"]):
+                if step["pages_per_sec"] < base_step["pages_per_sec"] * (1 - SPEED_TOLERANCE):
+                    problems.append(f"{name}: {step['step']} 速度 {base_step['pages_per_sec']:.0f} -> "
+                                    f"{step['pages_per_sec']:.0f} 页/秒")
+    return problems
+
+
+def print_report(results):
+    print("=" * 100)
+    print(f"{'转换链':<26}{'页':>6}{'框':>7}{'丢页':>6}{'丢框':>6}{'多框':>6}{'最大坐标误差':>14}{'平均':>8}"
+          f"{'最大角度误差':>14}  丢失字段 (标签/原文/译文/颜色)")
+    for name, r in results.items():
+        if r.get("error"):
+            print(f"{name:<26}运行失败: {r['error'].splitlines()[0]}")
+            continue
+        lost = "/".join(str(r["lost_fields"][f]) for f in FIELDS)
+        print(f"{name:<26}{r['pages']:>6}{r['boxes']:>7}{r['lost_pages']:>6}{r['lost_boxes']:>6}{r['extra_boxes']:>6}"
+              f"{r['max_coord_error']:>14.3f}{r['mean_coord_error']:>8.3f}{r['max_angle_error']:>14.3f}  {lost}")
+    print("-" * 100)
+    print("速度 (页/秒):")
+    for name, r in results.items():
+        if not r.get("error"):
+            print(f"  {name:<26}" + "   ".join(f"{s['step']} {s['pages_per_sec']:.0f}" for s in r["steps"]))
+    print("=" * 100)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="标签转换链的往返精度与速度测试，与保存的基准比较。")
+    parser.add_argument("--pages", type=int, default=DEFAULT_PAGES, help="模拟页数")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="随机种子")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基准文件路径")
+    parser.add_argument("--update-baseline", action="store_true", help="把本次结果保存为新的基准")
+    parser.add_argument("--no-speed-check", dest="speed_check", action="store_false", help="不比较速度")
+    parser.add_argument("--keep", action="store_true", help="保留工作目录 (用于查看各步骤的输出)")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="label_bench_")
+    try:
+        print(f"生成 {args.pages} 页模拟数据 (种子 {args.seed})...")
+        image_dir, sources = prepare_sources(work_dir, args.pages, args.seed)
+        results = {}
+        for k, (name, src_fmt, steps) in enumerate(CHAINS):
+            print(f"运行: {name}")
+            try:
+                results[name] = run_chain(os.path.join(work_dir, f"chain{k + 1}"), src_fmt, steps,
+                                          sources, image_dir, args.pages)
+            except Exception as e:
+                results[name] = {"error": f"{type(e).__name__}: {e}"}
+        print_report(results)
+    finally:
+        if args.keep:
+            print(f"工作目录: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    record = {"pages": args.pages, "seed": args.seed, "image_size": list(IMAGE_SIZE), "chains": results}
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        print(f"基准已更新: {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        print("没有找到基准文件，确认结果无误后用 --update-baseline 保存基准。")
+        return 0
+    if (baseline.get("pages"), baseline.get("seed"), baseline.get("image_size")) != (args.pages, args.seed, list(IMAGE_SIZE)):
+        print("模拟参数与基准不同，跳过基准比较。")
+        return 0
+    problems = check_regressions(results, baseline.get("chains", {}), args.speed_check)
+    if problems:
+        print("与基准相比出现退化:")
+        for p in problems:
+            print(f"  - {p}")
+        return 1
+    print("与基准相比没有退化。")
+    return 0
+
+
+if __name__ == "__main__":
+    code = 1
+    try:
+        code = main()
+    except Exception:
+        traceback.print_exc()
+    if os.name == "nt" and not sys.stdin.isatty():
+        try:
+            input("\n按回车键退出...")
+        except EOFError:
+            pass
+    sys.exit(code)
@@ -0,0 +1,958 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+标签格式互转引擎 - X-AnyLabeling / ImageTrans / BallonsTranslator / MTU (manga-translator-ui) / YOLO TXT 任意互转
+供 0A拖拽_标签格式任意互转.py 使用, 也可以在其他脚本中直接 import。
+
+结构:
+- 中间表示 Page: 每页一组列式数组 (未旋转矩形 [x, y, w, h] / 角度 / 标签编号 / 置信度),
+  文字、译文、样式 (颜色、字号、竖排...) 放在按框下标索引的稀疏副表中
+- 每种格式一个读取器 (源文件 -> Page) 和一个写出器 (Page -> 目标格式), 任意源格式都可以转到任意目标格式
+- 逐页处理: 读取、几何换算 (numpy 向量化)、序列化都在子进程中完成, 按页顺序收回结果
+- 单文件项目格式 (ImageTrans .itp / BallonsTranslator JSON) 用 json_stream.py 逐页读取、逐页写出, 内存占用与页数无关
+
+格式代号:
+    xal   X-AnyLabeling 标注文件夹 (每张图一个 .json)
+    itp   ImageTrans 项目文件 (.itp)
+    bt    BallonsTranslator 项目 JSON
+    mtu   manga-translator-ui 的 *_translations.json 文件夹
+    yolo  YOLO TXT 标签文件夹 (5 列水平框 / 9 列 OBB, 可带置信度列)
+
+几何约定与原来的各个两两转换脚本一致: 框 = 未旋转矩形 + 绕中心旋转的角度 (度, 顺时针, 与 ImageTrans 的 degree、
+BallonsTranslator 的 angle 相同); X-AnyLabeling 旋转框的宽 = p1p2、高 = p1p4、角度 = p1p2 的方向。
+
+直接运行本文件会生成模拟页面, 测试全部格式两两互转的速度 (页/秒):
+    python label_convert.py [页数]
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import tempfile
+from collections import deque
+from functools import lru_cache
+from itertools import chain, islice
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+from image_dims import image_size as read_image_size
+from json_stream import (BT_PAGES_KEY, ITP_PAGES_KEY, ProjectWriter, dump_json, encode_page,
+                         iter_pages, iter_project, read_fields)
+
+# ======================= 默认配置 =======================
+FORMATS = ("xal", "itp", "bt", "mtu", "yolo")
+PROJECT_FORMATS = ("itp", "bt")          # 单文件项目格式 (按页流式写出)
+FORMAT_NAMES = {
+    "xal": "X-AnyLabeling", "itp": "ImageTrans", "bt": "BallonsTranslator",
+    "mtu": "MTU (manga-translator-ui)", "yolo": "YOLO TXT",
+}
+
+ENABLE_MULTIPROCESSING = True
+MAX_PROCESSES = 0          # 0 表示使用全部 CPU 核心
+CHUNK_SIZE = 16            # 每次分发给子进程的页数
+MIN_PAGES_FOR_POOL = 32    # 页数少于此值时直接在当前进程处理 (启动进程池本身有开销)
+PENDING_CHUNKS_PER_PROCESS = 4   # 每个进程最多排队的任务块数 (限制逐页读取时的内存占用)
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.avif')
+
+DEFAULT_OPTIONS = {
+    "labels_to_exclude": (),      # 读取时丢弃的标签
+    "default_label": "text_region",  # 源格式没有标签 (BallonsTranslator / MTU) 时使用的标签
+    "yolo_classes": None,         # YOLO 类别名列表, None 表示读取 classes.txt, 找不到时直接使用数字编号
+    "yolo_obb": False,            # 写 YOLO 时是否输出 9 列 OBB (否则旋转框写成水平外接矩形)
+    "image_dir": None,            # 图片所在目录, None 表示按源文件自动判断
+    "default_image_size": None,   # 找不到图片时使用的 (宽, 高), 例如 (2402, 1799); None 表示报错跳过该页
+    "itp_template": None,         # 写 ImageTrans 时使用的 .itp 模板 (复制项目设置), None 表示源是 .itp 时沿用源项目
+    "mtu_target_lang": "CHS",
+    "mtu_source_lang": "ja",
+    "compact": False,             # 项目文件 (.itp / BallonsTranslator) 输出紧凑格式 (无缩进, 文件更小、写得更快)
+}
+
+# 各格式的输出缩进 (与原转换脚本一致)
+OUTPUT_INDENT = {"xal": 2, "itp": 4, "bt": 2, "mtu": 2}
+
+# BallonsTranslator 文本框的默认 fontformat (与原 X-AnyLabeling 转 BallonTranslator 脚本一致)
+BT_DEFAULT_FONTFORMAT = {
+    "font_family": "", "font_size": 24.0, "stroke_width": 0.0,
+    "frgb": [0, 0, 0], "srgb": [0, 0, 0], "bold": False,
+    "underline": False, "italic": False, "alignment": 0,
+    "vertical": False, "font_weight": 400, "line_spacing": 1.2,
+    "letter_spacing": 1.15, "opacity": 1.0, "shadow_radius": 0.0,
+    "shadow_strength": 1.0, "shadow_color": [0, 0, 0],
+    "shadow_offset": [0.0, 0.0], "gradient_enabled": False,
+    "gradient_start_color": [0, 0, 0], "gradient_end_color": [255, 255, 255],
+    "gradient_angle": 0.0, "gradient_size": 1.0, "_style_name": "",
+    "line_spacing_type": 0, "deprecated_attributes": {}
+}
+# 中间表示中保留的样式字段 (其余格式专有字段不参与转换)
+STYLE_KEYS = ("font_family", "font_size", "stroke_width", "frgb", "srgb", "bold", "italic", "underline",
+              "alignment", "vertical", "line_spacing", "letter_spacing", "font_path", "language")
+ALIGNMENT_NAMES = {0: "left", 1: "center", 2: "right"}
+
+
+# ======================= 中间表示 =======================
+
+class Page:
+    """
+    一页标注的列式中间表示。
+      rects:  (N, 4) float64, 未旋转矩形 [x, y, w, h]
+      angles: (N,) float64, 绕矩形中心旋转的角度 (度)
+      label_ids: (N,) int32, 指向 label_names 的下标
+      scores: (N,) float64, 没有置信度时为 NaN
+      texts / translations / styles: {框下标: 内容} 稀疏副表
+    """
+    __slots__ = ("name", "width", "height", "rects", "angles", "label_ids", "label_names", "scores",
+                 "texts", "translations", "styles")
+
+    def __init__(self, name, width, height, rects, angles, label_ids, label_names, scores,
+                 texts, translations, styles):
+        self.name = name
+        self.width, self.height = width, height
+        self.rects, self.angles = rects, angles
+        self.label_ids, self.label_names = label_ids, label_names
+        self.scores = scores
+        self.texts, self.translations, self.styles = texts, translations, styles
+
+    def __len__(self):
+        return len(self.rects)
+
+    def label(self, i):
+        return self.label_names[self.label_ids[i]]
+
+    def score(self, i):
+        s = self.scores[i]
+        return None if np.isnan(s) else float(s)
+
+    def corners(self):
+        return rect_corners(self.rects, self.angles)
+
+
+class PageBuilder:
+    """逐框收集一页的数据, build() 时一次性生成 numpy 数组 (旋转框的顶点换算也在这里统一向量化)。"""
+
+    def __init__(self, name, width=0, height=0, exclude=()):
+        self.name = name
+        self.width, self.height = int(width or 0), int(height or 0)
+        self.exclude = exclude
+        self.excluded = 0
+        self._rects, self._angles, self._labels, self._scores = [], [], [], []
+        self._label_index, self._label_names = {}, []
+        self._quads = []
+        self.texts, self.translations, self.styles = {}, {}, {}
+
+    def add(self, x, y, w, h, angle=0.0, label="", score=None, text="", translation="", style=None):
+        if label in self.exclude:
+            self.excluded += 1
+            return None
+        i = len(self._rects)
+        self._rects.append((float(x), float(y), float(w), float(h)))
+        self._angles.append(float(angle or 0.0))
+        idx = self._label_index.get(label)
+        if idx is None:
+            idx = self._label_index[label] = len(self._label_names)
+            self._label_names.append(label)
+        self._labels.append(idx)
+        self._scores.append(_to_float(score))
+        if text:
+            self.texts[i] = text
+        if translation:
+            self.translations[i] = translation
+        if style:
+            self.styles[i] = style
+        return i
+
+    def add_quad(self, points, **fields):
+        """旋转框 (4 个顶点), 矩形和角度在 build() 时统一计算。"""
+        i = self.add(0.0, 0.0, 0.0, 0.0, **fields)
+        if i is not None:
+            self._quads.append((i, points[:4]))
+        return i
+
+    def build(self):
+        rects = np.array(self._rects, dtype=np.float64).reshape(-1, 4)
+        angles = np.array(self._angles, dtype=np.float64)
+        if self._quads:
+            idx = np.array([i for i, _ in self._quads], dtype=np.intp)
+            quads = np.array([q for _, q in self._quads], dtype=np.float64).reshape(-1, 4, 2)
+            rects[idx], angles[idx] = quads_to_rects(quads)
+        return Page(self.name, self.width, self.height, rects, angles,
+                    np.array(self._labels, dtype=np.int32), self._label_names,
+                    np.array(self._scores, dtype=np.float64),
+                    self.texts, self.translations, self.styles)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+# ======================= 几何换算 (向量化) =======================
+
+def quads_to_rects(quads):
+    """旋转框顶点 (N, 4, 2) -> 未旋转矩形 (N, 4) 与角度 (N,), 与原 X-AnyLabeling 转换脚本的 OBB 计算一致。"""
+    p1, p2, p3, p4 = quads[:, 0], quads[:, 1], quads[:, 2], quads[:, 3]
+    v1, v2 = (p2 - p1).tolist(), (p4 - p1).tolist()
+    # 长度和方向用 math 逐个计算: np.hypot / np.arctan2 与 math 版本偶尔相差 1 ulp,
+    # 取整 (floor) 后会差 1 像素, 这里保证结果与原脚本逐位一致
+    w = np.array([math.hypot(x, y) for x, y in v1])
+    h = np.array([math.hypot(x, y) for x, y in v2])
+    angles = np.array([math.degrees(math.atan2(y, x)) for x, y in v1]) % 360
+    center = (p1 + p3) / 2
+    rects = np.stack([center[:, 0] - w / 2, center[:, 1] - h / 2, w, h], axis=1)
+    return rects, angles
+
+
+def rect_corners(rects, angles):
+    """未旋转矩形 + 角度 -> 绕中心旋转后的 4 个顶点 (N, 4, 2), 顺序: 左上, 右上, 右下, 左下。"""
+    x, y, w, h = rects[:, 0], rects[:, 1], rects[:, 2], rects[:, 3]
+    cx, cy = x + w / 2, y + h / 2
+    rad = np.radians(angles)
+    cos, sin = np.cos(rad)[:, None], np.sin(rad)[:, None]
+    dx = np.stack([-w / 2, w / 2, w / 2, -w / 2], axis=1)
+    dy = np.stack([-h / 2, -h / 2, h / 2, h / 2], axis=1)
+    corners = np.stack([cx[:, None] + dx * cos - dy * sin, cy[:, None] + dx * sin + dy * cos], axis=2)
+    # 不旋转的框直接取原坐标, 避免中心换算带来的浮点误差
+    flat = angles == 0
+    if flat.any():
+        x1, y1, x2, y2 = x[flat], y[flat], x[flat] + w[flat], y[flat] + h[flat]
+        corners[flat] = np.stack([np.stack([x1, y1], 1), np.stack([x2, y1], 1),
+                                  np.stack([x2, y2], 1), np.stack([x1, y2], 1)], axis=1)
+    return corners
+
+
+def corners_aabb(corners):
+    """顶点 (N, 4, 2) -> 水平外接矩形 (N, 4) [x1, y1, x2, y2]。"""
+    if not len(corners):
+        return np.zeros((0, 4))
+    return np.concatenate([corners.min(axis=1), corners.max(axis=1)], axis=1)
+
+
+# ======================= 通用辅助 =======================
+
+def load_json(path):
+    with open(path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=4096)
+def image_size(path):
+    """读取图片宽高 (image_dims 只解析文件头, 不解码像素); 文件不存在或无法识别时返回 None。"""
+    return read_image_size(path)
+
+
+def find_image(directory, stem):
+    for ext in IMAGE_EXTS:
+        for candidate in (stem + ext, stem + ext.upper()):
+            path = os.path.join(directory, candidate)
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+def page_size(page, ctx):
+    """页面宽高: 源格式自带的 -> 图片文件头 -> default_image_size; 都没有时返回 (0, 0)。"""
+    if page.width and page.height:
+        return page.width, page.height
+    size = image_size(os.path.join(ctx["directory"], page.name))
+    if size is None:
+        size = ctx["options"]["default_image_size"]
+    return tuple(size) if size else (0, 0)
+
+
+def parse_rgb(value):
+    """'r,g,b' 字符串 / [r, g, b] 列表 -> [r, g, b] 整数列表, 无法解析时返回 None。"""
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, (list, tuple)) or len(value) < 3:
+        return None
+    try:
+        return [int(round(float(c))) for c in value[:3]]
+    except (TypeError, ValueError):
+        return None
+
+
+def _rich_text_color(rich_text):
+    """从 BallonsTranslator 的 rich_text 中提取第一个 color:#RRGGBB。"""
+    if not rich_text:
+        return None
+    pos = rich_text.lower().find('color:')
+    while pos != -1:
+        value = rich_text[pos + 6:pos + 16].strip()
+        if value.startswith('#') and len(value) >= 7:
+            try:
+                return [int(value[k:k + 2], 16) for k in (1, 3, 5)]
+            except ValueError:
+                pass
+        pos = rich_text.lower().find('color:', pos + 6)
+    return None
+
+
+def _auto_stroke_color(frgb):
+    """深色文字 -> 白色描边, 浅色文字 -> 黑色描边 (与原 MTU 转换脚本一致)。"""
+    r, g, b = frgb
+    return [255, 255, 255] if 0.2126 * r + 0.7152 * g + 0.0722 * b < 128 else [0, 0, 0]
+
+
+def _rich_text_html(translation, frgb, font_family):
+    """与原 ImageTrans 转 BallonTranslator 脚本相同的 rich_text, 保留译文颜色。"""
+    hex_color = f"#{frgb[0]:02x}{frgb[1]:02x}{frgb[2]:02x}"
+    return (
+        '<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.0//EN" "http://www.w3.org/TR/REC-html40/strict.dtd">'
+        '<html><head><meta name="qrichtext" content="1" /><meta charset="utf-8" /><style type="text/css">'
+        'p, li { white-space: pre-wrap; } hr { height: 1px; border-width: 0; }'
+        'li.unchecked::marker { content: "\\2610"; } li.checked::marker { content: "\\2612"; }'
+        f'</style></head><body style=" font-family:\'{font_family}\'; font-size:18pt; font-weight:400; font-style:normal;">'
+        f'<p style=" margin-top:0px; margin-bottom:0px; margin-left:0px; margin-right:0px; -qt-block-indent:0; text-indent:0px;">'
+        f'<span style=" color:{hex_color};">{translation}</span></p></body></html>'
+    )
+
+
+def _builder(name, width, height, ctx):
+    return PageBuilder(name, width, height, exclude=ctx["options"]["labels_to_exclude"])
+
+
+# ======================= 读取器: 源格式 -> Page =======================
+
+def _read_xal(path, ctx):
+    data = load_json(path)
+    if not isinstance(data, dict) or 'shapes' not in data or 'imagePath' not in data:
+        return None
+    b = _builder(data['imagePath'], data.get('imageWidth'), data.get('imageHeight'), ctx)
+    default_label = ctx["options"]["default_label"]
+    for shape in data['shapes']:
+        points = shape.get('points')
+        if not points:
+            continue
+        fields = {"label": shape.get('label') or default_label, "score": shape.get('score'),
+                  "text": shape.get('description') or ''}
+        if shape.get('shape_type') == 'rotation' and len(points) == 4:
+            b.add_quad(points, **fields)
+        else:
+            xs = [p[0] for p in points]
+            ys = [p[1] for p in points]
+            b.add(min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys), **fields)
+    return b
+
+
+def _read_itp(item, ctx):
+    name, data = item
+    b = _builder(name, 0, 0, ctx)
+    default_label = ctx["options"]["default_label"]
+    for box in (data or {}).get('boxes', []):
+        geo = box.get('geometry', {})
+        color = parse_rgb(box.get('textColor'))
+        b.add(geo.get('X', 0), geo.get('Y', 0), geo.get('width', 0), geo.get('height', 0), box.get('degree', 0),
+              label=box.get('fontstyle') or default_label, text=box.get('text') or '',
+              translation=box.get('target') or '', style={"frgb": color} if color else None)
+    return b
+
+
+def _read_bt(item, ctx):
+    name, regions, info = item
+    info = info if isinstance(info, dict) else {}
+    b = _builder(name, info.get('width'), info.get('height'), ctx)
+    default_label = ctx["options"]["default_label"]
+    for region in regions or []:
+        rect = region.get('_bounding_rect')
+        if not rect:
+            xyxy = region.get('xyxy')
+            if not xyxy:
+                continue
+            rect = [xyxy[0], xyxy[1], xyxy[2] - xyxy[0], xyxy[3] - xyxy[1]]
+        ff = region.get('fontformat') if isinstance(region.get('fontformat'), dict) else {}
+        style = {k: ff[k] for k in STYLE_KEYS if k in ff}
+        # 颜色优先级与原 BallonTranslator 转 ImageTrans 脚本一致: rich_text > fontformat.frgb > fg_colors
+        color = _rich_text_color(region.get('rich_text')) or parse_rgb(ff.get('frgb')) or parse_rgb(region.get('fg_colors'))
+        if color:
+            style["frgb"] = color
+        for key in ("font_path", "language"):
+            if region.get(key) and region.get(key) != "unknown":
+                style[key] = region[key]
+        text = region.get('text', '')
+        b.add(*rect[:4], region.get('angle', 0), label=default_label,
+              text=''.join(text) if isinstance(text, list) else str(text),
+              translation=region.get('translation') or '', style=style)
+    return b
+
+
+def _read_mtu(path, ctx):
+    data = load_json(path)
+    if not isinstance(data, dict) or not data:
+        return None
+    img_abs = next(iter(data))
+    payload = data[img_abs]
+    if not isinstance(payload, dict):
+        return None
+    b = _builder(os.path.basename(img_abs.replace('\\', '/')), payload.get('original_width'),
+                 payload.get('original_height'), ctx)
+    default_label = ctx["options"]["default_label"]
+    for region in payload.get('regions') or []:
+        rect = None
+        center, wf = region.get('center'), region.get('white_frame_rect_local')
+        if isinstance(center, list) and len(center) >= 2 and isinstance(wf, list) and len(wf) >= 4:
+            l, t, r, btm = (float(v) for v in wf[:4])
+            if r > l and btm > t:
+                rect = (float(center[0]) + l, float(center[1]) + t, r - l, btm - t)
+        if rect is None:
+            pts = [p for poly in region.get('lines') or [] for p in poly if isinstance(p, list) and len(p) >= 2]
+            if not pts:
+                continue
+            xs, ys = [float(p[0]) for p in pts], [float(p[1]) for p in pts]
+            rect = (min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+        texts = region.get('texts')
+        text = ''.join(str(t) for t in texts) if isinstance(texts, list) and texts else str(region.get('text', ''))
+        translation = str(region.get('translation', ''))
+        for br in ("[BR]", "[br]", "<br>", "<br/>", "<br />"):
+            translation = translation.replace(br, "\n")
+        style = {}
+        for src_key, key in (("fg_colors", "frgb"), ("bg_colors", "srgb")):
+            color = parse_rgb(region.get(src_key))
+            if color:
+                style[key] = color
+        for key in ("font_size", "stroke_width", "line_spacing", "letter_spacing", "font_path"):
+            if region.get(key) not in (None, ""):
+                style[key] = region[key]
+        if region.get('direction'):
+            style["vertical"] = str(region['direction']).lower() == 'v'
+        if region.get('alignment'):
+            style["alignment"] = {v: k for k, v in ALIGNMENT_NAMES.items()}.get(str(region['alignment']).lower(), 0)
+        if region.get('source_lang'):
+            style["language"] = region['source_lang']
+        b.add(*rect, region.get('angle', 0), label=default_label, score=region.get('prob'),
+              text=text, translation=translation, style=style)
+    return b
+
+
+def _read_yolo(path, ctx):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    image_path = find_image(ctx["directory"], stem)
+    size = image_size(image_path) if image_path else None
+    if size is None:
+        size = ctx["options"]["default_image_size"]
+    if not size:
+        raise ValueError(f"找不到 {stem} 对应的图片, 无法还原像素坐标 (可设置 default_image_size)")
+    width, height = size
+    b = _builder(os.path.basename(image_path) if image_path else stem + '.jpg', width, height, ctx)
+    classes = ctx["options"]["yolo_classes"] or []
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    for line in lines:
+        parts = line.split()
+        if len(parts) not in (5, 6, 9, 10):
+            continue
+        try:
+            class_id, values = int(float(parts[0])), [float(v) for v in parts[1:]]
+        except ValueError:
+            continue
+        label = classes[class_id] if 0 <= class_id < len(classes) else str(class_id)
+        if len(values) >= 8:
+            quad = [[values[k] * width, values[k + 1] * height] for k in range(0, 8, 2)]
+            b.add_quad(quad, label=label, score=values[8] if len(values) == 9 else None)
+        else:
+            cx, cy, w, h = values[0] * width, values[1] * height, values[2] * width, values[3] * height
+            b.add(cx - w / 2, cy - h / 2, w, h, label=label, score=values[4] if len(values) == 5 else None)
+    return b
+
+
+READERS = {"xal": _read_xal, "itp": _read_itp, "bt": _read_bt, "mtu": _read_mtu, "yolo": _read_yolo}
+
+
+# ======================= 写出器: Page -> 目标格式 =======================
+# 文件夹格式返回 (文件名, 文件内容); 项目格式返回 (该页的 JSON 片段, 附加信息)
+
+def _encode_xal(page, ctx):
+    width, height = page_size(page, ctx)
+    corners = page.corners().tolist()
+    shapes = []
+    for i in range(len(page)):
+        angle = float(page.angles[i])
+        shape = {
+            "label": page.label(i), "score": page.score(i), "points": corners[i], "group_id": None,
+            "description": page.texts.get(i, ""), "difficult": False,
+            "shape_type": "rotation" if angle else "rectangle",
+            "flags": {}, "attributes": {}, "kie_linking": []
+        }
+        if angle:
+            shape["direction"] = math.radians(angle)
+        shapes.append(shape)
+    data = {
+        "version": "3.2.2", "flags": {}, "shapes": shapes, "imagePath": page.name, "imageData": None,
+        "imageHeight": height, "imageWidth": width, "description": ""
+    }
+    return os.path.splitext(page.name)[0] + ".json", dump_json(data, OUTPUT_INDENT["xal"])
+
+
+def _encode_itp(page, ctx):
+    geometry = np.floor(page.rects).astype(np.int64).tolist()
+    degrees = np.floor(page.angles).astype(np.int64).tolist()
+    boxes = []
+    for i in range(len(page)):
+        x, y, w, h = geometry[i]
+        box = {"fontstyle": page.label(i)}
+        if page.angles[i]:
+            box["degree"] = degrees[i]
+        box["geometry"] = {"X": x, "Y": y, "width": w, "height": h}
+        box["text"] = page.texts.get(i, "")
+        style = page.styles.get(i)
+        if style and style.get("frgb"):
+            box["textColor"] = ','.join(str(c) for c in style["frgb"])
+        if i in page.translations:
+            box["target"] = page.translations[i]
+        boxes.append(box)
+    return encode_page({"boxes": boxes}, ctx["indent"]), None
+
+
+def _encode_bt(page, ctx):
+    corners = page.corners()
+    aabb = corners_aabb(corners)
+    lo, hi = np.floor(aabb[:, :2]).astype(np.int64), np.ceil(aabb[:, 2:]).astype(np.int64)
+    xyxy = np.concatenate([lo, hi], axis=1).tolist()
+    rect_floor = np.floor(page.rects).astype(np.int64).tolist()
+    corners = corners.tolist()
+    objects = []
+    for i in range(len(page)):
+        x1, y1, x2, y2 = xyxy[i]
+        angle = float(page.angles[i])
+        if angle:
+            bounding_rect, lines = rect_floor[i], [corners[i]]
+        else:
+            bounding_rect, lines = [x1, y1, x2 - x1, y2 - y1], [[[x1, y1], [x2, y1], [x2, y2], [x1, y2]]]
+        w, h = page.rects[i, 2], page.rects[i, 3]
+        style = page.styles.get(i, {})
+        fontformat = dict(BT_DEFAULT_FONTFORMAT)
+        fontformat.update((k, style[k]) for k in BT_DEFAULT_FONTFORMAT if k in style)
+        if "vertical" not in style:
+            fontformat["vertical"] = bool(h >= w)
+        translation = page.translations.get(i, "")
+        rich_text = ""
+        if translation and style.get("frgb"):
+            rich_text = _rich_text_html(translation, style["frgb"], style.get("font_family") or "新兰圆-B")
+        obj = {
+            "xyxy": [x1, y1, x2, y2], "lines": lines, "language": style.get("language", "unknown"),
+            "distance": None, "angle": angle, "vec": None, "norm": -1, "merged": False,
+            "text": [page.texts.get(i, "")], "translation": translation, "rich_text": rich_text,
+            "_bounding_rect": bounding_rect, "src_is_vertical": fontformat["vertical"],
+            "det_model": "label_convert", "region_mask": None, "region_inpaint_dict": None,
+            "fontformat": fontformat
+        }
+        if style.get("font_path"):
+            obj["font_path"] = style["font_path"]
+        objects.append(obj)
+    width, height = page_size(page, ctx)
+    return encode_page(objects, ctx["indent"]), {"width": width, "height": height}
+
+
+def _encode_mtu(page, ctx):
+    options = ctx["options"]
+    corners = page.corners().tolist()
+    rects = page.rects.tolist()
+    regions = []
+    for i in range(len(page)):
+        x, y, w, h = rects[i]
+        style = page.styles.get(i, {})
+        frgb = style.get("frgb") or [0, 0, 0]
+        translation = page.translations.get(i, "").replace("\r\n", "[BR]").replace("\n", "[BR]").replace("\r", "[BR]")
+        text = page.texts.get(i, "")
+        regions.append({
+            "lines": [corners[i]],
+            "center": [x + w / 2, y + h / 2],
+            "texts": [text] if text else [],
+            "text": text,
+            "translation": translation,
+            "angle": float(page.angles[i]),
+            "font_size": int(round(float(style.get("font_size", 36)))),
+            "fg_colors": frgb,
+            "bg_colors": style.get("srgb") or _auto_stroke_color(frgb),
+            "direction": "v" if style.get("vertical", h >= w) else "h",
+            "alignment": ALIGNMENT_NAMES.get(style.get("alignment", 0), "left"),
+            "target_lang": options["mtu_target_lang"],
+            "source_lang": style.get("language") or options["mtu_source_lang"],
+            "line_spacing": float(style.get("line_spacing", 1.0)),
+            "letter_spacing": float(style.get("letter_spacing", 1.0)),
+            "stroke_width": float(style.get("stroke_width", 0.07)),
+            "prob": page.score(i) if page.score(i) is not None else 1.0,
+            "font_path": str(style.get("font_path") or "fonts/新兰圆-B.ttf").replace("\\", "/"),
+            "white_frame_rect_local": [-w / 2, -h / 2, w / 2, h / 2],
+            "has_custom_white_frame": True,
+        })
+    width, height = page_size(page, ctx)
+    abs_img = os.path.join(ctx["directory"], page.name) if ctx["directory"] else page.name
+    data = {abs_img: {"regions": regions, "textlines": [], "original_width": width, "original_height": height,
+                      "skip_font_scaling": False}}
+    return os.path.splitext(page.name)[0] + "_translations.json", dump_json(data, OUTPUT_INDENT["mtu"])
+
+
+def _encode_yolo(page, ctx):
+    width, height = page_size(page, ctx)
+    if not width or not height:
+        raise ValueError(f"无法确定 {page.name} 的尺寸 (找不到图片, 可设置 default_image_size)")
+    classes = ctx["options"]["yolo_classes"]
+    class_index = {name: k for k, name in enumerate(classes or [])}
+    corners = page.corners()
+    scale = np.array([width, height], dtype=np.float64)
+    lines = []
+    if ctx["options"]["yolo_obb"]:
+        values = (corners / scale).reshape(-1, 8).tolist()
+        fmt = "{} " + " ".join(["{:.6f}"] * 8)
+    else:
+        aabb = corners_aabb(corners)
+        values = np.stack([(aabb[:, 0] + aabb[:, 2]) / 2 / width, (aabb[:, 1] + aabb[:, 3]) / 2 / height,
+                           (aabb[:, 2] - aabb[:, 0]) / width, (aabb[:, 3] - aabb[:, 1]) / height], axis=1).tolist()
+        fmt = "{} {:.6f} {:.6f} {:.6f} {:.6f}"
+    for i in range(len(page)):
+        label = page.label(i)
+        if classes:
+            if label not in class_index:
+                continue  # 不在类别列表中的标签不写出
+            class_id = class_index[label]
+        else:
+            class_id = int(label) if label.isdigit() else 0
+        lines.append(fmt.format(class_id, *values[i]))
+    return os.path.splitext(page.name)[0] + ".txt", ''.join(line + '\n' for line in lines)
+
+
+ENCODERS = {"xal": _encode_xal, "itp": _encode_itp, "bt": _encode_bt, "mtu": _encode_mtu, "yolo": _encode_yolo}
+
+
+# ======================= 源文件解析 =======================
+
+def _mtu_files(folder):
+    for directory in (folder, os.path.join(folder, "json")):
+        if os.path.isdir(directory):
+            files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith("_translations.json"))
+            if files:
+                return files
+    return []
+
+
+def detect_format(path):
+    """根据拖入的文件 / 文件夹自动判断源格式。"""
+    if os.path.isdir(path):
+        if _mtu_files(path):
+            return "mtu"
+        names = [n.lower() for n in os.listdir(path)]
+        if any(n.endswith('.json') for n in names):
+            return "xal"
+        if any(n.endswith('.txt') and n != 'classes.txt' for n in names):
+            return "yolo"
+        raise ValueError(f"无法判断文件夹的标签格式: {path}")
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.itp', '.ipt'):
+        return "itp"
+    if ext == '.txt':
+        return "yolo"
+    if ext == '.json':
+        # 只看开头几个顶层字段, BallonsTranslator 项目遇到 pages 就能判断, 不用解析整个文件
+        for kind, key, value in islice(iter_project(path, BT_PAGES_KEY), 16):
+            if kind == "begin":
+                return "bt"
+            if key in ('shapes', 'imagePath'):
+                return "xal"
+            if key == ITP_PAGES_KEY:
+                return "itp"
+            if isinstance(value, dict) and 'regions' in value:
+                return "mtu"
+    raise ValueError(f"无法判断文件的标签格式: {path}")
+
+
+def _read_classes_txt(folder):
+    path = os.path.join(folder, "classes.txt")
+    if os.path.isfile(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    return None
+
+
+def open_source(path, fmt, options):
+    """
+    解析源: 返回 {"items": 逐页任务, "directory": 图片目录, "template": 项目模板文件 (仅 .itp)}。
+    文件夹格式的任务是文件路径 (读取在子进程中完成); 项目格式用 json_stream 逐页读取, 任务是每页的原始数据,
+    items 是惰性的生成器, 整个项目不会同时在内存中。
+    """
+    path = os.path.abspath(path)
+    folder = path if os.path.isdir(path) else os.path.dirname(path)
+    source = {"items": [], "directory": options["image_dir"] or folder, "template": None}
+    if fmt == "xal":
+        source["items"] = [path] if os.path.isfile(path) else sorted(
+            os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith('.json'))
+    elif fmt == "yolo":
+        source["items"] = [path] if os.path.isfile(path) else sorted(
+            os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith('.txt') and f.lower() != 'classes.txt')
+        if options["yolo_classes"] is None:
+            options["yolo_classes"] = _read_classes_txt(folder)
+        if not options["image_dir"] and not any(f.lower().endswith(IMAGE_EXTS) for f in os.listdir(folder)):
+            source["directory"] = os.path.dirname(folder)   # 标签文件夹里没有图片时, 到上一级找
+    elif fmt == "mtu":
+        source["items"] = [path] if os.path.isfile(path) else _mtu_files(path)
+        if source["items"] and not options["image_dir"]:
+            first = next(iter(load_json(source["items"][0])), "")
+            image_folder = os.path.dirname(first.replace('\\', os.sep))
+            source["directory"] = image_folder if os.path.isdir(image_folder) else os.path.dirname(folder)
+    elif fmt == "itp":
+        source["template"] = path     # 只有输出也是 .itp 时才需要读取项目设置
+        source["items"] = iter_pages(path, ITP_PAGES_KEY)
+    elif fmt == "bt":
+        fields = read_fields(path, BT_PAGES_KEY)
+        info = fields.get("image_info") if isinstance(fields.get("image_info"), dict) else {}
+        source["items"] = ((name, regions, info.get(name)) for name, regions in iter_pages(path, BT_PAGES_KEY))
+        if not options["image_dir"] and os.path.isdir(str(fields.get("directory", ""))):
+            source["directory"] = fields["directory"]
+    else:
+        raise ValueError(f"未知的源格式: {fmt}")
+    return source
+
+
+def default_output(path, fmt, directory):
+    """目标文件 / 文件夹的默认位置 (与原转换脚本的输出位置一致)。"""
+    path = os.path.abspath(path)
+    if fmt == "xal":
+        return directory
+    if fmt == "yolo":
+        return os.path.join(directory, "biaoqianTXT")
+    if fmt == "mtu":
+        return os.path.join(directory, "manga_translator_work", "json")
+    if fmt == "bt":
+        return os.path.join(directory, "output_ballons.json")
+    base = os.path.splitext(path)[0] if os.path.isfile(path) else os.path.join(path, os.path.basename(path))
+    return f"{base}_converted.itp"
+
+
+def _project_fields(fmt, template, directory):
+    """项目格式的顶层字段 (按输出顺序, 页面字段用 None 占位) 与页面字段名。"""
+    if fmt == "bt":
+        return {"directory": directory, BT_PAGES_KEY: None, "current_img": "", "image_info": {}}, BT_PAGES_KEY
+    # 与原 X-AnyLabeling 转 ImageTrans 脚本相同: 沿用模板的全部字段, 替换 images 和 dirPath
+    fields = dict(template or {})
+    fields.setdefault(ITP_PAGES_KEY, None)
+    fields["dirPath"] = directory
+    return fields, ITP_PAGES_KEY
+
+
+# ======================= 逐页转换 =======================
+
+_WORKER_TASK = None
+
+
+def _init_worker(task):
+    global _WORKER_TASK
+    _WORKER_TASK = task
+
+
+def _convert_item(item, task):
+    source_format, target_format, ctx = task
+    result = {"name": "", "status": "error", "boxes": 0, "excluded": 0, "message": "", "payload": None, "extra": None}
+    try:
+        if source_format is None:
+            page, excluded = item, 0           # 直接传入的 Page (基准测试 / 其他脚本调用)
+        else:
+            builder = READERS[source_format](item, ctx)
+            if builder is None:
+                result["status"], result["message"] = "skipped", "不是该格式的标注文件"
+                result["name"] = item if isinstance(item, str) else item[0]
+                return result
+            page, excluded = builder.build(), builder.excluded
+        result["name"], result["boxes"], result["excluded"] = page.name, len(page), excluded
+        if target_format in PROJECT_FORMATS:
+            result["payload"], result["extra"] = ENCODERS[target_format](page, ctx)
+        else:
+            file_name, content = ENCODERS[target_format](page, ctx)
+            with open(os.path.join(ctx["output"], file_name), 'w', encoding='utf-8') as f:
+                f.write(content)
+            result["extra"] = file_name
+        result["status"] = "ok"
+    except Exception as e:
+        if not result["name"]:
+            result["name"] = item if isinstance(item, str) else getattr(item, "name", None) or item[0]
+        result["message"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def _worker_chunk(chunk):
+    return [_convert_item(item, _WORKER_TASK) for item in chunk]
+
+
+def _chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _ordered_results(pool, items, processes):
+    """
+    按页顺序产出结果。pool.imap 会在后台一次性取完整个输入, 这里限制同时在途的任务块数,
+    逐页读取的项目源在多进程模式下内存占用也不随页数增长。
+    """
+    pending = deque()
+    for chunk in _chunked(items, CHUNK_SIZE):
+        pending.append(pool.apply_async(_worker_chunk, (chunk,)))
+        if len(pending) >= processes * PENDING_CHUNKS_PER_PROCESS:
+            yield from pending.popleft().get()
+    while pending:
+        yield from pending.popleft().get()
+
+
+def run_conversion(items, source_format, target_format, output, directory, options,
+                   template=None, processes=None, on_page=None):
+    """
+    核心转换循环: items (列表或生成器) 逐页交给 READERS[source_format] -> ENCODERS[target_format]。
+    source_format 为 None 时 items 直接是 Page 对象。返回汇总字典。
+    """
+    indent = None if options.get("compact") and target_format in PROJECT_FORMATS else OUTPUT_INDENT.get(target_format)
+    ctx = {"options": options, "directory": directory, "output": output, "indent": indent}
+    task = (source_format, target_format, ctx)
+    if processes is None:
+        processes = (MAX_PROCESSES if MAX_PROCESSES > 0 else cpu_count()) if ENABLE_MULTIPROCESSING else 1
+    # 先取出少量页面判断是否值得启动进程池 (items 可能是生成器, 不能直接取长度)
+    items = iter(items)
+    head = list(islice(items, MIN_PAGES_FOR_POOL))
+    use_pool = processes > 1 and len(head) >= MIN_PAGES_FOR_POOL
+    items = chain(head, items)
+
+    writer = None
+    if target_format in PROJECT_FORMATS:
+        fields, pages_key = _project_fields(target_format, template, directory)
+        keys = list(fields)
+        split = keys.index(pages_key)
+        writer = ProjectWriter(output, indent=indent)
+    else:
+        os.makedirs(output, exist_ok=True)
+
+    summary = {"pages": 0, "boxes": 0, "excluded": 0, "skipped": 0, "error": 0, "output": output,
+               "processes": processes if use_pool else 1, "elapsed": 0.0}
+    start = time.perf_counter()
+
+    def collect(result):
+        if result["status"] == "ok":
+            summary["pages"] += 1
+            summary["boxes"] += result["boxes"]
+            summary["excluded"] += result["excluded"]
+            if writer is not None:
+                writer.page(result["name"], fragment=result["payload"])
+                if target_format == "bt":
+                    if not fields["current_img"]:
+                        fields["current_img"] = result["name"]
+                    fields["image_info"][result["name"]] = dict(result["extra"], finish_code=11)
+        else:
+            summary[result["status"] if result["status"] == "skipped" else "error"] += 1
+        if on_page is not None:
+            on_page(result)
+
+    try:
+        if writer is not None:
+            for key in keys[:split]:
+                writer.field(key, fields[key])
+            writer.begin_pages(pages_key)
+        if use_pool:
+            with Pool(processes=processes, initializer=_init_worker, initargs=(task,)) as pool:
+                for result in _ordered_results(pool, items, processes):
+                    collect(result)
+        else:
+            for item in items:
+                collect(_convert_item(item, task))
+        if writer is not None:
+            writer.end_pages()
+            # 页面之后的字段 (BallonsTranslator 的 current_img / image_info) 在写完全部页面后才确定
+            for key in keys[split + 1:]:
+                writer.field(key, fields[key])
+            writer.close()
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    summary["elapsed"] = time.perf_counter() - start
+    return summary
+
+
+def convert(source_path, target_format, output=None, source_format=None, options=None,
+            processes=None, on_page=None):
+    """把 source_path (文件或文件夹) 转换为 target_format, 返回汇总字典 (含 output / source_format)。"""
+    opts = dict(DEFAULT_OPTIONS)
+    opts.update(options or {})
+    opts["labels_to_exclude"] = frozenset(opts["labels_to_exclude"] or ())
+    if target_format not in FORMATS:
+        raise ValueError(f"未知的目标格式: {target_format}")
+    source_format = source_format or detect_format(source_path)
+    source = open_source(source_path, source_format, opts)
+    directory = source["directory"]
+    output = os.path.abspath(output or default_output(source_path, target_format, directory))
+
+    template = None
+    if target_format == "itp" and (opts["itp_template"] or source["template"]):
+        template = read_fields(opts["itp_template"] or source["template"], ITP_PAGES_KEY)
+    if target_format == "yolo" and opts["yolo_classes"] is None:
+        opts["yolo_classes"] = _read_classes_txt(output)
+
+    summary = run_conversion(source["items"], source_format, target_format, output, directory, opts,
+                             template=template, processes=processes, on_page=on_page)
+    summary["source_format"] = source_format
+    return summary
+
+
+# ======================= 模拟页面基准测试 =======================
+
+def make_synthetic_pages(num_pages, seed=0, width=1600, height=2400):
+    """模拟漫画页: 随机的水平框与旋转框、标签、原文、译文和文字颜色。"""
+    rng = random.Random(seed)
+    labels = ("balloon", "qipao", "changfangtiao", "fangkuai", "kuangwai")
+    chars = "あいうえおかきくけこさしすせそたちつてとなにぬねの漢字翻訳文本测试"
+    pages = []
+    for p in range(num_pages):
+        b = PageBuilder(f"{p:05d}.jpg", width, height)
+        for _ in range(rng.randint(3, 30)):
+            w, h = rng.randint(20, 300), rng.randint(20, 500)
+            x, y = rng.randint(0, width - w), rng.randint(0, height - h)
+            angle = rng.randint(1, 359) if rng.random() < 0.3 else 0
+            b.add(x, y, w, h, angle, label=rng.choice(labels),
+                  text=''.join(rng.choice(chars) for _ in range(rng.randint(0, 20))),
+                  translation=''.join(rng.choice(chars) for _ in range(rng.randint(0, 20))),
+                  style={"frgb": [rng.randint(0, 255) for _ in range(3)]})
+        pages.append(b.build())
+    return pages
+
+
+def benchmark(num_pages=1000, processes=None):
+    work_dir = tempfile.mkdtemp(prefix="label_convert_bench_")
+    options = dict(DEFAULT_OPTIONS, default_image_size=(1600, 2400), image_dir=work_dir,
+                   yolo_classes=["balloon", "qipao", "changfangtiao", "fangkuai", "kuangwai"],
+                   labels_to_exclude=frozenset())
+    try:
+        pages = make_synthetic_pages(num_pages)
+        total_boxes = sum(len(p) for p in pages)
+        print(f"模拟 {num_pages} 页 / {total_boxes} 个框, 进程数: {processes or '自动'}")
+        sources = {}
+        for fmt in FORMATS:
+            out = os.path.join(work_dir, "src_" + fmt + (".itp" if fmt == "itp" else ".json" if fmt == "bt" else ""))
+            run_conversion(pages, None, fmt, out, work_dir, options, processes=processes)
+            sources[fmt] = out
+
+        header = "源 \\ 目标"
+        print(f"{header:<10}" + ''.join(f"{fmt:>10}" for fmt in FORMATS) + "   (页/秒)")
+        for src in FORMATS:
+            row = f"{src:<10}"
+            for dst in FORMATS:
+                if src == dst:
+                    row += f"{'-':>10}"
+                    continue
+                out = os.path.join(work_dir, f"out_{src}_{dst}" + (".itp" if dst == "itp" else ".json" if dst == "bt" else ""))
+                summary = convert(sources[src], dst, output=out, source_format=src, options=options, processes=processes)
+                assert summary["pages"] == num_pages and summary["error"] == 0, f"{src} -> {dst} 转换失败: {summary}"
+                row += f"{num_pages / summary['elapsed']:>10.0f}"
+            print(row)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
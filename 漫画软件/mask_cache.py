@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+掩膜缓存 - 供 yolo_to_mask_gui.py 保存 CTD 生成的原始掩膜
+- 内存层: 按压缩后的字节数限制 (不再按张数), 真正的 LRU 顺序 (每次读取都会移到最新)
+- 掩膜以 行程编码 (RLE) + zlib 压缩保存, 4000x3000 的文字掩膜通常只有几 KB ~ 几十 KB,
+  压缩约 10 ms, 解压约 2 ms, 结果与原数组逐像素一致
+- 磁盘层: labels 文件夹下的 .mask_cache/, 文件名 = 图片内容哈希 + CTD 模型哈希;
+  图片或模型变化后自动失效, 重启程序后仍可直接读回, 不需要重新运行 CTD
+- 线程安全: GUI 主线程和后台批处理线程可以同时读写
+
+用法:
+    from mask_cache import MaskCache, model_key
+    cache = MaskCache(max_bytes=256 * 1024 * 1024)
+    cache.model_key = model_key(模型路径, detect_size=1024)
+    cache.disk_dir = labels_folder / ".mask_cache"
+    mask = cache.get(image_path)           # 未缓存时返回 None
+    cache.put(image_path, mask)
+
+直接运行本文件会生成模拟掩膜, 测试压缩率、耗时和 LRU/磁盘层行为:
+    python mask_cache.py
+"""
+
+import os
+import json
+import time
+import zlib
+import struct
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+ZLIB_LEVEL = 1
+
+# 文件头: 魔数, 高, 宽, 行程长度块字节数
+_MAGIC = b"MRL1"
+_HEADER = struct.Struct("<4sIII")
+
+
+def encode_mask(mask):
+    """uint8 二维掩膜 -> 压缩字节 (行程编码 + zlib)"""
+    mask = np.ascontiguousarray(mask, dtype=np.uint8)
+    h, w = mask.shape
+    flat = mask.reshape(-1)
+    if flat.size:
+        change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+        bounds = np.concatenate(([0], change, [flat.size]))
+        lengths = np.diff(bounds).astype("<u4")
+        values = flat[bounds[:-1]]
+    else:
+        lengths = np.zeros(0, "<u4")
+        values = np.zeros(0, np.uint8)
+    length_block = zlib.compress(lengths.tobytes(), ZLIB_LEVEL)
+    value_block = zlib.compress(values.tobytes(), ZLIB_LEVEL)
+    return _HEADER.pack(_MAGIC, h, w, len(length_block)) + length_block + value_block
+
+
+def decode_mask(data):
+    """压缩字节 -> uint8 二维掩膜 (可写的新数组)"""
+    magic, h, w, length_size = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError("不是有效的掩膜缓存数据")
+    start = _HEADER.size
+    lengths = np.frombuffer(zlib.decompress(data[start:start + length_size]), "<u4")
+    values = np.frombuffer(zlib.decompress(data[start + length_size:]), np.uint8)
+    mask = np.repeat(values, lengths)
+    if mask.size != h * w:
+        raise ValueError("掩膜缓存数据已损坏")
+    return mask.reshape(h, w)
+
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def model_key(model_path, **params):
+    """CTD 模型文件内容 + 推理参数 的哈希; 换模型或改参数后旧缓存自然失效"""
+    h = hashlib.blake2b(digest_size=8)
+    h.update(file_hash(model_path).encode())
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class MaskCache:
+    """按字节限制的压缩 LRU 掩膜缓存, 可选磁盘层"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, disk_dir=None, model_key=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.model_key = model_key
+        self._entries = OrderedDict()  # 缓存键 -> 压缩字节
+        self._nbytes = 0
+        self._hashes = {}  # (路径, 大小, 修改时间) -> 图片内容哈希
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # ---------- 键 ----------
+    def _image_hash(self, image_path):
+        st = os.stat(image_path)
+        stat_key = (str(image_path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._hashes.get(stat_key)
+        if digest is None:
+            digest = file_hash(image_path)
+            with self._lock:
+                self._hashes[stat_key] = digest
+        return digest
+
+    def key_for(self, image_path, variant=None):
+        """
+        缓存键; 模型还没加载 (model_key 为空) 或图片不存在时返回 None。
+        variant: 结果还依赖其他输入时 (例如裁剪模式依赖 YOLO 标签) 传入其哈希, 作为键的一部分
+        """
+        if not self.model_key:
+            return None
+        try:
+            key = f"{self._image_hash(image_path)}_{self.model_key}"
+        except OSError:
+            return None
+        return f"{key}_{variant}" if variant else key
+
+    def _disk_path(self, key):
+        return self.disk_dir / (key + ".mask") if self.disk_dir else None
+
+    # ---------- 内存层 ----------
+    def _remember(self, key, data):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._nbytes -= len(old)
+            self._entries[key] = data
+            self._nbytes += len(data)
+            # 超出预算时淘汰最久未使用的条目 (磁盘层仍保留)
+            while self._nbytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._nbytes -= len(evicted)
+
+    def _lookup(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+        path = self._disk_path(key)
+        if path is not None:
+            try:
+                data = path.read_bytes()
+            except OSError:
+                data = None
+            if data is not None:
+                self._remember(key, data)
+                with self._lock:
+                    self.disk_hits += 1
+                return data
+        with self._lock:
+            self.misses += 1
+        return None
+
+    # ---------- 对外接口 ----------
+    def get(self, image_path, variant=None):
+        """读取掩膜; 内存层和磁盘层都没有时返回 None"""
+        key = self.key_for(image_path, variant)
+        if key is None:
+            return None
+        data = self._lookup(key)
+        if data is None:
+            return None
+        try:
+            return decode_mask(data)
+        except (ValueError, zlib.error, struct.error):
+            self.discard(image_path, variant)
+            return None
+
+    def get_bytes(self, image_path, variant=None):
+        """读取压缩后的掩膜字节 (不解压, 可直接交给 decode_mask 或其他进程); 没有时返回 None"""
+        key = self.key_for(image_path, variant)
+        return self._lookup(key) if key is not None else None
+
+    def contains(self, image_path, variant=None):
+        """是否已缓存 (不解压)"""
+        key = self.key_for(image_path, variant)
+        if key is None:
+            return False
+        with self._lock:
+            if key in self._entries:
+                return True
+        path = self._disk_path(key)
+        return path is not None and path.exists()
+
+    def put(self, image_path, mask, variant=None):
+        """写入内存层, 并在设置了 disk_dir 时写入磁盘层; 返回压缩后的字节"""
+        if mask is None:
+            return None
+        data = encode_mask(mask)
+        key = self.key_for(image_path, variant)
+        if key is None:
+            return data
+        self._remember(key, data)
+        path = self._disk_path(key)
+        if path is None:
+            return data
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # 先写临时文件再替换, 中途退出不会留下半个文件
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"写入掩膜磁盘缓存失败: {e}")
+        return data
+
+    def discard(self, image_path, variant=None):
+        key = self.key_for(image_path, variant)
+        if key is None:
+            return
+        with self._lock:
+            data = self._entries.pop(key, None)
+            if data is not None:
+                self._nbytes -= len(data)
+        path = self._disk_path(key)
+        if path is not None:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def clear(self):
+        """清空内存层 (磁盘层保留)"""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def describe(self):
+        return (f"内存 {len(self._entries)} 张 / {self._nbytes / 1024 / 1024:.1f} MB"
+                f" (上限 {self.max_bytes / 1024 / 1024:.1f} MB)")
+
+
+def benchmark(num_pages=40, seed=0):
+    from mask_morph import make_mask
+
+    masks = [make_mask(seed + i) for i in range(4)]
+    t0 = time.perf_counter()
+    blobs = [encode_mask(m) for m in masks]
+    t_enc = (time.perf_counter() - t0) / len(masks)
+    t0 = time.perf_counter()
+    ok = all(np.array_equal(decode_mask(b), m) for b, m in zip(blobs, masks))
+    t_dec = (time.perf_counter() - t0) / len(masks)
+    raw = masks[0].nbytes
+    avg = sum(map(len, blobs)) / len(blobs)
+    print(f"掩膜 {masks[0].shape[1]}x{masks[0].shape[0]}: 原始 {raw / 1024:.0f} KB -> 压缩 {avg / 1024:.1f} KB "
+          f"({raw / avg:.0f}x), 压缩 {t_enc * 1000:.1f} ms, 解压 {t_dec * 1000:.1f} ms, 结果一致: {ok}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        images = []
+        for i in range(num_pages):
+            p = tmp / f"{i:03d}.jpg"
+            p.write_bytes(os.urandom(2048))
+            images.append(p)
+        cache = MaskCache(max_bytes=int(avg * 10), disk_dir=tmp / ".mask_cache", model_key="test")
+        for i, p in enumerate(images):
+            cache.put(p, masks[i % len(masks)])
+        print(f"写入 {num_pages} 张后: {cache.describe()}")
+        cache.get(images[-10])  # 最近访问 -> 移到末尾
+        cache.put(images[0], masks[0])
+        print(f"LRU: 刚访问的页面仍在内存中: {cache.key_for(images[-10]) in cache._entries}")
+
+        # 模拟重启: 新建缓存对象, 只剩磁盘层
+        restarted = MaskCache(max_bytes=int(avg * 10), disk_dir=tmp / ".mask_cache", model_key="test")
+        ok = all(np.array_equal(restarted.get(p), masks[i % len(masks)]) for i, p in enumerate(images))
+        print(f"重启后从磁盘层读回 {num_pages} 张: 结果一致 {ok}, 磁盘命中 {restarted.disk_hits}, 未命中 {restarted.misses}")
+        other_model = MaskCache(disk_dir=tmp / ".mask_cache", model_key="other")
+        print(f"换模型后旧缓存失效: {other_model.get(images[0]) is None}")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+掩膜批量导出引擎 - 供 yolo_to_mask_gui.py 的批量保存 / 导出ITmask使用, 也可以不开界面直接调用
+原来每页依次: 读图 -> CTD -> 过滤/调整 -> PNG 写入, 全部在一个线程里串行。现在是流水线:
+- 已有缓存的页面 (mask_cache, 图片哈希 + 模型哈希为键) 跳过读图和 CTD
+- 其余页面在线程池中读图, 下一批在 CTD 推理当前批时预先读好
+- CTD 按批运行: 裁剪模式下多页的 YOLO 区域拼进同一批画布 (见 ctd_crops.py), 前向次数更少;
+  整页模式下 CTD 一次只能处理一页, 仍是每页一次前向, 但与读图/调整/写入重叠
+- 解压原始掩膜 -> YOLO 框过滤 -> 整体缩放 + 方向延伸 -> PNG 编码 在进程池中并行
+  (worker 只导入本模块, 不加载 torch / tkinter), 编码好的 PNG 字节交给写入线程池落盘
+
+调整任务格式 (可 pickle): (压缩掩膜字节, 标签路径, 配置字典, 输出路径, 格式 "mask" | "itmask")
+
+不开界面时的用法:
+    from mask_export import export_batch, create_pool
+    pages = [(图片路径, 标签路径, 输出路径), ...]
+    pool = create_pool()
+    success, errors, canceled, stats = export_batch(
+        pages, config, "mask", run_ctd=lambda img: ctd_model(img, refine_mode=0)[1], pool=pool,
+        crop={"padding": 16, "detail": 1.5})          # crop=None 为整页推理
+    pool.close()
+
+直接运行本文件会用模拟检测器生成测试页面, 对比原来的逐页串行流程和流水线的耗时并检查输出一致:
+    python mask_export.py
+"""
+
+import io
+import os
+import time
+import tempfile
+import multiprocessing
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+from mask_cache import encode_mask, decode_mask
+from mask_morph import extend_mask
+from ctd_crops import crop_ctd_masks
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DEFAULT_PROCESSES = max(1, min(8, (os.cpu_count() or 1) - 1))
+MIN_PAGES_FOR_POOL = 8     # 页数少于此值时直接在当前线程处理 (进程启动开销不划算)
+DECODE_THREADS = 4         # 读图线程数 (图片解码时释放 GIL)
+WRITE_THREADS = 4          # PNG 写入线程数
+CTD_BATCH_PAGES = 8        # 每批 CTD 处理的页数 (裁剪模式下这些页的区域共用画布)
+WAIT_INTERVAL = 0.1        # 等待结果时检查取消的间隔 (秒)
+ITMASK_COLOR = [20, 255, 208, 255]  # #D0FF14 的 BGR 顺序 + Alpha (与原 GUI 一致)
+
+
+def read_yolo_labels(label_path):
+    """读取YOLO标签 (x_center, y_center, width, height)"""
+    boxes = []
+    try:
+        with open(label_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.strip().split()
+                if len(parts) >= 5:
+                    _, x_center, y_center, width, height = map(float, parts[:5])
+                    boxes.append((x_center, y_center, width, height))
+    except Exception:
+        pass
+    return boxes
+
+
+def yolo_to_pixel_coords(boxes, img_width, img_height):
+    """YOLO坐标转像素坐标 (x1, y1, x2, y2)"""
+    pixel_boxes = []
+    for x_center, y_center, width, height in boxes:
+        x_center_px = x_center * img_width
+        y_center_px = y_center * img_height
+        width_px = width * img_width
+        height_px = height * img_height
+
+        x1 = int(x_center_px - width_px / 2)
+        y1 = int(y_center_px - height_px / 2)
+        x2 = int(x_center_px + width_px / 2)
+        y2 = int(y_center_px + height_px / 2)
+
+        x1 = max(0, min(x1, img_width))
+        y1 = max(0, min(y1, img_height))
+        x2 = max(0, min(x2, img_width))
+        y2 = max(0, min(y2, img_height))
+
+        pixel_boxes.append((x1, y1, x2, y2))
+    return pixel_boxes
+
+
+def filter_mask_with_boxes(mask, yolo_boxes):
+    """只保留YOLO框内的掩膜; 没有框时原样返回"""
+    if not yolo_boxes:
+        return mask
+    yolo_mask = np.zeros_like(mask)
+    for x1, y1, x2, y2 in yolo_boxes:
+        yolo_mask[y1:y2, x1:x2] = 255
+    return cv2.bitwise_and(mask, yolo_mask)
+
+
+def adjust_mask(mask, config):
+    """按配置调整掩膜: 整体膨胀/腐蚀 (mask_size_factor) + 4 个方向独立延伸"""
+    mask_size_factor = config.get('mask_size_factor', 1.0)
+    adjusted_mask = mask
+    if mask_size_factor != 1.0:
+        if mask_size_factor > 1.0:
+            kernel_size = int((mask_size_factor - 1.0) * 10) + 1
+            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+            adjusted_mask = cv2.dilate(adjusted_mask, kernel, iterations=1)
+        else:
+            kernel_size = int((1.0 - mask_size_factor) * 10) + 1
+            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+            adjusted_mask = cv2.erode(adjusted_mask, kernel, iterations=1)
+    return extend_mask(adjusted_mask, top=config.get('extend_top', 0), bottom=config.get('extend_bottom', 0),
+                       left=config.get('extend_left', 0), right=config.get('extend_right', 0))
+
+
+def create_itmask(mask):
+    """ITmask格式: 透明背景 + #D0FF14实心文字 (RGBA)"""
+    img_height, img_width = mask.shape[:2]
+    itmask = np.zeros((img_height, img_width, 4), dtype=np.uint8)
+    itmask[mask > 127] = ITMASK_COLOR
+    return itmask
+
+
+def encode_png(mask, fmt="mask"):
+    """黑白PNG或ITmask编码为字节"""
+    if fmt == "itmask":
+        buf = io.BytesIO()
+        Image.fromarray(create_itmask(mask), 'RGBA').save(buf, 'PNG')
+        return buf.getvalue()
+    ok, buf = cv2.imencode(".png", mask)
+    if not ok:
+        raise ValueError("PNG编码失败")
+    return buf.tobytes()
+
+
+def write_bytes(output_path, data):
+    """写入线程池 worker; 直接写字节, 中文路径也能保存。返回 (输出路径, 错误信息或None)"""
+    try:
+        with open(output_path, "wb") as f:
+            f.write(data)
+        return output_path, None
+    except Exception as e:
+        return output_path, str(e)
+
+
+def render_page(task):
+    """进程池 worker: 解压 -> 过滤 -> 调整 -> PNG 编码; 返回 (输出路径, PNG字节, 错误信息或None)"""
+    mask_data, label_path, config, output_path, fmt = task
+    try:
+        mask = decode_mask(mask_data)
+        h, w = mask.shape
+        boxes = read_yolo_labels(label_path) if label_path else []
+        yolo_boxes = yolo_to_pixel_coords(boxes, w, h) if boxes else []
+        return output_path, encode_png(adjust_mask(filter_mask_with_boxes(mask, yolo_boxes), config), fmt), None
+    except Exception as e:
+        return output_path, None, str(e)
+
+
+def export_page(task):
+    """单页导出 (当前线程): 调整 + 写入; 返回 (输出路径, 错误信息或None)"""
+    output_path, data, error = render_page(task)
+    return (output_path, error) if error else write_bytes(output_path, data)
+
+
+def read_image(image_path):
+    """读取 BGR 图片, 中文路径也能读取; 失败返回 None"""
+    try:
+        image = cv2.imdecode(np.fromfile(str(image_path), np.uint8), cv2.IMREAD_COLOR)
+        if image is None and Image is not None:
+            image = cv2.cvtColor(np.array(Image.open(image_path).convert('RGB')), cv2.COLOR_RGB2BGR)
+        return image
+    except Exception:
+        return None
+
+
+def create_pool(processes=DEFAULT_PROCESSES):
+    return multiprocessing.Pool(processes)
+
+
+def _run_ctd_batch(decoded, run_ctd, crop, stats):
+    """一批页面的 CTD 原始掩膜; 裁剪模式下有框的页面共用画布, 没有框的页面整页推理"""
+    masks = [None] * len(decoded)
+    cropped = [i for i, (image, boxes) in enumerate(decoded) if image is not None and crop is not None and boxes]
+    if cropped:
+        crop_masks, crop_stats = crop_ctd_masks([decoded[i] for i in cropped], run_ctd, **crop)
+        stats["forwards"] += crop_stats["forwards"]
+        for i, mask in zip(cropped, crop_masks):
+            masks[i] = mask
+    for i, (image, _) in enumerate(decoded):
+        if image is not None and masks[i] is None:
+            masks[i] = run_ctd(image)
+            stats["forwards"] += 1
+    return masks
+
+
+def export_batch(pages, config, fmt="mask", run_ctd=None, pool=None, cache=None, variant_for=None,
+                 crop=None, read_image=read_image, batch_pages=CTD_BATCH_PAGES,
+                 decode_threads=DECODE_THREADS, write_threads=WRITE_THREADS,
+                 on_progress=None, is_canceled=None):
+    """
+    批量导出。pages: [(图片路径, 标签路径, 输出路径)]; run_ctd(BGR图片) -> CTD 原始掩膜 (mask_refined)。
+    cache: MaskCache (可选), 命中的页面不读图、不运行 CTD, 新生成的掩膜写入缓存;
+    variant_for(图片路径) 返回缓存键的附加部分 (与界面的 mask_variant 一致)。
+    crop: None = 整页推理; 字典 = 裁剪模式, 作为 crop_ctd_masks 的参数 (canvas_size / padding / detail)。
+    pool 为 None 或页数较少时调整和编码在当前线程进行。
+    on_progress(已完成, 总数, 输出路径); is_canceled() 返回 True 时停止 (使用进程池时会 terminate 该池)。
+    返回 (成功数, [(输出路径, 错误信息)], 是否被取消, 统计信息)。
+    """
+    start = time.perf_counter()
+    total = len(pages)
+    stats = {"pages": total, "cached": 0, "ctd_pages": 0, "forwards": 0, "ctd_seconds": 0.0, "seconds": 0.0}
+    use_pool = pool is not None and total >= MIN_PAGES_FOR_POOL
+    adjusting = deque()  # 调整/编码中的页面 (进程池 AsyncResult, 或当前线程的结果)
+    writing = deque()    # 写入中的页面 (Future)
+    result = {"done": 0, "success": 0, "errors": []}
+
+    def finish(output_path, error):
+        result["done"] += 1
+        if error is None:
+            result["success"] += 1
+        else:
+            result["errors"].append((output_path, error))
+        if on_progress:
+            on_progress(result["done"], total, output_path)
+
+    def submit_adjust(mask_data, label_path, output_path):
+        task = (mask_data, str(label_path) if label_path else None, config, str(output_path), fmt)
+        adjusting.append(pool.apply_async(render_page, (task,)) if use_pool else render_page(task))
+
+    def drain():
+        # 按提交顺序把调整完的页面交给写入线程, 写完的页面计入进度
+        while adjusting and (not use_pool or adjusting[0].ready()):
+            item = adjusting.popleft()
+            output_path, data, error = item.get() if use_pool else item
+            if error:
+                finish(output_path, error)
+            else:
+                writing.append(writer.submit(write_bytes, output_path, data))
+        while writing and writing[0].done():
+            finish(*writing.popleft().result())
+
+    def canceled():
+        if is_canceled and is_canceled():
+            decoder.shutdown(wait=False, cancel_futures=True)
+            writer.shutdown(wait=False, cancel_futures=True)
+            if use_pool:
+                pool.terminate()
+            return True
+        return False
+
+    def decode(page):
+        image_path, label_path, _ = page
+        image = read_image(image_path)
+        if image is None:
+            return None, []
+        boxes = read_yolo_labels(label_path) if label_path else []
+        return image, yolo_to_pixel_coords(boxes, image.shape[1], image.shape[0]) if boxes else []
+
+    decoder = ThreadPoolExecutor(decode_threads)
+    writer = ThreadPoolExecutor(write_threads)
+    try:
+        # 已有缓存的页面直接进入调整阶段, 与后面的 CTD 重叠
+        todo = []
+        for page in pages:
+            image_path, label_path, output_path = page
+            mask_data = cache.get_bytes(image_path, variant_for(image_path) if variant_for else None) if cache is not None else None
+            if mask_data is None:
+                todo.append(page)
+            else:
+                stats["cached"] += 1
+                submit_adjust(mask_data, label_path, output_path)
+        drain()
+
+        batches = [todo[i:i + batch_pages] for i in range(0, len(todo), batch_pages)]
+        next_decoded = [decoder.submit(decode, page) for page in batches[0]] if batches else []
+        for b, batch in enumerate(batches):
+            if canceled():
+                return result["success"], result["errors"], True, stats
+            decoded = [f.result() for f in next_decoded]
+            if b + 1 < len(batches):
+                # CTD 推理这一批时, 下一批在后台读图
+                next_decoded = [decoder.submit(decode, page) for page in batches[b + 1]]
+            if run_ctd is None:
+                masks = [None] * len(batch)
+            else:
+                t0 = time.perf_counter()
+                masks = _run_ctd_batch(decoded, run_ctd, crop, stats)
+                stats["ctd_seconds"] += time.perf_counter() - t0
+            for (image_path, label_path, output_path), (image, _), mask in zip(batch, decoded, masks):
+                if mask is None:
+                    finish(str(output_path), "无法读取图片" if image is None else "CTD模型未加载")
+                    continue
+                stats["ctd_pages"] += 1
+                if cache is not None:
+                    mask_data = cache.put(image_path, mask, variant_for(image_path) if variant_for else None)
+                else:
+                    mask_data = encode_mask(mask)
+                submit_adjust(mask_data, label_path, output_path)
+            drain()
+
+        # 等待剩余的调整和写入
+        while adjusting or writing:
+            if canceled():
+                return result["success"], result["errors"], True, stats
+            if adjusting and use_pool:
+                adjusting[0].wait(WAIT_INTERVAL)
+            elif writing:
+                wait([writing[0]], timeout=WAIT_INTERVAL)
+            drain()
+    finally:
+        decoder.shutdown(wait=False, cancel_futures=True)
+        writer.shutdown(wait=True)
+        stats["seconds"] = time.perf_counter() - start
+    return result["success"], result["errors"], False, stats
+
+
+def _reference_export(image_path, label_path, config, output_path, fmt, run_ctd):
+    """原 GUI 的逐页流程 (读图 -> CTD -> 过滤 -> 调整 -> cv2.imwrite / PIL), 仅用于对比"""
+    image = read_image(image_path)
+    mask = run_ctd(image)
+    h, w = mask.shape
+    boxes = read_yolo_labels(label_path)
+    final_mask = filter_mask_with_boxes(mask, yolo_to_pixel_coords(boxes, w, h) if boxes else [])
+    final_mask = adjust_mask(final_mask, config)
+    if fmt == "itmask":
+        Image.fromarray(create_itmask(final_mask), 'RGBA').save(str(output_path), 'PNG')
+    else:
+        cv2.imwrite(str(output_path), final_mask)
+
+
+def benchmark(num_pages=24, processes=DEFAULT_PROCESSES):
+    from ctd_crops import _fake_ctd, _make_page
+    from mask_cache import MaskCache
+
+    config = {'mask_size_factor': 1.3, 'extend_left': 4, 'extend_right': 4, 'extend_top': 12, 'extend_bottom': 0}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        pages = []
+        for i in range(num_pages):
+            page, _, boxes = _make_page(i % 4, 2000, 2800, 12)
+            image_path, label_path = tmp / f"{i:03d}.jpg", tmp / f"{i:03d}.txt"
+            cv2.imwrite(str(image_path), page)
+            label_path.write_text("".join(f"0 {(x1 + x2) / 4000:.6f} {(y1 + y2) / 5600:.6f} {(x2 - x1) / 2000:.6f} "
+                                          f"{(y2 - y1) / 2800:.6f}\n" for x1, y1, x2, y2 in boxes), encoding="utf-8")
+            pages.append((image_path, label_path))
+
+        pool = create_pool(processes)
+        try:
+            for fmt in ("mask", "itmask"):
+                ref_dir, out_dir = tmp / f"ref_{fmt}", tmp / f"out_{fmt}"
+                ref_dir.mkdir()
+                out_dir.mkdir()
+                t0 = time.perf_counter()
+                for image_path, label_path in pages:
+                    _reference_export(image_path, str(label_path), config, ref_dir / (image_path.stem + ".png"), fmt, _fake_ctd)
+                t_serial = time.perf_counter() - t0
+
+                cache = MaskCache(disk_dir=tmp / ".mask_cache", model_key="fake")
+                tasks = [(image_path, label_path, out_dir / (image_path.stem + ".png")) for image_path, label_path in pages]
+                success, errors, _, stats = export_batch(tasks, config, fmt, _fake_ctd, pool, cache)
+                same = all((out_dir / p.name).read_bytes() == (ref_dir / p.name).read_bytes() for p in ref_dir.iterdir())
+                print(f"{fmt:>6}: {num_pages} 页 2000x2800, 逐页串行 {t_serial:.2f}s, 流水线 {stats['seconds']:.2f}s "
+                      f"(CTD {stats['ctd_seconds']:.2f}s), 成功 {success}, 与原流程输出一致: {same}")
+
+                # 第二次导出: 原始掩膜全部来自缓存, 不读图也不运行 CTD
+                _, _, _, stats = export_batch(tasks, config, fmt, _fake_ctd, pool, cache)
+                print(f"{'':>6}  再次导出 (缓存 {stats['cached']} 页): {stats['seconds']:.2f}s")
+
+            # 裁剪模式: 多页共用画布, 前向次数少于页数
+            crop_dir = tmp / "out_crop"
+            crop_dir.mkdir()
+            tasks = [(image_path, label_path, crop_dir / (image_path.stem + ".png")) for image_path, label_path in pages]
+            _, _, _, stats = export_batch(tasks, config, "mask", _fake_ctd, pool, crop={"padding": 16, "detail": 1.5})
+            print(f"  裁剪模式: {num_pages} 页 {stats['forwards']} 次前向, {stats['seconds']:.2f}s")
+        finally:
+            pool.close()
+            pool.join()
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+掩膜方向延伸引擎 - 供 yolo_to_mask_gui.py 的实时预览和批量导出共用
+功能:
+- 上/下/左/右 4 个方向独立单向生长, 结果与原来的逐像素平移 + np.maximum 循环完全一致
+- 上+下 合并成一次竖直线核膨胀, 左+右 合并成一次水平线核膨胀 (锚点偏移实现单向),
+  不再为每 1 像素延伸分配一张整图, 延伸 30 像素时从约 120 次整图运算降到 2 次膨胀 + 1 次合并
+- 只在掩膜非零区域的外接矩形 (加上延伸量) 内计算, 文字稀疏的页面更快
+
+用法:
+    from mask_morph import extend_mask
+    mask = extend_mask(mask, top=10, bottom=0, left=5, right=5)
+
+直接运行本文件会生成模拟掩膜, 对比新旧两种实现的结果和耗时:
+    python mask_morph.py
+"""
+
+import time
+import cv2
+import numpy as np
+
+
+def _line_dilate(roi, before, after, axis):
+    """沿 axis 取 [i-before, i+after] 窗口内的最大值 (窗口外视为 0)"""
+    length = before + after + 1
+    if axis == 0:
+        kernel = np.ones((length, 1), np.uint8)
+        anchor = (0, before)
+    else:
+        kernel = np.ones((1, length), np.uint8)
+        anchor = (before, 0)
+    return cv2.dilate(roi, kernel, anchor=anchor, borderType=cv2.BORDER_CONSTANT, borderValue=0)
+
+
+def extend_mask(mask, top=0, bottom=0, left=0, right=0):
+    """
+    4 个方向独立单向延伸掩膜 (像素)。
+    向上延伸 n: 每个像素取其下方 n 个像素内的最大值, 其余方向同理; 4 个方向各自作用于原掩膜后取并集。
+    所有延伸量为 0 时原样返回 mask, 否则返回新数组。
+    """
+    top, bottom, left, right = (max(0, int(v)) for v in (top, bottom, left, right))
+    if top == 0 and bottom == 0 and left == 0 and right == 0:
+        return mask
+
+    h, w = mask.shape[:2]
+    result = mask.copy()
+
+    # 只在非零区域附近计算; 外接矩形以外全是 0, 所以裁剪后结果不变
+    if mask.dtype == np.uint8 and mask.ndim == 2:
+        x, y, bw, bh = cv2.boundingRect(mask)
+        if bw == 0 or bh == 0:
+            return result
+    else:
+        x, y, bw, bh = 0, 0, w, h
+    y0, y1 = max(0, y - top), min(h, y + bh + bottom)
+    x0, x1 = max(0, x - left), min(w, x + bw + right)
+    roi = mask[y0:y1, x0:x1]
+
+    # 向上延伸 = 取下方像素, 所以窗口是 [i-bottom, i+top]
+    grown = roi
+    if top or bottom:
+        grown = _line_dilate(roi, bottom, top, 0)
+    if left or right:
+        horizontal = _line_dilate(roi, right, left, 1)
+        grown = horizontal if grown is roi else cv2.max(grown, horizontal)
+    result[y0:y1, x0:x1] = grown
+    return result
+
+
+def extend_mask_reference(mask, top=0, bottom=0, left=0, right=0):
+    """原来的逐像素平移实现, 仅用于对比"""
+    h, w = mask.shape
+    result_mask = mask.copy()
+    for i in range(1, int(top) + 1):
+        if i < h:
+            shifted = np.zeros_like(mask)
+            shifted[:-i, :] = mask[i:, :]
+            result_mask = np.maximum(result_mask, shifted)
+    for i in range(1, int(bottom) + 1):
+        if i < h:
+            shifted = np.zeros_like(mask)
+            shifted[i:, :] = mask[:-i, :]
+            result_mask = np.maximum(result_mask, shifted)
+    for i in range(1, int(left) + 1):
+        if i < w:
+            shifted = np.zeros_like(mask)
+            shifted[:, :-i] = mask[:, i:]
+            result_mask = np.maximum(result_mask, shifted)
+    for i in range(1, int(right) + 1):
+        if i < w:
+            shifted = np.zeros_like(mask)
+            shifted[:, i:] = mask[:, :-i]
+            result_mask = np.maximum(result_mask, shifted)
+    return result_mask
+
+
+def make_mask(seed, width=3000, height=4000, num_blobs=300):
+    """生成模拟文字掩膜 (随机矩形块)"""
+    rng = np.random.default_rng(seed)
+    mask = np.zeros((height, width), np.uint8)
+    for _ in range(num_blobs):
+        x, y = int(rng.integers(0, width - 10)), int(rng.integers(0, height - 10))
+        mask[y:y + int(rng.integers(5, 120)), x:x + int(rng.integers(5, 120))] = 255
+    return mask
+
+
+def benchmark(extends=(5, 15, 30, 50), repeats=3):
+    mask = make_mask(0)
+    print(f"掩膜尺寸: {mask.shape[1]}x{mask.shape[0]}")
+    print(f"{'延伸(4向)':>10} {'原实现(ms)':>12} {'新实现(ms)':>12} {'结果一致':>8}")
+    for n in extends:
+        t0 = time.perf_counter()
+        ref = extend_mask_reference(mask, n, n, n, n)
+        t_ref = time.perf_counter() - t0
+        best = float("inf")
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            new = extend_mask(mask, n, n, n, n)
+            best = min(best, time.perf_counter() - t0)
+        print(f"{n:>10} {t_ref * 1000:>12.1f} {best * 1000:>12.1f} {str(np.array_equal(ref, new)):>8}")
+
+    # 单方向、超出图片尺寸、灰度值掩膜等边界情况
+    gray = (make_mask(1, 400, 300, 20) // 255 * np.random.default_rng(2).integers(1, 256, (300, 400))).astype(np.uint8)
+    cases = [(7, 0, 0, 0), (0, 7, 0, 0), (0, 0, 7, 0), (0, 0, 0, 7), (3, 11, 0, 2), (500, 0, 0, 0), (0, 0, 0, 401)]
+    ok = all(np.array_equal(extend_mask_reference(m, *c), extend_mask(m, *c))
+             for m in (mask[:300, :400], gray, np.zeros((50, 60), np.uint8)) for c in cases)
+    print(f"边界情况结果一致: {ok}")
+
+
+if __name__ == "__main__":
+    benchmark()
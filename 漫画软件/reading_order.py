@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+阅读顺序排序引擎 - 供 x-Anylabeling 标签排序脚本 / YOLO后处理.py / yolo_RTDETR后处理.PY / detect_gateway.py 共用
+功能:
+- 框坐标只提取一次, 存为 numpy 数组, 排序时不再反复解析 points
+- 分栏模式: 按区间重叠扫描把框归入同一列 (或同一行), 再按列间顺序 + 列内顺序一次 lexsort, 总体 O(n log n)
+- 兼容原标签排序脚本的全部 SPATIAL_SORT_MODE (REV_X_THEN_Y / Y_THEN_REV_X / REV_X / X_THEN_Y / Y_THEN_X / X / Y / NONE),
+  结果与原来的 sorted(key=...) 完全一致 (同样是稳定排序)
+
+排序模式:
+    COLUMNS_RTL  竖排漫画: 先分列, 列从右到左, 列内从上到下
+    COLUMNS_LTR  先分列, 列从左到右, 列内从上到下
+    ROWS_TTB     横排文字: 先分行, 行从上到下, 行内从左到右
+
+直接运行本文件会生成模拟页面, 校验兼容模式的结果并测试排序速度:
+    python reading_order.py
+"""
+
+import time
+import random
+import numpy as np
+
+# 分栏时两个框被视为同一列 (行) 所需的最小重叠比例: 重叠宽度 / 当前框宽度
+DEFAULT_MIN_OVERLAP = 0.5
+
+COLUMN_MODES = ("COLUMNS_RTL", "COLUMNS_LTR", "ROWS_TTB")
+LEGACY_MODES = ("REV_X_THEN_Y", "Y_THEN_REV_X", "REV_X", "X_THEN_Y", "Y_THEN_X", "X", "Y", "NONE")
+SORT_MODES = COLUMN_MODES + LEGACY_MODES
+
+
+def box_array(boxes):
+    """把 [x_min, y_min, x_max, y_max] 列表转换为 (N, 4) 的 float64 数组。"""
+    arr = np.asarray(boxes, dtype=np.float64)
+    return arr.reshape(-1, 4)
+
+
+def points_to_box(points):
+    """X-AnyLabeling shape 的 points -> [x_min, y_min, x_max, y_max] (无点时返回全 0, 与原排序脚本一致)。"""
+    if not points:
+        return [0, 0, 0, 0]
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def group_intervals(start, end, min_overlap=DEFAULT_MIN_OVERLAP):
+    """
+    区间重叠扫描: 按起点排序后依次处理, 与当前组的范围重叠 >= min_overlap * 自身长度 时并入当前组, 否则开新组。
+    返回 (每个框的组号, 每组起点, 每组终点)。
+    """
+    n = len(start)
+    groups = [0] * n
+    group_start, group_end = [], []
+    cur_end = None
+    starts, ends = start.tolist(), end.tolist()
+    for i in np.argsort(start, kind='stable').tolist():
+        s, e = starts[i], ends[i]
+        if cur_end is not None and min(cur_end, e) - s > 0 and min(cur_end, e) - s >= min_overlap * (e - s):
+            if e > cur_end:
+                cur_end = group_end[-1] = e
+        else:
+            group_start.append(s)
+            group_end.append(e)
+            cur_end = e
+        groups[i] = len(group_start) - 1
+    return np.array(groups, dtype=np.intp), np.array(group_start), np.array(group_end)
+
+
+def _rank(*keys):
+    """按 keys (最后一个为主键) 给每组一个名次。"""
+    ranks = np.empty(len(keys[0]), dtype=np.intp)
+    ranks[np.lexsort(keys)] = np.arange(len(keys[0]))
+    return ranks
+
+
+def reading_order(boxes, mode="COLUMNS_RTL", min_overlap=DEFAULT_MIN_OVERLAP):
+    """
+    返回 boxes 按阅读顺序排列后的下标列表 (稳定排序: 完全并列的框保持原来的先后顺序)。
+    boxes: (N, 4) 数组或 [x_min, y_min, x_max, y_max] 列表。
+    """
+    arr = box_array(boxes)
+    n = len(arr)
+    if n <= 1 or mode == "NONE":
+        return list(range(n))
+    x_min, y_min, x_max, y_max = arr[:, 0], arr[:, 1], arr[:, 2], arr[:, 3]
+
+    if mode in ("COLUMNS_RTL", "COLUMNS_LTR"):
+        groups, g_start, g_end = group_intervals(x_min, x_max, min_overlap)
+        if mode == "COLUMNS_RTL":
+            col_rank = _rank(-g_start, -g_end)
+            keys = (-x_min, y_min, col_rank[groups])
+        else:
+            col_rank = _rank(g_end, g_start)
+            keys = (x_min, y_min, col_rank[groups])
+    elif mode == "ROWS_TTB":
+        groups, g_start, g_end = group_intervals(y_min, y_max, min_overlap)
+        row_rank = _rank(g_end, g_start)
+        keys = (y_min, x_min, row_rank[groups])
+    elif mode == "REV_X_THEN_Y":
+        keys = (y_min, -x_min)
+    elif mode == "Y_THEN_REV_X":
+        keys = (-x_min, y_min)
+    elif mode == "REV_X":
+        keys = (-x_min,)
+    elif mode == "X_THEN_Y":
+        keys = (y_min, x_min)
+    elif mode == "Y_THEN_X":
+        keys = (x_min, y_min)
+    elif mode == "X":
+        keys = (x_min,)
+    elif mode == "Y":
+        keys = (y_min,)
+    else:
+        raise ValueError(f"未知的排序模式: {mode}")
+    # np.lexsort 是稳定排序, 最后一个键为主键
+    return np.lexsort(keys).tolist()
+
+
+def order_detections(results, mode="COLUMNS_RTL", min_overlap=DEFAULT_MIN_OVERLAP):
+    """按阅读顺序排列检测结果 ({"location": {"left", "top", "width", "height", ...}, ...} 列表)。"""
+    if not mode or mode == "NONE" or len(results) <= 1:
+        return results
+    boxes = [(loc['left'], loc['top'], loc['left'] + loc['width'], loc['top'] + loc['height'])
+             for loc in (r['location'] for r in results)]
+    return [results[i] for i in reading_order(boxes, mode, min_overlap)]
+
+
+# ======================= 原始实现 (仅用于对比测试) =======================
+
+def _legacy_key(box, mode):
+    x_min, y_min = box[0], box[1]
+    return {
+        "REV_X_THEN_Y": (-x_min, y_min), "Y_THEN_REV_X": (y_min, -x_min), "REV_X": (-x_min, 0),
+        "X_THEN_Y": (x_min, y_min), "Y_THEN_X": (y_min, x_min), "X": (x_min, 0), "Y": (y_min, 0),
+    }.get(mode, (0, 0))
+
+
+def reading_order_reference(boxes, mode):
+    """原标签排序脚本的 sorted(key=...) 写法。"""
+    return sorted(range(len(boxes)), key=lambda i: _legacy_key(boxes[i], mode))
+
+
+# ======================= 模拟页面基准测试 =======================
+
+def make_manga_page(num_columns, seed, page_w=1600, page_h=2400):
+    """模拟竖排漫画页: 若干列文字框 (每列若干个碎片框, 有轻微错位), 整数坐标会产生大量并列。"""
+    rng = random.Random(seed)
+    boxes = []
+    for _ in range(num_columns):
+        col_w = rng.randint(25, 45)
+        left = rng.randint(0, page_w - col_w)
+        top = rng.randint(0, page_h // 2)
+        for _ in range(rng.randint(1, 6)):
+            h = rng.randint(20, 120)
+            x = left + rng.randint(-4, 4)
+            boxes.append([x, top, x + col_w, top + h])
+            top += h + rng.randint(-5, 30)
+    rng.shuffle(boxes)
+    return boxes
+
+
+def benchmark(num_files=2000):
+    pages = [make_manga_page(random.Random(i).randint(3, 25), seed=i) for i in range(num_files)]
+    for mode in LEGACY_MODES:
+        for boxes in pages[:200]:
+            assert reading_order(boxes, mode) == reading_order_reference(boxes, mode), f"{mode} 结果不一致"
+    print(f"兼容模式 {len(LEGACY_MODES)} 种: 与原 sorted(key=...) 结果一致")
+
+    total_boxes = sum(len(p) for p in pages)
+    for mode in ("COLUMNS_RTL", "ROWS_TTB", "REV_X_THEN_Y"):
+        start = time.perf_counter()
+        for boxes in pages:
+            reading_order(boxes, mode)
+        elapsed = time.perf_counter() - start
+        print(f"{mode:>14}: {num_files} 个页面 ({total_boxes} 个框) 耗时 {elapsed * 1000:.1f} ms, "
+              f"约 {num_files / elapsed:.0f} 页/秒")
+
+
+if __name__ == '__main__':
+    benchmark()
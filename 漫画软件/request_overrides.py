@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+单次请求覆盖参数 - 供 YOLO后处理.py / detect_gateway.py 共用
+/detect 请求体可以携带下面几个字段，只覆盖本次请求的后处理参数，不修改共享配置:
+  "conf":    最终置信度阈值，覆盖 FINAL_CONF_THRESHOLD
+  "classes": 只保留这些类别 (列表，单个类别也可以直接写字符串)，等同于 ENABLE_FILTER=True + FILTER_CLASSES
+  "merge":   {"类别名": "vertical" / "horizontal" / null}，null 表示该类别不合并
+  "expand":  {"类别名": [上, 下, 左, 右]}，同时打开 ENABLE_EXPANSION
+
+用法:
+    from request_overrides import apply_request_overrides
+    if ALLOW_REQUEST_OVERRIDES:
+        cfg = apply_request_overrides(cfg, json_data)
+"""
+
+import logging
+
+OVERRIDE_KEYS = ("conf", "classes", "merge", "expand")
+
+logger = logging.getLogger()
+
+
+def apply_request_overrides(cfg, json_data):
+    """根据请求体中的覆盖字段生成本次请求专用的配置 (浅拷贝)，cfg 本身不被修改。
+    没有覆盖字段时原样返回 cfg；字段取值不合法时抛出 ValueError。"""
+    overrides = {k: json_data[k] for k in OVERRIDE_KEYS if json_data.get(k) is not None}
+    if not overrides:
+        return cfg
+    cfg = dict(cfg)
+    if "conf" in overrides:
+        cfg["FINAL_CONF_THRESHOLD"] = float(overrides["conf"])
+    if "classes" in overrides:
+        cfg["ENABLE_FILTER"] = True
+        classes = overrides["classes"]
+        if isinstance(classes, str):
+            classes = [classes]  # "text" 视为单个类别，而不是拆成字符
+        elif not isinstance(classes, (list, tuple)):
+            raise ValueError(f"classes 需要类别名列表，收到: {classes!r}")
+        cfg["FILTER_CLASSES"] = list(classes)
+    if "merge" in overrides:
+        merge_config = dict(cfg["MERGE_CONFIG"])
+        for class_name, direction in overrides["merge"].items():
+            if direction is None:
+                merge_config.pop(class_name, None)
+            elif direction in ('vertical', 'horizontal'):
+                merge_config[class_name] = direction
+            else:
+                raise ValueError(f"merge 方向只能是 vertical / horizontal / null，收到: {direction}")
+        cfg["MERGE_CONFIG"] = merge_config
+    if "expand" in overrides:
+        expand_values = dict(cfg["EXPAND_VALUES"])
+        for class_name, values in overrides["expand"].items():
+            if len(values) != 4:
+                raise ValueError(f"expand 需要 [上, 下, 左, 右] 四个值，收到: {values}")
+            expand_values[class_name] = tuple(values)
+        cfg["ENABLE_EXPANSION"] = True
+        cfg["EXPAND_VALUES"] = expand_values
+    logger.info(f"本次请求使用覆盖参数: {overrides}")
+    return cfg
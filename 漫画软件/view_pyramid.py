@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视图金字塔渲染 - 供 yolo_to_mask_gui.py 的缩放/滚动预览使用
+原来每次缩放、拖动滑块、切换掩膜都要: 整页复制 -> 整页叠加蓝色掩膜 -> 画框 -> 整页 LANCZOS 缩放,
+5000 像素的页面每次要几百毫秒, 界面会卡住。现在:
+- 图片和 (调整后的) 掩膜各缓存一个金字塔 (每层边长减半, 按需逐层生成)
+- 只渲染画布可见的区域 (视口), 从最接近当前缩放比例且不低于它的层级取像素, 缩放不超过 2 倍
+- 分层增量合成: 图片层 (视口 + 缩放不变就复用) / 掩膜层 / YOLO 框层;
+  拖动掩膜滑块只重新计算掩膜层, 切换 YOLO 框只重画框
+叠加效果与原来一致: 显示掩膜时整页 60% 亮度, 掩膜区域叠加 40% 蓝色 (0, 100, 255)。
+
+用法:
+    from view_pyramid import PyramidRenderer
+    renderer = PyramidRenderer()
+    renderer.set_image(rgb)                 # 同一张图片重复调用不会重建
+    renderer.set_mask(adjusted_mask)        # 掩膜或调整参数变化时调用
+    renderer.set_boxes(pixel_boxes)
+    view, stats = renderer.render(zoom, (x0, y0, 视口宽, 视口高), show_mask=True)
+
+直接运行本文件会生成模拟页面, 对比原整页流程和金字塔视口渲染的耗时:
+    python view_pyramid.py
+"""
+
+import math
+import time
+import cv2
+import numpy as np
+
+MASK_COLOR = np.array([0, 100, 255], np.uint16)  # 蓝色 (RGB)
+MASK_ALPHA = 0.4
+BOX_COLOR = (255, 0, 0)  # 红色 (RGB)
+BOX_WIDTH = 2
+MIN_LEVEL_SIZE = 64  # 金字塔最小一层的短边
+
+
+class Pyramid:
+    """按需生成的金字塔: 第 k 层边长约为原图的 1/2^k (INTER_AREA 缩小, 掩膜缩小后为覆盖率灰度)"""
+
+    def __init__(self, base):
+        self.levels = [base]
+        h, w = base.shape[:2]
+        self.max_level = max(0, int(math.log2(max(1, min(h, w) / MIN_LEVEL_SIZE))))
+
+    def level_for(self, zoom):
+        """不低于 zoom 的最小一层 (缩小倍数不超过 2, INTER_AREA 质量接近整页缩放)"""
+        if zoom >= 1.0:
+            return 0
+        return min(self.max_level, int(math.floor(math.log2(1.0 / zoom))))
+
+    def get(self, k):
+        while len(self.levels) <= k:
+            prev = self.levels[-1]
+            h, w = prev.shape[:2]
+            self.levels.append(cv2.resize(prev, (max(1, (w + 1) // 2), max(1, (h + 1) // 2)),
+                                          interpolation=cv2.INTER_AREA))
+        return self.levels[k]
+
+
+def _sample(level_img, level_scale, zoom, x0, y0, w, h):
+    """
+    从金字塔某一层取出显示坐标 [x0, x0+w) x [y0, y0+h) 的像素 (显示坐标 = 原图坐标 x zoom)。
+    只裁剪、缩放视口覆盖的那一小块。
+    """
+    s = zoom / level_scale  # 层级像素 -> 显示像素
+    lh, lw = level_img.shape[:2]
+    lx0 = max(0, int(math.floor(x0 / s)))
+    ly0 = max(0, int(math.floor(y0 / s)))
+    lx1 = min(lw, int(math.ceil((x0 + w) / s)) + 1)
+    ly1 = min(lh, int(math.ceil((y0 + h) / s)) + 1)
+    crop = level_img[ly0:ly1, lx0:lx1]
+    if s != 1.0:
+        size = (max(1, round((lx1 - lx0) * s)), max(1, round((ly1 - ly0) * s)))
+        crop = cv2.resize(crop, size, interpolation=cv2.INTER_AREA if s < 1.0 else cv2.INTER_LINEAR)
+    ox, oy = x0 - round(lx0 * s), y0 - round(ly0 * s)
+    out = crop[oy:oy + h, ox:ox + w]
+    if out.shape[0] != h or out.shape[1] != w:
+        # 取整误差造成的 1 像素缺口用边缘像素补齐
+        out = cv2.copyMakeBorder(out, 0, h - out.shape[0], 0, w - out.shape[1], cv2.BORDER_REPLICATE)
+    return out
+
+
+class PyramidRenderer:
+    """图片/掩膜金字塔 + 分层增量合成的视口渲染器"""
+
+    def __init__(self):
+        self._image = None
+        self._image_pyr = None
+        self._mask_pyr = None
+        self._mask_version = 0
+        self._boxes = []
+        self._view_key = None   # (层级, zoom, 视口)
+        self._base = None       # 图片层 (视口)
+        self._mask_key = None   # (掩膜版本, 视口)
+        self._composite = None  # 图片层 + 掩膜层
+
+    def set_image(self, image):
+        """设置 RGB 图片; 同一个数组重复设置时不做任何事。换了图片时返回 True (掩膜层同时被清空)"""
+        if image is self._image:
+            return False
+        self._image = image
+        self._image_pyr = Pyramid(image) if image is not None else None
+        self._mask_pyr = None
+        self._mask_version += 1
+        self._view_key = None
+        return True
+
+    def set_mask(self, mask):
+        """设置要叠加的 (已调整) 掩膜; 只让掩膜层失效"""
+        self._mask_pyr = Pyramid(mask) if mask is not None else None
+        self._mask_version += 1
+
+    def set_boxes(self, boxes):
+        """设置 YOLO 像素框 (x1, y1, x2, y2); 框层每次渲染都重画, 开销很小"""
+        self._boxes = list(boxes or [])
+
+    def display_size(self, zoom):
+        h, w = self._image.shape[:2]
+        return max(1, int(w * zoom)), max(1, int(h * zoom))
+
+    def render(self, zoom, viewport, show_mask=True):
+        """
+        渲染视口, viewport = (x0, y0, 宽, 高) 为显示坐标, 超出页面的部分会被裁掉。
+        返回 (RGB 数组, 统计信息): 统计信息包含 level / viewport / image (图片层是否重算) / mask (掩膜层是否重算)。
+        """
+        dw, dh = self.display_size(zoom)
+        x0, y0, vw, vh = viewport
+        x0, y0 = max(0, min(int(x0), dw - 1)), max(0, min(int(y0), dh - 1))
+        vw, vh = max(1, min(int(vw), dw - x0)), max(1, min(int(vh), dh - y0))
+        view = (x0, y0, vw, vh)
+        k = self._image_pyr.level_for(zoom)
+        stats = {"level": k, "viewport": view, "image": False, "mask": False}
+
+        view_key = (k, zoom, view)
+        if view_key != self._view_key:
+            level_scale = self._image_pyr.get(k).shape[1] / self._image.shape[1]
+            self._base = _sample(self._image_pyr.get(k), level_scale, zoom, *view)
+            self._view_key = view_key
+            self._mask_key = None
+            stats["image"] = True
+
+        result = self._base
+        if show_mask and self._mask_pyr is not None:
+            mask_key = (self._mask_version, view_key)
+            if mask_key != self._mask_key:
+                mk = min(k, self._mask_pyr.max_level)
+                level = self._mask_pyr.get(mk)
+                coverage = _sample(level, level.shape[1] / self._image.shape[1], zoom, *view)
+                # 与原来 addWeighted(图片, 0.6, 蓝色掩膜, 0.4) 一致; 缩小后的掩膜按覆盖率混合, 边缘更平滑
+                if level is self._mask_pyr.levels[0] and zoom == 1.0:
+                    coverage = np.where(coverage > 127, 255, 0).astype(np.uint8)
+                overlay = ((coverage[..., None].astype(np.uint16) * MASK_COLOR + 127) // 255).astype(np.uint8)
+                self._composite = cv2.addWeighted(self._base, 1 - MASK_ALPHA, overlay, MASK_ALPHA, 0)
+                self._mask_key = mask_key
+                stats["mask"] = True
+            result = self._composite
+
+        if self._boxes:
+            result = result.copy()
+            for x1, y1, x2, y2 in self._boxes:
+                p1 = (round(x1 * zoom) - x0, round(y1 * zoom) - y0)
+                p2 = (round(x2 * zoom) - x0, round(y2 * zoom) - y0)
+                cv2.rectangle(result, p1, p2, BOX_COLOR, BOX_WIDTH)
+        return result, stats
+
+
+def _reference_render(image, mask, boxes, zoom):
+    """原 GUI 的整页流程, 仅用于对比"""
+    from PIL import Image, ImageDraw
+
+    display_img = image.copy()
+    if mask is not None:
+        blue_mask = np.zeros_like(display_img)
+        blue_mask[mask > 127] = [0, 100, 255]
+        display_img = cv2.addWeighted(display_img, 1 - MASK_ALPHA, blue_mask, MASK_ALPHA, 0)
+    pil_img = Image.fromarray(display_img)
+    if boxes:
+        draw = ImageDraw.Draw(pil_img)
+        for x1, y1, x2, y2 in boxes:
+            draw.rectangle([x1, y1, x2, y2], outline=(255, 0, 0), width=2)
+    if zoom != 1.0:
+        pil_img = pil_img.resize((int(pil_img.width * zoom), int(pil_img.height * zoom)), Image.Resampling.LANCZOS)
+    return np.asarray(pil_img)
+
+
+def benchmark(width=3500, height=5000, viewport=(1000, 780)):
+    from mask_morph import make_mask, extend_mask
+
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (height // 8, width // 8, 3), dtype=np.uint8)
+    image = cv2.resize(image, (width, height), interpolation=cv2.INTER_LINEAR)
+    mask = make_mask(0, width, height, 300)
+    boxes = [(x, y, x + 200, y + 400) for x, y in zip(range(100, width - 300, 400), range(100, height - 500, 500))]
+
+    def timed(fn):
+        t0 = time.perf_counter()
+        out = fn()
+        return (time.perf_counter() - t0) * 1000, out
+
+    renderer = PyramidRenderer()
+    renderer.set_image(image)
+    renderer.set_mask(mask)
+    renderer.set_boxes(boxes)
+    vw, vh = viewport
+    fit = min(vw / width, vh / height) * 0.9
+    print(f"页面 {width}x{height}, 视口 {vw}x{vh}")
+    print(f"{'操作':<16} {'原流程(ms)':>10} {'金字塔(ms)':>10} {'层级':>4}")
+    for name, zoom in (("适应窗口", fit), ("缩放 50%", 0.5), ("缩放 100%", 1.0), ("缩放 200%", 2.0)):
+        t_ref, _ = timed(lambda: _reference_render(image, mask, boxes, zoom))
+        renderer.set_image(None)
+        renderer.set_image(image)
+        renderer.set_mask(mask)
+        t_new, (_, stats) = timed(lambda: renderer.render(zoom, (0, 0, vw, vh)))
+        print(f"{name:<16} {t_ref:>10.1f} {t_new:>10.1f} {stats['level']:>4}  (首次, 含建金字塔)")
+        t_new, (_, stats) = timed(lambda: renderer.render(zoom, (vw // 2, vh // 2, vw, vh)))
+        print(f"{'  滚动':<16} {'':>10} {t_new:>10.1f} {stats['level']:>4}")
+
+    # 拖动方向延伸滑块: 原流程整页重算 + 整页合成缩放; 现在只有掩膜层重算
+    adjusted = extend_mask(mask, top=10)
+    t_ref, _ = timed(lambda: _reference_render(image, adjusted, boxes, fit))
+    renderer.render(fit, (0, 0, vw, vh))
+
+    def slider():
+        renderer.set_mask(adjusted)
+        return renderer.render(fit, (0, 0, vw, vh))
+
+    t_new, (_, stats) = timed(slider)
+    print(f"{'滑块(仅掩膜层)':<16} {t_ref:>10.1f} {t_new:>10.1f} {stats['level']:>4}  图片层重算: {stats['image']}")
+
+    # 100% 缩放、无框时与原流程逐像素一致
+    renderer.set_boxes([])
+    renderer.set_mask(mask)
+    crop = renderer.render(1.0, (200, 300, vw, vh))[0]
+    ref = _reference_render(image, mask, [], 1.0)[300:300 + vh, 200:200 + vw]
+    print(f"100% 缩放与原流程结果一致: {np.array_equal(crop, ref)}")
+
+
+if __name__ == "__main__":
+    benchmark()
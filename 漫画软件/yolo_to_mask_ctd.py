@@ -4,15 +4,21 @@
 YOLO标签 + CTD模型生成精确文字轮廓掩膜
 功能: 使用BallonsTranslator的CTD模型生成精确的文字轮廓掩膜
 用法: 将labels文件夹拖拽到此脚本上
+裁剪模式 (CROP_MODE, 默认关闭): 只把YOLO框附近的区域拼进CTD画布推理 (多页共用画布)，
+前向次数更少、小字分辨率更高，但掩膜与整页模式并不相同；结束时报告相对整页模式节省的前向次数，
+并对前 COMPARE_SAMPLE_PAGES 页同时跑整页模式，报告两种掩膜的 IoU
 """
 
 import cv2
 import numpy as np
 import os
 import sys
+import time
 import torch
 from pathlib import Path
 
+from ctd_crops import crop_ctd_masks, mask_iou
+
 # 添加BallonsTranslator路径到系统路径
 ballons_path = r"D:\BallonsTranslator\BallonsTranslator"
 if ballons_path not in sys.path:
@@ -31,6 +37,14 @@ IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff']
 
 # CTD模型路径
 CTD_MODEL_PATH = r"D:\BallonsTranslator\BallonsTranslator\data\models\comictextdetector.pt"
+CTD_DETECT_SIZE = 1024
+
+# ==================== 裁剪模式配置 ====================
+CROP_MODE = False              # True = 只对YOLO框附近区域推理；False = 原来的整页推理 (与GUI的 CTD_CROP_MODE 保持一致)
+CROP_PADDING = 16              # YOLO框外扩像素
+CROP_DETAIL = 1.5              # 裁剪区域分辨率 = 整页模式的倍数（越大越清晰，前向次数越多）
+CROP_BATCH_PAGES = 8           # 多少页的裁剪区域一起拼画布（越大画布越满，占用内存越多）
+COMPARE_SAMPLE_PAGES = 8       # 裁剪模式下对前几页同时运行整页模式，报告两种掩膜的IoU（0 = 不对比，-1 = 全部页面，会多花一倍时间）
 
 def read_yolo_labels(label_path):
     """读取YOLO标签文件"""
@@ -83,7 +97,7 @@ def load_ctd_model():
             print(f"CTD模型文件不存在: {CTD_MODEL_PATH}")
             return None
             
-        model = CTDModel(CTD_MODEL_PATH, detect_size=1024, device=device)
+        model = CTDModel(CTD_MODEL_PATH, detect_size=CTD_DETECT_SIZE, device=device)
         print("CTD模型加载成功!")
         return model
     except Exception as e:
@@ -142,6 +156,80 @@ def generate_mask_ctd(image_path, label_path, output_path, ctd_model):
         print(f"处理 {image_path} 时发生错误: {str(e)}")
         return False
 
+def run_ctd_refined(ctd_model, image):
+    """CTD推理，只返回mask_refined"""
+    mask, mask_refined, blk_list = ctd_model(image, refine_mode=0, keep_undetected_mask=False)
+    return mask_refined
+
+def generate_masks_ctd_crop(tasks, ctd_model, report):
+    """
+    裁剪模式：一批页面的YOLO框区域拼进同一批画布推理
+    tasks: [(base_name, image_path, label_path, output_path)]，返回成功的 base_name 列表
+    """
+    pages, page_tasks, done = [], [], []
+    for base_name, image_path, label_path, output_path in tasks:
+        image = cv2.imread(image_path)
+        if image is None:
+            print(f"无法读取图片: {image_path}")
+            continue
+        img_height, img_width = image.shape[:2]
+        boxes = read_yolo_labels(label_path)
+        yolo_boxes = yolo_to_pixel_coords(boxes, img_width, img_height) if boxes else []
+        if not yolo_boxes:
+            # 没有YOLO框时与原来一样使用整页CTD掩膜
+            if generate_mask_ctd(image_path, label_path, output_path, ctd_model):
+                report["full_forwards"] += 1
+                report["crop_forwards"] += 1
+                done.append(base_name)
+            continue
+        pages.append((image, yolo_boxes))
+        page_tasks.append((base_name, output_path))
+    if not pages:
+        return done
+    
+    print(f"🔄 裁剪模式处理 {len(pages)} 页: {', '.join(name for name, _ in page_tasks)}")
+    t0 = time.perf_counter()
+    masks, stats = crop_ctd_masks(pages, lambda img: run_ctd_refined(ctd_model, img),
+                                  canvas_size=CTD_DETECT_SIZE, padding=CROP_PADDING, detail=CROP_DETAIL)
+    report["crop_time"] += time.perf_counter() - t0
+    report["crop_forwards"] += stats["forwards"]
+    report["full_forwards"] += len(pages)
+    report["region_pixels"] += stats["region_pixels"]
+    report["page_pixels"] += stats["page_pixels"]
+    print(f"   📍 {stats['regions']} 个区域 → {stats['forwards']} 次CTD前向 (整页模式需要 {len(pages)} 次)")
+    
+    for (image, yolo_boxes), mask, (base_name, output_path) in zip(pages, masks, page_tasks):
+        # 裁剪区域带有外扩边距，同样只保留YOLO框内的掩膜
+        final_mask = filter_mask_with_yolo_boxes(mask, yolo_boxes)
+        
+        if COMPARE_SAMPLE_PAGES < 0 or len(report["ious"]) < COMPARE_SAMPLE_PAGES:
+            t0 = time.perf_counter()
+            full_mask = filter_mask_with_yolo_boxes(run_ctd_refined(ctd_model, image), yolo_boxes)
+            report["full_time"] += time.perf_counter() - t0
+            iou = mask_iou(final_mask, full_mask)
+            report["ious"].append(iou)
+            print(f"   {base_name}: 与整页模式掩膜 IoU = {iou:.3f}")
+        
+        try:
+            cv2.imwrite(output_path, final_mask)
+            done.append(base_name)
+        except Exception as e:
+            print(f"处理 {base_name} 时发生错误: {str(e)}")
+    return done
+
+def print_crop_report(report):
+    """裁剪模式统计"""
+    if report["full_forwards"] == 0:
+        return
+    saved = 1 - report["crop_forwards"] / report["full_forwards"]
+    print(f"✂️ 裁剪模式: CTD前向 {report['crop_forwards']} 次，整页模式需要 {report['full_forwards']} 次 (节省 {saved:.0%})")
+    if report["page_pixels"]:
+        print(f"   文字区域(含外扩)占页面面积: {report['region_pixels'] / report['page_pixels']:.1%}")
+    if report["ious"]:
+        ious = report["ious"]
+        print(f"   整页模式对比 ({len(ious)} 页): 对比页的整页推理耗时 {report['full_time']:.1f}s"
+              f" (裁剪模式全部页面 {report['crop_time']:.1f}s)，掩膜IoU 平均 {sum(ious) / len(ious):.3f}，最低 {min(ious):.3f}")
+
 def find_image_file(script_dir, base_name):
     """在脚本目录下查找同名图片文件"""
     for ext in IMAGE_EXTENSIONS:
@@ -179,6 +267,20 @@ def process_labels_folder_ctd(labels_folder_path):
     
     processed_count = 0
     success_count = 0
+    crop_tasks = []
+    report = {"crop_forwards": 0, "full_forwards": 0, "region_pixels": 0, "page_pixels": 0,
+              "crop_time": 0.0, "full_time": 0.0, "ious": []}
+    
+    def flush_crop_tasks():
+        nonlocal success_count
+        done = set(generate_masks_ctd_crop(crop_tasks, ctd_model, report))
+        for base_name, _, _, _ in crop_tasks:
+            if base_name in done:
+                success_count += 1
+                print(f"✅ {base_name}: CTD掩膜生成成功")
+            else:
+                print(f"❌ {base_name}: CTD掩膜生成失败")
+        crop_tasks.clear()
     
     for label_file in label_files:
         # 获取文件基本名称 (不含扩展名)
@@ -193,19 +295,31 @@ def process_labels_folder_ctd(labels_folder_path):
         
         # 生成输出掩膜路径
         output_path = mask_folder / (base_name + ".png")
+        processed_count += 1
+        
+        if CROP_MODE:
+            # 裁剪模式：攒够一批页面再一起推理
+            crop_tasks.append((base_name, image_path, str(label_file), str(output_path)))
+            if len(crop_tasks) >= CROP_BATCH_PAGES:
+                flush_crop_tasks()
+            continue
         
         # 使用CTD生成掩膜
         success = generate_mask_ctd(image_path, str(label_file), str(output_path), ctd_model)
         
-        processed_count += 1
         if success:
             success_count += 1
             print(f"✅ {base_name}: CTD掩膜生成成功")
         else:
             print(f"❌ {base_name}: CTD掩膜生成失败")
+    
+    if crop_tasks:
+        flush_crop_tasks()
         
     print("-" * 50)
     print(f"处理完成! 成功: {success_count}/{processed_count}")
+    if CROP_MODE:
+        print_crop_report(report)
     print(f"精确掩膜文件保存在: {mask_folder}")
 
 def main():
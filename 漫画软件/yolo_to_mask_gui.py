@@ -3,7 +3,7 @@
 """
 YOLO + CTD 文字掩膜生成器 - GUI版本
 功能: 
-- 图片浏览（放大缩小、上一张下一张）
+- 图片浏览（放大缩小、上一张下一张；金字塔缓存，只渲染可见区域）
 - 实时掩膜预览（蓝色叠加显示）
 - 掩膜大小调整
 - 批量生成黑白掩膜
@@ -13,13 +13,20 @@ import cv2
 import numpy as np
 import os
 import sys
-import torch
 from pathlib import Path
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk, ImageDraw
+from PIL import Image, ImageTk
 import threading
 import json
+import time
+import hashlib
+
+from mask_morph import extend_mask
+from mask_cache import MaskCache, model_key
+from ctd_crops import crop_ctd_mask
+import mask_export
+from view_pyramid import PyramidRenderer
 
 # 进度条弹窗类
 class ProgressDialog:
@@ -114,20 +121,77 @@ class ProgressDialog:
         """检查是否被取消"""
         return self.canceled
 
+# 后台预取类：在用户浏览当前页时，为相邻页面提前计算CTD掩膜
+class MaskPrefetcher:
+    def __init__(self, compute, on_done):
+        self.compute = compute  # compute(图片路径) -> 是否新计算了掩膜（在后台线程调用）
+        self.on_done = on_done  # on_done(图片路径)（在后台线程调用，需自行转回Tk主线程）
+        self._cond = threading.Condition()
+        self._queue = []
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def schedule(self, image_paths):
+        """替换待处理队列（按优先级排序）；翻页或跳页时调用，旧的未开始任务直接作废"""
+        with self._cond:
+            self._queue = list(image_paths)
+            self._cond.notify()
+    
+    def cancel(self):
+        """清空待处理队列（正在运行的一张会跑完并写入缓存）"""
+        self.schedule([])
+    
+    def stop(self):
+        with self._cond:
+            self._queue = []
+            self._stopped = True
+            self._cond.notify()
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                image_path = self._queue.pop(0)
+            try:
+                if self.compute(image_path):
+                    self.on_done(image_path)
+            except Exception as e:
+                print(f"后台预取掩膜失败: {image_path} - {e}")
+
 # 添加BallonsTranslator路径
 ballons_path = r"D:\BallonsTranslator\BallonsTranslator"
 if ballons_path not in sys.path:
     sys.path.insert(0, ballons_path)
 
-try:
-    from modules.textdetector.ctd import CTDModel
-except ImportError:
-    print("警告: 无法导入BallonsTranslator模块")
-    CTDModel = None
-
 # 支持的图片格式
 IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff']
 CTD_MODEL_PATH = r"D:\BallonsTranslator\BallonsTranslator\data\models\comictextdetector.pt"
+CTD_DETECT_SIZE = 1024
+
+# 裁剪模式: 只对YOLO框附近区域运行CTD（见 ctd_crops.py），小字分辨率更高；
+# GUI逐页推理时前向次数与整页相同，批量节省前向次数请用 yolo_to_mask_ctd.py
+CTD_CROP_MODE = False
+CTD_CROP_PADDING = 16  # YOLO框外扩像素
+CTD_CROP_DETAIL = 1.5  # 裁剪区域分辨率 = 整页模式的倍数
+
+# 批量导出（见 mask_export.py）：已缓存的页面不再运行CTD；其余页面线程池读图 + CTD按批推理，
+# 过滤/调整/PNG编码在进程池中并行，写入在线程池中进行
+EXPORT_PROCESSES = mask_export.DEFAULT_PROCESSES
+EXPORT_DECODE_THREADS = mask_export.DECODE_THREADS
+EXPORT_WRITE_THREADS = mask_export.WRITE_THREADS
+EXPORT_CTD_BATCH_PAGES = mask_export.CTD_BATCH_PAGES  # 裁剪模式下这些页的区域共用画布
+
+# 掩膜缓存: 内存层按压缩后的字节数限制; 磁盘层放在 labels 文件夹下, 重启后仍可复用, 不必重新运行 CTD
+MASK_CACHE_MAX_MB = 256
+MASK_CACHE_DIR_NAME = ".mask_cache"
+
+# 后台预取: 生成过第一张掩膜后，浏览时在后台为前后相邻页面计算CTD掩膜（按浏览方向优先）
+LOOKAHEAD_PAGES = 3   # 浏览方向上预取的页数，0 = 关闭预取
+LOOKBEHIND_PAGES = 1  # 反方向预取的页数
 
 def safe_imread(image_path):
     """安全读取图片，支持中文路径"""
@@ -171,18 +235,27 @@ class MaskGeneratorGUI:
         self.current_mask = None
         self.display_image = None
         self.zoom_factor = 1.0
+        self.renderer = PyramidRenderer()  # 图片/掩膜金字塔 + 视口增量合成
+        self.display_mask_source = None  # 掩膜层对应的原始掩膜和调整参数，都没变时不重新调整
+        self.display_mask_params = None
+        self.render_pending = False
         self.show_mask = False
         self.show_yolo_boxes = False  # 新增：是否显示YOLO框
         self.current_yolo_boxes = []  # 新增：当前图片的YOLO框
         self.mask_size_factor = 1.0
         
         # 内存管理
-        self.mask_cache = {}  # 掩膜缓存：{图片名: 掩膜数据}
-        self.max_cache_size = 100  # 最大缓存数量（增加到100）
+        self.mask_cache = MaskCache(max_bytes=MASK_CACHE_MAX_MB * 1024 * 1024)  # CTD原始掩膜缓存（压缩LRU + 磁盘层）
         
         # 已处理图片记录
         self.processed_images = set()  # 记录已经生成过掩膜的图片名称
         
+        # 后台预取
+        self.ctd_lock = threading.Lock()  # CTD模型同一时间只允许一个线程调用
+        self.browse_direction = 1  # 最近一次翻页方向：1 = 下一张，-1 = 上一张
+        self.prefetcher = MaskPrefetcher(self.prefetch_mask, self.on_mask_prefetched)
+        self.export_pool = None  # 批量导出进程池（第一次使用时创建，之后复用）
+        
         # 批量操作控制
         self.cancel_batch_operation = False  # 取消批量操作标志
         
@@ -221,14 +294,19 @@ class MaskGeneratorGUI:
         self.canvas = tk.Canvas(canvas_frame, bg='gray90')
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
-        # 滚动条
-        v_scroll = ttk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=self.canvas.yview)
+        # 滚动条（只渲染可见区域，滚动后需要重新渲染）
+        v_scroll = ttk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=self.on_canvas_yview)
         v_scroll.pack(side=tk.RIGHT, fill=tk.Y)
         self.canvas.configure(yscrollcommand=v_scroll.set)
         
-        h_scroll = ttk.Scrollbar(left_frame, orient=tk.HORIZONTAL, command=self.canvas.xview)
+        # 渲染信息状态栏
+        self.render_info_var = tk.StringVar(value="")
+        ttk.Label(left_frame, textvariable=self.render_info_var, foreground="gray").pack(side=tk.BOTTOM, fill=tk.X)
+        
+        h_scroll = ttk.Scrollbar(left_frame, orient=tk.HORIZONTAL, command=self.on_canvas_xview)
         h_scroll.pack(side=tk.BOTTOM, fill=tk.X)
         self.canvas.configure(xscrollcommand=h_scroll.set)
+        self.canvas.bind("<Configure>", lambda e: self.schedule_render())
         
         # 右侧控制面板
         right_frame = ttk.Frame(main_frame, width=300)
@@ -582,12 +660,16 @@ class MaskGeneratorGUI:
         """加载CTD模型"""
         def load_model():
             try:
-                if CTDModel is None:
-                    raise ImportError("CTDModel未导入")
+                # torch 和 BallonsTranslator 模块在这里才导入：界面启动更快，导出进程池的子进程也不会加载它们
+                import torch
+                from modules.textdetector.ctd import CTDModel
                 
                 device = 'cuda' if torch.cuda.is_available() else 'cpu'
                 self.progress_var.set(f"加载CTD模型 ({device})...")
-                self.ctd_model = CTDModel(CTD_MODEL_PATH, detect_size=1024, device=device)
+                # 缓存键包含模型文件哈希和推理参数，换模型后旧缓存自动失效
+                crop = (CTD_CROP_PADDING, CTD_CROP_DETAIL) if CTD_CROP_MODE else None
+                self.mask_cache.model_key = model_key(CTD_MODEL_PATH, detect_size=CTD_DETECT_SIZE, refine_mode=0, crop=crop)
+                self.ctd_model = CTDModel(CTD_MODEL_PATH, detect_size=CTD_DETECT_SIZE, device=device)
                 self.progress_var.set(f"CTD模型加载完成 ({device})")
                 
             except Exception as e:
@@ -604,6 +686,7 @@ class MaskGeneratorGUI:
             return
         
         self.labels_folder = Path(folder)
+        self.mask_cache.disk_dir = self.labels_folder / MASK_CACHE_DIR_NAME
         # 在labels文件夹的父目录查找图片文件
         image_search_dir = self.labels_folder.parent
         
@@ -630,10 +713,11 @@ class MaskGeneratorGUI:
             messagebox.showwarning("警告", f"在 {image_search_dir} 中未找到与标签文件匹配的图片文件\n请确保图片文件与labels文件夹在同一目录下")
     
     def clear_mask_cache(self):
-        """清除掩膜显示并清理缓存（保留YOLO框）"""
-        # 清理缓存和已处理记录
+        """清除掩膜显示并清理内存缓存（保留YOLO框和磁盘缓存）"""
+        # 清理内存缓存和已处理记录
         self.mask_cache.clear()
         self.processed_images.clear()  # 清除已处理记录
+        self.prefetcher.cancel()  # 停止后台预取，直到重新生成掩膜
         
         # 清除当前掩膜（但保留YOLO框用于指导）
         self.current_mask = None
@@ -645,22 +729,80 @@ class MaskGeneratorGUI:
         # 立即更新显示（移除蓝色掩膜，保留红色YOLO框）
         self.update_display()
         
-        self.progress_var.set("✅ 已清除所有掩膜显示和记录（YOLO框保留用于指导）")
+        self.progress_var.set("✅ 已清除掩膜显示和内存缓存（YOLO框和磁盘缓存保留，强制重算请用重新生成）")
     
-    def manage_mask_cache(self, image_name, mask):
-        """管理掩膜缓存，防止内存溢出"""
-        # 如果缓存已满，删除最旧的缓存
-        if len(self.mask_cache) >= self.max_cache_size:
-            # 删除第一个（最旧的）缓存
-            oldest_key = next(iter(self.mask_cache))
-            del self.mask_cache[oldest_key]
+    def mask_variant(self, image_path):
+        """裁剪模式的掩膜还依赖YOLO标签，用标签文件内容的哈希区分缓存；整页模式返回None"""
+        if not CTD_CROP_MODE or self.labels_folder is None:
+            return None
+        try:
+            label_bytes = (self.labels_folder / (image_path.stem + ".txt")).read_bytes()
+        except OSError:
+            return None
+        return hashlib.blake2b(label_bytes, digest_size=8).hexdigest()
+    
+    def manage_mask_cache(self, image_path, mask):
+        """缓存CTD原始掩膜（压缩保存，超出字节上限时淘汰最久未用的，磁盘层保留）"""
+        self.mask_cache.put(image_path, mask, self.mask_variant(image_path))
+    
+    def get_cached_mask(self, image_path):
+        """获取缓存的CTD原始掩膜（未经YOLO过滤），没有时返回None"""
+        return self.mask_cache.get(image_path, self.mask_variant(image_path))
+    
+    def is_mask_cached(self, image_path):
+        """是否已有缓存（不解压）"""
+        return self.mask_cache.contains(image_path, self.mask_variant(image_path))
+    
+    def lookahead_enabled(self):
+        """生成过掩膜（或恢复过缓存）且模型已加载时才在后台预取"""
+        return LOOKAHEAD_PAGES > 0 and self.ctd_model is not None and bool(self.processed_images)
+    
+    def schedule_lookahead(self):
+        """按浏览方向安排后台预取顺序：当前页 -> 前方 LOOKAHEAD_PAGES 页 -> 后方 LOOKBEHIND_PAGES 页"""
+        if not self.image_files or not self.lookahead_enabled():
+            self.prefetcher.cancel()
+            return
         
-        # 添加新缓存
-        self.mask_cache[image_name] = mask.copy() if mask is not None else None
+        step = self.browse_direction
+        offsets = [0] if self.current_mask is None else []
+        offsets += [step * k for k in range(1, LOOKAHEAD_PAGES + 1)]
+        offsets += [-step * k for k in range(1, LOOKBEHIND_PAGES + 1)]
+        
+        count = len(self.image_files)
+        indices = [self.current_index + o for o in offsets]
+        self.prefetcher.schedule([self.image_files[i] for i in indices if 0 <= i < count])
     
-    def get_cached_mask(self, image_name):
-        """获取缓存的掩膜"""
-        return self.mask_cache.get(image_name, None)
+    def prefetch_mask(self, image_path):
+        """后台线程：没有缓存时计算CTD原始掩膜并写入缓存，返回是否新计算"""
+        if self.ctd_model is None or self.is_mask_cached(image_path):
+            return False
+        image_bgr = safe_imread(image_path)
+        if image_bgr is None:
+            return False
+        yolo_boxes = self.load_pixel_boxes(image_path, image_bgr.shape[1], image_bgr.shape[0]) if CTD_CROP_MODE else None
+        self.generate_ctd_mask_with_thresh(image_bgr, image_path, yolo_boxes)
+        return True
+    
+    def on_mask_prefetched(self, image_path):
+        """后台线程完成一张后调用，转回Tk主线程更新状态"""
+        self.root.after(0, lambda: self.apply_prefetched_mask(image_path))
+    
+    def apply_prefetched_mask(self, image_path):
+        """Tk主线程：记录已处理；如果是当前页且还没有掩膜则立即显示"""
+        if not self.lookahead_enabled():  # 期间清除过缓存
+            return
+        self.processed_images.add(image_path.stem)
+        if not self.image_files or self.image_files[self.current_index] != image_path:
+            return
+        if self.current_mask is not None:
+            return
+        cached_mask = self.get_cached_mask(image_path)
+        if cached_mask is None:
+            return
+        self.current_mask = self.filter_mask_with_yolo_boxes(cached_mask, self.current_yolo_boxes)
+        self.progress_var.set(f"✅ 后台生成完成: {image_path.name}")
+        if self.show_mask:
+            self.update_display()
     
     def load_yolo_boxes_for_current_image(self):
         """只加载YOLO框数据，不生成掩膜"""
@@ -684,8 +826,8 @@ class MaskGeneratorGUI:
             print(f"加载YOLO框错误: {e}")
             self.current_yolo_boxes = []
     
-    def generate_mask_for_current_image(self):
-        """为当前图片生成掩膜"""
+    def generate_mask_for_current_image(self, force=False):
+        """为当前图片生成掩膜（force=True 时忽略缓存重新运行CTD）"""
         if not self.image_files or self.ctd_model is None:
             return
         
@@ -693,20 +835,17 @@ class MaskGeneratorGUI:
             image_path = self.image_files[self.current_index]
             image_name = image_path.stem
             
-            # 首先检查缓存
-            cached_mask = self.get_cached_mask(image_name)
-            if cached_mask is not None:
-                self.current_mask = cached_mask
-                self.progress_var.set(f"✅ 从缓存加载掩膜: {image_name}")
-                return
-            
             # 如果YOLO框数据为空，重新加载
             if not self.current_yolo_boxes:
                 self.load_yolo_boxes_for_current_image()
             
-            # 使用自定义阈值的CTD生成掩膜
-            image_bgr = cv2.cvtColor(self.current_image, cv2.COLOR_RGB2BGR)
-            mask, mask_refined = self.generate_ctd_mask_with_thresh(image_bgr)
+            # 首先检查缓存（内存层 -> 磁盘层）
+            mask_refined = None if force else self.get_cached_mask(image_path)
+            from_cache = mask_refined is not None
+            if not from_cache:
+                # 使用自定义阈值的CTD生成掩膜，成功后写入缓存
+                image_bgr = cv2.cvtColor(self.current_image, cv2.COLOR_RGB2BGR)
+                mask, mask_refined = self.generate_ctd_mask_with_thresh(image_bgr, image_path, self.current_yolo_boxes)
             
             # YOLO过滤
             if self.current_yolo_boxes:
@@ -714,20 +853,45 @@ class MaskGeneratorGUI:
             else:
                 self.current_mask = mask_refined
             
-            # 缓存掩膜
-            self.manage_mask_cache(image_name, self.current_mask)
-            self.progress_var.set(f"✅ 生成并缓存掩膜: {image_name} (缓存: {len(self.mask_cache)}/{self.max_cache_size})")
+            if from_cache:
+                self.progress_var.set(f"✅ 从缓存加载掩膜: {image_name}")
+            else:
+                self.progress_var.set(f"✅ 生成并缓存掩膜: {image_name} ({self.mask_cache.describe()})")
+            
+            # 生成过掩膜后开始为相邻页面后台预取
+            self.processed_images.add(image_name)
+            self.schedule_lookahead()
                 
         except Exception as e:
             print(f"生成掩膜错误: {e}")
             self.current_mask = np.zeros((self.current_image.shape[0], self.current_image.shape[1]), dtype=np.uint8)
             self.current_yolo_boxes = []
     
-    def generate_ctd_mask_with_thresh(self, image_bgr):
-        """使用默认阈值生成CTD掩膜"""
+    def run_ctd(self, image_bgr):
+        """调用CTD模型（加锁，后台预取和批处理线程不会同时使用模型）"""
+        with self.ctd_lock:
+            return self.ctd_model(image_bgr, refine_mode=0, keep_undetected_mask=False)
+    
+    def compute_ctd_mask(self, image_bgr, yolo_boxes):
+        """CTD原始掩膜（mask_refined）；裁剪模式且有YOLO框时只对框附近区域推理"""
+        if CTD_CROP_MODE and yolo_boxes:
+            mask_refined, _ = crop_ctd_mask(image_bgr, yolo_boxes, lambda img: self.run_ctd(img)[1],
+                                            canvas_size=CTD_DETECT_SIZE, padding=CTD_CROP_PADDING,
+                                            detail=CTD_CROP_DETAIL)
+            return mask_refined
+        mask, mask_refined, _ = self.run_ctd(image_bgr)
+        return mask_refined
+    
+    def generate_ctd_mask_with_thresh(self, image_bgr, image_path=None, yolo_boxes=None):
+        """使用默认阈值生成CTD掩膜（传入image_path时把成功的结果写入缓存）"""
         try:
-            # 直接使用CTD模型的默认设置，简化处理
-            mask, mask_refined, blk_list = self.ctd_model(image_bgr, refine_mode=0, keep_undetected_mask=False)
+            if CTD_CROP_MODE and yolo_boxes:
+                mask = mask_refined = self.compute_ctd_mask(image_bgr, yolo_boxes)
+            else:
+                # 直接使用CTD模型的默认设置，简化处理
+                mask, mask_refined, blk_list = self.run_ctd(image_bgr)
+            if image_path is not None:
+                self.manage_mask_cache(image_path, mask_refined)
             return mask, mask_refined
             
         except Exception as e:
@@ -737,6 +901,12 @@ class MaskGeneratorGUI:
             empty_mask = np.zeros((h, w), dtype=np.uint8)
             return empty_mask, empty_mask
     
+    def load_pixel_boxes(self, image_path, img_width, img_height):
+        """读取图片对应的YOLO标签并转为像素坐标"""
+        label_path = self.labels_folder / (image_path.stem + ".txt")
+        boxes = self.read_yolo_labels(str(label_path))
+        return self.yolo_to_pixel_coords(boxes, img_width, img_height) if boxes else []
+    
     def read_yolo_labels(self, label_path):
         """读取YOLO标签"""
         boxes = []
@@ -811,102 +981,90 @@ class MaskGeneratorGUI:
     
     def apply_directional_extensions(self, mask):
         """应用单方向延伸 - 4个方向独立单向生长"""
-        if (self.extend_left == 0 and self.extend_right == 0 and 
-            self.extend_top == 0 and self.extend_bottom == 0):
-            return mask
-        
-        h, w = mask.shape
-        result_mask = mask.copy()
-        
-        # 向上单向延伸
-        if self.extend_top > 0:
-            for i in range(1, int(self.extend_top) + 1):
-                shifted = np.zeros_like(mask)
-                if i < h:
-                    shifted[:-i, :] = mask[i:, :]
-                    result_mask = np.maximum(result_mask, shifted)
-        
-        # 向下单向延伸
-        if self.extend_bottom > 0:
-            for i in range(1, int(self.extend_bottom) + 1):
-                shifted = np.zeros_like(mask)
-                if i < h:
-                    shifted[i:, :] = mask[:-i, :]
-                    result_mask = np.maximum(result_mask, shifted)
-        
-        # 向左单向延伸
-        if self.extend_left > 0:
-            for i in range(1, int(self.extend_left) + 1):
-                shifted = np.zeros_like(mask)
-                if i < w:
-                    shifted[:, :-i] = mask[:, i:]
-                    result_mask = np.maximum(result_mask, shifted)
-        
-        # 向右单向延伸
-        if self.extend_right > 0:
-            for i in range(1, int(self.extend_right) + 1):
-                shifted = np.zeros_like(mask)
-                if i < w:
-                    shifted[:, i:] = mask[:, :-i]
-                    result_mask = np.maximum(result_mask, shifted)
-        
-        return result_mask
+        return extend_mask(mask, top=self.extend_top, bottom=self.extend_bottom,
+                           left=self.extend_left, right=self.extend_right)
     
     def update_display(self):
-        """更新图片显示"""
+        """更新图片显示（只有变化的图层会重新计算）"""
         if self.current_image is None:
             return
         
-        # 获取调整后的掩膜
-        display_mask = self.current_mask
-        if self.current_mask is not None:
-            display_mask = self.adjust_mask_size(self.current_mask, self.mask_size_factor)
+        start = time.perf_counter()
+        if self.renderer.set_image(self.current_image):
+            self.display_mask_source = None
+        
+        # 掩膜层：原始掩膜或调整参数变化时才重新调整
+        if self.show_mask and self.current_mask is not None:
+            params = (self.mask_size_factor, self.extend_top, self.extend_bottom, self.extend_left, self.extend_right)
+            if self.current_mask is not self.display_mask_source or params != self.display_mask_params:
+                self.renderer.set_mask(self.adjust_mask_size(self.current_mask, self.mask_size_factor))
+                self.display_mask_source = self.current_mask
+                self.display_mask_params = params
+        elif self.current_mask is not self.display_mask_source and self.display_mask_source is not None:
+            self.renderer.set_mask(None)
+            self.display_mask_source = None
+        
+        # YOLO框层
+        self.renderer.set_boxes(self.current_yolo_boxes if self.show_yolo_boxes else [])
+        
+        self.render_view(start)
+    
+    def render_view(self, start=None):
+        """按当前缩放比例和滚动位置渲染画布可见区域，并在状态栏显示耗时"""
+        self.render_pending = False
+        if self.current_image is None:
+            return
+        if start is None:
+            start = time.perf_counter()
         
-        # 创建显示图片
-        display_img = self.current_image.copy()
+        # 先更新滚动区域（缩放后页面尺寸变化），再读取可见区域
+        display_w, display_h = self.renderer.display_size(self.zoom_factor)
+        self.canvas.configure(scrollregion=(0, 0, display_w, display_h))
+        x0 = int(self.canvas.canvasx(0))
+        y0 = int(self.canvas.canvasy(0))
+        view_w = max(1, self.canvas.winfo_width())
+        view_h = max(1, self.canvas.winfo_height())
         
-        # 叠加蓝色掩膜
-        if self.show_mask and display_mask is not None:
-            # 创建蓝色掩膜
-            blue_mask = np.zeros_like(display_img)
-            blue_mask[display_mask > 127] = [0, 100, 255]  # 蓝色
-            
-            # 半透明叠加
-            alpha = 0.4
-            display_img = cv2.addWeighted(display_img, 1-alpha, blue_mask, alpha, 0)
-        
-        # 转换为PIL格式
-        pil_img = Image.fromarray(display_img)
-        
-        # 绘制YOLO框
-        if self.show_yolo_boxes and self.current_yolo_boxes:
-            draw = ImageDraw.Draw(pil_img)
-            for x1, y1, x2, y2 in self.current_yolo_boxes:
-                # 绘制红色矩形框，线宽2
-                draw.rectangle([x1, y1, x2, y2], outline=(255, 0, 0), width=2)
-        
-        # 缩放
-        if self.zoom_factor != 1.0:
-            new_size = (int(pil_img.width * self.zoom_factor), 
-                       int(pil_img.height * self.zoom_factor))
-            pil_img = pil_img.resize(new_size, Image.Resampling.LANCZOS)
+        show_mask = self.show_mask and self.display_mask_source is not None
+        view, stats = self.renderer.render(self.zoom_factor, (x0, y0, view_w, view_h), show_mask)
+        x0, y0 = stats["viewport"][:2]
         
         # 更新画布
-        self.display_image = ImageTk.PhotoImage(pil_img)
+        self.display_image = ImageTk.PhotoImage(Image.fromarray(view))
         self.canvas.delete("all")
-        self.canvas.create_image(0, 0, anchor=tk.NW, image=self.display_image)
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        self.canvas.create_image(x0, y0, anchor=tk.NW, image=self.display_image)
+        
+        layers = [name for name, key in (("图片", "image"), ("掩膜", "mask")) if stats[key]] or ["无"]
+        elapsed = (time.perf_counter() - start) * 1000
+        self.render_info_var.set(f"渲染 {elapsed:.1f} ms | 金字塔层级 {stats['level']} | "
+                                 f"可见区域 {view.shape[1]}x{view.shape[0]} | 重算图层: {'+'.join(layers)}")
+    
+    def schedule_render(self):
+        """滚动/窗口大小变化时合并到空闲时渲染一次"""
+        if not self.render_pending and self.current_image is not None:
+            self.render_pending = True
+            self.root.after_idle(self.render_view)
+    
+    def on_canvas_xview(self, *args):
+        self.canvas.xview(*args)
+        self.schedule_render()
+    
+    def on_canvas_yview(self, *args):
+        self.canvas.yview(*args)
+        self.schedule_render()
     
     def prev_image(self):
         """上一张图片"""
         if self.image_files and self.current_index > 0:
             self.current_index -= 1
+            self.browse_direction = -1
             self.load_current_image()
     
     def next_image(self):
         """下一张图片"""
         if self.image_files and self.current_index < len(self.image_files) - 1:
             self.current_index += 1
+            self.browse_direction = 1
             self.load_current_image()
     
     def zoom_in(self):
@@ -981,55 +1139,7 @@ class MaskGeneratorGUI:
     
     def generate_all_masks(self):
         """批量生成所有掩膜"""
-        if not self.image_files:
-            self.progress_var.set("警告: 没有可处理的图片")
-            return
-        
-        def generate_batch():
-            try:
-                mask_dir = Path(__file__).parent / "MASK"
-                mask_dir.mkdir(exist_ok=True)
-                
-                success_count = 0
-                for i, image_path in enumerate(self.image_files):
-                    self.progress_var.set(f"生成掩膜 {i+1}/{len(self.image_files)}")
-                    
-                    # 临时加载图片
-                    temp_image = safe_imread(image_path)
-                    if temp_image is None:
-                        self.progress_var.set(f"❌ 跳过无法读取的图片: {image_path.name}")
-                        continue
-                    
-                    # 读取标签
-                    label_path = self.labels_folder / (image_path.stem + ".txt")
-                    boxes = self.read_yolo_labels(str(label_path))
-                    yolo_boxes = self.yolo_to_pixel_coords(boxes, 
-                                                         temp_image.shape[1], 
-                                                         temp_image.shape[0]) if boxes else []
-                    
-                    # 生成掩膜
-                    mask, mask_refined, _ = self.ctd_model(temp_image, refine_mode=0, keep_undetected_mask=False)
-                    
-                    if yolo_boxes:
-                        final_mask = self.filter_mask_with_yolo_boxes(mask_refined, yolo_boxes)
-                    else:
-                        final_mask = mask_refined
-                    
-                    # 调整大小
-                    final_mask = self.adjust_mask_size(final_mask, self.mask_size_factor)
-                    
-                    # 保存
-                    output_path = mask_dir / (image_path.stem + ".png")
-                    cv2.imwrite(str(output_path), final_mask)
-                    success_count += 1
-                
-                self.progress_var.set(f"✅ 批量生成完成: {success_count}/{len(self.image_files)} 张掩膜已生成")
-                
-            except Exception as e:
-                self.progress_var.set(f"❌ 批量生成失败: {str(e)}")
-        
-        # 在后台线程执行
-        threading.Thread(target=generate_batch, daemon=True).start()
+        self.export_all_with_config("mask", "批量生成掩膜", "批量生成完成")
     
     def on_canvas_click(self, event):
         """画布点击事件"""
@@ -1129,8 +1239,9 @@ class MaskGeneratorGUI:
                     
                     image_name = image_path.stem
                     
-                    # 检查是否已经有缓存
-                    if self.get_cached_mask(image_name) is not None:
+                    # 检查是否已经有缓存（包括之前运行时留下的磁盘缓存）
+                    if self.is_mask_cached(image_path):
+                        self.processed_images.add(image_name)
                         success_count += 1
                         continue
                     
@@ -1139,33 +1250,19 @@ class MaskGeneratorGUI:
                     if temp_image is None:
                         continue
                     
-                    # 读取标签
-                    label_path = self.labels_folder / (image_path.stem + ".txt")
-                    boxes = self.read_yolo_labels(str(label_path))
-                    yolo_boxes = self.yolo_to_pixel_coords(boxes, 
-                                                         temp_image.shape[1], 
-                                                         temp_image.shape[0]) if boxes else []
+                    # 生成掩膜并缓存（缓存的是CTD原始掩膜，显示时再用YOLO框过滤）
+                    # safe_imread 返回的已经是BGR，与浏览时的推理输入一致
+                    yolo_boxes = self.load_pixel_boxes(image_path, temp_image.shape[1], temp_image.shape[0]) if CTD_CROP_MODE else None
+                    self.generate_ctd_mask_with_thresh(temp_image, image_path, yolo_boxes)
                     
-                    # 生成掩膜
-                    image_bgr = cv2.cvtColor(temp_image, cv2.COLOR_RGB2BGR)
-                    mask, mask_refined = self.generate_ctd_mask_with_thresh(image_bgr)
-                    
-                    # YOLO过滤
-                    if yolo_boxes:
-                        final_mask = self.filter_mask_with_yolo_boxes(mask_refined, yolo_boxes)
-                    else:
-                        final_mask = mask_refined
-                    
-                    # 缓存掩膜并记录已处理
-                    self.manage_mask_cache(image_name, final_mask)
+                    # 记录已处理
                     self.processed_images.add(image_name)  # 记录已处理
                     success_count += 1
                 
                 # 更新当前页掩膜
-                current_image_name = self.image_files[self.current_index].stem
-                cached_mask = self.get_cached_mask(current_image_name)
+                cached_mask = self.get_cached_mask(self.image_files[self.current_index])
                 if cached_mask is not None:
-                    self.current_mask = cached_mask
+                    self.current_mask = self.filter_mask_with_yolo_boxes(cached_mask, self.current_yolo_boxes)
                 
                 # 完成操作
                 self.root.after(0, lambda: (
@@ -1208,66 +1305,7 @@ class MaskGeneratorGUI:
     
     def save_all_masks(self):
         """批量保存所有掩膜"""
-        if not self.image_files:
-            messagebox.showwarning("警告", "没有可处理的图片")
-            return
-        
-        # 创建进度条弹窗
-        progress_dialog = ProgressDialog(self.root, "批量保存掩膜")
-        
-        def save_batch():
-            try:
-                mask_dir = Path(__file__).parent / "MASK"
-                mask_dir.mkdir(exist_ok=True)
-                
-                total_count = len(self.image_files)
-                success_count = 0
-                
-                for i, image_path in enumerate(self.image_files):
-                    # 检查是否取消
-                    if progress_dialog.is_canceled():
-                        progress_dialog.finish_operation(False, "用户取消了操作")
-                        return
-                    
-                    # 更新进度
-                    progress_dialog.update_progress(i+1, total_count, 
-                                                   f"正在处理: {image_path.name} ({i+1}/{total_count})")
-                    
-                    # 临时加载图片
-                    temp_image = safe_imread(image_path)
-                    if temp_image is None:
-                        continue
-                    
-                    # 读取标签
-                    label_path = self.labels_folder / (image_path.stem + ".txt")
-                    boxes = self.read_yolo_labels(str(label_path))
-                    yolo_boxes = self.yolo_to_pixel_coords(boxes, 
-                                                         temp_image.shape[1], 
-                                                         temp_image.shape[0]) if boxes else []
-                    
-                    # 生成掩膜
-                    mask, mask_refined, _ = self.ctd_model(temp_image, refine_mode=0, keep_undetected_mask=False)
-                    
-                    if yolo_boxes:
-                        final_mask = self.filter_mask_with_yolo_boxes(mask_refined, yolo_boxes)
-                    else:
-                        final_mask = mask_refined
-                    
-                    # 调整大小
-                    final_mask = self.adjust_mask_size(final_mask, self.mask_size_factor)
-                    
-                    # 保存
-                    output_path = mask_dir / (image_path.stem + ".png")
-                    cv2.imwrite(str(output_path), final_mask)
-                    success_count += 1
-                
-                progress_dialog.finish_operation(True, f"✅ 批量保存完成: {success_count}/{total_count} 张掩膜已保存")
-                
-            except Exception as e:
-                progress_dialog.finish_operation(False, f"❌ 批量保存失败: {str(e)}")
-        
-        # 在后台线程执行
-        threading.Thread(target=save_batch, daemon=True).start()
+        self.export_all_with_config("mask", "批量保存掩膜", "批量保存完成")
     
     def regenerate_current_mask(self):
         """重新生成当前图片的掩膜"""
@@ -1277,7 +1315,7 @@ class MaskGeneratorGUI:
         
         try:
             self.progress_var.set("重新生成掩膜中...")
-            self.generate_mask_for_current_image()
+            self.generate_mask_for_current_image(force=True)
             
             # 如果开启了预览，更新显示
             if self.show_mask:
@@ -1355,209 +1393,77 @@ class MaskGeneratorGUI:
     
     def save_all_with_current_config(self):
         """用当前配置批量保存所有掩膜"""
-        if not self.image_files:
-            messagebox.showwarning("警告", "没有可处理的图片")
-            return
-        
-        current_config = self.get_current_config()
-        
-        # 创建进度条弹窗
-        progress_dialog = ProgressDialog(self.root, "用当前配置保存")
-        
-        def save_batch():
-            try:
-                mask_dir = Path(__file__).parent / "MASK"
-                mask_dir.mkdir(exist_ok=True)
-                
-                total_count = len(self.image_files)
-                success_count = 0
-                
-                for i, image_path in enumerate(self.image_files):
-                    # 检查是否取消
-                    if progress_dialog.is_canceled():
-                        progress_dialog.finish_operation(False, "用户取消了操作")
-                        return
-                    
-                    # 更新进度
-                    progress_dialog.update_progress(i+1, total_count, 
-                                                   f"正在处理: {image_path.name} ({i+1}/{total_count})")
-                    
-                    # 临时加载图片
-                    temp_image = safe_imread(image_path)
-                    if temp_image is None:
-                        continue
-                    
-                    # 读取标签
-                    label_path = self.labels_folder / (image_path.stem + ".txt")
-                    boxes = self.read_yolo_labels(str(label_path))
-                    yolo_boxes = self.yolo_to_pixel_coords(boxes, 
-                                                         temp_image.shape[1], 
-                                                         temp_image.shape[0]) if boxes else []
-                    
-                    # 生成掩膜
-                    mask, mask_refined, _ = self.ctd_model(temp_image, refine_mode=0, keep_undetected_mask=False)
-                    
-                    if yolo_boxes:
-                        final_mask = self.filter_mask_with_yolo_boxes(mask_refined, yolo_boxes)
-                    else:
-                        final_mask = mask_refined
-                    
-                    # 使用当前配置调整大小
-                    final_mask = self.adjust_mask_with_config(final_mask, current_config)
-                    
-                    # 保存
-                    output_path = mask_dir / (image_path.stem + ".png")
-                    cv2.imwrite(str(output_path), final_mask)
-                    success_count += 1
-                
-                progress_dialog.finish_operation(True, f"✅ 用当前配置批量保存完成: {success_count}/{total_count} 张")
-                
-            except Exception as e:
-                progress_dialog.finish_operation(False, f"❌ 批量保存失败: {str(e)}")
-        
-        # 在后台线程执行
-        threading.Thread(target=save_batch, daemon=True).start()
+        self.export_all_with_config("mask", "用当前配置保存", "用当前配置批量保存完成")
     
     def save_all_itmask_with_current_config(self):
         """用当前配置批量保存ITmask格式掩膜"""
+        self.export_all_with_config("itmask", "用当前配置导出ITmask", "用当前配置 ITmask导出完成")
+    
+    def get_export_pool(self):
+        """批量导出进程池（复用，避免每次导出都启动子进程）"""
+        if self.export_pool is None:
+            self.export_pool = mask_export.create_pool(EXPORT_PROCESSES)
+        return self.export_pool
+    
+    def export_all_with_config(self, fmt, title, done_text):
+        """
+        用当前配置批量导出（fmt: "mask" 黑白PNG 到 MASK/ ，"itmask" ITmask格式 到 ITmask/）
+        由 mask_export.export_batch 流水线处理：已缓存的页面直接复用CTD原始掩膜，
+        其余页面线程池读图 + CTD按批推理，调整/编码在进程池中并行，写入在线程池中进行
+        """
         if not self.image_files:
             messagebox.showwarning("警告", "没有可处理的图片")
             return
         
         current_config = self.get_current_config()
+        out_dir = Path(__file__).parent / ("ITmask" if fmt == "itmask" else "MASK")
         
         # 创建进度条弹窗
-        progress_dialog = ProgressDialog(self.root, "用当前配置导出ITmask")
+        progress_dialog = ProgressDialog(self.root, title)
         
         def export_batch():
             try:
-                itmask_dir = Path(__file__).parent / "ITmask"
-                itmask_dir.mkdir(exist_ok=True)
+                out_dir.mkdir(exist_ok=True)
                 
-                total_count = len(self.image_files)
-                success_count = 0
+                pages = [(image_path, self.labels_folder / (image_path.stem + ".txt"), out_dir / (image_path.stem + ".png"))
+                         for image_path in self.image_files]
+                total_count = len(pages)
+                progress_dialog.update_progress(0, total_count, f"准备导出 {total_count} 张...")
                 
-                for i, image_path in enumerate(self.image_files):
-                    # 检查是否取消
-                    if progress_dialog.is_canceled():
-                        progress_dialog.finish_operation(False, "用户取消了操作")
-                        return
-                    
-                    # 更新进度
-                    progress_dialog.update_progress(i+1, total_count, 
-                                                   f"正在处理: {image_path.name} ({i+1}/{total_count})")
-                    
-                    # 临时加载图片
-                    temp_image = safe_imread(image_path)
-                    if temp_image is None:
-                        continue
-                    
-                    # 读取标签
-                    label_path = self.labels_folder / (image_path.stem + ".txt")
-                    boxes = self.read_yolo_labels(str(label_path))
-                    yolo_boxes = self.yolo_to_pixel_coords(boxes, 
-                                                         temp_image.shape[1], 
-                                                         temp_image.shape[0]) if boxes else []
-                    
-                    # 生成掩膜
-                    mask, mask_refined, _ = self.ctd_model(temp_image, refine_mode=0, keep_undetected_mask=False)
-                    
-                    if yolo_boxes:
-                        final_mask = self.filter_mask_with_yolo_boxes(mask_refined, yolo_boxes)
-                    else:
-                        final_mask = mask_refined
-                    
-                    # 使用当前配置调整大小
-                    final_mask = self.adjust_mask_with_config(final_mask, current_config)
-                    
-                    # 创建ITmask格式
-                    itmask = self.create_itmask(final_mask, temp_image.shape[1], temp_image.shape[0])
-                    
-                    # 保存
-                    output_path = itmask_dir / (image_path.stem + ".png")
-                    pil_image = Image.fromarray(itmask, 'RGBA')
-                    pil_image.save(str(output_path), 'PNG')
-                    success_count += 1
+                def on_progress(done, total, output_path):
+                    progress_dialog.update_progress(done, total, f"已完成: {Path(output_path).name} ({done}/{total})")
                 
-                progress_dialog.finish_operation(True, f"✅ 用当前配置 ITmask导出完成: {success_count}/{total_count} 张")
+                crop = None
+                if CTD_CROP_MODE:
+                    crop = {"canvas_size": CTD_DETECT_SIZE, "padding": CTD_CROP_PADDING, "detail": CTD_CROP_DETAIL}
+                run_ctd = (lambda img: self.run_ctd(img)[1]) if self.ctd_model is not None else None
+                pool = self.get_export_pool() if total_count >= mask_export.MIN_PAGES_FOR_POOL else None
+                
+                success_count, errors, canceled, stats = mask_export.export_batch(
+                    pages, current_config, fmt, run_ctd, pool=pool,
+                    cache=self.mask_cache, variant_for=self.mask_variant, crop=crop, read_image=safe_imread,
+                    batch_pages=EXPORT_CTD_BATCH_PAGES, decode_threads=EXPORT_DECODE_THREADS,
+                    write_threads=EXPORT_WRITE_THREADS,
+                    on_progress=on_progress, is_canceled=progress_dialog.is_canceled)
+                if canceled:
+                    if pool is not None:
+                        self.export_pool = None  # 已被 terminate，下次重新创建
+                    progress_dialog.finish_operation(False, "用户取消了操作")
+                    return
+                for output_path, error in errors:
+                    print(f"导出失败: {output_path} - {error}")
+                
+                progress_dialog.finish_operation(
+                    True, f"✅ {done_text}: {success_count}/{total_count} 张，用时 {stats['seconds']:.1f} 秒"
+                          f"（运行CTD {stats['ctd_pages']} 张 / {stats['forwards']} 次推理，"
+                          f"其余 {stats['cached']} 张来自掩膜缓存）")
                 
             except Exception as e:
-                progress_dialog.finish_operation(False, f"❌ ITmask导出失败: {str(e)}")
+                progress_dialog.finish_operation(False, f"❌ 批量导出失败: {str(e)}")
         
         # 在后台线程执行
         threading.Thread(target=export_batch, daemon=True).start()
     
-    def adjust_mask_with_config(self, mask, config):
-        """用指定配置调整掩膜"""
-        mask_size_factor = config.get('mask_size_factor', 1.0)
-        extend_left = config.get('extend_left', 0)
-        extend_right = config.get('extend_right', 0)
-        extend_top = config.get('extend_top', 0)
-        extend_bottom = config.get('extend_bottom', 0)
-        
-        adjusted_mask = mask
-        
-        # 应用整体大小调整
-        if mask_size_factor != 1.0:
-            if mask_size_factor > 1.0:
-                kernel_size = int((mask_size_factor - 1.0) * 10) + 1
-                kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
-                adjusted_mask = cv2.dilate(adjusted_mask, kernel, iterations=1)
-            else:
-                kernel_size = int((1.0 - mask_size_factor) * 10) + 1
-                kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
-                adjusted_mask = cv2.erode(adjusted_mask, kernel, iterations=1)
-        
-        # 应用方向延伸 - 只支持正值
-        if extend_left > 0 or extend_right > 0 or extend_top > 0 or extend_bottom > 0:
-            adjusted_mask = self.apply_directional_extensions_with_config(adjusted_mask, config)
-        
-        return adjusted_mask
-    
-    def apply_directional_extensions_with_config(self, mask, config):
-        """用指定配置应用单方向延伸 - 4个方向独立单向生长"""
-        extend_left = config.get('extend_left', 0)
-        extend_right = config.get('extend_right', 0)
-        extend_top = config.get('extend_top', 0)
-        extend_bottom = config.get('extend_bottom', 0)
-        
-        h, w = mask.shape
-        result_mask = mask.copy()
-        
-        # 向上单向延伸
-        if extend_top > 0:
-            for i in range(1, int(extend_top) + 1):
-                shifted = np.zeros_like(mask)
-                if i < h:
-                    shifted[:-i, :] = mask[i:, :]
-                    result_mask = np.maximum(result_mask, shifted)
-        
-        # 向下单向延伸
-        if extend_bottom > 0:
-            for i in range(1, int(extend_bottom) + 1):
-                shifted = np.zeros_like(mask)
-                if i < h:
-                    shifted[i:, :] = mask[:-i, :]
-                    result_mask = np.maximum(result_mask, shifted)
-        
-        # 向左单向延伸
-        if extend_left > 0:
-            for i in range(1, int(extend_left) + 1):
-                shifted = np.zeros_like(mask)
-                if i < w:
-                    shifted[:, :-i] = mask[:, i:]
-                    result_mask = np.maximum(result_mask, shifted)
-        
-        # 向右单向延伸
-        if extend_right > 0:
-            for i in range(1, int(extend_right) + 1):
-                shifted = np.zeros_like(mask)
-                if i < w:
-                    shifted[:, i:] = mask[:, :-i]
-                    result_mask = np.maximum(result_mask, shifted)
-        
-        return result_mask
-    
     def save_configs(self):
         """保存配置到文件"""
         try:
@@ -1605,11 +1511,16 @@ class MaskGeneratorGUI:
         # 加载YOLO框（用于显示指导，不自动生成掩膜）
         self.load_yolo_boxes_for_current_image()
         
-        # 尝试从缓存加载掩膜，或重新生成已处理的掩膜
-        cached_mask = self.get_cached_mask(current_image_name)
+        # 尝试从缓存加载掩膜（包括之前运行时的磁盘缓存），或重新生成已处理的掩膜
+        cached_mask = self.get_cached_mask(image_path)
         if cached_mask is not None:
-            self.current_mask = cached_mask
+            self.current_mask = self.filter_mask_with_yolo_boxes(cached_mask, self.current_yolo_boxes)
+            self.processed_images.add(current_image_name)
             self.progress_var.set(f"加载: {image_path.name} (已恢复掩膜缓存)")
+        elif self.lookahead_enabled():
+            # 预取模式：当前页排在后台队列最前面，生成完成后自动显示，不阻塞翻页
+            self.current_mask = None
+            self.progress_var.set(f"加载: {image_path.name} (后台生成掩膜中...)")
         elif current_image_name in self.processed_images:
             # 已处理过但不在缓存中，重新生成
             self.progress_var.set(f"重新生成: {image_path.name}")
@@ -1620,6 +1531,9 @@ class MaskGeneratorGUI:
             self.current_mask = None
             self.progress_var.set(f"加载: {image_path.name} (请点击生成掩膜)")
         
+        # 按浏览方向重新安排后台预取（跳页时旧队列直接作废）
+        self.schedule_lookahead()
+        
         # 更新显示
         self.update_display()
 
@@ -1640,14 +1554,7 @@ class MaskGeneratorGUI:
 
     def create_itmask(self, mask, img_width, img_height):
         """创建ITmask格式：透明背景 + #D0FF14实心文字"""
-        # 创建4通道RGBA图像（全透明）
-        itmask = np.zeros((img_height, img_width, 4), dtype=np.uint8)
-        
-        # 将掩膜区域设置为#D0FF14颜色，不透明
-        mask_area = mask > 127  # 二值化掩膜
-        itmask[mask_area] = [20, 255, 208, 255]  # #D0FF14的BGR顺序 + Alpha
-        
-        return itmask
+        return mask_export.create_itmask(mask)
     
     def export_current_itmask(self):
         """导出当前页ITmask格式掩膜"""
@@ -1680,76 +1587,15 @@ class MaskGeneratorGUI:
     
     def export_all_itmasks(self):
         """批量导出所有ITmask格式掩膜"""
-        if not self.image_files:
-            messagebox.showwarning("警告", "没有可处理的图片")
-            return
-        
-        current_config = self.get_current_config()
-        
-        # 创建进度条弹窗
-        progress_dialog = ProgressDialog(self.root, "批量导出ITmask")
-        
-        def export_batch():
-            try:
-                itmask_dir = Path(__file__).parent / "ITmask"
-                itmask_dir.mkdir(exist_ok=True)
-                
-                total_count = len(self.image_files)
-                success_count = 0
-                
-                for i, image_path in enumerate(self.image_files):
-                    # 检查是否取消
-                    if progress_dialog.is_canceled():
-                        progress_dialog.finish_operation(False, "用户取消了操作")
-                        return
-                    
-                    # 更新进度
-                    progress_dialog.update_progress(i+1, total_count, 
-                                                   f"正在处理: {image_path.name} ({i+1}/{total_count})")
-                    
-                    # 临时加载图片
-                    temp_image = safe_imread(image_path)
-                    if temp_image is None:
-                        continue
-                    
-                    # 读取标签
-                    label_path = self.labels_folder / (image_path.stem + ".txt")
-                    boxes = self.read_yolo_labels(str(label_path))
-                    yolo_boxes = self.yolo_to_pixel_coords(boxes, 
-                                                         temp_image.shape[1], 
-                                                         temp_image.shape[0]) if boxes else []
-                    
-                    # 生成掩膜
-                    mask, mask_refined, _ = self.ctd_model(temp_image, refine_mode=0, keep_undetected_mask=False)
-                    
-                    if yolo_boxes:
-                        final_mask = self.filter_mask_with_yolo_boxes(mask_refined, yolo_boxes)
-                    else:
-                        final_mask = mask_refined
-                    
-                    # 使用当前配置调整大小
-                    final_mask = self.adjust_mask_with_config(final_mask, current_config)
-                    
-                    # 创建ITmask格式
-                    itmask = self.create_itmask(final_mask, temp_image.shape[1], temp_image.shape[0])
-                    
-                    # 保存
-                    output_path = itmask_dir / (image_path.stem + ".png")
-                    pil_image = Image.fromarray(itmask, 'RGBA')
-                    pil_image.save(str(output_path), 'PNG')
-                    success_count += 1
-                
-                progress_dialog.finish_operation(True, f"✅ ITmask批量导出完成: {success_count}/{total_count} 张")
-                
-            except Exception as e:
-                progress_dialog.finish_operation(False, f"❌ ITmask批量导出失败: {str(e)}")
-        
-        # 在后台线程执行
-        threading.Thread(target=export_batch, daemon=True).start()
+        self.export_all_with_config("itmask", "批量导出ITmask", "ITmask批量导出完成")
 
     def on_closing(self):
         """程序关闭时的清理工作"""
-        # 清理掩膜缓存
+        # 停止后台预取和导出进程池，清理掩膜缓存
+        self.prefetcher.stop()
+        if self.export_pool is not None:
+            self.export_pool.terminate()
+            self.export_pool = None
         self.mask_cache.clear()
         self.current_mask = None
         print("已清理掩膜缓存")
@@ -2,6 +2,8 @@ import sys
 import json
 import os
 
+from json_stream import rewrite_project
+
 # ========== 自定义设置区 ==========
 MODIFY_SHADOW_COLOR = True
 SHADOW_COLOR_DARK = "0,0,0,1"  # 浅色文字用的黑色描边
@@ -10,6 +12,8 @@ MODIFY_SHADOW_RADIUS = True
 SHADOW_RADIUS_VALUE = 3
 # 深色文字亮度阈值（0-255），低于此值认为是深色，使用白色描边
 DARK_TEXT_THRESHOLD = 100
+# 输出紧凑格式（无缩进换行，文件更小、写得更快；ImageTrans 读取不受影响）
+COMPACT_OUTPUT = False
 # ================================
 
 def is_dark_color(color_str):
@@ -113,29 +117,33 @@ def insert_shadowColor_after_textColor(d):
     else:
         return d
 
+def modify_dict_itself(obj):
+    """只处理当前字典本身 (不递归): 修改 shadowColor，插入 shadowColor / shadowRadius。"""
+    # 根据文字颜色选择描边颜色
+    if "textColor" in obj:
+        is_dark = is_dark_color(obj["textColor"])
+        shadow_color = SHADOW_COLOR_LIGHT if is_dark else SHADOW_COLOR_DARK
+        
+        # 修改 shadowColor（如果已存在且开启修改）
+        if MODIFY_SHADOW_COLOR and "shadowColor" in obj:
+            print(f"修改 shadowColor: {obj['shadowColor']} -> {shadow_color}")
+            obj["shadowColor"] = shadow_color
+    
+    # 在textColor后插入shadowColor（函数内部会根据颜色选择描边）
+    obj = insert_shadowColor_after_textColor(obj)
+    
+    # 处理 shadowRadius 和 wrappedText 位置关系
+    obj = insert_or_move_shadowRadius_before_wrappedText(obj)
+    
+    return obj
+
 def recursive_modify(obj):
     if isinstance(obj, dict):
         # 先递归修改子元素
         for k in list(obj.keys()):
             obj[k] = recursive_modify(obj[k])
         
-        # 根据文字颜色选择描边颜色
-        if "textColor" in obj:
-            is_dark = is_dark_color(obj["textColor"])
-            shadow_color = SHADOW_COLOR_LIGHT if is_dark else SHADOW_COLOR_DARK
-            
-            # 修改 shadowColor（如果已存在且开启修改）
-            if MODIFY_SHADOW_COLOR and "shadowColor" in obj:
-                print(f"修改 shadowColor: {obj['shadowColor']} -> {shadow_color}")
-                obj["shadowColor"] = shadow_color
-        
-        # 在textColor后插入shadowColor（函数内部会根据颜色选择描边）
-        obj = insert_shadowColor_after_textColor(obj)
-        
-        # 处理 shadowRadius 和 wrappedText 位置关系
-        obj = insert_or_move_shadowRadius_before_wrappedText(obj)
-        
-        return obj
+        return modify_dict_itself(obj)
     elif isinstance(obj, list):
         return [recursive_modify(item) for item in obj]
     else:
@@ -143,19 +151,33 @@ def recursive_modify(obj):
 
 def process_itp_file(file_path):
     print(f"开始处理文件: {file_path}")
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
     
+    # 流式处理: 顶层字段逐个、images 中的页面逐页读取并修改后写出，不把整个项目读进内存
+    top_level_keys = []
+
+    def modify_field(key, value):
+        top_level_keys.append(key)
+        return recursive_modify(value)
+
+    def modify_page(page_name, page_data):
+        return recursive_modify(page_data)
+
     try:
-        data = json.loads(content)
-    except json.JSONDecodeError:
+        rewrite_project(file_path, file_path, page_fn=modify_page, field_fn=modify_field,
+                        indent=None if COMPACT_OUTPUT else 4)
+    except (json.JSONDecodeError, ValueError):
         print(f"文件 {file_path} 不是有效的JSON格式，跳过。")
         return
     
-    data = recursive_modify(data)
-    
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    # 项目顶层本身带有 textColor / wrappedText 时 (正常的 ImageTrans 项目没有)，补做顶层字典的处理。
+    # 这时才整体读入一次，子元素上面已经处理过，这里不再递归。
+    if "textColor" in top_level_keys or "wrappedText" in top_level_keys:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        data = modify_dict_itself(data)
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=None if COMPACT_OUTPUT else 4,
+                      separators=(',', ':') if COMPACT_OUTPUT else None)
     
     print(f"已完成文件: {file_path}\n")
 
@@ -16,7 +16,7 @@
 
 import os
 import sys
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 try:
     from PIL import Image, ImageDraw
@@ -26,6 +26,8 @@ except ImportError:
         input("按回车键退出...")
     sys.exit(1)
 
+from image_dims import image_sizes
+
 # ========== 配置 ==========
 OUT_DIR_NAME = "MAKS"          # 输出文件夹名（按你的命名）
 IMG_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
@@ -129,17 +131,15 @@ def yolo_to_pixel_box(cx: float, cy: float, bw: float, bh: float, w: int, h: int
 
     return left, top, right, bottom
 
-def draw_mask(img_path: str, txt_path: str, out_path: str, fill_rgba: Tuple[int, int, int, int]) -> str:
+def draw_mask(img_path: str, size: Optional[Tuple[int, int]], txt_path: str, out_path: str, fill_rgba: Tuple[int, int, int, int]) -> str:
     """
-    根据图片尺寸与 txt 标注生成彩色掩膜 PNG（透明背景 + 指定颜色实心矩形）。
+    根据图片尺寸 (size，None 表示无法读取) 与 txt 标注生成彩色掩膜 PNG（透明背景 + 指定颜色实心矩形）。
     返回状态：'ok' 正常生成；'empty' 空标注/无有效框；'error' 错误。
     """
-    try:
-        with Image.open(img_path) as im:
-            w, h = im.size
-    except Exception as e:
-        print(f"[跳过] 打开图片失败：{os.path.basename(img_path)} -> {e}")
+    if size is None:
+        print(f"[跳过] 无法读取图片尺寸：{os.path.basename(img_path)}")
         return "error"
+    w, h = size
 
     lines = load_txt_lines(txt_path)
 
@@ -200,15 +200,19 @@ def main():
     print(f"填充颜色：{COLOR_HEX}，透明度：{fill_rgba[3]}")
     print("-" * 50)
 
+    # 有同名 txt 的图片先一次性读取宽高（只读文件头，多线程 + 尺寸索引），不再逐张打开
+    sizes = image_sizes(img_path for stem, img_path in image_index.items()
+                        if os.path.exists(os.path.join(script_dir, stem + ".txt")))
+
     for stem, img_path in sorted(image_index.items()):
         total += 1
         txt_path = os.path.join(script_dir, stem + ".txt")
-        if not os.path.exists(txt_path):
+        if img_path not in sizes:
             skipped_no_txt += 1
             continue
 
         out_path = os.path.join(out_dir, stem + ".png")
-        status = draw_mask(img_path, txt_path, out_path, fill_rgba)
+        status = draw_mask(img_path, sizes[img_path], txt_path, out_path, fill_rgba)
         if status == "ok":
             generated += 1
         elif status == "empty":
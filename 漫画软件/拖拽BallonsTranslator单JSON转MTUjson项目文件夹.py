@@ -2,7 +2,13 @@
 import json
 import os
 import sys
-from typing import Any, Dict, List, Tuple
+import time
+from collections import deque
+from itertools import chain, islice
+from multiprocessing import Pool, cpu_count
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from json_stream import BT_PAGES_KEY, iter_project
 
 # ============== 反向转换输出配置 ==============
 # 输出文件名后缀（每页会输出: <stem><suffix>.json）
@@ -20,6 +26,17 @@ AUTO_STROKE_THRESHOLD = 128.0
 # 描边宽度覆盖：False 使用原值；True 使用下方统一值
 ENABLE_OVERRIDE_STROKE_WIDTH = False
 OVERRIDE_STROKE_WIDTH_VALUE = 0.07
+# 内容没有变化的页面不重写（保留文件修改时间，反向同步时也不会被当成有改动）
+SKIP_UNCHANGED = True
+# 多进程转换并写出页面（0 表示使用全部 CPU 核心）
+ENABLE_MULTIPROCESSING = True
+MAX_PROCESSES = 0
+
+# 页数少于此值时直接在当前进程处理（启动进程池本身有开销）
+MIN_PAGES_FOR_POOL = 32
+POOL_CHUNK_SIZE = 16
+# 每个进程最多排队的任务块数（逐页读取项目，内存占用不随页数增长）
+PENDING_CHUNKS_PER_PROCESS = 4
 
 
 def _to_float_point(pt: List[Any]) -> List[float]:
@@ -148,47 +165,110 @@ def _to_mtu_region(region: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def convert(input_file: str, output_dir: str) -> None:
-    with open(input_file, "r", encoding="utf-8", errors="replace") as f:
-        data = json.load(f)
-    if not isinstance(data, dict):
-        raise ValueError("Input must be a BallonsTranslator project JSON object.")
-
-    pages = data.get("pages", {})
-    if not isinstance(pages, dict) or not pages:
+def _write_page(task: Tuple[str, Any, str, Any, str]) -> Tuple[str, int, bool]:
+    page_name, regions, directory, info, output_dir = task
+    if not isinstance(regions, list):
+        regions = []
+    page_regions = [_to_mtu_region(r) for r in regions if isinstance(r, dict)]
+
+    stem, _ = os.path.splitext(page_name)
+    abs_img = os.path.join(directory, page_name) if directory else page_name
+    if not isinstance(info, dict):
+        info = {}
+    out_obj = {
+        abs_img: {
+            "regions": page_regions,
+            "textlines": [],
+            "original_width": int(info.get("width", 0) or 0),
+            "original_height": int(info.get("height", 0) or 0),
+            "skip_font_scaling": False,
+        }
+    }
+    out_path = os.path.join(output_dir, f"{stem}{OUTPUT_SUFFIX}.json")
+    content = json.dumps(out_obj, ensure_ascii=False, indent=2)
+    if SKIP_UNCHANGED:
+        try:
+            with open(out_path, "r", encoding="utf-8") as f:
+                if f.read() == content:
+                    return out_path, len(page_regions), False
+        except (OSError, UnicodeDecodeError):
+            pass
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return out_path, len(page_regions), True
+
+
+def _write_chunk(chunk: List[Tuple[str, Any, str, Any, str]]) -> List[Tuple[str, int, bool]]:
+    return [_write_page(task) for task in chunk]
+
+
+def _chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _write_pages(tasks: Iterator[Tuple[str, Any, str, Any, str]], processes: int) -> Iterator[Tuple[str, int, bool]]:
+    """Yield results in page order; at most a few chunks per worker are in flight."""
+    head = list(islice(tasks, MIN_PAGES_FOR_POOL))
+    tasks = chain(head, tasks)
+    if processes <= 1 or len(head) < MIN_PAGES_FOR_POOL:
+        for task in tasks:
+            yield _write_page(task)
+        return
+    pending: deque = deque()
+    with Pool(processes=processes) as pool:
+        for chunk in _chunked(tasks, POOL_CHUNK_SIZE):
+            pending.append(pool.apply_async(_write_chunk, (chunk,)))
+            if len(pending) >= processes * PENDING_CHUNKS_PER_PROCESS:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+def convert(input_file: str, output_dir: str, processes: int = 1) -> None:
+    # Top-level fields are read first (image_info comes after pages); pages are then
+    # streamed one at a time, so memory does not grow with the project size.
+    fields: Dict[str, Any] = {}
+    for kind, key, value in iter_project(input_file, BT_PAGES_KEY):
+        if kind == "field":
+            fields[key] = value
+        elif kind == "begin":
+            fields[key] = None
+    if BT_PAGES_KEY not in fields or fields[BT_PAGES_KEY] is not None:
         raise ValueError("Input JSON has no pages.")
 
-    image_info = data.get("image_info", {})
+    image_info = fields.get("image_info", {})
     if not isinstance(image_info, dict):
         image_info = {}
-    directory = str(data.get("directory", "")).replace("/", "\\")
+    directory = str(fields.get("directory", "")).replace("/", "\\")
 
     os.makedirs(output_dir, exist_ok=True)
-    count = 0
-    for page_name, regions in pages.items():
-        if not isinstance(regions, list):
-            regions = []
-        page_regions = [_to_mtu_region(r) for r in regions if isinstance(r, dict)]
-
-        stem, _ = os.path.splitext(page_name)
-        abs_img = os.path.join(directory, page_name) if directory else page_name
-        info = image_info.get(page_name, {}) if isinstance(image_info.get(page_name), dict) else {}
-        out_obj = {
-            abs_img: {
-                "regions": page_regions,
-                "textlines": [],
-                "original_width": int(info.get("width", 0) or 0),
-                "original_height": int(info.get("height", 0) or 0),
-                "skip_font_scaling": False,
-            }
-        }
-        out_path = os.path.join(output_dir, f"{stem}{OUTPUT_SUFFIX}.json")
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(out_obj, f, ensure_ascii=False, indent=2)
-        print(f"已写入: {out_path}（{len(page_regions)} 个文本区域）")
+    start = time.perf_counter()
+    tasks = (
+        (page_name, regions, directory, image_info.get(page_name), output_dir)
+        for kind, page_name, regions in iter_project(input_file, BT_PAGES_KEY)
+        if kind == "page"
+    )
+    count = skipped = 0
+    for out_path, n_regions, written in _write_pages(tasks, processes):
+        if written:
+            print(f"已写入: {out_path}（{n_regions} 个文本区域）")
+        else:
+            skipped += 1
         count += 1
+    if not count:
+        raise ValueError("Input JSON has no pages.")
 
     print(f"完成，共拆分 {count} 页，已生成 MTU JSON 文件。")
+    if skipped:
+        print(f"其中 {skipped} 页内容没有变化，未重写。")
+    print(f"耗时 {time.perf_counter() - start:.2f} 秒")
 
 
 def main() -> None:
@@ -204,7 +284,8 @@ def main() -> None:
         OUTPUT_ROOT_DIRNAME,
         OUTPUT_JSON_DIRNAME,
     )
-    convert(input_file, output_dir)
+    processes = (MAX_PROCESSES if MAX_PROCESSES > 0 else cpu_count()) if ENABLE_MULTIPROCESSING else 1
+    convert(input_file, output_dir, processes)
 
 
 if __name__ == "__main__":
@@ -1,19 +1,40 @@
 #!/usr/bin/env python3
 import argparse
 import glob
+import hashlib
 import json
 import os
 import sys
+import time
 import traceback
-from copy import deepcopy
+from multiprocessing import Pool, cpu_count
 from typing import Any, Dict, List, Tuple
 
+from json_stream import BT_PAGES_KEY, ProjectWriter, encode_page, iter_project, splice_project
+
 # ============== 描边宽度总开关与默认值配置 ==============
 # 描边覆盖总开关：False 时使用源 JSON 的 stroke_width；True 时统一覆盖为下方值
 ENABLE_OVERRIDE_STROKE_WIDTH = True
 # 当 ENABLE_OVERRIDE_STROKE_WIDTH = True 时生效
 OVERRIDE_STROKE_WIDTH_VALUE = 0.25
 
+# ============== 多进程与增量同步配置 ==============
+# 多进程解析 MTU JSON（0 表示使用全部 CPU 核心）
+ENABLE_MULTIPROCESSING = True
+MAX_PROCESSES = 0
+# 增量同步：输出文件已存在时，只重写 MTU JSON 有改动的页面，其余页面（包括在 BallonsTranslator 里做的修改）原样保留
+# 页面有增删、模板或描边设置改变时自动改为完整转换；False 时每次都完整转换
+SYNC_MODE = True
+
+# 文件数少于此值时直接在当前进程处理（启动进程池本身有开销）
+MIN_FILES_FOR_POOL = 32
+POOL_CHUNK_SIZE = 16
+OUTPUT_INDENT = 2
+# 同步记录文件（<输出>.json.sync）：记录每个 MTU JSON 的大小、修改时间和内容哈希
+MANIFEST_SUFFIX = ".sync"
+
+_WORKER_OPTIONS: Dict[str, Any] = {}
+
 
 def _to_int_point(pt: List[float]) -> List[int]:
     return [int(round(float(pt[0]))), int(round(float(pt[1])))]
@@ -145,9 +166,11 @@ def _region_to_balloon(
     if default_region is None:
         default_region = {}
 
-    out = deepcopy(default_region)
+    # Shallow copies are enough: every value replaced below is a fresh object and
+    # the shared template values are only serialized, never modified.
+    out = dict(default_region)
     out.setdefault("fontformat", {})
-    ff = deepcopy(out.get("fontformat", {}))
+    ff = dict(out.get("fontformat", {}))
 
     font_size = float(region.get("font_size", ff.get("font_size", 36)))
     stroke_width = float(region.get("stroke_width", ff.get("stroke_width", 0.0)))
@@ -204,102 +227,270 @@ def _region_to_balloon(
     return out
 
 
+def _init_worker(options: Dict[str, Any]) -> None:
+    global _WORKER_OPTIONS
+    _WORKER_OPTIONS = options
+
+
+def _convert_file(task: Tuple[str, str]) -> Dict[str, Any]:
+    """
+    Parse one MTU page file. Runs in a worker process; returns the page already
+    encoded for ProjectWriter (or as a region list when options["indent"] is None).
+    """
+    fp, old_hash = task
+    options = _WORKER_OPTIONS
+    with open(fp, "rb") as f:
+        raw = f.read()
+    st = os.stat(fp)
+    record = {
+        "size": len(raw),
+        "mtime_ns": st.st_mtime_ns,
+        "hash": hashlib.blake2b(raw, digest_size=16).hexdigest(),
+        "image": None,
+    }
+    result = {"file": fp, "record": record, "image": None, "unchanged": record["hash"] == old_hash}
+    if result["unchanged"]:
+        return result
+
+    data = json.loads(raw.decode("utf-8", errors="replace"))
+    if not isinstance(data, dict) or not data:
+        return result
+    img_abs = next(iter(data.keys()))
+    payload = data[img_abs]
+    if not isinstance(payload, dict):
+        return result
+
+    regions = payload.get("regions", [])
+    page_regions: List[Dict[str, Any]] = []
+    if isinstance(regions, list):
+        for region in regions:
+            if isinstance(region, dict):
+                page_regions.append(
+                    _region_to_balloon(
+                        region,
+                        options["default_region"],
+                        override_stroke_width=options["override_stroke_width"],
+                        stroke_width_value=options["stroke_width_value"],
+                    )
+                )
+
+    record["image"] = result["image"] = os.path.basename(img_abs)
+    result["directory"] = os.path.dirname(img_abs).replace("\\", "/")
+    result["regions"] = len(page_regions)
+    result["page"] = page_regions if options["indent"] is None else encode_page(page_regions, options["indent"])
+    result["info"] = {
+        "finish_code": 11,
+        "width": int(payload.get("original_width", 0) or 0),
+        "height": int(payload.get("original_height", 0) or 0),
+    }
+    return result
+
+
+def _convert_files(tasks: List[Tuple[str, str]], options: Dict[str, Any], processes: int):
+    """Yield _convert_file results in task order, fanned out over a process pool for large inputs."""
+    if processes > 1 and len(tasks) >= MIN_FILES_FOR_POOL:
+        with Pool(processes=processes, initializer=_init_worker, initargs=(options,)) as pool:
+            yield from pool.imap(_convert_file, tasks, chunksize=POOL_CHUNK_SIZE)
+    else:
+        _init_worker(options)
+        for task in tasks:
+            yield _convert_file(task)
+
+
+def _load_template(template_path: str) -> Tuple[Any, Dict[str, Any]]:
+    """Read the template's top-level fields and its first region; pages are streamed, not kept."""
+    if not template_path:
+        return None, {}
+    tpl: Dict[str, Any] = {}
+    default_region: Dict[str, Any] = {}
+    for kind, key, value in iter_project(template_path, BT_PAGES_KEY):
+        if kind == "field":
+            tpl[key] = value
+        elif kind == "page" and not default_region:
+            if isinstance(value, list) and value and isinstance(value[0], dict):
+                default_region = value[0]
+    return tpl, default_region
+
+
+def _merge_image_info(old: Any, infos: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
+    """Update width/height of the given pages, keeping any other per-page state."""
+    image_info = dict(old) if isinstance(old, dict) else {}
+    for k, info in infos.items():
+        if isinstance(image_info.get(k), dict):
+            merged = dict(image_info[k])
+            merged["width"] = info["width"]
+            merged["height"] = info["height"]
+            image_info[k] = merged
+        else:
+            image_info[k] = info
+    return image_info
+
+
+def _file_stat(fp: str) -> Tuple[int, int]:
+    st = os.stat(fp)
+    return st.st_size, st.st_mtime_ns
+
+
+def load_manifest(manifest_path: str) -> Any:
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if isinstance(manifest, dict) and isinstance(manifest.get("files"), dict):
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def save_manifest(manifest_path: str, settings: Dict[str, Any], files: Dict[str, Any]) -> None:
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"settings": settings, "files": files}, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def sync_project(
+    files: List[str], output_path: str, settings: Dict[str, Any], options: Dict[str, Any], processes: int
+) -> bool:
+    """
+    Rewrite only the pages whose MTU files changed since the last run; all other pages
+    (including edits made in BallonsTranslator) are copied byte-for-byte.
+    Returns False when a full conversion is needed instead.
+    """
+    manifest_path = output_path + MANIFEST_SUFFIX
+    manifest = load_manifest(manifest_path)
+    if manifest is None:
+        print("No sync record found, running a full conversion.")
+        return False
+    if manifest.get("settings") != settings:
+        print("Template or stroke width settings changed, running a full conversion.")
+        return False
+    old_files = manifest["files"]
+    names = {os.path.basename(fp): fp for fp in files}
+    if set(names) != set(old_files):
+        print("MTU files were added or removed, running a full conversion.")
+        return False
+    images = [r.get("image") for r in old_files.values() if r.get("image")]
+    if len(images) != len(set(images)):
+        print("Several MTU files share one page, running a full conversion.")
+        return False
+
+    new_files = dict(old_files)
+    tasks = []
+    for name, fp in names.items():
+        record = old_files[name]
+        if (record.get("size"), record.get("mtime_ns")) != _file_stat(fp):
+            tasks.append((fp, record.get("hash")))
+
+    pages: Dict[str, Any] = {}
+    infos: Dict[str, Dict[str, int]] = {}
+    for result in _convert_files(tasks, dict(options, indent=None), processes):
+        name = os.path.basename(result["file"])
+        if result["unchanged"]:
+            # Touched but not modified: only refresh the recorded size / mtime.
+            new_files[name] = dict(result["record"], image=old_files[name].get("image"))
+            continue
+        if result["image"] != old_files[name].get("image"):
+            print(f"{name} now points to a different page, running a full conversion.")
+            return False
+        new_files[name] = result["record"]
+        if result["image"] is None:
+            continue
+        pages[result["image"]] = result["page"]
+        infos[result["image"]] = result["info"]
+        print(f"  changed: {result['image']}: {result['regions']} regions")
+
+    if pages:
+        replaced, added = splice_project(
+            output_path,
+            output_path,
+            {k: (lambda _old, page=page: page) for k, page in pages.items()},
+            pages_key=BT_PAGES_KEY,
+            fields={"image_info": lambda old: _merge_image_info(old, infos)},
+        )
+        print(f"Synced {replaced + added} changed pages -> {output_path} ({len(files) - len(pages)} pages unchanged)")
+    else:
+        print(f"No MTU file changed, {output_path} is up to date.")
+    # Only record the new state once the project has been written.
+    save_manifest(manifest_path, settings, new_files)
+    return True
+
+
 def convert(
     input_glob: str,
     output_path: str,
     template_path: str = "",
     override_stroke_width: bool = False,
     stroke_width_value: float = 0.07,
+    processes: int = 1,
+    sync: bool = False,
 ) -> None:
     files = sorted(glob.glob(input_glob))
     if not files:
         raise FileNotFoundError(f"No files matched: {input_glob}")
 
-    pages: Dict[str, List[Dict[str, Any]]] = {}
+    start = time.perf_counter()
+    tpl, default_region = _load_template(template_path)
+    options = {
+        "default_region": default_region,
+        "override_stroke_width": override_stroke_width,
+        "stroke_width_value": stroke_width_value,
+        "indent": OUTPUT_INDENT,
+    }
+    settings = {
+        "template": [os.path.abspath(template_path), *_file_stat(template_path)] if template_path else None,
+        "override_stroke_width": override_stroke_width,
+        "stroke_width_value": stroke_width_value,
+    }
+    if sync and os.path.exists(output_path):
+        if sync_project(files, output_path, settings, options, processes):
+            print(f"Done in {time.perf_counter() - start:.2f}s")
+            return
+
+    # Pages arrive as pre-encoded JSON fragments; only one copy of each page is held.
+    pages: Dict[str, str] = {}
     image_info: Dict[str, Dict[str, int]] = {}
+    region_counts: Dict[str, int] = {}
+    records: Dict[str, Any] = {}
     directory = ""
-
-    default_region: Dict[str, Any] = {}
-    tpl = None
-    if template_path:
-        with open(template_path, "r", encoding="utf-8", errors="replace") as f:
-            tpl = json.load(f)
-        if isinstance(tpl, dict):
-            tpl_pages = tpl.get("pages", {})
-            if isinstance(tpl_pages, dict):
-                for _k, _regions in tpl_pages.items():
-                    if isinstance(_regions, list) and _regions:
-                        if isinstance(_regions[0], dict):
-                            default_region = deepcopy(_regions[0])
-                            break
-
-    for fp in files:
-        with open(fp, "r", encoding="utf-8", errors="replace") as f:
-            data = json.load(f)
-        if not isinstance(data, dict) or not data:
-            continue
-
-        img_abs = next(iter(data.keys()))
-        img_name = os.path.basename(img_abs)
-        payload = data[img_abs]
-        if not isinstance(payload, dict):
+    for result in _convert_files([(fp, None) for fp in files], options, processes):
+        records[os.path.basename(result["file"])] = result["record"]
+        img_name = result["image"]
+        if img_name is None:
             continue
-
         if not directory:
-            directory = os.path.dirname(img_abs).replace("\\", "/")
-
-        regions = payload.get("regions", [])
-        page_regions: List[Dict[str, Any]] = []
-        if isinstance(regions, list):
-            for region in regions:
-                if isinstance(region, dict):
-                    page_regions.append(
-                        _region_to_balloon(
-                            region,
-                            default_region,
-                            override_stroke_width=override_stroke_width,
-                            stroke_width_value=stroke_width_value,
-                        )
-                    )
-        pages[img_name] = page_regions
-
-        image_info[img_name] = {
-            "finish_code": 11,
-            "width": int(payload.get("original_width", 0) or 0),
-            "height": int(payload.get("original_height", 0) or 0),
-        }
+            directory = result["directory"]
+        pages[img_name] = result["page"]
+        image_info[img_name] = result["info"]
+        region_counts[img_name] = result["regions"]
 
     page_names = sorted(pages.keys())
     if template_path and isinstance(tpl, dict):
-        out = {
-            "directory": tpl.get("directory", directory),
-            "pages": {k: pages[k] for k in page_names},
-            "current_img": tpl.get("current_img", page_names[0] if page_names else ""),
-            "image_info": {},
-        }
+        directory = tpl.get("directory", directory)
+        current_img = tpl.get("current_img", page_names[0] if page_names else "")
         tpl_info = tpl.get("image_info", {})
-        for k in page_names:
-            if isinstance(tpl_info, dict) and k in tpl_info and isinstance(tpl_info[k], dict):
-                merged = dict(tpl_info[k])
-                merged["width"] = image_info[k]["width"]
-                merged["height"] = image_info[k]["height"]
-                out["image_info"][k] = merged
-            else:
-                out["image_info"][k] = image_info[k]
+        if not isinstance(tpl_info, dict):
+            tpl_info = {}
+        image_info = {k: _merge_image_info({k: tpl_info.get(k)}, {k: image_info[k]})[k] for k in page_names}
     else:
-        out = {
-            "directory": directory,
-            "pages": {k: pages[k] for k in page_names},
-            "current_img": page_names[0] if page_names else "",
-            "image_info": {k: image_info[k] for k in page_names},
-        }
+        current_img = page_names[0] if page_names else ""
+        image_info = {k: image_info[k] for k in page_names}
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(out, f, ensure_ascii=False, indent=2)
+    with ProjectWriter(output_path, indent=OUTPUT_INDENT) as writer:
+        writer.field("directory", directory)
+        writer.begin_pages(BT_PAGES_KEY)
+        for k in page_names:
+            writer.page(k, fragment=pages.pop(k))
+        writer.end_pages()
+        writer.field("current_img", current_img)
+        writer.field("image_info", image_info)
+    if sync:
+        save_manifest(output_path + MANIFEST_SUFFIX, settings, records)
 
     print(f"Converted {len(files)} files -> {output_path}")
     for k in page_names:
-        print(f"  {k}: {len(pages[k])} regions")
+        print(f"  {k}: {region_counts[k]} regions")
+    print(f"Done in {time.perf_counter() - start:.2f}s")
 
 
 def main() -> None:
@@ -347,7 +538,19 @@ def main() -> None:
         default=OVERRIDE_STROKE_WIDTH_VALUE,
         help="Custom stroke width value used when override is enabled.",
     )
-    parser.set_defaults(override_stroke_width=ENABLE_OVERRIDE_STROKE_WIDTH)
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=(MAX_PROCESSES if MAX_PROCESSES > 0 else cpu_count()) if ENABLE_MULTIPROCESSING else 1,
+        help="Number of worker processes used to parse the MTU files.",
+    )
+    parser.add_argument(
+        "--full",
+        dest="sync",
+        action="store_false",
+        help="Always rebuild the whole project instead of syncing changed pages only.",
+    )
+    parser.set_defaults(override_stroke_width=ENABLE_OVERRIDE_STROKE_WIDTH, sync=SYNC_MODE)
     args = parser.parse_args()
 
     input_glob = args.input_glob
@@ -402,6 +605,8 @@ def main() -> None:
         template_path,
         override_stroke_width=args.override_stroke_width,
         stroke_width_value=args.stroke_width_value,
+        processes=max(1, args.processes),
+        sync=args.sync,
     )
 
 
@@ -11,7 +11,7 @@
 
 import sys
 import os
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 try:
     from PIL import Image, ImageDraw
@@ -19,6 +19,8 @@ except ImportError:
     print("缺少 Pillow 库，请先安装：pip install pillow")
     sys.exit(1)
 
+from image_dims import image_sizes
+
 # 配置：是否只画白色边框；边框像素宽度
 DRAW_OUTLINE = False   # False = 白色填充矩形（推荐用于掩膜）
 LINE_WIDTH = 2
@@ -106,20 +108,19 @@ def load_txt_lines(txt_path: str) -> List[str]:
                     lines.append(s)
     return lines
 
-def process_single_txt(txt_path: str, image_index: Dict[str, str], out_dir: str) -> bool:
-    """处理一个 txt，生成对应掩膜。返回是否成功。"""
+def process_single_txt(txt_path: str, image_index: Dict[str, str], sizes: Dict[str, Optional[Tuple[int, int]]],
+                       out_dir: str) -> bool:
+    """处理一个 txt，生成对应掩膜（sizes 为预先读取的图片宽高）。返回是否成功。"""
     stem = os.path.splitext(os.path.basename(txt_path))[0]
     if stem not in image_index:
         print(f"[跳过] 找不到同名图片：{stem}.*")
         return False
 
     img_path = image_index[stem]
-    try:
-        with Image.open(img_path) as im:
-            w, h = im.size
-    except Exception as e:
-        print(f"[跳过] 打开图片失败：{img_path} -> {e}")
+    if sizes.get(img_path) is None:
+        print(f"[跳过] 无法读取图片尺寸：{img_path}")
         return False
+    w, h = sizes[img_path]
 
     lines = load_txt_lines(txt_path)
     if not lines:
@@ -205,9 +206,13 @@ def main():
     print(f"绘制模式：{'白色边框' if DRAW_OUTLINE else '白色填充'}")
     print("-" * 50)
 
+    # 先一次性读取所有对应图片的宽高（只读文件头，多线程 + 尺寸索引），不再逐张打开
+    stems = (os.path.splitext(os.path.basename(txt))[0] for txt in txt_list)
+    sizes = image_sizes(image_index[stem] for stem in stems if stem in image_index)
+
     ok, skip = 0, 0
     for txt in txt_list:
-        if process_single_txt(txt, image_index, out_dir):
+        if process_single_txt(txt, image_index, sizes, out_dir):
             ok += 1
         else:
             skip += 1